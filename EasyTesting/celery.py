@@ -22,6 +22,26 @@ app.conf.beat_schedule = {
         'task': 'test_manager.tasks.cleanup_old_execution_logs',
         'schedule': 86400.0,  # 每天执行一次
     },
+    'flush-email-notifications': {
+        'task': 'test_manager.tasks.flush_email_notifications',
+        'schedule': 60.0,  # 每分钟发送到期的合并通知
+    },
+    'cleanup-old-test-runs': {
+        'task': 'test_manager.tasks.cleanup_old_test_runs',
+        'schedule': 86400.0,  # 每天执行一次
+    },
+    'cleanup-response-blobs': {
+        'task': 'test_manager.tasks.cleanup_response_blobs',
+        'schedule': 86400.0,  # 每天删除未引用的响应体
+    },
+    'resume-suite-runs': {
+        'task': 'test_manager.tasks.resume_suite_runs',
+        'schedule': 60.0,  # 每分钟恢复异常中断的批量运行调度
+    },
+    'expire-agent-leases': {
+        'task': 'test_manager.tasks.expire_agent_leases',
+        'schedule': 30.0,  # 每30秒处理执行代理失联后租约过期的任务
+    },
 }
 
 app.conf.timezone = 'Asia/Shanghai'
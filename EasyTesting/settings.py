@@ -144,7 +144,9 @@ LOGOUT_REDIRECT_URL = '/login/'
 
 
 # 邮件设置 - SMTP 配置
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# 优先使用后台激活的邮件配置发信，没有激活配置时使用 EMAIL_FALLBACK_BACKEND 和下面的 SMTP 参数
+EMAIL_BACKEND = 'test_manager.notifications.ActiveConfigEmailBackend'
+EMAIL_FALLBACK_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.qq.com'  # SMTP 服务器地址
 EMAIL_PORT = 465  # SMTP 服务器端口
 EMAIL_USE_TLS = True  # 使用 TLS 加密
@@ -331,4 +333,123 @@ CELERY_TIMEZONE = 'Asia/Shanghai'
 CELERY_ENABLE_UTC = True
 
 # Celery Beat Configuration
-CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+
+# 定时任务执行租约有效期(秒)，执行期间每隔三分之一有效期续约，worker异常退出后租约在该时间后失效
+SCHEDULED_TASK_LEASE_TTL = 5 * 60
+
+
+# Worker心跳上报间隔(秒)，超过超时时间未上报的worker视为离线
+WORKER_HEARTBEAT_INTERVAL = 10
+WORKER_HEARTBEAT_TIMEOUT = 30
+
+# Celery队列路由：交互执行、批量执行、通知、维护任务分开排队
+CELERY_TASK_ROUTES = ('test_manager.queues.route_task',)
+# 批量执行按项目散列的分片队列数量，worker轮询消费各分片以保证项目间公平
+CELERY_BATCH_QUEUE_SHARDS = 4
+# Redis代理开启0-9级优先级
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'round_robin',
+}
+# 每个进程只预取一个任务，避免长时间的批量执行压住已预取的高优先级任务
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# 各队列分组的worker并发数，通过 python manage.py run_worker <分组> 启动
+CELERY_QUEUE_CONCURRENCY = {
+    'interactive': 4,
+    'batch': 2,
+    'notification': 2,
+    'maintenance': 1,
+}
+
+# 历史数据保留策略
+RETENTION_EXECUTION_LOG_DAYS = 30  # 定时任务执行日志保留天数
+RETENTION_TEST_RUN_DAYS = 90  # 测试运行及测试结果保留天数
+RETENTION_BATCH_SIZE = 500  # 每批删除的记录数
+RETENTION_BATCH_PAUSE = 0.5  # 批次间暂停秒数，避免长时间占用SQLite写锁
+RETENTION_ARCHIVE_ENABLED = True  # 删除前是否把测试结果归档为gzip压缩的JSONL文件
+RETENTION_ARCHIVE_DIR = BASE_DIR / 'archive'
+
+# 缓存，设置 EASYTESTING_REDIS_CACHE_URL 环境变量（如 redis://localhost:6379/1）时使用Redis，在各进程间共享；
+# 未设置时使用进程内缓存，缓存失效只作用于当前进程，其他进程中的面板统计最多延迟 DASHBOARD_CACHE_TTL 秒
+REDIS_CACHE_URL = os.environ.get('EASYTESTING_REDIS_CACHE_URL', '')
+if REDIS_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# 邮件通知
+EMAIL_CONFIG_CACHE_TTL = 300  # 激活邮件配置的缓存时间(秒)
+NOTIFICATION_FLUSH_DELAY = 10  # 通知登记后延迟发送的秒数，期间的通知合并到同一批，复用同一个连接
+NOTIFICATION_BATCH_SIZE = 200  # 每批最多处理的通知数
+NOTIFICATION_DIGEST_WINDOW = 30 * 60  # 合并通知的汇总窗口(秒)
+NOTIFICATION_MAX_ATTEMPTS = 5  # 通知最多发送的次数，用完后记为发送失败
+NOTIFICATION_RETRY_DELAY = 60  # 发送失败后第一次重试的延迟(秒)，之后每次翻倍
+NOTIFICATION_CLAIM_TTL = 300  # 通知领取后的发送超时(秒)，超时仍在发送中的通知重新发送
+
+# 面板统计缓存
+DASHBOARD_CACHE_TTL = 300  # 面板统计的缓存时间(秒)，测试运行结束时提前失效
+DASHBOARD_RECENT_ACTIVITY_LIMIT = 5  # 面板最近活动的展示条数
+
+# 每日汇总
+TEST_CASE_TREND_DAYS = 30  # 测试用例详情页展示的每日趋势天数
+
+# 游标分页
+PAGINATION_COUNT_CAP = 10000  # 估算总数时最多计数的条数，超过后显示为"约N+条"
+PAGINATION_COUNT_CACHE_TTL = 300  # 估算总数的缓存时间(秒)
+
+# 响应体存储
+RESPONSE_BLOB_COMPRESS_LEVEL = 6  # zlib压缩级别
+RESPONSE_BLOB_TOUCH_INTERVAL = 3600  # 重复内容刷新最近引用时间的最小间隔(秒)
+RESPONSE_BLOB_GC_GRACE = 24 * 3600  # 最近引用时间在此时长内的未引用内容不回收(秒)
+
+# 响应读取
+RESPONSE_MAX_BYTES = 10 * 1024 * 1024  # 完整读取响应体的上限(字节)，超过时只增量解析校验和参数提取用到的JSON字段
+RESPONSE_STREAM_MAX_BYTES = 1024 * 1024 * 1024  # 增量解析的响应体上限(字节)
+RESPONSE_READ_CHUNK_SIZE = 64 * 1024  # 分块读取的块大小(字节)
+
+# 测试报告
+REPORT_STORAGE_DIR = BASE_DIR / 'reports'  # 后台生成的报告文件目录
+REPORT_CHUNK_SIZE = 500  # 生成报告时每次从数据库读取的测试结果条数
+REPORT_PROGRESS_INTERVAL = 200  # 每处理多少条结果更新一次生成进度
+REPORT_SECTION_PAGE_SIZE = 50  # 详情页每次加载的测试结果条数
+
+# 测试结果导出
+EXPORT_CHUNK_SIZE = 1000  # 流式导出时每次从数据库读取的测试结果条数
+
+# 外部执行器提交结果
+INGEST_CHUNK_SIZE = 1000  # 每次批量插入的测试结果条数
+INGEST_MAX_RESULTS = 10000  # 每个请求最多提交的测试结果条数
+INGEST_MAX_BYTES = 256 * 1024 * 1024  # 每个请求解压后的请求体上限(字节)，超过时返回413
+INGEST_MAX_LINE_BYTES = 10 * 1024 * 1024  # 每条结果(一行)的大小上限(字节)，超过时返回413
+
+# API提交的测试运行
+RUN_STATUS_MAX_WAIT = 10  # 状态接口长轮询的最长等待时间(秒)，等待中的请求占用一个Web工作线程并定期查询数据库
+RUN_STATUS_POLL_INTERVAL = 1  # 长轮询期间查询运行状态的间隔(秒)
+
+# 批量运行
+SUITE_RUN_CONCURRENCY = 4  # 所有批量运行同时执行的子运行数上限
+SUITE_RUN_SLOT_TTL = 3600  # 并发槽位租约时间(秒)，执行期间每隔三分之一续约，超时未续约的槽位可被其他运行占用
+
+# 执行代理
+AGENT_LEASE_TTL = 60  # 代理任务的租约时间(秒)，代理超过该时间未上报心跳或提交结果时任务可被其他代理领取
+AGENT_HEARTBEAT_INTERVAL = 15  # 代理上报心跳的间隔(秒)，注册时下发给代理
+AGENT_MAX_ATTEMPTS = 3  # 代理任务最多被领取的次数，用完后测试运行记为失败
+
+# 环境限流
+THROTTLE_REDIS_URL = 'redis://localhost:6379/2'  # 所有worker、线程和平台共用的限流计数器，连接失败时临时改用进程内计数
+THROTTLE_MAX_WAIT = 300  # 请求等待环境限流的最长时间(秒)，超过后该用例记为错误
+THROTTLE_SLOT_TTL = 120  # 并发名额的占用时间上限(秒)，进程异常退出后名额自动释放，应大于请求超时
+
+# 分组树
+GROUP_TREE_CACHE_TTL = 600  # 项目分组树缓存时间(秒)，分组、用例或套件变更时立即失效
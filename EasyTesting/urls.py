@@ -59,6 +59,12 @@ urlpatterns = [
     path('test-runs/', views.test_run_list, name='test_run_list'),
     path('test-runs/<int:pk>/', views.test_run_detail, name='test_run_detail'),
     path('test-runs/<int:pk>/delete/', views.test_run_delete, name='test_run_delete'),
+    path('test-results/export/', views.test_result_export, name='test_result_export'),
+    # 批量运行
+    path('test-suite-runs/', views.test_suite_run_list, name='test_suite_run_list'),
+    path('test-suite-runs/create/', views.test_suite_run_create, name='test_suite_run_create'),
+    path('test-suite-runs/<int:pk>/', views.test_suite_run_detail, name='test_suite_run_detail'),
+    path('test-suite-runs/<int:pk>/status/', views.test_suite_run_status, name='test_suite_run_status'),
 
     # 认证相关
     path('', auth_views.LoginView.as_view(template_name='auth/login.html'), name='login'),
@@ -118,6 +124,7 @@ urlpatterns = [
     path('test-case-groups/create/', views.test_case_group_create, name='test_case_group_create'),
     path('test-case-groups/<int:pk>/edit/', views.test_case_group_edit, name='test_case_group_edit'),
     path('test-case-groups/<int:pk>/delete/', views.test_case_group_delete, name='test_case_group_delete'),
+    path('test-case-groups/<int:pk>/run/', views.test_case_group_run, name='test_case_group_run'),
 
     # 测试套件分组
     path('test-suite-groups/', views.test_suite_group_list, name='test_suite_group_list'),
@@ -129,6 +136,9 @@ urlpatterns = [
     path('reports/', views.test_report_list, name='test_report_list'),
     path('reports/<int:pk>/', views.test_report_detail, name='test_report_detail'),
     path('reports/<int:pk>/delete/', views.test_report_delete, name='test_report_delete'),
+    path('reports/<int:pk>/status/', views.test_report_status, name='test_report_status'),
+    path('reports/<int:pk>/file/', views.test_report_file, name='test_report_file'),
+    path('reports/<int:pk>/sections/', views.test_report_sections, name='test_report_sections'),
     path('test-runs/<int:pk>/generate-report/', views.generate_test_run_report, name='generate_test_run_report'),
     path('test-suite-runs/<int:pk>/generate-report/', views.generate_test_suite_run_report,
          name='generate_test_suite_run_report'),
@@ -150,6 +160,8 @@ urlpatterns = [
     # 调试相关URL
     path('debug/task-monitor/', debug_views.task_monitor, name='task_monitor'),
     path('debug/task-monitor-api/', debug_views.task_monitor_api, name='task_monitor_api'),
+    path('debug/worker-health/', debug_views.worker_health_api, name='worker_health_api'),
+    path('debug/blob-storage/', debug_views.blob_storage_api, name='blob_storage_api'),
     path('debug/sync-tasks/', debug_views.sync_tasks_api, name='sync_tasks_api'),
     path('debug/cleanup-tasks/', debug_views.cleanup_tasks_api, name='cleanup_tasks_api'),
     path('debug/sync-task/<int:task_id>/', debug_views.sync_single_task_api, name='sync_single_task_api'),
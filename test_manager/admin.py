@@ -6,7 +6,7 @@ from django.contrib.auth.models import AbstractUser
 
 from .models import (
     Project, Environment, TestCase, TestSuite,
-    TestRun, TestResult, TestReport, TestCaseGroup, TestSuiteGroup, EmailConfig
+    TestRun, TestResult, TestResultPayload, TestReport, TestCaseGroup, TestSuiteGroup, EmailConfig
 )
 
 
@@ -45,17 +45,33 @@ class TestRunAdmin(admin.ModelAdmin):
     list_per_page = 10
 
 
+class TestResultPayloadInline(admin.StackedInline):
+    model = TestResultPayload
+    can_delete = False
+    readonly_fields = ('request_headers', 'request_body', 'response_headers', 'extracted_params', 'validators')
+
+
 class TestResultAdmin(admin.ModelAdmin):
     list_display = ('test_run', 'test_case', 'status', 'response_time', 'response_status_code', 'created_at')
     search_fields = ('test_case__name', 'error_message')
     list_filter = ('test_run', 'status', 'created_at')
+    list_select_related = ('test_run', 'test_case')
     list_per_page = 10
+    # 载荷只在详情页展示
+    inlines = [TestResultPayloadInline]
+    readonly_fields = ('response_blob', 'response_size', 'response_body')
+
+    def response_body(self, obj):
+        return obj.response_body
+    response_body.short_description = '响应体'
 
 
 class TestReportAdmin(admin.ModelAdmin):
-    list_display = ('name', 'project', 'report_type', 'report_format', 'created_at')
+    list_display = ('name', 'project', 'report_type', 'report_format', 'generation_status', 'created_at')
     search_fields = ('name', 'summary')
-    list_filter = ('project', 'report_type', 'created_at')
+    list_filter = ('project', 'report_type', 'generation_status', 'created_at')
+    readonly_fields = ('generation_status', 'progress', 'processed_count', 'total_count', 'file_path', 'file_size',
+                       'generation_error', 'generated_at', 'section_offsets')
     # date_hierarchy = 'created_at'
 
 
@@ -63,6 +79,7 @@ class TestCaseGroupAdmin(admin.ModelAdmin):
     list_display = ('name', 'project', 'parent', 'created_at')
     search_fields = ('name', 'project')
     list_filter = ('project', 'created_at')
+    readonly_fields = ('path',)
     list_per_page = 10
 
 
@@ -70,6 +87,7 @@ class TestSuiteGroupAdmin(admin.ModelAdmin):
     list_display = ('name', 'project', 'parent', 'created_at')
     search_fields = ('name', 'project')
     list_filter = ('project', 'created_at')
+    readonly_fields = ('path',)
     list_per_page = 10
 
 
@@ -0,0 +1,313 @@
+import gzip
+import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import requests
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .capture import CapturePolicy
+from .httprunner_executor import execute_test_cases
+from .models import PAYLOAD_FIELDS
+from .throttle import set_backend
+
+logger = logging.getLogger(__name__)
+
+# 代理协议版本，注册时上报
+AGENT_VERSION = '1'
+
+# 提交给平台的结果字段，与外部执行器提交结果的格式相同
+RESULT_FIELDS = ('test_case_id', 'environment_id', 'status', 'response_time', 'throttle_wait',
+                 'response_status_code', 'error_message', 'response_body') + PAYLOAD_FIELDS
+
+
+class AgentError(Exception):
+    """与平台通信失败，重试后仍未成功"""
+
+
+class JobCancelled(Exception):
+    """任务的租约已被其他代理取得或任务已结束，停止执行"""
+
+
+class AgentClient:
+    """
+    执行代理调用平台接口的客户端，使用 Basic 认证
+
+    连接错误和5xx响应按 1、2、4 秒退避重试；409 表示租约已失效，抛出 JobCancelled
+    """
+
+    def __init__(self, server, username, password, timeout=30, retries=3):
+        self.base_url = server.rstrip('/') + '/api/'
+        self.session = requests.Session()
+        self.session.auth = (username, password)
+        self.timeout = timeout
+        self.retries = retries
+
+    def _request(self, method, path, **kwargs):
+        error = None
+        for attempt in range(self.retries + 1):
+            try:
+                response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+            except requests.RequestException as e:
+                error = e
+            else:
+                if response.status_code == 409:
+                    raise JobCancelled(response.json().get('error', '租约已失效'))
+                if response.status_code < 500:
+                    if response.status_code >= 400:
+                        raise AgentError(f"{method} {path}: HTTP {response.status_code} {response.text[:200]}")
+                    return response.json()
+                error = f"HTTP {response.status_code}"
+            if attempt < self.retries:
+                time.sleep(2 ** attempt)
+        raise AgentError(f"{method} {path}: {error}")
+
+    def register(self, name, hostname, labels, capacity):
+        return self._request('POST', 'agents/', json={
+            'name': name, 'hostname': hostname, 'labels': labels, 'capacity': capacity, 'version': AGENT_VERSION,
+        })
+
+    def heartbeat(self, agent_id, job_ids):
+        return self._request('POST', f'agents/{agent_id}/heartbeat/', json={'jobs': job_ids})['cancelled']
+
+    def lease(self, agent_id, max_jobs):
+        return self._request('POST', f'agents/{agent_id}/lease/', json={'max_jobs': max_jobs})['jobs']
+
+    def push_results(self, job, agent_id, rows, key):
+        """一批结果以 gzip 压缩的 NDJSON 提交，重试时使用相同的幂等键"""
+        body = ''.join(json.dumps(row, ensure_ascii=False, cls=DjangoJSONEncoder) + '\n' for row in rows)
+        return self._request(
+            'POST', f"agent-jobs/{job['id']}/results/",
+            params={'agent': agent_id, 'attempt': job['attempt']},
+            data=gzip.compress(body.encode('utf-8')),
+            headers={'Content-Type': 'application/x-ndjson', 'Content-Encoding': 'gzip', 'Idempotency-Key': key},
+        )
+
+    def permits(self, agent_id, environment_id, count):
+        return self._request('POST', f'agents/{agent_id}/permits/', json={
+            'environment_id': environment_id, 'count': count,
+        })
+
+    def complete(self, job, agent_id, error_message=''):
+        return self._request('POST', f"agent-jobs/{job['id']}/complete/", json={
+            'agent': agent_id, 'attempt': job['attempt'], 'error_message': error_message,
+        })
+
+
+def result_row(result, capture_policy=None):
+    """执行器返回的结果按保存策略处理后，只保留提交的字段"""
+    if capture_policy is not None:
+        result = capture_policy.apply(result)
+    return {name: result.get(name) for name in RESULT_FIELDS}
+
+
+class PermitBackend:
+    """
+    执行代理的限流计数器：令牌向平台批量申请，与平台的worker共用环境的令牌桶
+
+    申请到的令牌在本地缓存，1秒内未用完作废，避免代理囤积令牌超出每秒上限；
+    并发名额在领取任务时由平台按任务占用，这里不再占用
+    """
+
+    # 令牌在本地的有效时间(秒)
+    TOKEN_TTL = 1
+
+    def __init__(self, client, agent_id, batch=5):
+        self.client = client
+        self.agent_id = agent_id
+        self.batch = batch
+        self.tokens = {}  # 环境ID -> (剩余令牌数, 作废时间)
+        self.lock = threading.Lock()
+
+    def _cached(self, environment_id):
+        with self.lock:
+            tokens, expires_at = self.tokens.get(environment_id, (0, 0))
+            if tokens and time.monotonic() < expires_at:
+                self.tokens[environment_id] = (tokens - 1, expires_at)
+                return True
+        return False
+
+    def take(self, environment_id, rate, burst, count=1):
+        if self._cached(environment_id):
+            return 1, 0
+        data = self.client.permits(self.agent_id, environment_id, max(count, min(self.batch, burst)))
+        if not data['granted']:
+            return 0, data['wait_ms']
+        with self.lock:
+            now = time.monotonic()
+            tokens, expires_at = self.tokens.get(environment_id, (0, 0))
+            tokens = tokens if now < expires_at else 0
+            self.tokens[environment_id] = (tokens + data['granted'] - 1, now + self.TOKEN_TTL)
+        return 1, 0
+
+    def hold(self, environment_id, max_in_flight, member, ttl):
+        return True
+
+    def release(self, environment_id, member):
+        pass
+
+
+class _ResultUploader:
+    """缓存一个任务的结果，攒满 batch_size 条提交一批，批次序号作为幂等键"""
+
+    def __init__(self, client, job, agent_id, batch_size):
+        self.client = client
+        self.job = job
+        self.agent_id = agent_id
+        self.batch_size = batch_size
+        self.rows = []
+        self.batches = 0
+        self.count = 0
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        self.batches += 1
+        self.client.push_results(self.job, self.agent_id, self.rows, key=str(self.batches))
+        self.count += len(self.rows)
+        self.rows = []
+
+
+class Agent:
+    """
+    执行代理主循环：注册后按空闲容量领取任务，在线程池中用执行器执行，结果分批提交
+
+    后台线程定期上报心跳为执行中的任务续约；平台告知租约已失效的任务在当前用例结束后停止。
+    代理不访问数据库，任务内容和结果都通过HTTP传递
+    """
+
+    def __init__(self, client, name, labels, capacity=1, hostname='', batch_size=50, poll_interval=5,
+                 exit_when_idle=False, log=None):
+        self.client = client
+        self.name = name
+        self.labels = labels
+        self.capacity = max(1, capacity)
+        self.hostname = hostname
+        self.batch_size = max(1, batch_size)
+        self.poll_interval = poll_interval
+        self.exit_when_idle = exit_when_idle
+        self.log = log or (lambda message: logger.info(message))
+        self.agent_id = None
+        self.heartbeat_interval = 15
+        self.running = {}  # 任务ID -> 置位时停止执行的事件
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = threading.Event()
+        self.counts = {'completed': 0, 'failed': 0, 'cancelled': 0}
+
+    def register(self):
+        data = self.client.register(self.name, self.hostname, self.labels, self.capacity)
+        self.agent_id = data['id']
+        self.heartbeat_interval = data.get('heartbeat_interval', self.heartbeat_interval)
+        set_backend(PermitBackend(self.client, self.agent_id))
+        self.log(f"已注册执行代理 {self.name} (ID: {self.agent_id})，标签: {','.join(self.labels)}，"
+                 f"容量: {self.capacity}")
+
+    def run(self):
+        self.register()
+        threading.Thread(target=self._heartbeat_loop, name='agent-heartbeat', daemon=True).start()
+        try:
+            with ThreadPoolExecutor(max_workers=self.capacity, thread_name_prefix='agent-job') as pool:
+                try:
+                    self._lease_loop(pool)
+                except KeyboardInterrupt:
+                    self.log("停止领取任务，等待执行中的任务结束")
+        finally:
+            self.closed.set()
+        return self.counts
+
+    def _lease_loop(self, pool):
+        while True:
+            jobs = []
+            free = self.capacity - len(self.running)
+            if free > 0:
+                try:
+                    jobs = self.client.lease(self.agent_id, free)
+                except AgentError as e:
+                    logger.warning(f"领取任务失败: {e}")
+            for job in jobs:
+                with self.lock:
+                    self.running[job['id']] = threading.Event()
+                self.log(f"领取任务 {job['id']}: {job['name']}，{len(job['cases'])} 个用例，第 {job['attempt']} 次领取")
+                pool.submit(self._run_job, job)
+            if not jobs and not self.running and self.exit_when_idle:
+                return
+            if not jobs or len(self.running) >= self.capacity:
+                # 没有任务或容量已满时等待，任务结束会提前唤醒
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+
+    def _heartbeat_loop(self):
+        while not self.closed.wait(self.heartbeat_interval):
+            with self.lock:
+                job_ids = list(self.running)
+            try:
+                cancelled = self.client.heartbeat(self.agent_id, job_ids)
+            except (AgentError, JobCancelled) as e:
+                logger.warning(f"上报心跳失败: {e}")
+                continue
+            for job_id in cancelled:
+                with self.lock:
+                    stop = self.running.get(job_id)
+                if stop is not None:
+                    stop.set()
+
+    def _count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def _run_job(self, job):
+        try:
+            self._execute(job, self.running[job['id']])
+        except Exception as e:
+            logger.exception(f"执行任务出错: {job['id']}, {e}")
+        finally:
+            with self.lock:
+                self.running.pop(job['id'], None)
+            self.wakeup.set()
+
+    def _execute(self, job, stop):
+        environments = {env['id']: SimpleNamespace(**env) for env in job['environments']}
+        cases = [(SimpleNamespace(**case['test_case']), environments[case['environment_id']])
+                 for case in job['cases']]
+        capture_policy = CapturePolicy(**job['capture']) if job['capture'] else None
+        uploader = _ResultUploader(self.client, job, self.agent_id, self.batch_size)
+
+        def on_result(result):
+            uploader.add(result_row(result, capture_policy))
+            if stop.is_set():
+                raise JobCancelled("租约已失效")
+
+        started = time.monotonic()
+        error_message = ''
+        try:
+            execute_test_cases(cases, capture_policy, on_result)
+            uploader.flush()
+        except JobCancelled as e:
+            self._count('cancelled')
+            self.log(f"任务 {job['id']} 已停止: {e}")
+            return
+        except Exception as e:
+            error_message = f"执行出错: {str(e)}"
+            try:
+                uploader.flush()
+            except (AgentError, JobCancelled) as flush_error:
+                logger.warning(f"提交剩余结果失败: {job['id']}, {flush_error}")
+
+        try:
+            outcome = self.client.complete(job, self.agent_id, error_message)
+        except JobCancelled as e:
+            self._count('cancelled')
+            self.log(f"任务 {job['id']} 已停止: {e}")
+            return
+        self._count('completed' if outcome['status'] == 'completed' else 'failed')
+        self.log(f"任务 {job['id']} 完成: {outcome['status']}，{uploader.count} 条结果，"
+                 f"耗时 {time.monotonic() - started:.2f}s")
@@ -0,0 +1,352 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .capture import CapturePolicy
+from .httprunner_executor import suite_cases
+from .ingest import finish_run, ingest_results
+from .models import AgentJob, Environment, RunnerAgent, TestResult, TestRun
+from .runs import FINISHED_STATUSES
+from .throttle import hold_slot, limits, release_slot, take_tokens
+
+logger = logging.getLogger(__name__)
+
+# 下发给代理的测试用例字段，即执行器读取的字段
+CASE_FIELDS = ('id', 'name', 'request_method', 'request_url', 'request_headers', 'request_body',
+               'request_body_format', 'expected_status_code', 'validation_rules', 'extract_params')
+
+ENVIRONMENT_FIELDS = ('id', 'name', 'base_url', 'variables', 'rate_limit', 'rate_burst', 'max_in_flight')
+
+
+class LeaseLost(Exception):
+    """任务的租约已被其他代理取得或任务已结束，持有旧租约的代理应停止执行"""
+
+
+def lease_ttl():
+    return getattr(settings, 'AGENT_LEASE_TTL', 60)
+
+
+def heartbeat_interval():
+    return getattr(settings, 'AGENT_HEARTBEAT_INTERVAL', 15)
+
+
+def max_attempts():
+    return max(1, getattr(settings, 'AGENT_MAX_ATTEMPTS', 3))
+
+
+# 入队
+
+def enqueue_job(test_run, test_case_id=None, case_environments=None):
+    """测试运行交给执行代理，代理轮询领取，不需要等事务提交后再提交任务"""
+    job = AgentJob.objects.create(
+        test_run=test_run,
+        label=test_run.environment.agent_label,
+        test_case_id=test_case_id,
+        case_environments=case_environments or {},
+    )
+    logger.info(f"测试运行交给执行代理: {test_run.id}, 标签: {job.label}")
+    return job
+
+
+def enqueue_suite_run(suite_run):
+    """批量运行的每个子运行一个代理任务，并发由领取任务的代理数量和容量决定"""
+    test_runs = TestRun.objects.filter(suite_run=suite_run, status='pending').order_by('id')
+    AgentJob.objects.bulk_create([
+        AgentJob(test_run=test_run, label=suite_run.environment.agent_label) for test_run in test_runs
+    ])
+
+
+# 注册和心跳
+
+def register_agent(user, name, hostname='', labels=(), capacity=1, version=''):
+    """注册或更新同名代理；同名代理重启后，之前持有的任务交还队列"""
+    now = timezone.now()
+    agent, created = RunnerAgent.objects.update_or_create(name=name, defaults={
+        'hostname': hostname,
+        'labels': list(labels),
+        'capacity': max(1, capacity),
+        'version': version,
+        'registered_by': user,
+        'started_at': now,
+        'last_heartbeat': now,
+    })
+    held = AgentJob.objects.filter(agent=agent, status='leased')
+    for job_id in held.values_list('id', flat=True):
+        _release_slots(job_id)
+    requeued = held.update(status='queued', agent=None, lease_expires_at=None)
+    logger.info(f"执行代理{'注册' if created else '重新注册'}: {agent.name}, 标签: {agent.labels}, "
+                f"容量: {agent.capacity}, 交还任务: {requeued}")
+    return agent
+
+
+def heartbeat(agent, job_ids):
+    """
+    代理心跳，为代理仍持有的任务续约
+
+    返回 job_ids 中已不归该代理所有的任务ID（租约被其他代理取得或任务已结束），代理应停止执行这些任务
+    """
+    now = timezone.now()
+    RunnerAgent.objects.filter(pk=agent.pk).update(last_heartbeat=now)
+    job_ids = set(job_ids)
+    held = set(AgentJob.objects.filter(agent=agent, status='leased', id__in=job_ids).values_list('id', flat=True))
+    if held:
+        AgentJob.objects.filter(agent=agent, status='leased', id__in=held).update(
+            lease_expires_at=now + timedelta(seconds=lease_ttl()))
+        _renew_slots(held)
+    return sorted(job_ids - held)
+
+
+# 领取
+
+def lease_jobs(agent, max_jobs):
+    """
+    为代理领取最多 max_jobs 个标签匹配的任务，返回任务内容列表
+
+    等待领取和租约已过期的任务都可以领取，条件UPDATE保证同一任务只会被一个代理取得
+    """
+    now = timezone.now()
+    RunnerAgent.objects.filter(pk=agent.pk).update(last_heartbeat=now)
+    if not agent.labels or max_jobs < 1:
+        return []
+
+    leasable = Q(status='queued') | Q(status='leased', lease_expires_at__lte=now)
+    candidates = list(AgentJob.objects.filter(leasable, label__in=agent.labels).order_by('id').values_list(
+        'id', flat=True)[:max_jobs])
+    specs = []
+    for job_id in candidates:
+        if not AgentJob.objects.filter(leasable, pk=job_id).update(
+                status='leased', agent=agent, attempt=F('attempt') + 1, leased_at=now,
+                lease_expires_at=now + timedelta(seconds=lease_ttl())):
+            continue
+        job = AgentJob.objects.select_related(
+            'test_run__environment', 'test_run__test_suite', 'test_case').get(pk=job_id)
+        try:
+            spec = _start_job(job)
+        except Exception as e:
+            logger.error(f"代理任务内容生成失败: {job_id}, {e}")
+            _fail_job(job, f"执行出错: {str(e)}")
+            continue
+        if spec is not None:
+            specs.append(spec)
+    if specs:
+        logger.info(f"执行代理 {agent.name} 领取任务: {[spec['id'] for spec in specs]}")
+    return specs
+
+
+def _start_job(job):
+    test_run = job.test_run
+    if test_run.status in FINISHED_STATUSES:
+        AgentJob.objects.filter(pk=job.pk).update(status='finished', finished_at=timezone.now(),
+                                                  lease_expires_at=None)
+        return None
+    if job.attempt > max_attempts():
+        _fail_job(job, f"执行代理失联，任务已领取 {max_attempts()} 次")
+        return None
+    spec = job_spec(job)
+    if not _hold_slots(job, spec['environments']):
+        # 环境的并发名额已满，任务交还队列，这次领取不计入领取次数
+        AgentJob.objects.filter(pk=job.pk, attempt=job.attempt).update(
+            status='queued', agent=None, attempt=F('attempt') - 1, lease_expires_at=None)
+        return None
+    if job.attempt > 1:
+        # 失联代理提交的部分结果作废，由新的代理从头执行
+        TestResult.objects.filter(test_run=test_run).delete()
+        logger.warning(f"代理任务重新领取: {job.id}, 第 {job.attempt} 次, 测试运行: {test_run.id}")
+    TestRun.objects.filter(pk=test_run.pk, status='pending').update(status='running', start_time=timezone.now())
+    return spec
+
+
+def job_spec(job):
+    """
+    下发给代理的任务内容：按顺序执行的用例、用到的环境和载荷保存策略
+
+    代理不访问数据库，套件中各用例的环境在这里确定
+    """
+    test_run = job.test_run
+    environment = test_run.environment
+    capture_policy = None
+    if test_run.test_suite_id:
+        case_environments = {int(k): int(v) for k, v in job.case_environments.items()}
+        cases = suite_cases(test_run.test_suite, environment, case_environments)
+        capture_policy = CapturePolicy.for_suite(test_run.test_suite)
+    elif job.test_case_id:
+        cases = [(job.test_case, environment)]
+    else:
+        cases = []
+
+    environments = {environment.id: environment}
+    environments.update((case_environment.id, case_environment) for _, case_environment in cases)
+    return {
+        'id': job.id,
+        'attempt': job.attempt,
+        'test_run': test_run.id,
+        'name': test_run.name,
+        'lease_expires_at': job.lease_expires_at,
+        'capture': {
+            'mode': capture_policy.mode,
+            'max_bytes': capture_policy.max_bytes,
+            'keep_headers': capture_policy.keep_headers,
+        } if capture_policy else None,
+        'environments': [{name: getattr(env, name) for name in ENVIRONMENT_FIELDS} for env in environments.values()],
+        'cases': [
+            {'environment_id': case_environment.id,
+             'test_case': {name: getattr(test_case, name) for name in CASE_FIELDS}}
+            for test_case, case_environment in cases
+        ],
+    }
+
+
+# 限流
+
+def grant_tokens(environment, count):
+    """
+    代理申请向环境发送请求的令牌，从所有执行器共用的令牌桶中扣除，一次最多取令牌桶容量个
+
+    返回 (取得数, 令牌不足时还需等待的毫秒数)；环境未限制每秒请求数时全部发放
+    """
+    rate, burst, _ = limits(environment)
+    if not rate:
+        return count, 0
+    return take_tokens(environment.id, rate, burst, min(count, burst))
+
+
+def _slot_member(job_id):
+    return f'agent-job-{job_id}'
+
+
+def _hold_slots(job, environments):
+    """
+    为任务用到的、限制了并发请求数的环境各占用一个名额，名额随租约续期
+
+    代理按用例顺序执行任务，一个任务同时只有一个请求；任一环境已满时归还已占用的名额并返回False
+    """
+    member = _slot_member(job.pk)
+    held = []
+    for environment in environments:
+        if not environment['max_in_flight']:
+            continue
+        if not hold_slot(environment['id'], environment['max_in_flight'], member, lease_ttl()):
+            for environment_id in held:
+                release_slot(environment_id, member)
+            return False
+        held.append(environment['id'])
+    AgentJob.objects.filter(pk=job.pk).update(throttled_environments=held)
+    return True
+
+
+def _renew_slots(job_ids):
+    jobs = [(job_id, environment_ids) for job_id, environment_ids in AgentJob.objects.filter(
+        id__in=job_ids).values_list('id', 'throttled_environments') if environment_ids]
+    if not jobs:
+        return
+    limits = dict(Environment.objects.filter(
+        id__in={environment_id for _, environment_ids in jobs for environment_id in environment_ids}
+    ).values_list('id', 'max_in_flight'))
+    for job_id, environment_ids in jobs:
+        for environment_id in environment_ids:
+            if limits.get(environment_id) and not hold_slot(
+                    environment_id, limits[environment_id], _slot_member(job_id), lease_ttl()):
+                logger.warning(f"代理任务的并发名额续期失败: {job_id}, 环境: {environment_id}")
+
+
+def _release_slots(job_id):
+    environment_ids = AgentJob.objects.filter(pk=job_id).values_list('throttled_environments', flat=True).first()
+    for environment_id in environment_ids or []:
+        release_slot(environment_id, _slot_member(job_id))
+
+
+# 提交结果和结束
+
+def _held_job(job_id, agent_id, attempt, allow_finished=False):
+    """锁定任务并确认租约仍归该代理的这次领取所有；allow_finished 时也接受这次领取已结束的任务"""
+    job = AgentJob.objects.select_for_update().get(pk=job_id)
+    statuses = ('leased', 'finished') if allow_finished else ('leased',)
+    if job.status not in statuses or job.agent_id != agent_id or job.attempt != attempt:
+        raise LeaseLost(f"任务 {job_id} 的租约已失效")
+    return job
+
+
+def submit_results(job_id, agent_id, attempt, stream, key=''):
+    """
+    代理提交一批 NDJSON 格式的测试结果，写入方式与外部执行器提交相同
+
+    key 按领取次数区分，重新领取后的提交不会被当作旧租约的重试；提交结果同时续约
+    """
+    with transaction.atomic():
+        job = _held_job(job_id, agent_id, attempt)
+        outcome = ingest_results(job.test_run_id, stream, key=f"agent-{attempt}-{key}" if key else '')
+        job.lease_expires_at = timezone.now() + timedelta(seconds=lease_ttl())
+        job.save(update_fields=['lease_expires_at'])
+    return outcome
+
+
+def complete_job(job_id, agent_id, attempt, error_message=''):
+    """
+    代理执行完毕，按已提交的结果结束测试运行；error_message 非空时记为失败
+
+    同一次领取重复结束时直接返回测试运行，代理没收到响应而重试时不会被当作租约失效
+    """
+    with transaction.atomic():
+        job = _held_job(job_id, agent_id, attempt, allow_finished=True)
+        test_run = TestRun.objects.select_for_update().get(pk=job.test_run_id)
+        if job.status == 'finished':
+            return test_run
+        if test_run.status not in FINISHED_STATUSES:
+            finish_run(test_run, error_message)
+        job.status = 'finished'
+        job.finished_at = timezone.now()
+        job.lease_expires_at = None
+        job.save(update_fields=['status', 'finished_at', 'lease_expires_at'])
+    _release_slots(job_id)
+    _finish_suite_run(test_run)
+    logger.info(f"代理任务执行完成: {job_id}, 测试运行: {test_run.id}, 状态: {test_run.status}")
+    return test_run
+
+
+def _fail_job(job, message):
+    with transaction.atomic():
+        test_run = TestRun.objects.select_for_update().get(pk=job.test_run_id)
+        if test_run.status not in FINISHED_STATUSES:
+            # 通过 save() 结束运行，触发每日汇总
+            test_run.status = 'failed'
+            test_run.error_message = message
+            test_run.start_time = test_run.start_time or timezone.now()
+            test_run.end_time = timezone.now()
+            test_run.save()
+        AgentJob.objects.filter(pk=job.pk).update(status='finished', finished_at=timezone.now(),
+                                                  lease_expires_at=None)
+    _release_slots(job.pk)
+    logger.warning(f"代理任务失败: {job.pk}, 测试运行: {test_run.id}, {message}")
+    _finish_suite_run(test_run)
+
+
+def _finish_suite_run(test_run):
+    if test_run.suite_run_id:
+        from .suite_runs import finish_suite_run_if_done
+        finish_suite_run_if_done(test_run.suite_run_id)
+
+
+def expire_leases():
+    """
+    定期检查代理任务：租约过期的任务交还队列，领取次数用完的任务结束为失败，
+    测试运行已结束的任务标记为结束，持有它的代理在下次心跳时停止执行
+
+    租约过期的任务不经过这里也能被重新领取，这里让状态及时可见并保证失联任务最终结束。
+    返回 (交还队列数, 失败数)
+    """
+    now = timezone.now()
+    expired = AgentJob.objects.filter(status='leased', lease_expires_at__lte=now)
+    failed = 0
+    for job in expired.filter(attempt__gte=max_attempts()):
+        _fail_job(job, f"执行代理失联，任务已领取 {max_attempts()} 次")
+        failed += 1
+    requeued = expired.filter(attempt__lt=max_attempts()).update(status='queued', agent=None,
+                                                                 lease_expires_at=None)
+    AgentJob.objects.exclude(status='finished').filter(test_run__status__in=FINISHED_STATUSES).update(
+        status='finished', finished_at=now, lease_expires_at=None)
+    if requeued or failed:
+        logger.warning(f"代理任务租约过期: 交还队列 {requeued} 个, 失败 {failed} 个")
+    return requeued, failed
@@ -1,78 +1,218 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from test_manager.models import (
     Project, Environment, TestCase, TestSuite,
-    TestSuiteCase, TestRun, TestResult
+    TestSuiteCase, TestRun, TestResult, TestResultPayload, TestSuiteRun, RunnerAgent, AgentJob
 )
 
 
-class UserSerializer(serializers.ModelSerializer):
+def split_param(value):
+    """逗号分隔的查询参数，返回去重后的名称列表"""
+    names = []
+    for name in (value or '').split(','):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def _top_names(names):
+    """a.b 形式的名称取第一级"""
+    return {name.split('.', 1)[0] for name in names}
+
+
+def _nested_names(names, prefix):
+    """取出 prefix.xxx 形式的下一级名称"""
+    return [name[len(prefix) + 1:] for name in names if name.startswith(prefix + '.')]
+
+
+def _reverse_field_name(model, accessor):
+    """一对多反向关联对应的外键字段名，预取的子查询集要读取这一列才能归到上一级对象"""
+    for relation in model._meta.related_objects:
+        if relation.one_to_many and relation.get_accessor_name() == accessor:
+            return relation.field.name
+    return None
+
+
+class DynamicFieldsMixin:
+    """
+    支持按需选择字段和展开关联对象的序列化器
+
+    ?fields=id,status 只返回列出的字段；?expand=test_case 把 Meta.expandable_fields 中声明的
+    关联字段由ID替换为嵌套对象，多级用点号，例如 ?expand=test_suite_cases.test_case&fields=id,test_suite_cases.order。
+    默认只返回本表字段，关联对象都以ID表示
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 只有顶层序列化器读取请求参数，嵌套的序列化器由上一级传入
+        request = self.context.get('request')
+        if request is not None and fields is None and expand is None:
+            fields = split_param(request.query_params.get('fields'))
+            expand = split_param(request.query_params.get('expand'))
+        fields = fields or []
+        expand = expand or []
+
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name in _top_names(expand):
+            if name in expandable:
+                serializer_class, options = expandable[name]
+                self.fields[name] = serializer_class(fields=_nested_names(fields, name),
+                                                     expand=_nested_names(expand, name),
+                                                     read_only=True, **options)
+
+        if fields:
+            for name in set(self.fields) - _top_names(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def related_lookups(cls, fields=None, expand=None, prefix=''):
+        """
+        展开项需要的关联查询，返回 (select_related 路径列表, Prefetch 列表)
+
+        外键一路 select_related，遇到一对多时改用 Prefetch，子查询集按下一级的展开项继续优化
+        """
+        fields = fields or []
+        expand = expand or []
+        expandable = getattr(cls.Meta, 'expandable_fields', {})
+        top_fields = _top_names(fields)
+        select, prefetch = [], []
+        for name in _top_names(expand):
+            if name not in expandable or (top_fields and name not in top_fields):
+                continue
+            serializer_class, options = expandable[name]
+            lookup = prefix + options.get('source', name)
+            nested_fields = _nested_names(fields, name)
+            nested_expand = _nested_names(expand, name)
+            if options.get('many'):
+                reverse_field = _reverse_field_name(cls.Meta.model, options.get('source', name))
+                queryset = serializer_class.optimize_queryset(
+                    serializer_class.Meta.model._default_manager.all(), nested_fields, nested_expand,
+                    always_load=(reverse_field,) if reverse_field else ())
+                prefetch.append(Prefetch(lookup, queryset=queryset))
+            else:
+                select.append(lookup)
+                nested_select, nested_prefetch = serializer_class.related_lookups(
+                    nested_fields, nested_expand, prefix=lookup + '__')
+                select.extend(nested_select)
+                prefetch.extend(nested_prefetch)
+        return select, prefetch
+
+    @classmethod
+    def optimize_queryset(cls, queryset, fields=None, expand=None, always_load=()):
+        """
+        按请求的字段和展开项调整查询集
+
+        请求的字段都对应本表的列时用 only() 只读取这些列，always_load 为分页等额外需要的列
+        """
+        select, prefetch = cls.related_lookups(fields, expand)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+
+        if fields:
+            expandable = getattr(cls.Meta, 'expandable_fields', {})
+            columns = {field.name for field in cls.Meta.model._meta.concrete_fields}
+            selected = set(always_load)
+            for name in _top_names(fields):
+                if name in expandable:
+                    if expandable[name][1].get('many'):
+                        continue
+                    source = expandable[name][1].get('source', name)
+                else:
+                    declared = cls._declared_fields.get(name)
+                    source = declared.source if declared is not None and declared.source else name
+                if source not in columns:
+                    # 请求了计算字段，无法确定它依赖哪些列，读取全部列
+                    return queryset
+                selected.add(source)
+            queryset = queryset.only(cls.Meta.model._meta.pk.name, *selected)
+        return queryset
+
+
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name']
 
 
-class ProjectSerializer(serializers.ModelSerializer):
-    created_by = UserSerializer(read_only=True)
-
+class ProjectSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Project
         fields = '__all__'
         read_only_fields = ['created_by']
+        expandable_fields = {
+            'created_by': (UserSerializer, {}),
+        }
 
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         return super().create(validated_data)
 
 
-class EnvironmentSerializer(serializers.ModelSerializer):
+class EnvironmentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Environment
         fields = '__all__'
+        expandable_fields = {
+            'project': (ProjectSerializer, {}),
+        }
 
 
-class TestCaseSerializer(serializers.ModelSerializer):
-    created_by = UserSerializer(read_only=True)
-
+class TestCaseSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = TestCase
         fields = '__all__'
         read_only_fields = ['created_by']
+        expandable_fields = {
+            'project': (ProjectSerializer, {}),
+            'created_by': (UserSerializer, {}),
+        }
 
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         return super().create(validated_data)
 
 
-class TestSuiteCaseSerializer(serializers.ModelSerializer):
-    test_case_details = TestCaseSerializer(source='test_case', read_only=True)
-
+class TestSuiteCaseSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = TestSuiteCase
-        fields = ['id', 'test_case', 'test_case_details', 'order']
-
+        fields = ['id', 'test_case', 'environment', 'order']
+        expandable_fields = {
+            'test_case': (TestCaseSerializer, {}),
+            'environment': (EnvironmentSerializer, {}),
+        }
 
-class TestSuiteSerializer(serializers.ModelSerializer):
-    created_by = UserSerializer(read_only=True)
-    test_suite_cases = TestSuiteCaseSerializer(source='testsuitecase_set', many=True, read_only=True)
 
+class TestSuiteSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = TestSuite
-        fields = ['id', 'name', 'project', 'description', 'created_at', 'updated_at', 'created_by', 'test_suite_cases']
+        fields = ['id', 'name', 'project', 'description', 'created_at', 'updated_at', 'created_by']
         read_only_fields = ['created_by']
+        expandable_fields = {
+            'project': (ProjectSerializer, {}),
+            'created_by': (UserSerializer, {}),
+            'test_suite_cases': (TestSuiteCaseSerializer, {'source': 'testsuitecase_set', 'many': True}),
+        }
 
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
         return super().create(validated_data)
 
 
-class TestRunSerializer(serializers.ModelSerializer):
-    created_by = UserSerializer(read_only=True)
-
+class TestRunSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = TestRun
         fields = '__all__'
         read_only_fields = ['created_by', 'status', 'start_time', 'end_time']
+        expandable_fields = {
+            'project': (ProjectSerializer, {}),
+            'test_suite': (TestSuiteSerializer, {}),
+            'environment': (EnvironmentSerializer, {}),
+            'created_by': (UserSerializer, {}),
+        }
 
     def create(self, validated_data):
         validated_data['created_by'] = self.context['request'].user
@@ -80,9 +220,63 @@ class TestRunSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class TestResultSerializer(serializers.ModelSerializer):
-    test_case_details = TestCaseSerializer(source='test_case', read_only=True)
+class TestSuiteRunSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = TestSuiteRun
+        fields = ['id', 'name', 'project', 'test_suite', 'environment', 'status', 'total_count',
+                  'start_time', 'end_time', 'created_at', 'created_by']
+        read_only_fields = fields
+        expandable_fields = {
+            'project': (ProjectSerializer, {}),
+            'environment': (EnvironmentSerializer, {}),
+            'created_by': (UserSerializer, {}),
+            'test_runs': (TestRunSerializer, {'many': True}),
+        }
+
+
+class RunnerAgentSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    is_online = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = RunnerAgent
+        fields = ['id', 'name', 'hostname', 'labels', 'capacity', 'version', 'registered_by',
+                  'started_at', 'last_heartbeat', 'is_online']
+        read_only_fields = ['registered_by', 'started_at', 'last_heartbeat']
+        expandable_fields = {
+            'registered_by': (UserSerializer, {}),
+        }
+
 
+class AgentJobSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    class Meta:
+        model = AgentJob
+        fields = ['id', 'test_run', 'label', 'status', 'agent', 'attempt', 'lease_expires_at',
+                  'created_at', 'leased_at', 'finished_at']
+        read_only_fields = fields
+        expandable_fields = {
+            'test_run': (TestRunSerializer, {}),
+            'agent': (RunnerAgentSerializer, {}),
+        }
+
+
+class TestResultSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = TestResult
-        fields = '__all__'
+        fields = '__all__'
+        expandable_fields = {
+            'test_run': (TestRunSerializer, {}),
+            'test_case': (TestCaseSerializer, {}),
+            'environment': (EnvironmentSerializer, {}),
+        }
+
+
+class TestResultPayloadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TestResultPayload
+        exclude = ['result']
+
+
+class TestResultDetailSerializer(TestResultSerializer):
+    """单个测试结果，包含请求和响应载荷"""
+    payload = TestResultPayloadSerializer(source='get_payload', read_only=True)
+    response_body = serializers.JSONField(read_only=True)
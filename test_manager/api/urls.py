@@ -2,7 +2,8 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     ProjectViewSet, EnvironmentViewSet, TestCaseViewSet,
-    TestSuiteViewSet, TestRunViewSet, TestResultViewSet
+    TestSuiteViewSet, TestRunViewSet, TestResultViewSet, TestSuiteRunViewSet,
+    RunnerAgentViewSet, AgentJobViewSet
 )
 
 router = DefaultRouter()
@@ -12,6 +13,9 @@ router.register(r'test-cases', TestCaseViewSet)
 router.register(r'test-suites', TestSuiteViewSet)
 router.register(r'test-runs', TestRunViewSet)
 router.register(r'test-results', TestResultViewSet)
+router.register(r'test-suite-runs', TestSuiteRunViewSet)
+router.register(r'agents', RunnerAgentViewSet)
+router.register(r'agent-jobs', AgentJobViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -3,17 +3,24 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
+from django.urls import reverse
 from test_manager.models import (
     Project, Environment, TestCase, TestSuite,
-    TestSuiteCase, TestRun, TestResult
+    TestSuiteCase, TestRun, TestResult, TestSuiteRun, RunnerAgent, AgentJob
 )
 from .serializers import (
     ProjectSerializer, EnvironmentSerializer, TestCaseSerializer,
     TestSuiteSerializer, TestSuiteCaseSerializer, TestRunSerializer,
-    TestResultSerializer
+    TestResultSerializer, TestResultDetailSerializer, TestSuiteRunSerializer,
+    RunnerAgentSerializer, AgentJobSerializer, split_param
 )
-from test_manager.httprunner_executor import execute_test_case, execute_test_suite
+from test_manager import agents
+from test_manager.pagination import KeysetPagination
+from test_manager.exports import EXPORT_FORMATS, export_filename, export_response, filter_results
+from test_manager.forms import SuiteRunForm
+from test_manager.ingest import IngestError, ingest_results, open_stream
+from test_manager.runs import dispatch_test_run, get_run_status, wait_for_run_status
+from test_manager.suite_runs import get_suite_run_status, launch_suite_run
 
 
 # 自定义分页类
@@ -23,7 +30,47 @@ class StandardResultsSetPagination(PageNumberPagination):
     max_page_size = 100
 
 
-class ProjectViewSet(viewsets.ModelViewSet):
+def run_accepted_response(request, test_run):
+    """测试运行已提交，返回 202，Location 为状态查询地址"""
+    status_url = request.build_absolute_uri(reverse('testrun-run-status', args=[test_run.pk]))
+    return Response(
+        {"id": test_run.pk, "status": test_run.status, "status_url": status_url},
+        status=status.HTTP_202_ACCEPTED,
+        headers={"Location": status_url},
+    )
+
+
+def ingest_error_response(error):
+    """提交结果被拒绝：运行已结束返回 409，超过大小上限返回 413，其他返回 400"""
+    if error.conflict:
+        code = status.HTTP_409_CONFLICT
+    elif error.too_large:
+        code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    else:
+        code = status.HTTP_400_BAD_REQUEST
+    return Response({"error": str(error)}, status=code)
+
+
+class SparseFieldsMixin:
+    """
+    按 ?fields= 和 ?expand= 优化视图集的查询集
+
+    展开的关联对象联表或预取，只请求本表字段时只读取对应的列；
+    always_load_fields 为分页需要读取的列
+    """
+    always_load_fields = ()
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return self.get_serializer_class().optimize_queryset(
+            queryset,
+            split_param(self.request.query_params.get('fields')),
+            split_param(self.request.query_params.get('expand')),
+            always_load=self.always_load_fields,
+        )
+
+
+class ProjectViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Project.objects.all()
     serializer_class = ProjectSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -33,7 +80,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
         return Project.objects.all().order_by('-created_at')
 
 
-class EnvironmentViewSet(viewsets.ModelViewSet):
+class EnvironmentViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = Environment.objects.all()
     serializer_class = EnvironmentSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -46,7 +93,7 @@ class EnvironmentViewSet(viewsets.ModelViewSet):
         return Environment.objects.all().order_by('-created_at')
 
 
-class TestCaseViewSet(viewsets.ModelViewSet):
+class TestCaseViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = TestCase.objects.all()
     serializer_class = TestCaseSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -60,6 +107,7 @@ class TestCaseViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def run(self, request, pk=None):
+        """提交测试用例执行，返回 202 和状态查询地址"""
         test_case = self.get_object()
         environment_id = request.data.get('environment_id')
 
@@ -73,41 +121,16 @@ class TestCaseViewSet(viewsets.ModelViewSet):
             name=f"Single run: {test_case.name}",
             project=test_case.project,
             environment=environment,
-            status='running',
-            start_time=timezone.now(),
+            status='pending',
+            total_count=1,
             created_by=request.user
         )
 
-        # Execute the test case
-        result = execute_test_case(test_case, environment)
-
-        # Update test run
-        test_run.status = 'completed' if result['status'] == 'passed' else 'failed'
-        test_run.end_time = timezone.now()
-        test_run.save()
-
-        # Create test result
-        test_result = TestResult.objects.create(
-            test_run=test_run,
-            test_case=test_case,
-            environment=environment,
-            status=result['status'],
-            request_headers=result.get('request_headers', {}),  # 保存请求头
-            request_body=result.get('request_body'),  # 保存请求体
-            response_time=result.get('response_time'),
-            response_status_code=result.get('response_status_code'),
-            response_headers=result.get('response_headers', {}),
-            response_body=result.get('response_body'),
-            error_message=result.get('error_message', ''),
-            extracted_params=result.get('extracted_params', {}),
-            validators=result.get('validators', [])
-        )
-
-        serializer = TestResultSerializer(test_result)
-        return Response(serializer.data)
+        dispatch_test_run(test_run, test_case_id=test_case.id)
+        return run_accepted_response(request, test_run)
 
 
-class TestSuiteViewSet(viewsets.ModelViewSet):
+class TestSuiteViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = TestSuite.objects.all()
     serializer_class = TestSuiteSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -209,44 +232,16 @@ class TestSuiteViewSet(viewsets.ModelViewSet):
             project=test_suite.project,
             test_suite=test_suite,
             environment=default_environment,  # 默认环境
-            status='running',
-            start_time=timezone.now(),
+            status='pending',
+            total_count=test_suite.testsuitecase_set.count(),
             created_by=request.user
         )
 
-        # Execute the test suite with custom environments
-        results = execute_test_suite(test_suite, default_environment, case_environments)
-
-        # Create test results
-        for result in results:
-            # 获取测试用例使用的环境
-            environment_id = result.get('environment_id', default_environment_id)
-            environment = get_object_or_404(Environment, id=environment_id)
-
-            TestResult.objects.create(
-                test_run=test_run,
-                test_case_id=result['test_case_id'],
-                environment=environment,
-                status=result['status'],
-                response_time=result.get('response_time'),
-                response_status_code=result.get('response_status_code'),
-                response_headers=result.get('response_headers', {}),
-                response_body=result.get('response_body'),
-                error_message=result.get('error_message', ''),
-                extracted_params=result.get('extracted_params', {})
-            )
-
-        # Update test run
-        failed_results = [r for r in results if r['status'] != 'passed']
-        test_run.status = 'failed' if failed_results else 'completed'
-        test_run.end_time = timezone.now()
-        test_run.save()
-
-        serializer = TestRunSerializer(test_run)
-        return Response(serializer.data)
+        dispatch_test_run(test_run, case_environments=case_environments)
+        return run_accepted_response(request, test_run)
 
 
-class TestRunViewSet(viewsets.ModelViewSet):
+class TestRunViewSet(SparseFieldsMixin, viewsets.ModelViewSet):
     queryset = TestRun.objects.all()
     serializer_class = TestRunSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -258,27 +253,339 @@ class TestRunViewSet(viewsets.ModelViewSet):
             return TestRun.objects.filter(project_id=project_id).order_by('-created_at')
         return TestRun.objects.all().order_by('-created_at')
 
+    @action(detail=True, methods=['get'], url_path='status')
+    def run_status(self, request, pk=None):
+        """
+        测试运行的状态和进度，只返回计数，不读取测试结果
+
+        ?wait=N 长轮询，最多等待N秒（不超过 RUN_STATUS_MAX_WAIT），运行结束或 ?since= 给出的已完成数变化时立即返回
+        """
+        try:
+            wait = float(request.query_params.get('wait', 0))
+            since = request.query_params.get('since')
+            since = int(since) if since not in (None, '') else None
+        except ValueError:
+            return Response({"error": "wait and since must be numbers"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 先确认运行存在，同时检查访问权限
+        self.get_object()
+        if wait > 0:
+            run_status = wait_for_run_status(pk, wait, since)
+        else:
+            run_status = get_run_status(pk)
+        if run_status is None:
+            return Response(status=status.HTTP_404_NOT_FOUND)
+        return Response(run_status)
+
+    @action(detail=True, methods=['post'])
+    def ingest(self, request, pk=None):
+        """
+        外部执行器批量提交测试结果，请求体为 NDJSON，每行一条结果，可 gzip 压缩
+
+        Idempotency-Key 请求头为批次的幂等键，重试时不会重复写入；?finish=1 写入后结束测试运行
+        """
+        test_run = self.get_object()
+        stream = request.stream
+        if stream is None:
+            return Response({"error": "Request body is empty"}, status=status.HTTP_400_BAD_REQUEST)
+
+        key = request.headers.get('Idempotency-Key', '').strip()
+        if len(key) > 100:
+            return Response({"error": "Idempotency-Key is too long"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            outcome = ingest_results(
+                test_run.pk,
+                open_stream(stream, request.headers.get('Content-Encoding', '')),
+                key=key,
+                finish=request.query_params.get('finish') == '1',
+            )
+        except IngestError as e:
+            return ingest_error_response(e)
+        except (OSError, EOFError) as e:
+            # gzip 内容损坏
+            return Response({"error": f"Invalid request body: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(outcome, status=status.HTTP_200_OK if outcome['replayed'] else status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['get'])
     def results(self, request, pk=None):
         test_run = self.get_object()
-        results = TestResult.objects.filter(test_run=test_run)
+        results = TestResultSerializer.optimize_queryset(
+            TestResult.objects.filter(test_run=test_run),
+            split_param(request.query_params.get('fields')),
+            split_param(request.query_params.get('expand')),
+            always_load=('created_at',),
+        )
 
-        # 使用分页
-        paginator = StandardResultsSetPagination()
+        # 按 (created_at, id) 游标分页
+        paginator = KeysetPagination()
         paginated_results = paginator.paginate_queryset(results, request)
 
-        serializer = TestResultSerializer(paginated_results, many=True)
+        serializer = TestResultSerializer(paginated_results, many=True, context=self.get_serializer_context())
         return paginator.get_paginated_response(serializer.data)
 
 
-class TestResultViewSet(viewsets.ReadOnlyModelViewSet):
+class TestSuiteRunViewSet(SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = TestSuiteRun.objects.all()
+    serializer_class = TestSuiteRunSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+
+    def get_queryset(self):
+        project_id = self.request.query_params.get('project', None)
+        if project_id:
+            return TestSuiteRun.objects.filter(project_id=project_id).order_by('-created_at')
+        return TestSuiteRun.objects.all().order_by('-created_at')
+
+    def create(self, request):
+        """
+        批量运行测试套件，返回 202 和状态查询地址
+
+        test_suite_ids 指定套件；否则 group_id 运行套件分组的整个子树；都不指定时运行环境所属项目的全部套件
+        """
+        environment_id = request.data.get('environment_id')
+        if not environment_id:
+            return Response({"error": "Environment ID is required"}, status=status.HTTP_400_BAD_REQUEST)
+        environment = get_object_or_404(Environment.objects.select_related('project'), id=environment_id)
+
+        test_suite_ids = request.data.get('test_suite_ids') or []
+        group_id = request.data.get('group_id')
+        if test_suite_ids:
+            scope = 'selected'
+        elif group_id:
+            scope = 'group'
+        else:
+            scope = 'project'
+
+        form = SuiteRunForm({
+            'name': request.data.get('name') or f"{environment.project.name} 批量运行",
+            'environment': environment.id,
+            'scope': scope,
+            'test_suites': test_suite_ids,
+            'group': group_id,
+        }, project=environment.project)
+        if not form.is_valid():
+            return Response({"error": form.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        suite_run = launch_suite_run(
+            name=form.cleaned_data['name'],
+            project=environment.project,
+            environment=environment,
+            test_suites=form.cleaned_data['suites'],
+            user=request.user,
+        )
+        status_url = request.build_absolute_uri(reverse('testsuiterun-run-status', args=[suite_run.pk]))
+        return Response(
+            {"id": suite_run.pk, "status": suite_run.status, "total_count": suite_run.total_count,
+             "status_url": status_url},
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": status_url},
+        )
+
+    @action(detail=True, methods=['get'], url_path='status')
+    def run_status(self, request, pk=None):
+        """批量运行的汇总进度：子运行按状态计数，测试结果按状态计数"""
+        self.get_object()
+        return Response(get_suite_run_status(pk))
+
+
+class TestResultViewSet(SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
     queryset = TestResult.objects.all()
     serializer_class = TestResultSerializer
     permission_classes = [permissions.IsAuthenticated]
-    pagination_class = StandardResultsSetPagination
+    # 结果量很大，使用游标分页，排序由分页类按 (created_at, id) 处理
+    pagination_class = KeysetPagination
+    always_load_fields = ('created_at',)
 
     def get_queryset(self):
+        # 列表只读取精简的结果行，详情才联表读取载荷；关联对象按 ?expand= 联表
+        queryset = TestResult.objects.all()
+        if self.action == 'retrieve':
+            queryset = queryset.with_payload()
         test_run_id = self.request.query_params.get('test_run', None)
         if test_run_id:
-            return TestResult.objects.filter(test_run_id=test_run_id).order_by('-created_at')
-        return TestResult.objects.all().order_by('-created_at')
+            return queryset.filter(test_run_id=test_run_id)
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return TestResultDetailSerializer
+        return TestResultSerializer
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        流式导出测试结果，不分页
+
+        ?test_run=、?project=、?start=YYYY-MM-DD&end=YYYY-MM-DD 至少指定一个；
+        ?file_format=ndjson|csv|junit，NDJSON 加 ?payload=1 时附带请求和响应内容
+        """
+        export_format = request.query_params.get('file_format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return Response({"error": f"Unsupported file_format: {export_format}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        filters = {name: request.query_params.get(name) for name in ('test_run', 'project', 'start', 'end')}
+        try:
+            results = filter_results(**filters)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return export_response(results, export_format, export_filename(**filters),
+                               include_payload=request.query_params.get('payload') == '1')
+
+
+def _agent_lease(request, params):
+    """提交结果和结束任务时代理给出的 (代理, 领取次数)，代理须由当前用户注册；参数不合法时返回None"""
+    try:
+        agent_id = int(params.get('agent'))
+        attempt = int(params.get('attempt'))
+    except (TypeError, ValueError):
+        return None
+    return get_object_or_404(RunnerAgent, pk=agent_id, registered_by=request.user), attempt
+
+
+class RunnerAgentViewSet(SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
+    """执行代理：注册、心跳、领取任务和申请限流令牌"""
+    queryset = RunnerAgent.objects.all()
+    serializer_class = RunnerAgentSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+
+    def _own_agent(self, pk):
+        """心跳和领取任务只能由注册代理的用户发起"""
+        return get_object_or_404(RunnerAgent, pk=pk, registered_by=self.request.user)
+
+    def create(self, request):
+        """
+        注册执行代理，同名代理重新注册时更新信息，并交还之前持有的任务
+
+        labels 为可领取的环境标签，capacity 为同时执行的任务数；返回代理信息、心跳间隔和租约时间
+        """
+        name = str(request.data.get('name') or '').strip()
+        if not name or len(name) > 100:
+            return Response({"error": "name is required (at most 100 characters)"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        labels = request.data.get('labels') or []
+        if isinstance(labels, str):
+            labels = split_param(labels)
+        if not isinstance(labels, list) or not all(isinstance(label, str) and label for label in labels):
+            return Response({"error": "labels must be a list of strings"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            capacity = int(request.data.get('capacity', 1))
+        except (TypeError, ValueError):
+            capacity = 0
+        if capacity < 1:
+            return Response({"error": "capacity must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        agent = agents.register_agent(
+            request.user, name,
+            hostname=str(request.data.get('hostname') or '')[:255],
+            labels=labels,
+            capacity=capacity,
+            version=str(request.data.get('version') or '')[:50],
+        )
+        data = RunnerAgentSerializer(agent, context=self.get_serializer_context()).data
+        data.update(heartbeat_interval=agents.heartbeat_interval(), lease_ttl=agents.lease_ttl())
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def heartbeat(self, request, pk=None):
+        """上报心跳并为 jobs 中仍持有的任务续约，返回应停止执行的任务ID"""
+        agent = self._own_agent(pk)
+        job_ids = request.data.get('jobs') or []
+        if not isinstance(job_ids, list) or not all(isinstance(job_id, int) for job_id in job_ids):
+            return Response({"error": "jobs must be a list of job IDs"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"cancelled": agents.heartbeat(agent, job_ids)})
+
+    @action(detail=True, methods=['post'])
+    def lease(self, request, pk=None):
+        """领取最多 max_jobs 个标签匹配的任务，默认和上限为代理的并发容量；没有可领取的任务时返回空列表"""
+        agent = self._own_agent(pk)
+        try:
+            max_jobs = int(request.data.get('max_jobs', agent.capacity))
+        except (TypeError, ValueError):
+            return Response({"error": "max_jobs must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"jobs": agents.lease_jobs(agent, min(max_jobs, agent.capacity))})
+
+    @action(detail=True, methods=['post'])
+    def permits(self, request, pk=None):
+        """
+        申请向 environment_id 环境发送 count 个请求的令牌，与平台的worker共用环境的令牌桶
+
+        返回取得的令牌数 granted；为0时代理等待 wait_ms 毫秒后重试
+        """
+        self._own_agent(pk)
+        try:
+            environment_id = int(request.data.get('environment_id'))
+            count = int(request.data.get('count', 1))
+        except (TypeError, ValueError):
+            return Response({"error": "environment_id and count must be integers"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if count < 1:
+            return Response({"error": "count must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
+        environment = get_object_or_404(Environment, pk=environment_id)
+        granted, wait_ms = agents.grant_tokens(environment, count)
+        return Response({"granted": granted, "wait_ms": wait_ms})
+
+
+class AgentJobViewSet(SparseFieldsMixin, viewsets.ReadOnlyModelViewSet):
+    """代理任务，执行中的代理提交结果和结束任务"""
+    queryset = AgentJob.objects.all()
+    serializer_class = AgentJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = StandardResultsSetPagination
+
+    def get_queryset(self):
+        queryset = AgentJob.objects.all().order_by('-id')
+        if self.action != 'list':
+            # 提交结果时的 ?agent= 是提交者，不是过滤条件；任务已被其他代理领取时应返回409而不是404
+            return queryset
+        for name in ('status', 'agent', 'test_run'):
+            value = self.request.query_params.get(name)
+            if value:
+                queryset = queryset.filter(**{name: value})
+        return queryset
+
+    @action(detail=True, methods=['post'])
+    def results(self, request, pk=None):
+        """
+        代理提交一批测试结果，请求体与测试运行的 ingest 接口相同
+
+        ?agent= 和 ?attempt= 为领取任务时的代理ID和领取次数，租约已被其他代理取得或任务已结束时返回 409
+        """
+        job = self.get_object()
+        lease = _agent_lease(request, request.query_params)
+        if lease is None:
+            return Response({"error": "agent and attempt are required"}, status=status.HTTP_400_BAD_REQUEST)
+        agent, attempt = lease
+        if request.stream is None:
+            return Response({"error": "Request body is empty"}, status=status.HTTP_400_BAD_REQUEST)
+        key = request.headers.get('Idempotency-Key', '').strip()
+        if len(key) > 80:
+            return Response({"error": "Idempotency-Key is too long"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            outcome = agents.submit_results(
+                job.pk, agent.pk, attempt,
+                open_stream(request.stream, request.headers.get('Content-Encoding', '')),
+                key=key,
+            )
+        except agents.LeaseLost as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except IngestError as e:
+            return ingest_error_response(e)
+        except (OSError, EOFError) as e:
+            return Response({"error": f"Invalid request body: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(outcome, status=status.HTTP_200_OK if outcome['replayed'] else status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """代理执行完毕，按已提交的结果结束测试运行；error_message 非空时运行记为失败"""
+        job = self.get_object()
+        lease = _agent_lease(request, request.data)
+        if lease is None:
+            return Response({"error": "agent and attempt are required"}, status=status.HTTP_400_BAD_REQUEST)
+        agent, attempt = lease
+        try:
+            test_run = agents.complete_job(job.pk, agent.pk, attempt, str(request.data.get('error_message') or ''))
+        except agents.LeaseLost as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response({"id": job.pk, "test_run": test_run.pk, "status": test_run.status})
@@ -10,10 +10,5 @@ class TestManagerConfig(AppConfig):
         """应用启动时执行的操作"""
         # 导入信号处理器
         import test_manager.signals
-
-        # 加载邮件配置
-        try:
-            from test_manager.models import EmailConfig
-            EmailConfig.apply_active_config()
-        except:
-            pass
+        # 注册worker心跳上报
+        import test_manager.worker_health
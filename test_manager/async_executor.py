@@ -4,6 +4,8 @@ import traceback
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
 
+from .capture import CapturePolicy
+
 logger = logging.getLogger(__name__)
 
 
@@ -40,26 +42,24 @@ def _execute_test_suite_thread(test_suite, environment, case_environments, test_
     try:
         logger.info(f"开始异步执行测试套件: {test_suite.name} (ID: {test_suite.id})")
 
-        # 执行测试套件
-        results = execute_test_suite_func(test_suite, environment, case_environments)
-
         # 导入需要的模型
         from django.apps import apps
         TestResult = apps.get_model('test_manager', 'TestResult')
         Environment = apps.get_model('test_manager', 'Environment')
 
-        # 创建测试结果
-        for result in results:
+        def save_result(result):
+            result = capture_policy.apply(result)
             # 获取测试用例使用的环境
             env_id = result.get('environment_id', environment.id)
             test_env = get_object_or_404(Environment, id=env_id)
 
-            TestResult.objects.create(
+            TestResult.objects.create_with_payload(
                 test_run=test_run,
                 test_case_id=result['test_case_id'],
                 environment=test_env,
                 status=result['status'],
                 response_time=result.get('response_time'),
+                throttle_wait=result.get('throttle_wait'),
                 response_status_code=result.get('response_status_code'),
                 response_headers=result.get('response_headers', {}),
                 response_body=result.get('response_body'),
@@ -69,6 +69,11 @@ def _execute_test_suite_thread(test_suite, environment, case_environments, test_
                 extracted_params=result.get('extracted_params', {})
             )
 
+        # 执行测试套件，按套件的载荷保存策略逐条保存结果，执行器只返回结果摘要
+        capture_policy = CapturePolicy.for_suite(test_suite)
+        results = execute_test_suite_func(test_suite, environment, case_environments,
+                                          capture_policy=capture_policy, on_result=save_result)
+
         # 更新测试运行状态
         failed_results = [r for r in results if r['status'] != 'passed']
         test_run.status = 'failed' if failed_results else 'completed'
@@ -131,12 +136,13 @@ def _execute_test_case_thread(test_case, environment, test_run, user, execute_te
         TestResult = apps.get_model('test_manager', 'TestResult')
 
         # 创建测试结果
-        TestResult.objects.create(
+        TestResult.objects.create_with_payload(
             test_run=test_run,
             test_case=test_case,
             environment=environment,
             status=result['status'],
             response_time=result.get('response_time'),
+            throttle_wait=result.get('throttle_wait'),
             response_status_code=result.get('response_status_code'),
             response_headers=result.get('response_headers', {}),
             response_body=result.get('response_body'),
@@ -165,4 +171,83 @@ def _execute_test_case_thread(test_case, environment, test_run, user, execute_te
         test_run.status = 'failed'
         test_run.end_time = timezone.now()
         test_run.error_message = f"执行出错: {str(e)}"
-        test_run.save()
+        test_run.save()
+
+
+def execute_test_group_async(test_cases, environment, test_run, user, execute_test_case_func):
+    """
+    在后台线程中依次执行分组子树下的测试用例
+
+    Args:
+        test_cases: 测试用例查询集
+        environment: 环境对象
+        test_run: 测试运行对象
+        user: 当前用户
+        execute_test_case_func: 执行测试用例的函数
+    """
+    thread = threading.Thread(
+        target=_execute_test_group_thread,
+        args=(test_cases, environment, test_run, user, execute_test_case_func),
+        daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def _execute_test_group_thread(test_cases, environment, test_run, user, execute_test_case_func):
+    """
+    执行分组测试用例的线程函数
+    """
+    from django.db import connection
+
+    # 在新线程中关闭旧的数据库连接并创建新的连接
+    connection.close()
+
+    try:
+        logger.info(f"开始异步执行分组测试用例: {test_run.name} (ID: {test_run.id})")
+
+        from django.apps import apps
+        TestResult = apps.get_model('test_manager', 'TestResult')
+
+        total = failed = 0
+        for test_case in test_cases.iterator():
+            result = execute_test_case_func(test_case, environment)
+            TestResult.objects.create_with_payload(
+                test_run=test_run,
+                test_case=test_case,
+                environment=environment,
+                status=result['status'],
+                response_time=result.get('response_time'),
+                throttle_wait=result.get('throttle_wait'),
+                response_status_code=result.get('response_status_code'),
+                response_headers=result.get('response_headers', {}),
+                response_body=result.get('response_body'),
+                request_headers=result.get('request_headers', {}),
+                request_body=result.get('request_body'),
+                error_message=result.get('error_message', ''),
+                extracted_params=result.get('extracted_params', {}),
+                validators=result.get('validators', [])
+            )
+            total += 1
+            if result['status'] != 'passed':
+                failed += 1
+
+        # 更新测试运行状态
+        test_run.status = 'failed' if failed else 'completed'
+        test_run.end_time = timezone.now()
+        test_run.save()
+
+        logger.info(
+            f"分组测试用例异步执行完成: {test_run.name} (ID: {test_run.id}), "
+            f"结果: {total - failed}/{total} 通过"
+        )
+
+    except Exception as e:
+        logger.error(f"分组测试用例异步执行出错: {test_run.name} (ID: {test_run.id}), 错误: {str(e)}")
+        logger.error(traceback.format_exc())
+
+        # 更新测试运行状态为失败
+        test_run.status = 'failed'
+        test_run.end_time = timezone.now()
+        test_run.error_message = f"执行出错: {str(e)}"
+        test_run.save()
@@ -0,0 +1,70 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.db.models.deletion import ProtectedError
+from django.utils import timezone
+
+from .models import ResponseBlob, TestResult
+
+logger = logging.getLogger(__name__)
+
+
+def storage_report():
+    """
+    响应体存储的空间统计
+
+    logical_size 为所有测试结果引用的响应体原始大小之和，即不去重、不压缩时需要的空间
+    """
+    blobs = ResponseBlob.objects.aggregate(
+        blob_count=Count('hash'),
+        raw_size=Sum('size'),
+        stored_size=Sum('compressed_size'),
+    )
+    references = TestResult.objects.filter(response_blob__isnull=False).aggregate(
+        result_count=Count('id'),
+        logical_size=Sum('response_size'),
+    )
+    unreferenced = ResponseBlob.objects.filter(results__isnull=True).aggregate(
+        count=Count('hash'),
+        stored_size=Sum('compressed_size'),
+    )
+
+    stored_size = blobs['stored_size'] or 0
+    logical_size = references['logical_size'] or 0
+    return {
+        'blob_count': blobs['blob_count'],
+        'raw_size': blobs['raw_size'] or 0,
+        'stored_size': stored_size,
+        'result_count': references['result_count'],
+        'logical_size': logical_size,
+        'saving_ratio': round(1 - stored_size / logical_size, 4) if logical_size else 0,
+        'unreferenced_count': unreferenced['count'],
+        'unreferenced_size': unreferenced['stored_size'] or 0,
+    }
+
+
+def collect_unreferenced_blobs(grace=None, batch_size=500):
+    """
+    分批删除没有测试结果引用的响应体
+
+    最近 grace 秒内被引用过的内容不删除，避免删除正在写入的测试结果将要引用的内容
+    """
+    grace = grace if grace is not None else getattr(settings, 'RESPONSE_BLOB_GC_GRACE', 24 * 3600)
+    cutoff = timezone.now() - timedelta(seconds=grace)
+    unreferenced = ResponseBlob.objects.filter(last_used_at__lt=cutoff, results__isnull=True)
+
+    deleted = 0
+    while True:
+        hashes = list(unreferenced.order_by('hash').values_list('hash', flat=True)[:batch_size])
+        if not hashes:
+            break
+        try:
+            deleted += unreferenced.filter(hash__in=hashes).delete()[0]
+        except ProtectedError as e:
+            # 查询和删除之间有新的测试结果引用了其中的内容，下一批会重新筛选
+            logger.warning(f"部分响应体已被重新引用，跳过本批: {e}")
+            continue
+
+    logger.info(f"已删除 {deleted} 个未引用的响应体")
+    return deleted
@@ -0,0 +1,78 @@
+import json
+import hashlib
+import logging
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+HEADER_FIELDS = ('request_headers', 'response_headers')
+BODY_FIELDS = ('request_body', 'response_body')
+
+
+def truncate_payload(value, max_bytes):
+    """
+    超过大小的载荷替换为摘要
+
+    摘要保留原始大小、SHA-256 和开头 max_bytes 字节的内容
+    """
+    if value is None:
+        return None
+    raw = json.dumps(value, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8')
+    if len(raw) <= max_bytes:
+        return value
+    return {
+        'truncated': True,
+        'size': len(raw),
+        'sha256': hashlib.sha256(raw).hexdigest(),
+        'preview': raw[:max_bytes].decode('utf-8', errors='ignore'),
+    }
+
+
+class CapturePolicy:
+    """
+    测试结果载荷的保存策略
+
+    full 完整保存；on_failure 只保存失败和错误结果的载荷；
+    truncated 超过 max_bytes 的请求体和响应体截断为摘要；none 不保存载荷。
+    校验结果和提取参数始终保存
+    """
+
+    def __init__(self, mode='full', max_bytes=64 * 1024, keep_headers=True):
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.keep_headers = keep_headers
+
+    def __repr__(self):
+        return f"CapturePolicy({self.mode}, max_bytes={self.max_bytes}, keep_headers={self.keep_headers})"
+
+    @classmethod
+    def for_suite(cls, test_suite, scheduled_task=None):
+        """测试套件的保存策略，定时任务设置了策略时覆盖套件的设置"""
+        mode = test_suite.payload_capture
+        if scheduled_task is not None and scheduled_task.payload_capture:
+            mode = scheduled_task.payload_capture
+        return cls(mode, test_suite.payload_max_kb * 1024, test_suite.capture_headers)
+
+    def keeps_payload(self, passed):
+        """给定结果是否保留载荷"""
+        if self.mode == 'none':
+            return False
+        if self.mode == 'on_failure':
+            return not passed
+        return True
+
+    def apply(self, result):
+        """按策略处理执行器返回的结果字典，返回新的字典"""
+        result = dict(result)
+        if not self.keeps_payload(result.get('status') == 'passed'):
+            for name in HEADER_FIELDS + BODY_FIELDS:
+                result[name] = None
+            return result
+
+        if not self.keep_headers:
+            for name in HEADER_FIELDS:
+                result[name] = None
+        if self.mode == 'truncated':
+            for name in BODY_FIELDS:
+                result[name] = truncate_payload(result.get(name), self.max_bytes)
+        return result
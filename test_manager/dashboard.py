@@ -0,0 +1,203 @@
+import logging
+from datetime import timedelta
+import pytz
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Sum, Q
+from django.db.models.functions import TruncDay, TruncMonth, TruncYear
+from django.utils import timezone
+
+from .models import Project, TestCase, TestSuite, TestRun, TestResult, TestReport, ProjectDailyStats
+
+logger = logging.getLogger(__name__)
+
+DASHBOARD_CACHE_KEY = 'dashboard:stats'
+
+TRUNC_FUNCTIONS = {
+    'day': TruncDay,
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+
+
+def invalidate_dashboard_cache():
+    try:
+        cache.delete(DASHBOARD_CACHE_KEY)
+    except Exception as e:
+        logger.warning(f"清除面板统计缓存失败: {e}")
+
+
+def get_dashboard_stats():
+    """
+    获取面板统计数据
+
+    所有统计都在数据库中聚合，结果缓存 DASHBOARD_CACHE_TTL 秒，测试运行结束时失效
+    """
+    try:
+        stats = cache.get(DASHBOARD_CACHE_KEY)
+    except Exception as e:
+        logger.warning(f"读取面板统计缓存失败: {e}")
+        stats = None
+
+    if stats is None:
+        stats = build_dashboard_stats()
+        try:
+            cache.set(DASHBOARD_CACHE_KEY, stats, getattr(settings, 'DASHBOARD_CACHE_TTL', 300))
+        except Exception as e:
+            logger.warning(f"写入面板统计缓存失败: {e}")
+    return stats
+
+
+def build_dashboard_stats():
+    tz = pytz.timezone(settings.TIME_ZONE)
+
+    # 测试运行状态统计，一次查询完成
+    test_run_stats = TestRun.objects.aggregate(
+        total=Count('id'),
+        passed=Count('id', filter=Q(status='completed')),
+        failed=Count('id', filter=Q(status='failed')),
+        pending=Count('id', filter=Q(status='pending')),
+        running=Count('id', filter=Q(status='running')),
+    )
+
+    # 测试结果状态统计，一次查询完成
+    test_result_stats = TestResult.objects.aggregate(
+        total=Count('id'),
+        passed=Count('id', filter=Q(status='passed')),
+        failed=Count('id', filter=Q(status='failed')),
+        error=Count('id', filter=Q(status='error')),
+        skipped=Count('id', filter=Q(status='skipped')),
+    )
+
+    # 最近活动列表，只取需要展示的条数
+    limit = getattr(settings, 'DASHBOARD_RECENT_ACTIVITY_LIMIT', 5)
+    recent_activities = []
+    for name, status, created_at in TestRun.objects.order_by('-created_at').values_list(
+            'name', 'status', 'created_at')[:limit]:
+        recent_activities.append({
+            'action': name.split(': ')[0],
+            'timestamp': created_at,
+            'description': f"{name} 执行结果为： {status}",
+        })
+
+    return {
+        'projects_count': Project.objects.count(),
+        'test_cases_count': TestCase.objects.count(),
+        'test_suites_count': TestSuite.objects.count(),
+        'test_runs_count': test_run_stats['total'],
+        'report_count': TestReport.objects.count(),
+        'test_run_stats': test_run_stats,
+        'test_result_stats': test_result_stats,
+        'recent_activities': recent_activities,
+        'daily_data': generate_time_series_data(mode='daily', tz=tz),
+        'monthly_data': generate_time_series_data(mode='monthly', tz=tz),
+        'yearly_data': generate_time_series_data(mode='yearly', tz=tz),
+    }
+
+
+def generate_time_series_data(mode, tz):
+    now = timezone.now().astimezone(tz)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    if mode == 'daily':
+        count = 7
+        start_date = today - timedelta(days=count - 1)
+        period = 'day'
+
+    elif mode == 'monthly':
+        start_date = today.replace(month=1, day=1)
+        count = 12
+        period = 'month'
+
+    elif mode == 'yearly':
+        count = 5
+        start_date = today.replace(year=now.year - count + 1, month=1, day=1)
+        period = 'year'
+
+    else:
+        raise ValueError("Invalid mode")
+
+    labels = generate_date_labels(start_date, period, count)
+    data = {
+        'projects': get_model_timeseries(Project, start_date, count, period, tz),
+        'test_cases': get_model_timeseries(TestCase, start_date, count, period, tz),
+        'test_suites': get_model_timeseries(TestSuite, start_date, count, period, tz),
+        # 测试运行数量读取每日汇总表，不再扫描测试运行表
+        'test_runs': get_rollup_timeseries(start_date, count, period),
+        'test_reports': get_model_timeseries(TestReport, start_date, count, period, tz),
+    }
+    return {'labels': labels, 'datasets': data}
+
+
+def generate_date_labels(start_date, period, count):
+    labels = []
+    current = start_date
+
+    if period == 'day':
+        for _ in range(count):
+            labels.append(current.strftime('%b %d').lstrip('0').replace(' 0', ' '))
+            current += timedelta(days=1)
+
+    elif period == 'month':
+        for i in range(count):
+            labels.append(f'{i+1}月')
+
+    elif period == 'year':
+        for i in range(count):
+            labels.append(str(start_date.year + i))
+
+    return labels
+
+
+def get_model_timeseries(model, start_date, count, period, tz):
+    """按时间段在数据库中分组计数，只返回每个时间段一行"""
+    trunc = TRUNC_FUNCTIONS[period]
+    rows = (
+        model.objects
+        .filter(created_at__gte=start_date)
+        .annotate(bucket=trunc('created_at', tzinfo=tz))
+        .values('bucket')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+
+    counts = [0] * count
+    for row in rows:
+        if row['bucket'] is None:
+            continue
+        index = _bucket_index(row['bucket'], start_date, period)
+        if 0 <= index < count:
+            counts[index] += row['total']
+
+    return counts
+
+
+def get_rollup_timeseries(start_date, count, period):
+    """从项目每日汇总表按时间段累加测试运行次数"""
+    trunc = TRUNC_FUNCTIONS[period]
+    rows = (
+        ProjectDailyStats.objects
+        .filter(date__gte=start_date.date())
+        .annotate(bucket=trunc('date'))
+        .values('bucket')
+        .annotate(total=Sum('run_count'))
+        .order_by()
+    )
+
+    counts = [0] * count
+    for row in rows:
+        index = _bucket_index(row['bucket'], start_date, period)
+        if 0 <= index < count:
+            counts[index] += row['total']
+
+    return counts
+
+
+def _bucket_index(bucket, start_date, period):
+    """时间段在序列中的位置，bucket 可以是日期或时间"""
+    if period == 'day':
+        bucket_date = bucket.date() if hasattr(bucket, 'date') else bucket
+        return (bucket_date - start_date.date()).days
+    elif period == 'month':
+        return (bucket.year - start_date.year) * 12 + bucket.month - start_date.month
+    return bucket.year - start_date.year
@@ -6,6 +6,8 @@ from django.utils import timezone
 from django_celery_beat.models import PeriodicTask
 from .models import ScheduledTask
 from .scheduler import TaskScheduler
+from .worker_health import get_worker_health
+from .blobstore import storage_report
 import json
 
 
@@ -58,6 +60,37 @@ def task_monitor_api(request):
         })
 
 
+@login_required
+def worker_health_api(request):
+    """Worker健康状态API"""
+    try:
+        health = get_worker_health()
+        return JsonResponse({
+            'success': True,
+            **health,
+        })
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        })
+
+
+@login_required
+def blob_storage_api(request):
+    """响应体存储空间统计API"""
+    try:
+        return JsonResponse({
+            'success': True,
+            **storage_report(),
+        })
+    except Exception as e:
+        return JsonResponse({
+            'success': False,
+            'error': str(e)
+        })
+
+
 @login_required
 @require_POST
 def sync_tasks_api(request):
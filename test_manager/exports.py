@@ -0,0 +1,229 @@
+import re
+import csv
+import json
+from datetime import datetime, time, timedelta
+from xml.sax.saxutils import escape as xml_escape, quoteattr
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Q, Sum
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import TestResult
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv'),
+    'junit': ('application/xml', 'xml'),
+}
+
+# (导出列名, 查询字段)，NDJSON 和 CSV 使用相同的列
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('test_run_id', 'test_run_id'),
+    ('test_run', 'test_run__name'),
+    ('test_case_id', 'test_case_id'),
+    ('test_case', 'test_case__name'),
+    ('request_method', 'test_case__request_method'),
+    ('request_url', 'test_case__request_url'),
+    ('environment', 'environment__name'),
+    ('status', 'status'),
+    ('response_status_code', 'response_status_code'),
+    ('response_time', 'response_time'),
+    ('throttle_wait', 'throttle_wait'),
+    ('response_size', 'response_size'),
+    ('error_message', 'error_message'),
+    ('created_at', 'created_at'),
+]
+
+PAYLOAD_COLUMNS = ('request_headers', 'request_body', 'response_headers', 'response_body')
+
+# XML 1.0 不允许的控制字符
+_XML_INVALID_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+def _chunk_size():
+    return getattr(settings, 'EXPORT_CHUNK_SIZE', 1000)
+
+
+def _parse_day(value, name):
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(f"{name} 应为 YYYY-MM-DD 格式的日期")
+    return timezone.make_aware(datetime.combine(day, time.min), timezone.get_current_timezone())
+
+
+def filter_results(test_run=None, project=None, start=None, end=None):
+    """
+    按运行、项目和日期范围过滤要导出的测试结果，参数为查询字符串中的原始值
+
+    至少需要一个条件；end 当天的结果也包含在内。参数不合法时抛出 ValueError
+    """
+    if not any((test_run, project, start, end)):
+        raise ValueError("请指定 test_run、project 或 start/end 日期范围")
+
+    results = TestResult.objects.all()
+    try:
+        if test_run:
+            results = results.filter(test_run_id=int(test_run))
+        if project:
+            results = results.filter(test_run__project_id=int(project))
+    except ValueError:
+        raise ValueError("test_run 和 project 应为ID")
+    if start:
+        results = results.filter(created_at__gte=_parse_day(start, 'start'))
+    if end:
+        results = results.filter(created_at__lt=_parse_day(end, 'end') + timedelta(days=1))
+    return results
+
+
+def _iter_rows(results):
+    """按ID顺序分块读取导出的列，内存中只保留一个分块"""
+    lookups = [lookup for _, lookup in EXPORT_COLUMNS]
+    for row in results.values_list(*lookups).order_by('id').iterator(chunk_size=_chunk_size()):
+        yield dict(zip((name for name, _ in EXPORT_COLUMNS), row))
+
+
+def _iter_rows_with_payload(results):
+    """在导出列之外附带请求和响应内容，载荷和响应体联表读出"""
+    results = results.with_payload().select_related('test_run', 'test_case', 'environment').order_by('id')
+    for result in results.iterator(chunk_size=_chunk_size()):
+        row = {}
+        for name, lookup in EXPORT_COLUMNS:
+            value = result
+            for part in lookup.split('__'):
+                value = getattr(value, part)
+            row[name] = value
+        for name in PAYLOAD_COLUMNS:
+            row[name] = getattr(result, name)
+        yield row
+
+
+def iter_ndjson(results, include_payload=False):
+    """每条测试结果一行JSON"""
+    rows = _iter_rows_with_payload(results) if include_payload else _iter_rows(results)
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False, cls=DjangoJSONEncoder) + '\n'
+
+
+class _Echo:
+    """csv.writer 的写入目标，直接返回写入的行"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(results):
+    """CSV 导出，带 BOM 便于 Excel 识别中文"""
+    writer = csv.writer(_Echo())
+    yield '\ufeff' + writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    for row in _iter_rows(results):
+        created_at = row['created_at']
+        row['created_at'] = timezone.localtime(created_at).isoformat() if created_at else ''
+        yield writer.writerow(row.values())
+
+
+def _xml_text(value):
+    return xml_escape(_XML_INVALID_CHARS.sub('', str(value or '')))
+
+
+def _xml_attr(value):
+    return quoteattr(_XML_INVALID_CHARS.sub('', str(value or '')))
+
+
+def junit_testsuites_start(tests=0, failures=0, errors=0, skipped=0):
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<testsuites name="EasyTesting" tests="{tests}" failures="{failures}" '
+            f'errors="{errors}" skipped="{skipped}">\n')
+
+
+def junit_testsuite_start(suite_id, name, tests=0, failures=0, errors=0, skipped=0, time_ms=0, timestamp=None):
+    """testsuite 开始标签，time_ms 为各用例响应时间之和(毫秒)"""
+    return (f'  <testsuite id="{suite_id}" name={_xml_attr(name)} '
+            f'tests="{tests}" failures="{failures}" errors="{errors}" '
+            f'skipped="{skipped}" time="{(time_ms or 0) / 1000:.3f}"'
+            + (f' timestamp="{timestamp.isoformat()}"' if timestamp else '') + '>\n')
+
+
+def junit_testcase(name, method, url, status, response_time=None, error_message=''):
+    """一条测试结果对应的 testcase 元素，失败为 failure，错误为 error"""
+    seconds = (response_time or 0) / 1000
+    testcase = (f'    <testcase name={_xml_attr(name)} classname={_xml_attr(f"{method} {url}")} '
+                f'time="{seconds:.3f}"')
+    if status == 'passed':
+        return testcase + '/>\n'
+    if status == 'skipped':
+        detail = '<skipped/>'
+    else:
+        tag = 'failure' if status == 'failed' else 'error'
+        detail = (f'<{tag} message={_xml_attr(error_message.splitlines()[0] if error_message else status)}>'
+                  f'{_xml_text(error_message)}</{tag}>')
+    return f'{testcase}>\n      {detail}\n    </testcase>\n'
+
+
+def iter_junit(results):
+    """
+    JUnit XML 导出，每次测试运行一个 testsuite
+
+    各运行的计数先用一次分组聚合查询得到，结果再按运行分块流式输出
+    """
+    suites = results.values('test_run_id', 'test_run__name', 'test_run__start_time').annotate(
+        tests=Count('id'),
+        failures=Count('id', filter=Q(status='failed')),
+        errors=Count('id', filter=Q(status='error')),
+        skipped=Count('id', filter=Q(status='skipped')),
+        time=Sum('response_time'),
+    ).order_by('test_run_id')
+    suites = {suite['test_run_id']: suite for suite in suites}
+
+    yield junit_testsuites_start(**{name: sum(suite[name] for suite in suites.values())
+                                    for name in ('tests', 'failures', 'errors', 'skipped')})
+
+    lookups = ('test_run_id', 'test_case__name', 'test_case__request_method', 'test_case__request_url',
+               'status', 'response_time', 'error_message')
+    current_run_id = None
+    for run_id, *testcase in results.values_list(*lookups).order_by('test_run_id', 'id').iterator(
+            chunk_size=_chunk_size()):
+        if run_id != current_run_id:
+            if current_run_id is not None:
+                yield '  </testsuite>\n'
+            current_run_id = run_id
+            suite = suites.get(run_id, {})
+            yield junit_testsuite_start(
+                run_id, suite.get('test_run__name'), suite.get('tests', 0), suite.get('failures', 0),
+                suite.get('errors', 0), suite.get('skipped', 0), suite.get('time'), suite.get('test_run__start_time'))
+        yield junit_testcase(*testcase)
+
+    if current_run_id is not None:
+        yield '  </testsuite>\n'
+    yield '</testsuites>\n'
+
+
+def export_response(results, export_format, filename, include_payload=False):
+    """
+    以流的形式返回导出文件，数据库按块读取，逐行写出，内存占用与结果数量无关
+
+    export_format 为 ndjson、csv 或 junit
+    """
+    content_type, extension = EXPORT_FORMATS[export_format]
+    if export_format == 'csv':
+        rows = iter_csv(results)
+    elif export_format == 'junit':
+        rows = iter_junit(results)
+    else:
+        rows = iter_ndjson(results, include_payload)
+    response = StreamingHttpResponse(rows, content_type=f'{content_type}; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{extension}"'
+    return response
+
+
+def export_filename(test_run=None, project=None, start=None, end=None):
+    parts = ['test_results']
+    if test_run:
+        parts.append(f'run{test_run}')
+    if project:
+        parts.append(f'project{project}')
+    if start or end:
+        parts.append(f"{start or ''}_{end or ''}")
+    return '_'.join(parts)
@@ -8,6 +8,18 @@ from .models import (
 import json
 
 
+def set_group_path_labels(field):
+    """分组下拉选项显示完整路径，所有分组名称一次查询取出，不再逐个选项查询父分组"""
+    names = {}
+
+    def label(group):
+        if not names:
+            names.update(field.queryset.values_list('id', 'name'))
+        return ' / '.join(names[pk] for pk in group.path_ids if pk in names) or group.name
+
+    field.label_from_instance = label
+
+
 class ProjectForm(forms.ModelForm):
     class Meta:
         model = Project
@@ -26,7 +38,7 @@ class EnvironmentForm(forms.ModelForm):
 
     class Meta:
         model = Environment
-        fields = ['name', 'project', 'base_url']
+        fields = ['name', 'project', 'base_url', 'agent_label', 'rate_limit', 'rate_burst', 'max_in_flight']
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -100,6 +112,7 @@ class TestCaseForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        set_group_path_labels(self.fields['group'])
         if self.instance.pk:
             self.fields['request_headers_json'].initial = json.dumps(self.instance.request_headers, indent=2)
 
@@ -210,11 +223,15 @@ class TestCaseForm(forms.ModelForm):
 class TestSuiteForm(forms.ModelForm):
     class Meta:
         model = TestSuite
-        fields = ['name', 'project', 'group', 'description']
+        fields = ['name', 'project', 'group', 'description', 'payload_capture', 'payload_max_kb', 'capture_headers']
         widgets = {
             'description': forms.Textarea(attrs={'rows': 4}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        set_group_path_labels(self.fields['group'])
+
 
 class TestRunForm(forms.ModelForm):
     class Meta:
@@ -283,21 +300,10 @@ class TestCaseGroupForm(forms.ModelForm):
 
         # 如果是编辑模式，排除自己及其子分组，防止循环引用
         if self.instance.pk:
-            exclude_ids = [self.instance.pk]
-            children = TestCaseGroup.objects.filter(parent=self.instance)
-            for child in children:
-                exclude_ids.append(child.pk)
-
-                # 递归获取所有子分组
-                def get_child_ids(parent_id):
-                    child_groups = TestCaseGroup.objects.filter(parent_id=parent_id)
-                    for cg in child_groups:
-                        exclude_ids.append(cg.pk)
-                        get_child_ids(cg.pk)
-
-                get_child_ids(child.pk)
+            self.fields['parent'].queryset = self.fields['parent'].queryset.exclude(
+                self.instance.subtree_q())
 
-            self.fields['parent'].queryset = self.fields['parent'].queryset.exclude(pk__in=exclude_ids)
+        set_group_path_labels(self.fields['parent'])
 
 
 # 新增测试套件分组表单
@@ -321,21 +327,10 @@ class TestSuiteGroupForm(forms.ModelForm):
 
         # 如果是编辑模式，排除自己及其子分组，防止循环引用
         if self.instance.pk:
-            exclude_ids = [self.instance.pk]
-            children = TestSuiteGroup.objects.filter(parent=self.instance)
-            for child in children:
-                exclude_ids.append(child.pk)
-
-                # 递归获取所有子分组
-                def get_child_ids(parent_id):
-                    child_groups = TestSuiteGroup.objects.filter(parent_id=parent_id)
-                    for cg in child_groups:
-                        exclude_ids.append(cg.pk)
-                        get_child_ids(cg.pk)
-
-                get_child_ids(child.pk)
+            self.fields['parent'].queryset = self.fields['parent'].queryset.exclude(
+                self.instance.subtree_q())
 
-            self.fields['parent'].queryset = self.fields['parent'].queryset.exclude(pk__in=exclude_ids)
+        set_group_path_labels(self.fields['parent'])
 
 
 class TestReportForm(forms.ModelForm):
@@ -354,6 +349,49 @@ class GenerateReportForm(forms.Form):
     is_public = forms.BooleanField(required=False, initial=False)
 
 
+class SuiteRunForm(forms.Form):
+    """批量运行：选择的套件、某个套件分组的整个子树，或项目的全部套件"""
+    SCOPE_CHOICES = [
+        ('selected', '选择的测试套件'),
+        ('group', '套件分组（包含子分组）'),
+        ('project', '项目的全部测试套件'),
+    ]
+
+    name = forms.CharField(max_length=100, label='运行名称')
+    environment = forms.ModelChoiceField(queryset=Environment.objects.none(), label='运行环境')
+    scope = forms.ChoiceField(choices=SCOPE_CHOICES, initial='selected', label='运行范围')
+    test_suites = forms.ModelMultipleChoiceField(queryset=TestSuite.objects.none(), required=False,
+                                                 label='测试套件')
+    group = forms.ModelChoiceField(queryset=TestSuiteGroup.objects.none(), required=False, label='套件分组')
+
+    def __init__(self, *args, project=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.project = project
+        self.fields['environment'].queryset = Environment.objects.filter(project=project)
+        self.fields['test_suites'].queryset = TestSuite.objects.filter(project=project).order_by('name')
+        self.fields['group'].queryset = TestSuiteGroup.objects.filter(project=project)
+        set_group_path_labels(self.fields['group'])
+
+    def clean(self):
+        cleaned_data = super().clean()
+        scope = cleaned_data.get('scope')
+        if scope == 'group':
+            group = cleaned_data.get('group')
+            if not group:
+                self.add_error('group', '请选择套件分组')
+                return cleaned_data
+            suites = group.get_test_suites()
+        elif scope == 'project':
+            suites = TestSuite.objects.filter(project=self.project)
+        else:
+            suites = cleaned_data.get('test_suites') or TestSuite.objects.none()
+
+        cleaned_data['suites'] = list(suites.order_by('name'))
+        if not cleaned_data['suites']:
+            raise forms.ValidationError('所选范围内没有测试套件')
+        return cleaned_data
+
+
 class MockDataForm(forms.ModelForm):
     variables_json = forms.CharField(
         widget=forms.Textarea(attrs={'rows': 4}),
@@ -402,7 +440,7 @@ class ScheduledTaskForm(forms.ModelForm):
             'name', 'description', 'test_suite', 'environment',
             'schedule_type', 'scheduled_time', 'scheduled_date', 'weekday', 'day_of_month', 'cron_expression',
             'send_email_notification', 'notification_emails', 'notify_on_success', 'notify_on_failure',
-            'max_retries', 'retry_delay'
+            'notification_digest', 'max_retries', 'retry_delay', 'overlap_policy', 'payload_capture'
         ]
         widgets = {
             'description': forms.Textarea(attrs={'rows': 3}),
@@ -431,7 +469,8 @@ class ScheduledTaskForm(forms.ModelForm):
 
         # 添加CSS类
         for field_name, field in self.fields.items():
-            if field_name not in ['send_email_notification', 'notify_on_success', 'notify_on_failure']:
+            if field_name not in ['send_email_notification', 'notify_on_success', 'notify_on_failure',
+                                  'notification_digest']:
                 field.widget.attrs.update({'class': 'form-control'})
 
     def clean_notification_emails(self):
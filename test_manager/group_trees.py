@@ -0,0 +1,145 @@
+import logging
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import TestCase, TestCaseGroup, TestSuite, TestSuiteGroup
+
+logger = logging.getLogger(__name__)
+
+CASE_TREE_CACHE_KEY = 'group_tree:case:{}'
+SUITE_TREE_CACHE_KEY = 'group_tree:suite:{}'
+
+
+def invalidate_case_tree(project_id):
+    try:
+        cache.delete(CASE_TREE_CACHE_KEY.format(project_id))
+    except Exception as e:
+        logger.warning(f"清除分组树缓存失败: {e}")
+
+
+def invalidate_suite_tree(project_id):
+    try:
+        cache.delete(SUITE_TREE_CACHE_KEY.format(project_id))
+    except Exception as e:
+        logger.warning(f"清除分组树缓存失败: {e}")
+
+
+def _assemble(groups):
+    """
+    由扁平的分组列表在内存中组装分组树
+
+    groups 已按名称排序，子分组的顺序与之相同；父分组不存在时按顶级分组处理
+    """
+    nodes = {}
+    for group in groups:
+        nodes[group['id']] = dict(group, children=[])
+    roots = []
+    for node in nodes.values():
+        parent = nodes.get(node['parent_id'])
+        if parent is None:
+            roots.append(node)
+        else:
+            parent['children'].append(node)
+    return roots, nodes
+
+
+def iter_groups(roots):
+    """深度优先遍历分组树"""
+    stack = list(reversed(roots))
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node['children']))
+
+
+def _split_by_project(rows, project_ids):
+    by_project = {project_id: [] for project_id in project_ids}
+    for row in rows:
+        by_project[row['project_id']].append(row)
+    return by_project
+
+
+def build_case_trees(project_ids):
+    """
+    多个项目的测试用例分组树，无论项目和分组数量，分组和用例各一次查询
+
+    每个项目的分组树为 {'groups': 顶级分组列表, 'ungrouped': 未分组用例列表}，
+    分组节点包含 id、name、parent_id、project_id、children、test_cases 和 case_count
+    """
+    groups = TestCaseGroup.objects.filter(project_id__in=project_ids).order_by('name').values(
+        'id', 'name', 'parent_id', 'project_id')
+    cases = TestCase.objects.filter(project_id__in=project_ids).order_by('id').values(
+        'id', 'name', 'request_method', 'request_url', 'group_id', 'project_id')
+    cases_by_project = _split_by_project(cases, project_ids)
+
+    trees = {}
+    for project_id, project_groups in _split_by_project(groups, project_ids).items():
+        roots, nodes = _assemble(project_groups)
+        for node in nodes.values():
+            node['test_cases'] = []
+        ungrouped = []
+        for case in cases_by_project[project_id]:
+            del case['project_id']
+            node = nodes.get(case.pop('group_id'))
+            (node['test_cases'] if node else ungrouped).append(case)
+        for node in nodes.values():
+            node['case_count'] = len(node['test_cases'])
+        trees[project_id] = {'groups': roots, 'ungrouped': ungrouped}
+    return trees
+
+
+def build_suite_trees(project_ids):
+    """多个项目的测试套件分组树，每个分组节点带 suite_count"""
+    groups = TestSuiteGroup.objects.filter(project_id__in=project_ids).order_by('name').values(
+        'id', 'name', 'parent_id', 'project_id')
+    counts = dict(TestSuite.objects.filter(project_id__in=project_ids, group__isnull=False).values_list(
+        'group_id').annotate(total=Count('id')).order_by())
+
+    trees = {}
+    for project_id, project_groups in _split_by_project(groups, project_ids).items():
+        roots, nodes = _assemble(project_groups)
+        for node in nodes.values():
+            node['suite_count'] = counts.get(node['id'], 0)
+        trees[project_id] = {'groups': roots}
+    return trees
+
+
+def _get_trees(key_format, builder, project_ids):
+    """批量读取缓存，未命中的项目一起构建"""
+    keys = {project_id: key_format.format(project_id) for project_id in project_ids}
+    try:
+        cached = cache.get_many(keys.values())
+    except Exception as e:
+        logger.warning(f"读取分组树缓存失败: {e}")
+        cached = {}
+
+    trees = {project_id: cached[key] for project_id, key in keys.items() if key in cached}
+    missing = [project_id for project_id in project_ids if project_id not in trees]
+    if missing:
+        built = builder(missing)
+        trees.update(built)
+        try:
+            cache.set_many({keys[project_id]: tree for project_id, tree in built.items()},
+                           getattr(settings, 'GROUP_TREE_CACHE_TTL', 600))
+        except Exception as e:
+            logger.warning(f"写入分组树缓存失败: {e}")
+    return trees
+
+
+def get_case_trees(project_ids):
+    return _get_trees(CASE_TREE_CACHE_KEY, build_case_trees, list(project_ids))
+
+
+def get_case_tree(project_id):
+    """读取缓存的测试用例分组树，分组或用例变更时失效"""
+    return get_case_trees([project_id])[project_id]
+
+
+def get_suite_trees(project_ids):
+    return _get_trees(SUITE_TREE_CACHE_KEY, build_suite_trees, list(project_ids))
+
+
+def get_suite_tree(project_id):
+    """读取缓存的测试套件分组树，分组或套件变更时失效"""
+    return get_suite_trees([project_id])[project_id]
@@ -0,0 +1,312 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+
+from .capture import CapturePolicy
+from .exports import junit_testcase, junit_testsuite_start, junit_testsuites_start
+from .httprunner_executor import execute_test_case, execute_test_suite
+from .models import TestCase, TestResult, TestRun, TestSuiteCase, TestSuiteRun
+from .runs import result_row
+
+logger = logging.getLogger(__name__)
+
+RESULT_STATUSES = ('passed', 'failed', 'error', 'skipped')
+
+
+class _Stopped(Exception):
+    """fail-fast 时中止正在执行的测试套件"""
+
+
+class HeadlessJob:
+    """
+    一个执行单元：一个测试套件（用例按顺序执行，共享提取的变量），或一个独立的测试用例
+
+    results 只保留 JUnit 等输出需要的字段，每条结果执行完即写入数据库，请求和响应内容不留在内存中
+    """
+
+    def __init__(self, target, is_suite, total=1, capture_policy=None):
+        self.target = target
+        self.is_suite = is_suite
+        self.total = total
+        self.capture_policy = capture_policy
+        self.results = []
+        self.start_time = None
+        self.end_time = None
+        self.stopped = False
+        self.skipped = False
+        self.error_message = ''
+        self.test_run_id = None
+
+    @property
+    def name(self):
+        return self.target.name
+
+    @property
+    def failed(self):
+        return bool(self.error_message) or any(result['status'] != 'passed' for result in self.results)
+
+    @property
+    def status(self):
+        if self.skipped:
+            return 'skipped'
+        return 'failed' if self.failed or self.stopped else 'completed'
+
+    @property
+    def duration(self):
+        if self.start_time and self.end_time:
+            return (self.end_time - self.start_time).total_seconds()
+        return 0
+
+
+def _compact(result):
+    """输出只用到用例（取名称）、状态、耗时和错误信息"""
+    return {
+        'test_case_id': result['test_case_id'],
+        'status': result['status'],
+        'response_time': result.get('response_time'),
+        'error_message': result.get('error_message') or '',
+    }
+
+
+class HeadlessRunner:
+    """
+    不经过Web服务和Celery，在当前进程内直接调用执行器运行测试
+
+    多个执行单元由 parallel 个线程并行执行，测试套件的运行和每条结果都在执行线程中随执行写入；
+    save 为假时不写数据库，只返回结果。fail_fast 时出现第一个未通过的结果后不再开始新的执行单元，
+    正在执行的测试套件在当前用例结束后中止
+    """
+
+    def __init__(self, environment, parallel=1, fail_fast=False, save=True, user=None, name=None,
+                 on_job_done=None):
+        self.environment = environment
+        self.parallel = max(1, parallel)
+        self.fail_fast = fail_fast
+        self.save = save
+        self.user = user
+        self.name = name
+        self.on_job_done = on_job_done
+        self.stop = threading.Event()
+        self.jobs = []
+        self.suite_run = None
+        self.test_run = None
+        self.duration = 0
+
+    # 执行
+
+    def _run_job(self, job):
+        """在线程池中执行，返回执行单元"""
+        if self.stop.is_set():
+            job.skipped = True
+            return job
+
+        job.start_time = timezone.now()
+        try:
+            test_run = self._start_job(job) if self.save else None
+
+            def on_result(result):
+                if test_run is not None:
+                    TestResult.objects.create_with_payload(
+                        **result_row(test_run, result, self.environment, job.capture_policy))
+                job.results.append(_compact(result))
+                if self.fail_fast and result['status'] != 'passed':
+                    self.stop.set()
+
+            if job.is_suite:
+                def on_suite_result(result):
+                    on_result(result)
+                    if self.stop.is_set():
+                        raise _Stopped()
+
+                execute_test_suite(job.target, self.environment, capture_policy=job.capture_policy,
+                                   on_result=on_suite_result)
+            else:
+                result = execute_test_case(job.target, self.environment)
+                result['test_case_id'] = job.target.id
+                on_result(result)
+        except _Stopped:
+            job.stopped = len(job.results) < job.total
+        except Exception as e:
+            logger.error(f"执行出错: {job.name}, {e}")
+            job.error_message = f"执行出错: {str(e)}"
+            if self.fail_fast:
+                self.stop.set()
+        finally:
+            job.end_time = timezone.now()
+            try:
+                if job.is_suite and job.test_run_id:
+                    self._finish_job(job)
+            finally:
+                # 线程池中的线程各自打开了数据库连接
+                connection.close()
+        return job
+
+    def _execute(self, jobs):
+        started = time.monotonic()
+        self.jobs = jobs
+        with ThreadPoolExecutor(max_workers=self.parallel) as pool:
+            futures = [pool.submit(self._run_job, job) for job in jobs]
+            for future in as_completed(futures):
+                job = future.result()
+                if self.on_job_done is not None:
+                    self.on_job_done(job)
+        self.duration = time.monotonic() - started
+
+    def run_suites(self, test_suites):
+        """每个测试套件一个执行单元；保存时多个套件记为一次批量运行，每个套件一个测试运行"""
+        test_suites = list(test_suites)
+        case_counts = dict(TestSuiteCase.objects.filter(test_suite__in=test_suites).values_list(
+            'test_suite_id').annotate(total=Count('id')).order_by())
+        jobs = [HeadlessJob(test_suite, is_suite=True, total=case_counts.get(test_suite.id, 0),
+                            capture_policy=CapturePolicy.for_suite(test_suite))
+                for test_suite in test_suites]
+
+        if self.save and len(test_suites) > 1:
+            self.suite_run = TestSuiteRun.objects.create(
+                name=self.name or f"{self.environment.project.name} 命令行运行",
+                project=self.environment.project,
+                environment=self.environment,
+                status='running',
+                start_time=timezone.now(),
+                created_by=self.user,
+                total_count=len(test_suites),
+            )
+        self._execute(jobs)
+        if self.suite_run is not None:
+            self.suite_run.status = 'failed' if any(job.status != 'completed' for job in jobs) else 'completed'
+            self.suite_run.end_time = timezone.now()
+            self.suite_run.save()
+        return self.summary()
+
+    def run_cases(self, test_cases):
+        """每个测试用例一个执行单元；保存时所有用例的结果记在同一个测试运行中"""
+        jobs = [HeadlessJob(test_case, is_suite=False) for test_case in test_cases]
+
+        if self.save:
+            self.test_run = TestRun.objects.create(
+                name=self.name or f"命令行运行: {len(jobs)} 个用例",
+                project=self.environment.project,
+                environment=self.environment,
+                status='running',
+                start_time=timezone.now(),
+                total_count=len(jobs),
+                created_by=self.user,
+            )
+        self._execute(jobs)
+        if self.test_run is not None:
+            # 通过 save() 结束运行，触发每日汇总
+            self.test_run.status = 'failed' if any(job.status != 'completed' for job in jobs) else 'completed'
+            self.test_run.end_time = timezone.now()
+            self.test_run.save()
+        return self.summary()
+
+    # 保存
+
+    def _start_job(self, job):
+        """执行前确定结果写入的测试运行：测试套件各建一个执行中的运行，单个用例共用 run_cases 创建的运行"""
+        if not job.is_suite:
+            job.test_run_id = self.test_run.id
+            return self.test_run
+
+        test_run = TestRun.objects.create(
+            name=f"Suite run: {job.name}",
+            project=job.target.project,
+            test_suite=job.target,
+            environment=self.environment,
+            suite_run=self.suite_run,
+            status='running',
+            start_time=job.start_time,
+            total_count=job.total,
+            created_by=self.user,
+        )
+        job.test_run_id = test_run.id
+        return test_run
+
+    def _finish_job(self, job):
+        # 通过 save() 结束运行，触发每日汇总
+        test_run = TestRun.objects.get(pk=job.test_run_id)
+        test_run.status = job.status
+        test_run.end_time = job.end_time
+        test_run.error_message = job.error_message or ('因 fail-fast 中止' if job.stopped else '')
+        test_run.save()
+
+    # 输出
+
+    def counts(self):
+        counts = {status: 0 for status in RESULT_STATUSES}
+        for job in self.jobs:
+            for result in job.results:
+                counts[result['status']] = counts.get(result['status'], 0) + 1
+        counts['total'] = sum(counts.values())
+        return counts
+
+    @property
+    def passed(self):
+        return all(job.status == 'completed' for job in self.jobs)
+
+    def _case_info(self):
+        """输出需要的用例名称和请求信息，一次查询"""
+        case_ids = {result['test_case_id'] for job in self.jobs for result in job.results}
+        return {case.id: case for case in TestCase.objects.filter(id__in=case_ids).only(
+            'id', 'name', 'request_method', 'request_url')}
+
+    def summary(self):
+        cases = self._case_info()
+        jobs = []
+        for job in self.jobs:
+            results = []
+            for result in job.results:
+                test_case = cases.get(result['test_case_id'])
+                results.append(dict(result, test_case=test_case.name if test_case else ''))
+            jobs.append({
+                'type': 'test_suite' if job.is_suite else 'test_case',
+                'id': job.target.id,
+                'name': job.name,
+                'status': job.status,
+                'test_run': job.test_run_id,
+                'start_time': job.start_time,
+                'end_time': job.end_time,
+                'duration': job.duration,
+                'error_message': job.error_message,
+                'results': results,
+            })
+        return {
+            'environment': {'id': self.environment.id, 'name': self.environment.name},
+            'passed': self.passed,
+            'aborted': self.stop.is_set(),
+            'duration': self.duration,
+            'counts': self.counts(),
+            'suite_run': self.suite_run.id if self.suite_run else None,
+            'test_run': self.test_run.id if self.test_run else None,
+            'jobs': jobs,
+        }
+
+    def iter_junit(self):
+        """JUnit XML，每个执行单元一个 testsuite；单个用例的执行单元合并为一个 testsuite"""
+        cases = self._case_info()
+        counts = self.counts()
+        yield junit_testsuites_start(counts['total'], counts['failed'], counts['error'], counts['skipped'])
+
+        suites = [(job.target.id, job.name, job.start_time, job.results) for job in self.jobs if job.is_suite]
+        case_results = [result for job in self.jobs if not job.is_suite for result in job.results]
+        if case_results:
+            suites.append((self.test_run.id if self.test_run else 0, self.name or '测试用例',
+                           self.jobs[0].start_time if self.jobs else None, case_results))
+
+        for suite_id, name, start_time, results in suites:
+            statuses = [result['status'] for result in results]
+            yield junit_testsuite_start(
+                suite_id, name, len(results), statuses.count('failed'), statuses.count('error'),
+                statuses.count('skipped'), sum(result['response_time'] or 0 for result in results), start_time)
+            for result in results:
+                test_case = cases.get(result['test_case_id'])
+                yield junit_testcase(test_case.name if test_case else str(result['test_case_id']),
+                                     test_case.request_method if test_case else '',
+                                     test_case.request_url if test_case else '',
+                                     result['status'], result['response_time'], result['error_message'])
+            yield '  </testsuite>\n'
+        yield '</testsuites>\n'
@@ -6,6 +6,9 @@ import re
 from urllib.parse import urljoin
 from jsonpath_ng import jsonpath, parse
 
+from .response_reader import ResponseTooLarge, read_response_body
+from .throttle import throttled
+
 # 尝试导入 HTTPRunner，如果失败则记录错误但不中断执行
 try:
     import httprunner
@@ -46,6 +49,9 @@ except ImportError:
 logger = logging.getLogger(__name__)
 logger.info(f"HTTPRunner version: {HTTPRUNNER_VERSION}, Available: {HTTPRUNNER_AVAILABLE}")
 
+# 逐条处理结果时，execute_test_cases 返回列表中保留的字段
+RESULT_SUMMARY_FIELDS = ('test_case_id', 'environment_id', 'status', 'response_time', 'error_message')
+
 
 def replace_variables(content, variables):
     """
@@ -123,7 +129,7 @@ def replace_variables(content, variables):
         return content
 
 
-def execute_test_case(test_case, environment, variables=None):
+def execute_test_case(test_case, environment, variables=None, capture_policy=None):
     """
     Execute a single test case using direct HTTP request
 
@@ -131,6 +137,7 @@ def execute_test_case(test_case, environment, variables=None):
         test_case: TestCase object
         environment: Environment object
         variables: Dict of variables to use for parameter substitution
+        capture_policy: CapturePolicy, 校验和参数提取用不到且策略不保存时不读取响应体
     """
     try:
         # 初始化变量字典
@@ -160,14 +167,17 @@ def execute_test_case(test_case, environment, variables=None):
         if variables:
             logger.info(f"Using variables: {variables}")
 
-        start_time = time.time()
+        # 在环境的每秒请求数和并发上限内发送请求，等待时间单独记录，不计入响应时间
+        with throttled(environment) as permit:
+            start_time = time.time()
 
-        # 直接使用 HTTP 请求执行测试
-        result = _execute_with_requests(test_case, environment, variables)
+            # 直接使用 HTTP 请求执行测试
+            result = _execute_with_requests(test_case, environment, variables, capture_policy)
 
-        # 计算响应时间
-        end_time = time.time()
+            # 计算响应时间
+            end_time = time.time()
         result["response_time"] = (end_time - start_time) * 1000  # 转换为毫秒
+        result["throttle_wait"] = permit.wait_ms
 
         # 在处理响应后，添加参数提取逻辑
         try:
@@ -227,6 +237,14 @@ def execute_test_case(test_case, environment, variables=None):
             logger.error(f"Error in parameter extraction process: {e}")
             result['extracted_params'] = {}
 
+        if 'partial_size' in result:
+            # 增量解析只得到了校验和参数提取用到的部分，不能当作完整响应体保存
+            result['response_body'] = {
+                "truncated": True,
+                "size": result.pop('partial_size'),
+                "extracted": result['response_body'],
+            }
+
         return result
 
     except Exception as e:
@@ -244,7 +262,60 @@ def execute_test_case(test_case, environment, variables=None):
         }
 
 
-def _execute_with_requests(test_case, environment, variables=None):
+def _load_rules(rules):
+    """校验规则和提取参数可能以JSON字符串保存"""
+    if isinstance(rules, str):
+        try:
+            return json.loads(rules)
+        except json.JSONDecodeError:
+            return []
+    return rules or []
+
+
+def _response_body_needed(test_case):
+    """参数提取或除状态码以外的校验规则需要读取响应体"""
+    if _load_rules(getattr(test_case, 'extract_params', None)):
+        return True
+    for rule in _load_rules(getattr(test_case, 'validation_rules', None)):
+        if not isinstance(rule, dict):
+            return True
+        for args in rule.values():
+            if not isinstance(args, (list, tuple)) or not args or args[0] != "status_code":
+                return True
+    return False
+
+
+def _response_json_paths(test_case):
+    """校验规则和参数提取用到的 JSONPath 列表，有规则需要完整响应文本时返回None"""
+    paths = []
+    for extract in _load_rules(getattr(test_case, 'extract_params', None)):
+        if isinstance(extract, str):
+            try:
+                extract = json.loads(extract)
+            except json.JSONDecodeError:
+                continue
+        if not isinstance(extract, dict) or not extract.get('path'):
+            continue
+        path = extract['path']
+        if not isinstance(path, str) or not path.startswith("$."):
+            return None
+        paths.append(path)
+    for rule in _load_rules(getattr(test_case, 'validation_rules', None)):
+        if not isinstance(rule, dict):
+            return None
+        for args in rule.values():
+            if not isinstance(args, (list, tuple)) or not args:
+                return None
+            path = args[0]
+            if path == "status_code":
+                continue
+            if not isinstance(path, str) or not path.startswith("$."):
+                return None
+            paths.append(path)
+    return paths
+
+
+def _execute_with_requests(test_case, environment, variables=None, capture_policy=None):
     """
     Execute test case using direct HTTP requests
 
@@ -252,6 +323,7 @@ def _execute_with_requests(test_case, environment, variables=None):
         test_case: TestCase object
         environment: Environment object
         variables: Dict of variables to use for parameter substitution
+        capture_policy: CapturePolicy or None
     """
     try:
         # 构建完整 URL，并替换变量
@@ -284,7 +356,9 @@ def _execute_with_requests(test_case, environment, variables=None):
 
         kwargs = {
             "headers": headers,
-            "timeout": 30
+            "timeout": 30,
+            # 响应体按需读取，不需要时直接丢弃
+            "stream": True
         }
 
         # 保存原始请求头和请求体，用于结果记录
@@ -377,16 +451,32 @@ def _execute_with_requests(test_case, environment, variables=None):
         logger.debug(f"Response status code: {response.status_code}")
         logger.debug(f"Response headers: {dict(response.headers)}")
 
-        try:
-            response_body = response.json()
-            logger.debug("Response body parsed as JSON")
-        except ValueError:
-            response_body = {"content": response.text}
-            logger.debug("Response body parsed as text")
-
         # 检查状态码是否符合预期
         success = response.status_code == test_case.expected_status_code
 
+        partial = False
+        if capture_policy is not None and not capture_policy.keeps_payload(success) \
+                and not _response_body_needed(test_case):
+            # 校验只看状态码且策略不保存载荷，响应体不读入内存
+            response.close()
+            response_body = None
+            logger.debug("Response body discarded by capture policy")
+        else:
+            keep_full = capture_policy is None or capture_policy.keeps_payload(success)
+            try:
+                response_body, partial = read_response_body(response, _response_json_paths(test_case), keep_full)
+            except ResponseTooLarge as e:
+                logger.warning(f"Response body too large: {e}")
+                return {
+                    "status": "error",
+                    "request_headers": original_headers,
+                    "request_body": original_body,
+                    "response_status_code": response.status_code,
+                    "response_headers": dict(response.headers),
+                    "response_body": None,
+                    "error_message": str(e)
+                }
+
         # 验证其他规则
         validation_errors = []
         validators = []
@@ -494,7 +584,7 @@ def _execute_with_requests(test_case, environment, variables=None):
         status = "passed" if success else "failed"
         error_message = "\n".join(validation_errors) if validation_errors else ""
 
-        return {
+        result = {
             "status": status,
             "request_headers": original_headers,  # 保存原始请求头
             "request_body": original_body,  # 保存原始请求体
@@ -504,6 +594,11 @@ def _execute_with_requests(test_case, environment, variables=None):
             "error_message": error_message,
             "validators": validators
         }
+        if partial:
+            # 增量解析只得到了部分响应体，参数提取之后由 execute_test_case 标记为不完整
+            content_length = response.headers.get("Content-Length", "")
+            result["partial_size"] = int(content_length) if content_length.isdigit() else None
+        return result
 
     except requests.RequestException as e:
         logger.exception(f"HTTP request error: {e}")
@@ -529,36 +624,25 @@ def _execute_with_requests(test_case, environment, variables=None):
         }
 
 
-def execute_test_suite(test_suite, default_environment, case_environments=None):
+def suite_cases(test_suite, default_environment, case_environments=None):
     """
-    Execute a test suite (multiple test cases) using direct HTTP requests
+    测试套件中按顺序执行的 (测试用例, 运行环境) 列表
 
-    Args:
-        test_suite: TestSuite object
-        default_environment: Default Environment object to use
-        case_environments: Dict mapping test case IDs to environment IDs
+    套件中为用例指定了环境时使用该环境，其次使用运行时为用例指定的环境，否则使用默认环境
     """
-    results = []
     case_environments = case_environments or {}
-    extracted_variables = {}  # 存储提取的变量，用于后续测试用例
+    cases = []
 
     # 获取套件中的所有测试用例，按顺序排列
-    test_suite_cases = test_suite.testsuitecase_set.all().order_by('order')
-
-    logger.info(
-        f"Executing test suite: {test_suite.name} (ID: {test_suite.id}) with {test_suite_cases.count()} test cases")
-
-    for test_suite_case in test_suite_cases:
+    for test_suite_case in test_suite.testsuitecase_set.select_related('test_case', 'environment').order_by('order'):
         test_case = test_suite_case.test_case
 
         # 确定使用哪个环境
         environment = default_environment
-        environment_id = default_environment.id
 
         # 首先检查测试套件用例是否有指定环境
-        if hasattr(test_suite_case, 'environment') and test_suite_case.environment:
+        if test_suite_case.environment:
             environment = test_suite_case.environment
-            environment_id = environment.id
         # 然后检查运行时是否指定了环境
         elif test_case.id in case_environments:
             environment_id = case_environments[test_case.id]
@@ -569,24 +653,69 @@ def execute_test_suite(test_suite, default_environment, case_environments=None):
             except Environment.DoesNotExist:
                 logger.error(f"Environment with ID {environment_id} does not exist, using default environment")
                 environment = default_environment
-                environment_id = default_environment.id
 
+        cases.append((test_case, environment))
+    return cases
+
+
+def result_summary(result):
+    """执行结果的摘要，不含请求和响应内容"""
+    return {name: result.get(name) for name in RESULT_SUMMARY_FIELDS}
+
+
+def execute_test_cases(cases, capture_policy=None, on_result=None):
+    """
+    按顺序执行 (测试用例, 运行环境) 列表，前面用例提取的参数传给后续用例
+
+    测试用例和环境只需具有执行器读取的属性，执行代理用接口返回的数据构造，不访问数据库。
+    传入 on_result 时完整结果逐条交给 on_result 处理，返回的列表只保留 result_summary 摘要，
+    整个套件的响应内容不会同时留在内存中
+    """
+    results = []
+    extracted_variables = {}  # 存储提取的变量，用于后续测试用例
+
+    for test_case, environment in cases:
         logger.info(
             f"Executing test case {test_case.name} (ID: {test_case.id}) from suite with environment: {environment.name} (ID: {environment.id})")
         logger.info(f"Using variables: {extracted_variables}")
 
         # 执行测试用例，传递之前提取的变量
-        result = execute_test_case(test_case, environment, extracted_variables)
+        result = execute_test_case(test_case, environment, extracted_variables, capture_policy)
         result['test_case_id'] = test_case.id
-        result['environment_id'] = environment_id
+        result['environment_id'] = environment.id
 
         # 存储提取的变量，用于后续测试用例
         if 'extracted_params' in result and result['extracted_params']:
             extracted_variables.update(result['extracted_params'])
             logger.info(f"Updated variables after test case: {extracted_variables}")
 
-        results.append(result)
         logger.info(f"Test case {test_case.name} execution result: {result['status']}")
+        if on_result is None:
+            results.append(result)
+        else:
+            on_result(result)
+            results.append(result_summary(result))
+
+    return results
+
+
+def execute_test_suite(test_suite, default_environment, case_environments=None, capture_policy=None, on_result=None):
+    """
+    Execute a test suite (multiple test cases) using direct HTTP requests
+
+    Args:
+        test_suite: TestSuite object
+        default_environment: Default Environment object to use
+        case_environments: Dict mapping test case IDs to environment IDs
+        capture_policy: CapturePolicy passed to each test case
+        on_result: 每个用例执行完成后调用，用于逐条保存结果和更新进度；传入时只返回结果摘要
+    """
+    cases = suite_cases(test_suite, default_environment, case_environments)
+
+    logger.info(
+        f"Executing test suite: {test_suite.name} (ID: {test_suite.id}) with {len(cases)} test cases")
+
+    results = execute_test_cases(cases, capture_policy, on_result)
 
     logger.info(
         f"Test suite execution completed. Total: {len(results)}, Passed: {sum(1 for r in results if r['status'] == 'passed')}")
@@ -0,0 +1,204 @@
+import json
+import gzip
+import logging
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import Environment, IngestBatch, TestCase, TestResult, TestRun, PAYLOAD_FIELDS
+from .runs import FINISHED_STATUSES
+
+logger = logging.getLogger(__name__)
+
+RESULT_STATUSES = {status for status, _ in TestResult.STATUS_CHOICES}
+
+
+class IngestError(ValueError):
+    """
+    提交的结果不合法，整批不写入
+
+    conflict 为真时表示测试运行已结束；too_large 为真时表示请求体解压后或单行超过大小上限
+    """
+
+    def __init__(self, message, conflict=False, too_large=False):
+        super().__init__(message)
+        self.conflict = conflict
+        self.too_large = too_large
+
+
+def _chunk_size():
+    return getattr(settings, 'INGEST_CHUNK_SIZE', 1000)
+
+
+def _max_results():
+    return getattr(settings, 'INGEST_MAX_RESULTS', 10000)
+
+
+def _max_bytes():
+    return getattr(settings, 'INGEST_MAX_BYTES', 256 * 1024 * 1024)
+
+
+def _max_line_bytes():
+    return getattr(settings, 'INGEST_MAX_LINE_BYTES', 10 * 1024 * 1024)
+
+
+class _LimitedStream:
+    """累计读取超过 max_bytes 字节时抛出 IngestError，限制 gzip 请求体解压后的大小"""
+
+    def __init__(self, stream, max_bytes):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.total = 0
+
+    def readline(self, size=-1):
+        line = self.stream.readline(size)
+        self.total += len(line)
+        if self.total > self.max_bytes:
+            raise IngestError(f"请求体超过 {self.max_bytes} 字节", too_large=True)
+        return line
+
+
+def open_stream(stream, content_encoding=''):
+    """请求体为 gzip 压缩时边读边解压，解压后的大小不超过 INGEST_MAX_BYTES"""
+    if content_encoding.strip().lower() == 'gzip':
+        stream = gzip.GzipFile(fileobj=stream, mode='rb')
+    return _LimitedStream(stream, _max_bytes())
+
+
+def iter_lines(stream):
+    """逐行解析 NDJSON，跳过空行，返回 (行号, 字典)；一行超过 INGEST_MAX_LINE_BYTES 时整批拒绝"""
+    max_line = _max_line_bytes()
+    for line_no, line in enumerate(iter(lambda: stream.readline(max_line + 1), b''), 1):
+        if len(line) > max_line and not line.endswith(b'\n'):
+            raise IngestError(f"第{line_no}行超过 {max_line} 字节", too_large=True)
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            raise IngestError(f"第{line_no}行不是合法的JSON")
+        if not isinstance(row, dict):
+            raise IngestError(f"第{line_no}行应为JSON对象")
+        yield line_no, row
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _build_result(line_no, row, test_run, case_ids, environment_ids):
+    """只做类型和引用检查，不经过序列化器，返回 bulk_create_with_payload 的参数字典"""
+    test_case_id = row.get('test_case_id')
+    if not isinstance(test_case_id, int) or test_case_id not in case_ids:
+        raise IngestError(f"第{line_no}行: test_case_id 不存在或不属于该项目")
+    status = row.get('status')
+    if status not in RESULT_STATUSES:
+        raise IngestError(f"第{line_no}行: status 应为 {', '.join(sorted(RESULT_STATUSES))} 之一")
+    environment_id = row.get('environment_id') or test_run.environment_id
+    if environment_id not in environment_ids:
+        raise IngestError(f"第{line_no}行: environment_id 不存在或不属于该项目")
+    response_time = row.get('response_time')
+    if response_time is not None and not _is_number(response_time):
+        raise IngestError(f"第{line_no}行: response_time 应为数字(毫秒)")
+    throttle_wait = row.get('throttle_wait')
+    if throttle_wait is not None and not _is_number(throttle_wait):
+        raise IngestError(f"第{line_no}行: throttle_wait 应为数字(毫秒)")
+    response_status_code = row.get('response_status_code')
+    if response_status_code is not None and not isinstance(response_status_code, int):
+        raise IngestError(f"第{line_no}行: response_status_code 应为整数")
+    error_message = row.get('error_message') or ''
+    if not isinstance(error_message, str):
+        raise IngestError(f"第{line_no}行: error_message 应为字符串")
+
+    result = {
+        'test_run_id': test_run.id,
+        'test_case_id': test_case_id,
+        'environment_id': environment_id,
+        'status': status,
+        'response_time': response_time,
+        'throttle_wait': throttle_wait,
+        'response_status_code': response_status_code,
+        'error_message': error_message,
+        'response_body': row.get('response_body'),
+    }
+    for name in PAYLOAD_FIELDS:
+        result[name] = row.get(name)
+    return result
+
+
+def _write_chunk(test_run, chunk, environment_ids):
+    # 一个分块内引用的用例一次查询
+    referenced = {row.get('test_case_id') for _, row in chunk if isinstance(row.get('test_case_id'), int)}
+    case_ids = set(TestCase.objects.filter(project_id=test_run.project_id, id__in=referenced)
+                   .values_list('id', flat=True))
+    results = [_build_result(line_no, row, test_run, case_ids, environment_ids) for line_no, row in chunk]
+    TestResult.objects.bulk_create_with_payload(results)
+    return len(results)
+
+
+def finish_run(test_run, error_message=''):
+    """结果提交完毕，按结果状态结束测试运行，给出 error_message 时记为失败；通过 save() 触发每日汇总"""
+    failed = bool(error_message) or test_run.test_results.exclude(status='passed').exists()
+    test_run.status = 'failed' if failed else 'completed'
+    if error_message:
+        test_run.error_message = error_message
+    test_run.start_time = test_run.start_time or timezone.now()
+    test_run.end_time = timezone.now()
+    test_run.save()
+
+
+def ingest_results(test_run_id, stream, key='', finish=False):
+    """
+    写入一批 NDJSON 格式的测试结果，每行一条，字段与 TestResult 相同
+
+    整批在一个事务中按 INGEST_CHUNK_SIZE 分块校验和批量插入，任一行不合法时整批回滚。
+    给出 key 时同一测试运行下相同 key 的批次只写入一次，重试直接返回首次的结果；
+    finish 为真时写入后结束测试运行。返回处理结果字典
+    """
+    with transaction.atomic():
+        # 多个分片可以同时向同一运行提交；结束运行的批次锁定测试运行，按全部已提交的结果计算状态
+        test_runs = TestRun.objects.select_for_update() if finish else TestRun.objects
+        test_run = test_runs.get(pk=test_run_id)
+        if key:
+            try:
+                with transaction.atomic():
+                    batch = IngestBatch.objects.create(test_run=test_run, key=key)
+            except IntegrityError:
+                batch = IngestBatch.objects.get(test_run=test_run, key=key)
+                logger.info(f"重复提交的结果批次: test_run={test_run_id}, key={key}")
+                return {'test_run': test_run.id, 'key': key, 'accepted': batch.result_count, 'replayed': True,
+                        'status': test_run.status}
+        else:
+            batch = None
+
+        if test_run.status in FINISHED_STATUSES:
+            raise IngestError("测试运行已结束，不能再提交结果", conflict=True)
+
+        environment_ids = set(Environment.objects.filter(project_id=test_run.project_id)
+                              .values_list('id', flat=True))
+        accepted = 0
+        chunk = []
+        for line_no, row in iter_lines(stream):
+            chunk.append((line_no, row))
+            if accepted + len(chunk) > _max_results():
+                raise IngestError(f"每批最多提交 {_max_results()} 条结果")
+            if len(chunk) >= _chunk_size():
+                accepted += _write_chunk(test_run, chunk, environment_ids)
+                chunk = []
+        if chunk:
+            accepted += _write_chunk(test_run, chunk, environment_ids)
+
+        if test_run.status == 'pending':
+            TestRun.objects.filter(pk=test_run.pk, status='pending').update(status='running',
+                                                                           start_time=timezone.now())
+            test_run.refresh_from_db(fields=['status', 'start_time'])
+        if batch is not None:
+            batch.result_count = accepted
+            batch.save(update_fields=['result_count'])
+        if finish:
+            finish_run(test_run)
+
+    logger.info(f"写入外部提交的测试结果: test_run={test_run_id}, 条数: {accepted}, key={key or '-'}")
+    return {'test_run': test_run.id, 'key': key, 'accepted': accepted, 'replayed': False,
+            'status': test_run.status}
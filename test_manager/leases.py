@@ -0,0 +1,49 @@
+import logging
+import threading
+
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseRenewer:
+    """
+    执行期间在后台线程中按 interval 秒定期续约，退出 with 块时停止
+
+    renew 返回False表示租约已不归当前执行所有，停止续约并置位 lost；
+    续约出错只记录日志，下个周期重试
+    """
+
+    def __init__(self, renew, interval, name='lease-renewer'):
+        self.renew = renew
+        self.interval = interval
+        self.name = name
+        self.stop = threading.Event()
+        self.lost = threading.Event()
+        self.thread = None
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop.set()
+        self.thread.join()
+        return False
+
+    def _run(self):
+        try:
+            while not self.stop.wait(self.interval):
+                try:
+                    renewed = self.renew()
+                except Exception as e:
+                    logger.warning(f"{self.name} 续约失败: {e}")
+                    continue
+                if not renewed:
+                    logger.warning(f"{self.name} 租约已失效，停止续约")
+                    self.lost.set()
+                    return
+        finally:
+            # 线程使用独立的数据库连接，退出时关闭
+            connection.close()
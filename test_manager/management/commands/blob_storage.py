@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from test_manager.blobstore import storage_report, collect_unreferenced_blobs
+
+
+class Command(BaseCommand):
+    help = '查看响应体存储的空间统计，可选删除未引用的响应体'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--gc',
+            action='store_true',
+            help='删除没有测试结果引用的响应体',
+        )
+        parser.add_argument(
+            '--grace',
+            type=int,
+            help='最近引用时间在此秒数内的内容不删除，默认取RESPONSE_BLOB_GC_GRACE',
+        )
+
+    def handle(self, *args, **options):
+        if options['gc']:
+            deleted = collect_unreferenced_blobs(grace=options['grace'])
+            self.stdout.write(f'删除了 {deleted} 个未引用的响应体')
+
+        report = storage_report()
+        self.stdout.write(f"响应体: {report['blob_count']} 个，原始 {report['raw_size']} 字节，"
+                          f"压缩后 {report['stored_size']} 字节")
+        self.stdout.write(f"引用: {report['result_count']} 条测试结果，未去重未压缩共 {report['logical_size']} 字节，"
+                          f"节省 {report['saving_ratio']:.1%}")
+        self.stdout.write(f"未引用: {report['unreferenced_count']} 个，{report['unreferenced_size']} 字节")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from test_manager.retention import prune_execution_logs, prune_test_runs
+
+
+class Command(BaseCommand):
+    help = '按保留策略分批清理历史执行日志、测试运行和测试结果'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--log-days',
+            type=int,
+            help='执行日志保留天数，默认取RETENTION_EXECUTION_LOG_DAYS',
+        )
+        parser.add_argument(
+            '--run-days',
+            type=int,
+            help='测试运行保留天数，默认取RETENTION_TEST_RUN_DAYS',
+        )
+        parser.add_argument(
+            '--no-archive',
+            action='store_true',
+            help='删除测试结果前不归档',
+        )
+
+    def handle(self, *args, **options):
+        deleted_logs = prune_execution_logs(days=options['log_days'])
+        self.stdout.write(f'清理了 {deleted_logs} 条执行日志')
+
+        stats = prune_test_runs(days=options['run_days'], archive=False if options['no_archive'] else None)
+        self.stdout.write(f"清理了 {stats['runs']} 个测试运行，{stats['results']} 条测试结果")
+        if stats['archive'] and stats['results']:
+            self.stdout.write(f"测试结果已归档到 {stats['archive']}")
+
+        self.stdout.write(self.style.SUCCESS('历史数据清理完成'))
@@ -0,0 +1,27 @@
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from test_manager.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = '从测试运行和测试结果重建每日汇总表'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='只重建该日期(YYYY-MM-DD)及之后的汇总，默认全部重建',
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.strptime(options['since'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('日期格式应为 YYYY-MM-DD')
+
+        self.stdout.write('开始重建每日汇总，重建期间结束的测试运行可能需要再次重建')
+        stats = rebuild_rollups(since=since)
+        self.stdout.write(
+            self.style.SUCCESS(f"重建完成: 项目汇总 {stats['project_rows']} 行，用例汇总 {stats['case_rows']} 行")
+        )
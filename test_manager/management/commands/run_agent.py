@@ -0,0 +1,50 @@
+import os
+import socket
+from django.core.management.base import BaseCommand, CommandError
+from test_manager.agent_client import Agent, AgentClient, AgentError
+
+
+class Command(BaseCommand):
+    help = '启动执行代理：向平台注册，领取环境标签匹配的运行任务，执行后分批提交结果'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', default=os.environ.get('EASYTESTING_SERVER', 'http://127.0.0.1:8000'),
+                            help='平台地址，默认取环境变量 EASYTESTING_SERVER')
+        parser.add_argument('--username', default=os.environ.get('EASYTESTING_USERNAME'),
+                            help='平台用户名，默认取环境变量 EASYTESTING_USERNAME')
+        parser.add_argument('--password', default=os.environ.get('EASYTESTING_PASSWORD'),
+                            help='平台密码，默认取环境变量 EASYTESTING_PASSWORD')
+        parser.add_argument('--name', help='代理名称，默认为 主机名-进程ID')
+        parser.add_argument('--labels', default='default', help='可领取的环境标签，逗号分隔，默认 default')
+        parser.add_argument('--capacity', '-c', type=int, default=1, help='同时执行的任务数，默认1')
+        parser.add_argument('--batch-size', type=int, default=50, help='每批提交的结果条数，默认50')
+        parser.add_argument('--poll-interval', type=float, default=5, help='没有任务时领取的间隔(秒)，默认5')
+        parser.add_argument('--exit-when-idle', action='store_true', help='没有可领取和执行中的任务时退出')
+
+    def handle(self, *args, **options):
+        if not options['username'] or not options['password']:
+            raise CommandError('请通过 --username/--password 或环境变量指定平台账号', returncode=2)
+        if options['capacity'] < 1:
+            raise CommandError('并发数必须大于0', returncode=2)
+        labels = [label.strip() for label in options['labels'].split(',') if label.strip()]
+        if not labels:
+            raise CommandError('至少需要一个标签', returncode=2)
+
+        hostname = socket.gethostname()
+        agent = Agent(
+            AgentClient(options['server'], options['username'], options['password']),
+            name=options['name'] or f'{hostname}-{os.getpid()}',
+            labels=labels,
+            capacity=options['capacity'],
+            hostname=hostname,
+            batch_size=options['batch_size'],
+            poll_interval=options['poll_interval'],
+            exit_when_idle=options['exit_when_idle'],
+            log=self.stdout.write,
+        )
+        try:
+            counts = agent.run()
+        except AgentError as e:
+            raise CommandError(f'无法连接平台: {e}')
+        self.stdout.write(f"执行代理退出，完成 {counts['completed']} 个任务，失败 {counts['failed']} 个，"
+                          f"中途停止 {counts['cancelled']} 个")
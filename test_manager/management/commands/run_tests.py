@@ -0,0 +1,123 @@
+import sys
+import json
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from test_manager.headless import HeadlessRunner
+from test_manager.models import Environment, TestCase, TestCaseGroup, TestSuite, TestSuiteGroup
+
+
+class Command(BaseCommand):
+    help = '不经过Web服务和Celery，在当前进程内运行测试套件、分组或整个项目的测试'
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--suite', type=int, nargs='+', metavar='ID', help='运行指定的测试套件')
+        target.add_argument('--suite-group', type=int, metavar='ID', help='运行套件分组及其子分组下的全部测试套件')
+        target.add_argument('--case-group', type=int, metavar='ID', help='运行用例分组及其子分组下的全部测试用例')
+        target.add_argument('--project', type=int, metavar='ID', help='运行项目的全部测试套件')
+        parser.add_argument('--environment', '-e', type=int, required=True, metavar='ID', help='运行环境')
+        parser.add_argument('--parallel', '-p', type=int, default=1,
+                            help='并行执行的套件数（运行用例分组时为用例数），默认1')
+        parser.add_argument('--fail-fast', action='store_true', help='出现第一个未通过的结果后停止')
+        parser.add_argument('--json', metavar='PATH', help='结果写入JSON文件')
+        parser.add_argument('--junit', metavar='PATH', help='结果写入JUnit XML文件')
+        parser.add_argument('--no-save', action='store_true', help='不保存测试运行和结果，只输出')
+        parser.add_argument('--user', help='保存的测试运行的创建人，默认第一个超级用户')
+        parser.add_argument('--name', help='测试运行名称')
+
+    def _user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f'用户不存在: {username}', returncode=2)
+            return user
+        user = User.objects.filter(is_superuser=True, is_active=True).order_by('id').first()
+        if user is None:
+            raise CommandError('没有超级用户，请用 --user 指定创建人，或使用 --no-save', returncode=2)
+        return user
+
+    def _print_job(self, job):
+        passed = sum(1 for result in job.results if result['status'] == 'passed')
+        line = f'{job.name}: {passed}/{len(job.results)} 通过 ({job.duration:.2f}s)'
+        if job.status == 'completed':
+            self.stdout.write(self.style.SUCCESS(f'  通过  {line}'))
+        elif job.status == 'skipped':
+            self.stdout.write(self.style.WARNING(f'  跳过  {job.name}'))
+        else:
+            self.stdout.write(self.style.ERROR(f'  失败  {line}'))
+            for result in job.results:
+                if result['status'] != 'passed' and result['error_message']:
+                    self.stdout.write(f"        用例 {result['test_case_id']}: {result['error_message'].splitlines()[0]}")
+            if job.error_message:
+                self.stdout.write(f'        {job.error_message}')
+
+    def handle(self, *args, **options):
+        if options['parallel'] < 1:
+            raise CommandError('并行数必须大于0', returncode=2)
+        environment = Environment.objects.select_related('project').filter(pk=options['environment']).first()
+        if environment is None:
+            raise CommandError(f"运行环境不存在: {options['environment']}", returncode=2)
+        project = environment.project
+
+        test_suites = test_cases = None
+        if options['suite']:
+            test_suites = TestSuite.objects.filter(project=project, id__in=options['suite']).order_by('name')
+            missing = set(options['suite']) - {test_suite.id for test_suite in test_suites}
+            if missing:
+                raise CommandError(f"测试套件不存在或不属于环境所在的项目: {sorted(missing)}", returncode=2)
+        elif options['suite_group']:
+            group = TestSuiteGroup.objects.filter(project=project, pk=options['suite_group']).first()
+            if group is None:
+                raise CommandError('套件分组不存在或不属于环境所在的项目', returncode=2)
+            test_suites = group.get_test_suites().order_by('name')
+        elif options['case_group']:
+            group = TestCaseGroup.objects.filter(project=project, pk=options['case_group']).first()
+            if group is None:
+                raise CommandError('用例分组不存在或不属于环境所在的项目', returncode=2)
+            test_cases = group.get_test_cases().order_by('id')
+        else:
+            if options['project'] != project.id:
+                raise CommandError('运行环境不属于该项目', returncode=2)
+            test_suites = TestSuite.objects.filter(project=project).order_by('name')
+
+        save = not options['no_save']
+        runner = HeadlessRunner(
+            environment,
+            parallel=options['parallel'],
+            fail_fast=options['fail_fast'],
+            save=save,
+            user=self._user(options['user']) if save else None,
+            name=options['name'],
+            on_job_done=self._print_job,
+        )
+
+        self.stdout.write(f'运行环境: {environment.name} ({environment.base_url})，并行数: {options["parallel"]}')
+        if test_cases is not None:
+            summary = runner.run_cases(list(test_cases))
+        else:
+            summary = runner.run_suites(list(test_suites))
+
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as f:
+                json.dump(summary, f, ensure_ascii=False, indent=2, cls=DjangoJSONEncoder)
+        if options['junit']:
+            with open(options['junit'], 'w', encoding='utf-8') as f:
+                f.writelines(runner.iter_junit())
+
+        counts = summary['counts']
+        message = (f"共 {counts['total']} 个用例: 通过 {counts['passed']}，失败 {counts['failed']}，"
+                   f"错误 {counts['error']}，跳过 {counts['skipped']}，耗时 {summary['duration']:.2f}s")
+        if summary['aborted']:
+            message += '（fail-fast 已中止）'
+        if summary['suite_run']:
+            message += f"，批量运行ID: {summary['suite_run']}"
+        elif summary['test_run']:
+            message += f"，测试运行ID: {summary['test_run']}"
+
+        if summary['passed']:
+            self.stdout.write(self.style.SUCCESS(message))
+        else:
+            self.stdout.write(self.style.ERROR(message))
+            # 有未通过的结果时以1退出，参数错误为2
+            sys.exit(1)
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from EasyTesting.celery import app
+from test_manager.queues import QUEUE_GROUPS, queues_for_group
+
+
+class Command(BaseCommand):
+    help = '按队列分组启动Celery worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'groups',
+            nargs='+',
+            choices=QUEUE_GROUPS,
+            help='要消费的队列分组',
+        )
+        parser.add_argument(
+            '--concurrency', '-c',
+            type=int,
+            help='worker并发数，默认取CELERY_QUEUE_CONCURRENCY中各分组之和',
+        )
+        parser.add_argument(
+            '--loglevel', '-l',
+            default='info',
+            help='日志级别',
+        )
+
+    def handle(self, *args, **options):
+        groups = options['groups']
+        concurrency_settings = getattr(settings, 'CELERY_QUEUE_CONCURRENCY', {})
+
+        concurrency = options['concurrency'] or sum(concurrency_settings.get(group, 1) for group in groups)
+        if concurrency < 1:
+            raise CommandError('并发数必须大于0')
+
+        queues = []
+        for group in groups:
+            queues.extend(queues_for_group(group))
+
+        node_name = f"{'-'.join(groups)}@%h"
+        self.stdout.write(
+            self.style.SUCCESS(f'启动worker {node_name}，队列: {",".join(queues)}，并发数: {concurrency}')
+        )
+
+        app.worker_main([
+            'worker',
+            '-l', options['loglevel'],
+            '-Q', ','.join(queues),
+            '-c', str(concurrency),
+            '-n', node_name,
+        ])
@@ -0,0 +1,76 @@
+# Generated by Django 4.2.11 on 2026-10-19 15:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0017_scheduledtask_environment"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scheduledtask",
+            name="lease_expires_at",
+            field=models.DateTimeField(
+                blank=True,
+                db_comment="租约过期时间",
+                null=True,
+                verbose_name="租约过期时间",
+            ),
+        ),
+        migrations.AddField(
+            model_name="scheduledtask",
+            name="lease_owner",
+            field=models.CharField(
+                blank=True,
+                db_comment="租约持有者",
+                max_length=255,
+                verbose_name="租约持有者",
+            ),
+        ),
+        migrations.AddField(
+            model_name="scheduledtask",
+            name="overlap_policy",
+            field=models.CharField(
+                choices=[
+                    ("skip", "跳过本次"),
+                    ("queue", "排队一次"),
+                    ("coalesce", "合并到当前执行"),
+                ],
+                db_comment="重叠执行策略",
+                default="skip",
+                help_text="上一次执行尚未结束时再次触发的处理方式",
+                max_length=20,
+                verbose_name="重叠执行策略",
+            ),
+        ),
+        migrations.AddField(
+            model_name="scheduledtask",
+            name="pending_run",
+            field=models.BooleanField(
+                db_comment="已排队执行", default=False, verbose_name="已排队执行"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="taskexecutionlog",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("running", "运行中"),
+                    ("success", "成功"),
+                    ("failed", "失败"),
+                    ("timeout", "超时"),
+                    ("cancelled", "已取消"),
+                    ("skipped", "已跳过"),
+                    ("queued", "已排队"),
+                    ("coalesced", "已合并"),
+                ],
+                db_comment="执行状态",
+                default="running",
+                max_length=20,
+                verbose_name="执行状态",
+            ),
+        ),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0018_scheduledtask_lease_expires_at_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="WorkerHeartbeat",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "hostname",
+                    models.CharField(
+                        db_comment="主机名",
+                        max_length=255,
+                        unique=True,
+                        verbose_name="主机名",
+                    ),
+                ),
+                (
+                    "pid",
+                    models.IntegerField(
+                        blank=True,
+                        db_comment="进程ID",
+                        null=True,
+                        verbose_name="进程ID",
+                    ),
+                ),
+                (
+                    "concurrency",
+                    models.IntegerField(
+                        db_comment="并发容量", default=0, verbose_name="并发容量"
+                    ),
+                ),
+                (
+                    "active_tasks",
+                    models.IntegerField(
+                        db_comment="执行中任务数",
+                        default=0,
+                        verbose_name="执行中任务数",
+                    ),
+                ),
+                (
+                    "reserved_tasks",
+                    models.IntegerField(
+                        db_comment="已预取任务数",
+                        default=0,
+                        verbose_name="已预取任务数",
+                    ),
+                ),
+                (
+                    "queues",
+                    models.JSONField(
+                        blank=True,
+                        db_comment="消费队列",
+                        default=list,
+                        verbose_name="消费队列",
+                    ),
+                ),
+                (
+                    "queue_depth",
+                    models.JSONField(
+                        blank=True,
+                        db_comment="队列积压",
+                        default=dict,
+                        verbose_name="队列积压",
+                    ),
+                ),
+                (
+                    "registered_tasks",
+                    models.JSONField(
+                        blank=True,
+                        db_comment="已注册任务",
+                        default=list,
+                        verbose_name="已注册任务",
+                    ),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(
+                        blank=True,
+                        db_comment="启动时间",
+                        null=True,
+                        verbose_name="启动时间",
+                    ),
+                ),
+                (
+                    "last_seen",
+                    models.DateTimeField(
+                        db_comment="最近心跳时间",
+                        db_index=True,
+                        verbose_name="最近心跳时间",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Worker心跳",
+                "verbose_name_plural": "Worker心跳",
+                "ordering": ["hostname"],
+            },
+        ),
+    ]
@@ -0,0 +1,130 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:04
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0019_workerheartbeat"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TestCaseResultSummary",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "total_count",
+                    models.IntegerField(
+                        db_comment="执行次数", default=0, verbose_name="执行次数"
+                    ),
+                ),
+                (
+                    "passed_count",
+                    models.IntegerField(
+                        db_comment="通过次数", default=0, verbose_name="通过次数"
+                    ),
+                ),
+                (
+                    "failed_count",
+                    models.IntegerField(
+                        db_comment="失败次数", default=0, verbose_name="失败次数"
+                    ),
+                ),
+                (
+                    "error_count",
+                    models.IntegerField(
+                        db_comment="错误次数", default=0, verbose_name="错误次数"
+                    ),
+                ),
+                (
+                    "skipped_count",
+                    models.IntegerField(
+                        db_comment="跳过次数", default=0, verbose_name="跳过次数"
+                    ),
+                ),
+                (
+                    "timed_count",
+                    models.IntegerField(
+                        db_comment="有响应时间的次数",
+                        default=0,
+                        verbose_name="有响应时间的次数",
+                    ),
+                ),
+                (
+                    "total_response_time",
+                    models.FloatField(
+                        db_comment="响应时间合计",
+                        default=0,
+                        verbose_name="响应时间合计",
+                    ),
+                ),
+                (
+                    "min_response_time",
+                    models.FloatField(
+                        blank=True,
+                        db_comment="最小响应时间",
+                        null=True,
+                        verbose_name="最小响应时间",
+                    ),
+                ),
+                (
+                    "max_response_time",
+                    models.FloatField(
+                        blank=True,
+                        db_comment="最大响应时间",
+                        null=True,
+                        verbose_name="最大响应时间",
+                    ),
+                ),
+                (
+                    "first_run_at",
+                    models.DateTimeField(
+                        blank=True,
+                        db_comment="最早执行时间",
+                        null=True,
+                        verbose_name="最早执行时间",
+                    ),
+                ),
+                (
+                    "last_run_at",
+                    models.DateTimeField(
+                        blank=True,
+                        db_comment="最近执行时间",
+                        null=True,
+                        verbose_name="最近执行时间",
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        auto_now=True, db_comment="更新时间", verbose_name="更新时间"
+                    ),
+                ),
+                (
+                    "test_case",
+                    models.OneToOneField(
+                        db_comment="测试用例",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="result_summary",
+                        to="test_manager.testcase",
+                        verbose_name="测试用例",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "测试结果汇总",
+                "verbose_name_plural": "测试结果汇总",
+            },
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0020_testcaseresultsummary"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scheduledtask",
+            name="notification_digest",
+            field=models.BooleanField(
+                db_comment="合并通知",
+                default=False,
+                help_text="在汇总窗口内把同一收件人的多次执行通知合并为一封邮件",
+                verbose_name="合并通知",
+            ),
+        ),
+        migrations.CreateModel(
+            name="EmailNotification",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "recipient",
+                    models.EmailField(
+                        db_comment="收件人", max_length=254, verbose_name="收件人"
+                    ),
+                ),
+                (
+                    "digest",
+                    models.BooleanField(
+                        db_comment="合并发送", default=False, verbose_name="合并发送"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("pending", "待发送"),
+                            ("sent", "已发送"),
+                            ("failed", "发送失败"),
+                        ],
+                        db_comment="发送状态",
+                        db_index=True,
+                        default="pending",
+                        max_length=20,
+                        verbose_name="发送状态",
+                    ),
+                ),
+                (
+                    "error_message",
+                    models.TextField(
+                        blank=True, db_comment="错误信息", verbose_name="错误信息"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True,
+                        db_comment="创建时间",
+                        verbose_name="创建时间",
+                    ),
+                ),
+                (
+                    "sent_at",
+                    models.DateTimeField(
+                        blank=True,
+                        db_comment="发送时间",
+                        null=True,
+                        verbose_name="发送时间",
+                    ),
+                ),
+                (
+                    "execution_log",
+                    models.ForeignKey(
+                        db_comment="执行日志",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="email_notifications",
+                        to="test_manager.taskexecutionlog",
+                        verbose_name="执行日志",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "邮件通知",
+                "verbose_name_plural": "邮件通知",
+                "ordering": ["id"],
+            },
+        ),
+    ]
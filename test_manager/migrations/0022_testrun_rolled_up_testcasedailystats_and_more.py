@@ -0,0 +1,214 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0021_scheduledtask_notification_digest_emailnotification"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="testrun",
+            name="rolled_up",
+            field=models.BooleanField(
+                db_comment="已汇总",
+                default=False,
+                help_text="是否已计入每日汇总表",
+                verbose_name="已汇总",
+            ),
+        ),
+        migrations.CreateModel(
+            name="TestCaseDailyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(db_comment="日期", verbose_name="日期")),
+                (
+                    "result_count",
+                    models.IntegerField(
+                        db_comment="执行次数", default=0, verbose_name="执行次数"
+                    ),
+                ),
+                (
+                    "passed_count",
+                    models.IntegerField(
+                        db_comment="通过次数", default=0, verbose_name="通过次数"
+                    ),
+                ),
+                (
+                    "failed_count",
+                    models.IntegerField(
+                        db_comment="失败次数", default=0, verbose_name="失败次数"
+                    ),
+                ),
+                (
+                    "error_count",
+                    models.IntegerField(
+                        db_comment="错误次数", default=0, verbose_name="错误次数"
+                    ),
+                ),
+                (
+                    "skipped_count",
+                    models.IntegerField(
+                        db_comment="跳过次数", default=0, verbose_name="跳过次数"
+                    ),
+                ),
+                (
+                    "timed_count",
+                    models.IntegerField(
+                        db_comment="有响应时间的次数",
+                        default=0,
+                        verbose_name="有响应时间的次数",
+                    ),
+                ),
+                (
+                    "total_response_time",
+                    models.FloatField(
+                        db_comment="响应时间合计",
+                        default=0,
+                        verbose_name="响应时间合计",
+                    ),
+                ),
+                (
+                    "min_response_time",
+                    models.FloatField(
+                        blank=True,
+                        db_comment="最小响应时间",
+                        null=True,
+                        verbose_name="最小响应时间",
+                    ),
+                ),
+                (
+                    "max_response_time",
+                    models.FloatField(
+                        blank=True,
+                        db_comment="最大响应时间",
+                        null=True,
+                        verbose_name="最大响应时间",
+                    ),
+                ),
+                (
+                    "test_case",
+                    models.ForeignKey(
+                        db_comment="测试用例",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_stats",
+                        to="test_manager.testcase",
+                        verbose_name="测试用例",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "测试用例每日汇总",
+                "verbose_name_plural": "测试用例每日汇总",
+                "ordering": ["-date"],
+                "unique_together": {("test_case", "date")},
+            },
+        ),
+        migrations.CreateModel(
+            name="ProjectDailyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(db_comment="日期", verbose_name="日期")),
+                (
+                    "run_count",
+                    models.IntegerField(
+                        db_comment="运行次数", default=0, verbose_name="运行次数"
+                    ),
+                ),
+                (
+                    "completed_run_count",
+                    models.IntegerField(
+                        db_comment="完成次数", default=0, verbose_name="完成次数"
+                    ),
+                ),
+                (
+                    "failed_run_count",
+                    models.IntegerField(
+                        db_comment="失败次数", default=0, verbose_name="失败次数"
+                    ),
+                ),
+                (
+                    "result_count",
+                    models.IntegerField(
+                        db_comment="结果数", default=0, verbose_name="结果数"
+                    ),
+                ),
+                (
+                    "passed_count",
+                    models.IntegerField(
+                        db_comment="通过数", default=0, verbose_name="通过数"
+                    ),
+                ),
+                (
+                    "failed_count",
+                    models.IntegerField(
+                        db_comment="失败数", default=0, verbose_name="失败数"
+                    ),
+                ),
+                (
+                    "error_count",
+                    models.IntegerField(
+                        db_comment="错误数", default=0, verbose_name="错误数"
+                    ),
+                ),
+                (
+                    "skipped_count",
+                    models.IntegerField(
+                        db_comment="跳过数", default=0, verbose_name="跳过数"
+                    ),
+                ),
+                (
+                    "timed_count",
+                    models.IntegerField(
+                        db_comment="有响应时间的结果数",
+                        default=0,
+                        verbose_name="有响应时间的结果数",
+                    ),
+                ),
+                (
+                    "total_response_time",
+                    models.FloatField(
+                        db_comment="响应时间合计",
+                        default=0,
+                        verbose_name="响应时间合计",
+                    ),
+                ),
+                (
+                    "project",
+                    models.ForeignKey(
+                        db_comment="所属项目",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_stats",
+                        to="test_manager.project",
+                        verbose_name="所属项目",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "项目每日汇总",
+                "verbose_name_plural": "项目每日汇总",
+                "ordering": ["-date"],
+                "unique_together": {("project", "date")},
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0022_testrun_rolled_up_testcasedailystats_and_more"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="taskexecutionlog",
+            index=models.Index(
+                fields=["scheduled_task", "-start_time"], name="tasklog_task_start_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="testresult",
+            index=models.Index(
+                fields=["test_run", "status"], name="testresult_run_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="testresult",
+            index=models.Index(
+                fields=["test_case", "-created_at", "-id"],
+                name="testresult_case_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="testresult",
+            index=models.Index(
+                fields=["created_at", "id"], name="testresult_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="testrun",
+            index=models.Index(
+                fields=["project", "-created_at", "-id"],
+                name="testrun_project_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="testrun",
+            index=models.Index(fields=["created_at", "id"], name="testrun_created_idx"),
+        ),
+    ]
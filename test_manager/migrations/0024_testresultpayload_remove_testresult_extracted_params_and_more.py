@@ -0,0 +1,144 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+PAYLOAD_FIELDS = ("request_headers", "request_body", "response_headers", "response_body", "extracted_params",
+                  "validators")
+
+
+def copy_payloads(apps, schema_editor):
+    """把已有测试结果的大字段分批复制到载荷表"""
+    TestResult = apps.get_model("test_manager", "TestResult")
+    TestResultPayload = apps.get_model("test_manager", "TestResultPayload")
+
+    batch = []
+    for row in TestResult.objects.order_by("id").values("id", *PAYLOAD_FIELDS).iterator(chunk_size=500):
+        result_id = row.pop("id")
+        batch.append(TestResultPayload(result_id=result_id, **row))
+        if len(batch) >= 500:
+            TestResultPayload.objects.bulk_create(batch)
+            batch = []
+    TestResultPayload.objects.bulk_create(batch)
+
+
+def restore_payloads(apps, schema_editor):
+    TestResult = apps.get_model("test_manager", "TestResult")
+    TestResultPayload = apps.get_model("test_manager", "TestResultPayload")
+
+    for payload in TestResultPayload.objects.iterator(chunk_size=500):
+        TestResult.objects.filter(id=payload.result_id).update(
+            **{name: getattr(payload, name) for name in PAYLOAD_FIELDS}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0023_taskexecutionlog_tasklog_task_start_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TestResultPayload",
+            fields=[
+                (
+                    "result",
+                    models.OneToOneField(
+                        db_comment="测试结果",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="payload",
+                        serialize=False,
+                        to="test_manager.testresult",
+                        verbose_name="测试结果",
+                    ),
+                ),
+                (
+                    "request_headers",
+                    models.JSONField(
+                        blank=True,
+                        db_comment="请求头",
+                        default=dict,
+                        verbose_name="请求头",
+                    ),
+                ),
+                (
+                    "request_body",
+                    models.JSONField(
+                        blank=True,
+                        db_comment="请求体",
+                        default=dict,
+                        null=True,
+                        verbose_name="请求体",
+                    ),
+                ),
+                (
+                    "response_headers",
+                    models.JSONField(
+                        blank=True,
+                        db_comment="响应头",
+                        default=dict,
+                        verbose_name="响应头",
+                    ),
+                ),
+                (
+                    "response_body",
+                    models.JSONField(
+                        blank=True,
+                        db_comment="响应体",
+                        default=dict,
+                        null=True,
+                        verbose_name="响应体",
+                    ),
+                ),
+                (
+                    "extracted_params",
+                    models.JSONField(
+                        blank=True,
+                        db_comment="提取参数",
+                        default=dict,
+                        verbose_name="提取参数",
+                    ),
+                ),
+                (
+                    "validators",
+                    models.JSONField(
+                        blank=True,
+                        db_comment="验证器",
+                        default=list,
+                        verbose_name="验证器",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "测试结果载荷",
+                "verbose_name_plural": "测试结果载荷",
+            },
+        ),
+        migrations.RunPython(copy_payloads, restore_payloads),
+        migrations.RemoveField(
+            model_name="testresult",
+            name="extracted_params",
+        ),
+        migrations.RemoveField(
+            model_name="testresult",
+            name="request_body",
+        ),
+        migrations.RemoveField(
+            model_name="testresult",
+            name="request_headers",
+        ),
+        migrations.RemoveField(
+            model_name="testresult",
+            name="response_body",
+        ),
+        migrations.RemoveField(
+            model_name="testresult",
+            name="response_headers",
+        ),
+        migrations.RemoveField(
+            model_name="testresult",
+            name="validators",
+        ),
+    ]
@@ -0,0 +1,137 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import hashlib
+import json
+import zlib
+
+
+def _encode(value):
+    """与 ResponseBlob.encode 相同：哈希按键排序计算，保存的内容保留原始键顺序"""
+    options = {"ensure_ascii": False, "separators": (",", ":")}
+    canonical = json.dumps(value, sort_keys=True, **options).encode("utf-8")
+    return hashlib.sha256(canonical).hexdigest(), json.dumps(value, **options).encode("utf-8")
+
+
+def move_response_bodies(apps, schema_editor):
+    """把载荷表中的响应体按内容去重写入响应体存储"""
+    TestResult = apps.get_model("test_manager", "TestResult")
+    TestResultPayload = apps.get_model("test_manager", "TestResultPayload")
+    ResponseBlob = apps.get_model("test_manager", "ResponseBlob")
+
+    known = set(ResponseBlob.objects.values_list("hash", flat=True))
+    rows = TestResultPayload.objects.exclude(response_body=None).order_by("result_id").values_list(
+        "result_id", "response_body")
+    for result_id, body in rows.iterator(chunk_size=500):
+        digest, raw = _encode(body)
+        if digest not in known:
+            data = zlib.compress(raw, 6)
+            ResponseBlob.objects.create(hash=digest, size=len(raw), compressed_size=len(data), data=data)
+            known.add(digest)
+        TestResult.objects.filter(id=result_id).update(response_blob_id=digest, response_size=len(raw))
+
+
+def restore_response_bodies(apps, schema_editor):
+    TestResult = apps.get_model("test_manager", "TestResult")
+    TestResultPayload = apps.get_model("test_manager", "TestResultPayload")
+    ResponseBlob = apps.get_model("test_manager", "ResponseBlob")
+
+    for blob in ResponseBlob.objects.iterator(chunk_size=100):
+        body = json.loads(zlib.decompress(bytes(blob.data)))
+        result_ids = TestResult.objects.filter(response_blob_id=blob.hash).values_list("id", flat=True)
+        TestResultPayload.objects.filter(result_id__in=result_ids).update(response_body=body)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "test_manager",
+            "0024_testresultpayload_remove_testresult_extracted_params_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ResponseBlob",
+            fields=[
+                (
+                    "hash",
+                    models.CharField(
+                        db_comment="内容哈希",
+                        max_length=64,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="内容哈希",
+                    ),
+                ),
+                (
+                    "size",
+                    models.PositiveIntegerField(
+                        db_comment="原始大小(字节)", verbose_name="原始大小"
+                    ),
+                ),
+                (
+                    "compressed_size",
+                    models.PositiveIntegerField(
+                        db_comment="压缩后大小(字节)", verbose_name="压缩后大小"
+                    ),
+                ),
+                (
+                    "data",
+                    models.BinaryField(db_comment="压缩内容", verbose_name="压缩内容"),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True,
+                        db_comment="创建时间",
+                        verbose_name="创建时间",
+                    ),
+                ),
+                (
+                    "last_used_at",
+                    models.DateTimeField(
+                        db_comment="最近引用时间",
+                        db_index=True,
+                        default=django.utils.timezone.now,
+                        verbose_name="最近引用时间",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "响应体存储",
+                "verbose_name_plural": "响应体存储",
+            },
+        ),
+        migrations.AddField(
+            model_name="testresult",
+            name="response_size",
+            field=models.PositiveIntegerField(
+                blank=True,
+                db_comment="响应体大小(字节)",
+                null=True,
+                verbose_name="响应体大小",
+            ),
+        ),
+        migrations.AddField(
+            model_name="testresult",
+            name="response_blob",
+            field=models.ForeignKey(
+                blank=True,
+                db_comment="响应体内容哈希",
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="results",
+                to="test_manager.responseblob",
+                verbose_name="响应体",
+            ),
+        ),
+        migrations.RunPython(move_response_bodies, restore_response_bodies),
+        migrations.RemoveField(
+            model_name="testresultpayload",
+            name="response_body",
+        ),
+    ]
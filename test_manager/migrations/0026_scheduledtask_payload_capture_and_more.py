@@ -0,0 +1,70 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        (
+            "test_manager",
+            "0025_responseblob_remove_testresultpayload_response_body_and_more",
+        ),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="scheduledtask",
+            name="payload_capture",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("", "跟随测试套件"),
+                    ("full", "完整保存"),
+                    ("on_failure", "仅失败时保存"),
+                    ("truncated", "超出大小时截断"),
+                    ("none", "不保存"),
+                ],
+                db_comment="载荷保存策略",
+                help_text="为空时使用测试套件的设置",
+                max_length=20,
+                verbose_name="载荷保存策略",
+            ),
+        ),
+        migrations.AddField(
+            model_name="testsuite",
+            name="capture_headers",
+            field=models.BooleanField(
+                db_comment="保存请求头和响应头",
+                default=True,
+                verbose_name="保存请求头和响应头",
+            ),
+        ),
+        migrations.AddField(
+            model_name="testsuite",
+            name="payload_capture",
+            field=models.CharField(
+                choices=[
+                    ("full", "完整保存"),
+                    ("on_failure", "仅失败时保存"),
+                    ("truncated", "超出大小时截断"),
+                    ("none", "不保存"),
+                ],
+                db_comment="载荷保存策略",
+                default="full",
+                help_text="测试结果的请求和响应内容如何保存",
+                max_length=20,
+                verbose_name="载荷保存策略",
+            ),
+        ),
+        migrations.AddField(
+            model_name="testsuite",
+            name="payload_max_kb",
+            field=models.PositiveIntegerField(
+                db_comment="载荷截断大小(KB)",
+                default=64,
+                help_text="截断策略下超过该大小的请求体和响应体只保存开头部分和摘要",
+                verbose_name="载荷截断大小(KB)",
+            ),
+        ),
+    ]
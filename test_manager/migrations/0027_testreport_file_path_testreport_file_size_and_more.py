@@ -0,0 +1,105 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:30
+
+from django.db import migrations, models
+
+
+def mark_existing_completed(apps, schema_editor):
+    # 已有的报告内容都在 content 中，视为生成完成
+    TestReport = apps.get_model('test_manager', 'TestReport')
+    TestReport.objects.update(generation_status='completed', progress=100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0026_scheduledtask_payload_capture_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="testreport",
+            name="file_path",
+            field=models.CharField(
+                blank=True,
+                db_comment="报告文件相对 REPORT_STORAGE_DIR 的路径",
+                default="",
+                max_length=255,
+                verbose_name="报告文件",
+            ),
+        ),
+        migrations.AddField(
+            model_name="testreport",
+            name="file_size",
+            field=models.BigIntegerField(
+                blank=True,
+                db_comment="文件大小(字节)",
+                null=True,
+                verbose_name="文件大小",
+            ),
+        ),
+        migrations.AddField(
+            model_name="testreport",
+            name="generated_at",
+            field=models.DateTimeField(
+                blank=True,
+                db_comment="生成完成时间",
+                null=True,
+                verbose_name="生成完成时间",
+            ),
+        ),
+        migrations.AddField(
+            model_name="testreport",
+            name="generation_error",
+            field=models.TextField(
+                blank=True, db_comment="生成错误", default="", verbose_name="生成错误"
+            ),
+        ),
+        migrations.AddField(
+            model_name="testreport",
+            name="generation_status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "等待生成"),
+                    ("generating", "生成中"),
+                    ("completed", "已完成"),
+                    ("failed", "生成失败"),
+                ],
+                db_comment="生成状态",
+                default="pending",
+                max_length=20,
+                verbose_name="生成状态",
+            ),
+        ),
+        migrations.AddField(
+            model_name="testreport",
+            name="processed_count",
+            field=models.PositiveIntegerField(
+                db_comment="已处理结果数", default=0, verbose_name="已处理结果数"
+            ),
+        ),
+        migrations.AddField(
+            model_name="testreport",
+            name="progress",
+            field=models.PositiveSmallIntegerField(
+                db_comment="生成进度(百分比)", default=0, verbose_name="生成进度"
+            ),
+        ),
+        migrations.AddField(
+            model_name="testreport",
+            name="total_count",
+            field=models.PositiveIntegerField(
+                db_comment="结果总数", default=0, verbose_name="结果总数"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="testreport",
+            name="content",
+            field=models.TextField(
+                blank=True,
+                db_comment="报告内容，后台生成的报告保存在报告文件中",
+                default="",
+                verbose_name="报告内容",
+            ),
+        ),
+        migrations.RunPython(mark_existing_completed, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,147 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:33
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_metadata(apps, schema_editor):
+    # 已有报告的元数据从关联的测试运行读取，不再解析报告内容
+    TestReport = apps.get_model('test_manager', 'TestReport')
+    TestResult = apps.get_model('test_manager', 'TestResult')
+    reports = TestReport.objects.select_related('test_run__environment', 'test_suite_run__environment',
+                                                'test_suite_run__test_suite')
+    for report in reports.iterator():
+        run = report.test_run or report.test_suite_run
+        if run is None:
+            report.title = report.name
+        else:
+            report.title = run.name if report.test_run else getattr(run.test_suite, 'name', run.name)
+            report.environment_name = run.environment.name
+            report.run_status = run.status
+            report.start_time = run.start_time
+            report.end_time = run.end_time
+            if run.start_time and run.end_time:
+                report.duration = (run.end_time - run.start_time).total_seconds()
+        if report.test_run_id:
+            counts = TestResult.objects.filter(test_run_id=report.test_run_id).aggregate(
+                total=Count('id'),
+                passed=Count('id', filter=Q(status='passed')),
+                failed=Count('id', filter=Q(status='failed')),
+                error=Count('id', filter=Q(status='error')),
+                skipped=Count('id', filter=Q(status='skipped')),
+            )
+            report.total_count = counts['total']
+            report.passed_count = counts['passed']
+            report.failed_count = counts['failed']
+            report.error_count = counts['error']
+            report.skipped_count = counts['skipped']
+        report.save(update_fields=[
+            'title', 'environment_name', 'run_status', 'start_time', 'end_time', 'duration',
+            'total_count', 'passed_count', 'failed_count', 'error_count', 'skipped_count',
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0027_testreport_file_path_testreport_file_size_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="testreport",
+            name="duration",
+            field=models.FloatField(
+                blank=True,
+                db_comment="持续时间(秒)",
+                null=True,
+                verbose_name="持续时间",
+            ),
+        ),
+        migrations.AddField(
+            model_name="testreport",
+            name="end_time",
+            field=models.DateTimeField(
+                blank=True, db_comment="结束时间", null=True, verbose_name="结束时间"
+            ),
+        ),
+        migrations.AddField(
+            model_name="testreport",
+            name="environment_name",
+            field=models.CharField(
+                blank=True,
+                db_comment="环境名称",
+                default="",
+                max_length=100,
+                verbose_name="环境名称",
+            ),
+        ),
+        migrations.AddField(
+            model_name="testreport",
+            name="error_count",
+            field=models.PositiveIntegerField(
+                db_comment="错误数", default=0, verbose_name="错误数"
+            ),
+        ),
+        migrations.AddField(
+            model_name="testreport",
+            name="failed_count",
+            field=models.PositiveIntegerField(
+                db_comment="失败数", default=0, verbose_name="失败数"
+            ),
+        ),
+        migrations.AddField(
+            model_name="testreport",
+            name="passed_count",
+            field=models.PositiveIntegerField(
+                db_comment="通过数", default=0, verbose_name="通过数"
+            ),
+        ),
+        migrations.AddField(
+            model_name="testreport",
+            name="run_status",
+            field=models.CharField(
+                blank=True,
+                db_comment="运行状态",
+                default="",
+                max_length=20,
+                verbose_name="运行状态",
+            ),
+        ),
+        migrations.AddField(
+            model_name="testreport",
+            name="section_offsets",
+            field=models.JSONField(
+                blank=True,
+                db_comment="分段文件中每页起始的字节偏移，最后一项为文件末尾",
+                default=list,
+                verbose_name="分段偏移",
+            ),
+        ),
+        migrations.AddField(
+            model_name="testreport",
+            name="skipped_count",
+            field=models.PositiveIntegerField(
+                db_comment="跳过数", default=0, verbose_name="跳过数"
+            ),
+        ),
+        migrations.AddField(
+            model_name="testreport",
+            name="start_time",
+            field=models.DateTimeField(
+                blank=True, db_comment="开始时间", null=True, verbose_name="开始时间"
+            ),
+        ),
+        migrations.AddField(
+            model_name="testreport",
+            name="title",
+            field=models.CharField(
+                blank=True,
+                db_comment="报告标题",
+                default="",
+                max_length=255,
+                verbose_name="报告标题",
+            ),
+        ),
+        migrations.RunPython(backfill_metadata, migrations.RunPython.noop),
+    ]
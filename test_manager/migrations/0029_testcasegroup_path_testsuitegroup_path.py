@@ -0,0 +1,58 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:40
+
+from django.db import migrations, models
+
+
+def build_paths(apps, schema_editor):
+    """按层级从顶级分组开始计算已有分组的物化路径"""
+    for model_name in ('TestCaseGroup', 'TestSuiteGroup'):
+        model = apps.get_model('test_manager', model_name)
+        parents = dict(model.objects.values_list('id', 'parent_id'))
+        paths = {}
+
+        def path_of(group_id):
+            if group_id not in paths:
+                parent_id = parents.get(group_id)
+                prefix = path_of(parent_id) if parent_id in parents else '/'
+                paths[group_id] = f"{prefix}{group_id}/"
+            return paths[group_id]
+
+        groups = list(model.objects.only('id'))
+        for group in groups:
+            group.path = path_of(group.id)
+        model.objects.bulk_update(groups, ['path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0028_testreport_duration_testreport_end_time_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="testcasegroup",
+            name="path",
+            field=models.CharField(
+                blank=True,
+                db_comment="物化路径，依次为各级祖先分组和自身的ID",
+                db_index=True,
+                default="",
+                max_length=255,
+                verbose_name="分组路径",
+            ),
+        ),
+        migrations.AddField(
+            model_name="testsuitegroup",
+            name="path",
+            field=models.CharField(
+                blank=True,
+                db_comment="物化路径，依次为各级祖先分组和自身的ID",
+                db_index=True,
+                default="",
+                max_length=255,
+                verbose_name="分组路径",
+            ),
+        ),
+        migrations.RunPython(build_paths, migrations.RunPython.noop),
+    ]
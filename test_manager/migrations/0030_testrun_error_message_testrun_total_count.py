@@ -0,0 +1,30 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0029_testcasegroup_path_testsuitegroup_path"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="testrun",
+            name="error_message",
+            field=models.TextField(
+                blank=True, db_comment="错误信息", default="", verbose_name="错误信息"
+            ),
+        ),
+        migrations.AddField(
+            model_name="testrun",
+            name="total_count",
+            field=models.PositiveIntegerField(
+                db_comment="用例总数",
+                default=0,
+                help_text="提交时确定的待执行用例数，用于计算进度",
+                verbose_name="用例总数",
+            ),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.11 on 2026-10-19 16:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0030_testrun_error_message_testrun_total_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="testrun",
+            name="suite_run",
+            field=models.ForeignKey(
+                blank=True,
+                db_comment="所属的批量运行",
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="test_runs",
+                to="test_manager.testsuiterun",
+                verbose_name="批量运行",
+            ),
+        ),
+        migrations.AddField(
+            model_name="testsuiterun",
+            name="total_count",
+            field=models.PositiveIntegerField(
+                db_comment="批量运行包含的套件数", default=0, verbose_name="套件数"
+            ),
+        ),
+        migrations.CreateModel(
+            name="RunSlot",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "slot",
+                    models.PositiveIntegerField(
+                        db_comment="槽位编号", unique=True, verbose_name="槽位编号"
+                    ),
+                ),
+                (
+                    "lease_expires_at",
+                    models.DateTimeField(
+                        blank=True,
+                        db_comment="租约过期时间",
+                        null=True,
+                        verbose_name="租约过期时间",
+                    ),
+                ),
+                (
+                    "test_run",
+                    models.OneToOneField(
+                        blank=True,
+                        db_comment="占用的测试运行",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="run_slot",
+                        to="test_manager.testrun",
+                        verbose_name="占用的测试运行",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "运行槽位",
+                "verbose_name_plural": "运行槽位",
+                "ordering": ["slot"],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.2.11 on 2026-10-19 17:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0031_testrun_suite_run_testsuiterun_total_count_runslot"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IngestBatch",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "key",
+                    models.CharField(
+                        db_comment="客户端提供的幂等键",
+                        max_length=100,
+                        verbose_name="幂等键",
+                    ),
+                ),
+                (
+                    "result_count",
+                    models.PositiveIntegerField(
+                        db_comment="本批写入的测试结果数",
+                        default=0,
+                        verbose_name="结果数",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True,
+                        db_comment="创建时间",
+                        verbose_name="创建时间",
+                    ),
+                ),
+                (
+                    "test_run",
+                    models.ForeignKey(
+                        db_comment="测试运行",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ingest_batches",
+                        to="test_manager.testrun",
+                        verbose_name="测试运行",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "结果提交批次",
+                "verbose_name_plural": "结果提交批次",
+                "unique_together": {("test_run", "key")},
+            },
+        ),
+    ]
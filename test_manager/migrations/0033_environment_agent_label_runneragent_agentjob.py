@@ -0,0 +1,253 @@
+# Generated by Django 4.2.11 on 2026-10-19 17:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("test_manager", "0032_ingestbatch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="environment",
+            name="agent_label",
+            field=models.CharField(
+                blank=True,
+                db_comment="设置后该环境的API运行和批量运行由带此标签的执行代理执行",
+                default="",
+                max_length=50,
+                verbose_name="执行代理标签",
+            ),
+        ),
+        migrations.CreateModel(
+            name="RunnerAgent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        db_comment="代理名称",
+                        max_length=100,
+                        unique=True,
+                        verbose_name="代理名称",
+                    ),
+                ),
+                (
+                    "hostname",
+                    models.CharField(
+                        blank=True,
+                        db_comment="主机名",
+                        max_length=255,
+                        verbose_name="主机名",
+                    ),
+                ),
+                (
+                    "labels",
+                    models.JSONField(
+                        blank=True,
+                        db_comment="可领取的任务标签，对应环境的执行代理标签",
+                        default=list,
+                        verbose_name="标签",
+                    ),
+                ),
+                (
+                    "capacity",
+                    models.PositiveIntegerField(
+                        db_comment="同时执行的任务数",
+                        default=1,
+                        verbose_name="并发容量",
+                    ),
+                ),
+                (
+                    "version",
+                    models.CharField(
+                        blank=True,
+                        db_comment="代理版本",
+                        max_length=50,
+                        verbose_name="版本",
+                    ),
+                ),
+                (
+                    "started_at",
+                    models.DateTimeField(
+                        blank=True,
+                        db_comment="最近一次注册的时间",
+                        null=True,
+                        verbose_name="启动时间",
+                    ),
+                ),
+                (
+                    "last_heartbeat",
+                    models.DateTimeField(
+                        blank=True,
+                        db_comment="最近心跳时间",
+                        db_index=True,
+                        null=True,
+                        verbose_name="最近心跳时间",
+                    ),
+                ),
+                (
+                    "registered_by",
+                    models.ForeignKey(
+                        blank=True,
+                        db_comment="注册用户",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="runner_agents",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="注册用户",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "执行代理",
+                "verbose_name_plural": "执行代理",
+                "ordering": ["name"],
+            },
+        ),
+        migrations.CreateModel(
+            name="AgentJob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "label",
+                    models.CharField(
+                        db_comment="只有带此标签的代理可以领取",
+                        max_length=50,
+                        verbose_name="标签",
+                    ),
+                ),
+                (
+                    "case_environments",
+                    models.JSONField(
+                        blank=True,
+                        db_comment="运行时为套件中的用例指定的环境",
+                        default=dict,
+                        verbose_name="用例环境",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "等待领取"),
+                            ("leased", "执行中"),
+                            ("finished", "已结束"),
+                        ],
+                        db_comment="状态",
+                        default="queued",
+                        max_length=20,
+                        verbose_name="状态",
+                    ),
+                ),
+                (
+                    "attempt",
+                    models.PositiveIntegerField(
+                        db_comment="领取次数，也是租约的防护令牌",
+                        default=0,
+                        verbose_name="领取次数",
+                    ),
+                ),
+                (
+                    "lease_expires_at",
+                    models.DateTimeField(
+                        blank=True,
+                        db_comment="租约过期时间",
+                        null=True,
+                        verbose_name="租约过期时间",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        auto_now_add=True,
+                        db_comment="创建时间",
+                        verbose_name="创建时间",
+                    ),
+                ),
+                (
+                    "leased_at",
+                    models.DateTimeField(
+                        blank=True,
+                        db_comment="最近一次领取的时间",
+                        null=True,
+                        verbose_name="领取时间",
+                    ),
+                ),
+                (
+                    "finished_at",
+                    models.DateTimeField(
+                        blank=True,
+                        db_comment="结束时间",
+                        null=True,
+                        verbose_name="结束时间",
+                    ),
+                ),
+                (
+                    "agent",
+                    models.ForeignKey(
+                        blank=True,
+                        db_comment="持有租约的执行代理",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="jobs",
+                        to="test_manager.runneragent",
+                        verbose_name="执行代理",
+                    ),
+                ),
+                (
+                    "test_case",
+                    models.ForeignKey(
+                        blank=True,
+                        db_comment="单个用例的运行执行的用例，套件运行为空",
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="agent_jobs",
+                        to="test_manager.testcase",
+                        verbose_name="测试用例",
+                    ),
+                ),
+                (
+                    "test_run",
+                    models.OneToOneField(
+                        db_comment="测试运行",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="agent_job",
+                        to="test_manager.testrun",
+                        verbose_name="测试运行",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "代理任务",
+                "verbose_name_plural": "代理任务",
+                "ordering": ["id"],
+                "indexes": [
+                    models.Index(
+                        fields=["status", "label"], name="agentjob_status_label_idx"
+                    )
+                ],
+            },
+        ),
+    ]
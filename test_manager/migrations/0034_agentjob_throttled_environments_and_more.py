@@ -0,0 +1,60 @@
+# Generated by Django 4.2.11 on 2026-10-19 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0033_environment_agent_label_runneragent_agentjob"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="agentjob",
+            name="throttled_environments",
+            field=models.JSONField(
+                blank=True,
+                db_comment="领取时占用了并发名额的环境ID，续约时续期，结束时归还",
+                default=list,
+                verbose_name="占用并发名额的环境",
+            ),
+        ),
+        migrations.AddField(
+            model_name="environment",
+            name="max_in_flight",
+            field=models.PositiveIntegerField(
+                db_comment="所有执行器同时向该环境发送的请求数上限，0为不限制",
+                default=0,
+                verbose_name="并发请求数上限",
+            ),
+        ),
+        migrations.AddField(
+            model_name="environment",
+            name="rate_burst",
+            field=models.PositiveIntegerField(
+                db_comment="令牌桶容量，允许短时间内连续发送的请求数，0为与每秒上限相同",
+                default=0,
+                verbose_name="突发请求数",
+            ),
+        ),
+        migrations.AddField(
+            model_name="environment",
+            name="rate_limit",
+            field=models.PositiveIntegerField(
+                db_comment="所有执行器向该环境发送请求的每秒总数上限，0为不限制",
+                default=0,
+                verbose_name="每秒请求数上限",
+            ),
+        ),
+        migrations.AddField(
+            model_name="testresult",
+            name="throttle_wait",
+            field=models.FloatField(
+                blank=True,
+                db_comment="发送请求前等待环境限流和并发上限的时间(毫秒)，不计入响应时间",
+                null=True,
+                verbose_name="限流等待时间",
+            ),
+        ),
+    ]
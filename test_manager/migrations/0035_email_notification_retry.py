@@ -0,0 +1,30 @@
+# Generated by Django 4.2.11 on 2026-10-19 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0034_agentjob_throttled_environments_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="emailnotification",
+            name="attempts",
+            field=models.PositiveIntegerField(
+                db_comment="已尝试发送的次数", default=0, verbose_name="发送次数"
+            ),
+        ),
+        migrations.AddField(
+            model_name="emailnotification",
+            name="next_attempt_at",
+            field=models.DateTimeField(
+                blank=True,
+                db_comment="发送失败后下次重试的时间，为空时立即发送",
+                null=True,
+                verbose_name="下次发送时间",
+            ),
+        ),
+    ]
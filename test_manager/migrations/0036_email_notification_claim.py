@@ -0,0 +1,40 @@
+# Generated by Django 4.2.11 on 2026-10-19 17:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("test_manager", "0035_email_notification_retry"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="emailnotification",
+            name="claim_token",
+            field=models.CharField(
+                blank=True,
+                db_comment="发送中的通知由哪一次发送领取",
+                max_length=32,
+                verbose_name="领取标识",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="emailnotification",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "待发送"),
+                    ("sending", "发送中"),
+                    ("sent", "已发送"),
+                    ("failed", "发送失败"),
+                ],
+                db_comment="发送状态",
+                db_index=True,
+                default="pending",
+                max_length=20,
+                verbose_name="发送状态",
+            ),
+        ),
+    ]
@@ -1,9 +1,22 @@
 import uuid
+import zlib
+import hashlib
+import logging
+from datetime import timedelta
+from pathlib import Path
+from django.conf import settings
 from django.urls import reverse
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.exceptions import ValidationError
+from django.db import connections, models, transaction, IntegrityError
+from django.db.models import Case, Q, Value, When
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import User
+from django.utils import timezone
 import json
 
+logger = logging.getLogger(__name__)
+
 
 class Project(models.Model):
     name = models.CharField(max_length=100, verbose_name="项目名称", db_comment="项目名称")
@@ -28,6 +41,14 @@ class Environment(models.Model):
                                 db_comment="所属环境")
     base_url = models.URLField(verbose_name="环境URL", db_comment="环境URL")
     variables = models.JSONField(default=dict, blank=True, verbose_name="环境变量", db_comment="环境变量")
+    agent_label = models.CharField(max_length=50, blank=True, default='', verbose_name="执行代理标签",
+                                   db_comment="设置后该环境的API运行和批量运行由带此标签的执行代理执行")
+    rate_limit = models.PositiveIntegerField(default=0, verbose_name="每秒请求数上限",
+                                             db_comment="所有执行器向该环境发送请求的每秒总数上限，0为不限制")
+    rate_burst = models.PositiveIntegerField(default=0, verbose_name="突发请求数",
+                                             db_comment="令牌桶容量，允许短时间内连续发送的请求数，0为与每秒上限相同")
+    max_in_flight = models.PositiveIntegerField(default=0, verbose_name="并发请求数上限",
+                                                db_comment="所有执行器同时向该环境发送的请求数上限，0为不限制")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间", db_comment="创建时间")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间", db_comment="更新时间")
 
@@ -39,8 +60,112 @@ class Environment(models.Model):
         verbose_name_plural = verbose_name
 
 
+def path_prefix_q(prefix, field='path'):
+    """
+    路径前缀条件，写成范围比较
+
+    startswith 在 SQLite 上生成 LIKE ... ESCAPE，用不上索引；路径以 / 结尾，以 prefix 开头的路径
+    都在 [prefix, prefix 末尾的 / 换成下一个字符) 之间，范围比较可以走路径索引
+    """
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix[:-1] + chr(ord('/') + 1)})
+
+
 # 测试用例分组
-class TestCaseGroup(models.Model):
+class GroupPathMixin(models.Model):
+    """
+    分组的物化路径，形如 /1/5/9/，依次为各级祖先分组和自身的ID
+
+    子树、祖先和子树下的用例都可以用一次带索引的查询取出，不再逐级查询父分组
+    """
+    path = models.CharField(max_length=255, blank=True, default='', db_index=True, verbose_name="分组路径",
+                            db_comment="物化路径，依次为各级祖先分组和自身的ID")
+
+    class Meta:
+        abstract = True
+
+    def build_path(self):
+        parent_path = self.parent.get_path() if self.parent_id else '/'
+        return f"{parent_path}{self.pk}/"
+
+    def get_path(self):
+        """
+        非空的分组路径，子树前缀查询都要经过这里
+
+        空路径作为前缀会匹配所有分组；已保存但路径为空的分组（批量创建或补算路径之前的数据）
+        按父分组补算后写回，未保存的分组返回空字符串
+        """
+        if not self.path and self.pk:
+            self.path = self.build_path()
+            type(self).objects.filter(pk=self.pk).update(path=self.path)
+        return self.path
+
+    def clean(self):
+        super().clean()
+        # 父分组不能是自身或自身的子分组
+        if self.pk and self.parent_id and f"/{self.pk}/" in self.parent.path:
+            raise ValidationError({'parent': '父分组不能是当前分组或其子分组'})
+
+    def save(self, *args, **kwargs):
+        old_path = self.path
+        if self.pk:
+            self.path = self.build_path()
+            if kwargs.get('update_fields') is not None:
+                # 只保存部分字段时也保存路径，否则改了父分组路径却没有写入
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'path'}
+        super().save(*args, **kwargs)
+
+        if not self.path:
+            # 新建的分组保存后才有ID
+            self.path = self.build_path()
+            type(self).objects.filter(pk=self.pk).update(path=self.path)
+        elif old_path and old_path != self.path:
+            # 移动了父分组，一条UPDATE改写整个子树的路径前缀
+            type(self).objects.filter(path_prefix_q(old_path)).exclude(pk=self.pk).update(
+                path=Concat(Value(self.path), Substr('path', len(old_path) + 1)))
+
+    @property
+    def path_ids(self):
+        return [int(pk) for pk in self.path.strip('/').split('/') if pk]
+
+    @property
+    def depth(self):
+        return len(self.path_ids)
+
+    def subtree_q(self, field='path'):
+        """
+        整个子树的查询条件，field 为路径字段，查询子树下的用例或套件时为 group__path
+
+        没有路径（未保存）的分组不匹配任何记录
+        """
+        if not self.get_path():
+            return Q(pk__in=[])
+        return path_prefix_q(self.path, field)
+
+    def get_descendants(self, include_self=True):
+        """整个子树的分组，一次路径范围查询"""
+        if not self.get_path():
+            return type(self).objects.none()
+        queryset = type(self).objects.filter(self.subtree_q())
+        if not include_self:
+            queryset = queryset.exclude(pk=self.pk)
+        return queryset
+
+    def get_ancestors(self, include_self=False):
+        """从顶级分组开始的祖先分组列表，一次查询"""
+        ancestor_ids = self.path_ids[:-1]
+        ancestors = type(self).objects.in_bulk(ancestor_ids) if ancestor_ids else {}
+        groups = [ancestors[pk] for pk in ancestor_ids if pk in ancestors]
+        if include_self:
+            groups.append(self)
+        return groups
+
+    def __str__(self):
+        if not self.path:
+            return f"{self.parent} / {self.name}" if self.parent else self.name
+        return ' / '.join(group.name for group in self.get_ancestors(include_self=True))
+
+
+class TestCaseGroup(GroupPathMixin):
     name = models.CharField(max_length=100, verbose_name="分组名称", db_comment="分组名称")
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='test_case_groups',
                                 verbose_name="所属项目", db_comment="所属项目")
@@ -51,10 +176,11 @@ class TestCaseGroup(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_test_case_groups',
                                    verbose_name="创建人", db_comment="创建人")
 
-    def __str__(self):
-        if self.parent:
-            return f"{self.parent} / {self.name}"
-        return self.name
+    def get_test_cases(self):
+        """子树下所有分组中的测试用例"""
+        if not self.get_path():
+            return TestCase.objects.none()
+        return TestCase.objects.filter(self.subtree_q('group__path'))
 
     class Meta:
         unique_together = ('name', 'project', 'parent')
@@ -105,7 +231,7 @@ class TestCase(models.Model):
 
 
 # 新增测试套件分组模型
-class TestSuiteGroup(models.Model):
+class TestSuiteGroup(GroupPathMixin):
     name = models.CharField(max_length=100, verbose_name="分组名称", db_comment="分组名称")
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='test_suite_groups',
                                 verbose_name="所属项目", db_comment="所属项目")
@@ -116,10 +242,11 @@ class TestSuiteGroup(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_test_suite_groups',
                                    verbose_name="创建人", db_comment="创建人")
 
-    def __str__(self):
-        if self.parent:
-            return f"{self.parent} / {self.name}"
-        return self.name
+    def get_test_suites(self):
+        """子树下所有分组中的测试套件"""
+        if not self.get_path():
+            return TestSuite.objects.none()
+        return TestSuite.objects.filter(self.subtree_q('group__path'))
 
     class Meta:
         unique_together = ('name', 'project', 'parent')
@@ -128,6 +255,15 @@ class TestSuiteGroup(models.Model):
         verbose_name_plural = verbose_name
 
 
+# 测试结果请求/响应载荷的保存策略
+PAYLOAD_CAPTURE_CHOICES = [
+    ('full', '完整保存'),
+    ('on_failure', '仅失败时保存'),
+    ('truncated', '超出大小时截断'),
+    ('none', '不保存'),
+]
+
+
 class TestSuite(models.Model):
     name = models.CharField(max_length=100, verbose_name="套件名称", db_comment="套件名称")
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='test_suites', verbose_name="所属项目",
@@ -137,6 +273,14 @@ class TestSuite(models.Model):
     description = models.TextField(blank=True, verbose_name="套件描述", db_comment="套件描述")
     test_cases = models.ManyToManyField(TestCase, through='TestSuiteCase', verbose_name="关联用例",
                                         db_comment="关联用例")
+    payload_capture = models.CharField(max_length=20, choices=PAYLOAD_CAPTURE_CHOICES, default='full',
+                                       verbose_name="载荷保存策略", db_comment="载荷保存策略",
+                                       help_text="测试结果的请求和响应内容如何保存")
+    payload_max_kb = models.PositiveIntegerField(default=64, verbose_name="载荷截断大小(KB)",
+                                                 db_comment="载荷截断大小(KB)",
+                                                 help_text="截断策略下超过该大小的请求体和响应体只保存开头部分和摘要")
+    capture_headers = models.BooleanField(default=True, verbose_name="保存请求头和响应头",
+                                          db_comment="保存请求头和响应头")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间", db_comment="创建时间")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间", db_comment="更新时间")
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_test_suites',
@@ -176,6 +320,8 @@ class TestRun(models.Model):
                                    verbose_name="测试套件", db_comment="测试套件")
     environment = models.ForeignKey(Environment, on_delete=models.CASCADE, related_name='test_runs',
                                     verbose_name="运行环境", db_comment="运行环境")
+    suite_run = models.ForeignKey('TestSuiteRun', on_delete=models.SET_NULL, null=True, blank=True,
+                                  related_name='test_runs', verbose_name="批量运行", db_comment="所属的批量运行")
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="运行状态",
                               db_comment="运行状态")
     start_time = models.DateTimeField(null=True, blank=True, verbose_name="开始时间", db_comment="开始时间")
@@ -183,10 +329,24 @@ class TestRun(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间", db_comment="创建时间")
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_test_runs',
                                    verbose_name="创建人", db_comment="创建人")
+    rolled_up = models.BooleanField(default=False, verbose_name="已汇总", db_comment="已汇总",
+                                    help_text="是否已计入每日汇总表")
+    total_count = models.PositiveIntegerField(default=0, verbose_name="用例总数", db_comment="用例总数",
+                                              help_text="提交时确定的待执行用例数，用于计算进度")
+    error_message = models.TextField(blank=True, default='', verbose_name="错误信息", db_comment="错误信息")
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # rolled_up 只由汇总逻辑用条件更新修改，完整保存时不覆盖
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'rolled_up'
+            ]
+        super().save(*args, **kwargs)
+
     @property
     def duration(self):
         if self.start_time and self.end_time:
@@ -196,6 +356,174 @@ class TestRun(models.Model):
     class Meta:
         verbose_name = "测试运行"
         verbose_name_plural = verbose_name
+        indexes = [
+            # 项目下的运行列表，按 (created_at, id) 游标分页
+            models.Index(fields=['project', '-created_at', '-id'], name='testrun_project_created_idx'),
+            # 全部运行列表的游标分页和按时间的范围统计
+            models.Index(fields=['created_at', 'id'], name='testrun_created_idx'),
+        ]
+
+
+class ResponseBlob(models.Model):
+    """
+    按内容寻址的响应体存储
+
+    相同的响应体只保存一份，以规范化JSON的SHA-256作为主键，内容zlib压缩后存放
+    """
+    hash = models.CharField(max_length=64, primary_key=True, verbose_name="内容哈希", db_comment="内容哈希")
+    size = models.PositiveIntegerField(verbose_name="原始大小", db_comment="原始大小(字节)")
+    compressed_size = models.PositiveIntegerField(verbose_name="压缩后大小", db_comment="压缩后大小(字节)")
+    data = models.BinaryField(verbose_name="压缩内容", db_comment="压缩内容")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间", db_comment="创建时间")
+    last_used_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name="最近引用时间",
+                                        db_comment="最近引用时间")
+
+    def __str__(self):
+        return f"{self.hash[:12]} ({self.size} B)"
+
+    def load(self):
+        """解压并解析为JSON"""
+        return json.loads(zlib.decompress(bytes(self.data)))
+
+    @staticmethod
+    def encode(value):
+        """
+        返回 (内容哈希, 保存的JSON字节)
+
+        哈希按键排序后的JSON计算，键顺序不同的相同内容共用一份；保存的内容保留响应中的键顺序
+        """
+        options = {'cls': DjangoJSONEncoder, 'ensure_ascii': False, 'separators': (',', ':')}
+        canonical = json.dumps(value, sort_keys=True, **options).encode('utf-8')
+        return hashlib.sha256(canonical).hexdigest(), json.dumps(value, **options).encode('utf-8')
+
+    @classmethod
+    def store(cls, value, using=None):
+        """
+        保存响应体，返回 (哈希, 原始大小)
+
+        内容已存在时只刷新最近引用时间（间隔 RESPONSE_BLOB_TOUCH_INTERVAL 秒内不重复刷新），
+        垃圾回收据此跳过刚被引用的内容
+        """
+        digest, raw = cls.encode(value)
+        now = timezone.now()
+        manager = cls.objects.db_manager(using)
+
+        touch_interval = timedelta(seconds=getattr(settings, 'RESPONSE_BLOB_TOUCH_INTERVAL', 3600))
+        touched = manager.filter(hash=digest, last_used_at__lt=now - touch_interval).update(last_used_at=now)
+        if not touched and not manager.filter(hash=digest).exists():
+            data = zlib.compress(raw, getattr(settings, 'RESPONSE_BLOB_COMPRESS_LEVEL', 6))
+            try:
+                with transaction.atomic(using=manager.db):
+                    manager.create(hash=digest, size=len(raw), compressed_size=len(data), data=data,
+                                   last_used_at=now)
+            except IntegrityError:
+                # 并发写入了相同内容
+                pass
+        return digest, len(raw)
+
+    @classmethod
+    def store_many(cls, values, using=None):
+        """
+        批量保存响应体，返回与 values 对应的 (哈希, 原始大小) 列表
+
+        已有内容一次查询得到，新内容一次批量插入，最近引用时间一次批量刷新
+        """
+        encoded = [cls.encode(value) for value in values]
+        now = timezone.now()
+        manager = cls.objects.db_manager(using)
+
+        touch_interval = timedelta(seconds=getattr(settings, 'RESPONSE_BLOB_TOUCH_INTERVAL', 3600))
+        unique = {digest for digest, raw in encoded}
+        existing = set(manager.filter(hash__in=unique).values_list('hash', flat=True))
+        manager.filter(hash__in=existing, last_used_at__lt=now - touch_interval).update(last_used_at=now)
+
+        level = getattr(settings, 'RESPONSE_BLOB_COMPRESS_LEVEL', 6)
+        new_blobs = {}
+        for digest, raw in encoded:
+            if digest not in existing and digest not in new_blobs:
+                data = zlib.compress(raw, level)
+                new_blobs[digest] = cls(hash=digest, size=len(raw), compressed_size=len(data), data=data,
+                                        last_used_at=now)
+        # 并发写入相同内容时忽略冲突
+        manager.bulk_create(new_blobs.values(), ignore_conflicts=True)
+        return [(digest, len(raw)) for digest, raw in encoded]
+
+    class Meta:
+        verbose_name = "响应体存储"
+        verbose_name_plural = verbose_name
+
+
+# 存放在 TestResultPayload 中的大字段，列表和统计查询不读取；响应体存放在 ResponseBlob 中
+PAYLOAD_FIELDS = ('request_headers', 'request_body', 'response_headers', 'extracted_params', 'validators')
+
+
+class TestResultQuerySet(models.QuerySet):
+    def with_payload(self):
+        """需要展示请求和响应内容时使用，一次联表读出载荷和响应体"""
+        return self.select_related('payload', 'response_blob')
+
+
+class TestResultManager(models.Manager.from_queryset(TestResultQuerySet)):
+    def create_with_payload(self, **kwargs):
+        """创建测试结果，请求/响应头等大字段写入载荷表，响应体写入去重的响应体存储"""
+        payload = {}
+        for name in PAYLOAD_FIELDS:
+            value = kwargs.pop(name, None)
+            if value is not None:
+                payload[name] = value
+        response_body = kwargs.pop('response_body', None)
+        with transaction.atomic(using=self.db):
+            if response_body is not None:
+                kwargs['response_blob_id'], kwargs['response_size'] = ResponseBlob.store(response_body, using=self.db)
+            result = self.create(**kwargs)
+            TestResultPayload.objects.using(self.db).create(result=result, **payload)
+        return result
+
+    def bulk_create_with_payload(self, rows):
+        """
+        批量创建测试结果，rows 为 create_with_payload 参数的字典列表
+
+        测试结果、载荷和响应体各一次批量插入；数据库不支持批量插入返回主键时逐条创建
+        """
+        if not connections[self.db].features.can_return_rows_from_bulk_insert:
+            return [self.create_with_payload(**dict(row)) for row in rows]
+
+        payloads = []
+        results = []
+        bodies = []
+        for row in rows:
+            row = dict(row)
+            payload = {}
+            for name in PAYLOAD_FIELDS:
+                value = row.pop(name, None)
+                if value is not None:
+                    payload[name] = value
+            payloads.append(payload)
+            bodies.append(row.pop('response_body', None))
+            results.append(self.model(**row))
+
+        with transaction.atomic(using=self.db):
+            stored = ResponseBlob.store_many([body for body in bodies if body is not None], using=self.db)
+            stored = iter(stored)
+            for result, body in zip(results, bodies):
+                if body is not None:
+                    result.response_blob_id, result.response_size = next(stored)
+            self.bulk_create(results)
+            TestResultPayload.objects.using(self.db).bulk_create([
+                TestResultPayload(result=result, **payload) for result, payload in zip(results, payloads)
+            ])
+        return results
+
+
+def _payload_property(name):
+    def getter(self):
+        payload = self.get_payload()
+        if payload is None:
+            return TestResultPayload._meta.get_field(name).get_default()
+        return getattr(payload, name)
+
+    getter.__name__ = name
+    return property(getter)
 
 
 class TestResult(models.Model):
@@ -215,28 +543,215 @@ class TestResult(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, verbose_name="运行状态", db_comment="运行状态")
     response_time = models.FloatField(null=True, blank=True, verbose_name="响应时间",
                                       db_comment="响应时间")  # in milliseconds
+    throttle_wait = models.FloatField(null=True, blank=True, verbose_name="限流等待时间",
+                                      db_comment="发送请求前等待环境限流和并发上限的时间(毫秒)，不计入响应时间")
     response_status_code = models.IntegerField(null=True, blank=True, verbose_name="响应状态码",
                                                db_comment="响应状态码")
-    response_headers = models.JSONField(default=dict, blank=True, verbose_name="响应头", db_comment="响应头")
-    response_body = models.JSONField(default=dict, blank=True, null=True, verbose_name="响应体", db_comment="响应体")
+    response_blob = models.ForeignKey(ResponseBlob, on_delete=models.PROTECT, null=True, blank=True,
+                                      related_name='results', verbose_name="响应体", db_comment="响应体内容哈希")
+    response_size = models.PositiveIntegerField(null=True, blank=True, verbose_name="响应体大小",
+                                                db_comment="响应体大小(字节)")
+    error_message = models.TextField(blank=True, verbose_name="错误信息", db_comment="错误信息")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间", db_comment="创建时间")
+
+    objects = TestResultManager()
+
+    # 载荷字段按需从 TestResultPayload 读取，首次访问时才查询
+    request_headers = _payload_property('request_headers')
+    request_body = _payload_property('request_body')
+    response_headers = _payload_property('response_headers')
+    extracted_params = _payload_property('extracted_params')
+    validators = _payload_property('validators')
+
+    @property
+    def response_body(self):
+        """响应体，首次访问时从响应体存储读取并解压"""
+        if not hasattr(self, '_response_body'):
+            self._response_body = self.response_blob.load() if self.response_blob_id else {}
+        return self._response_body
+
+    def __str__(self):
+        return f"{self.test_case.name} - {self.status}"
+
+    def get_payload(self):
+        """测试结果的载荷，没有载荷时返回None"""
+        try:
+            return self.payload
+        except TestResultPayload.DoesNotExist:
+            return None
+
+    class Meta:
+        verbose_name = "测试结果"
+        verbose_name_plural = verbose_name
+        indexes = [
+            # 按状态过滤某次运行的结果
+            models.Index(fields=['test_run', 'status'], name='testresult_run_status_idx'),
+            # 用例详情页的结果列表，按 (created_at, id) 游标分页
+            models.Index(fields=['test_case', '-created_at', '-id'], name='testresult_case_created_idx'),
+            # 全部结果的游标分页和按时间的范围统计
+            models.Index(fields=['created_at', 'id'], name='testresult_created_idx'),
+        ]
+
+
+class TestResultPayload(models.Model):
+    """测试结果的请求和响应内容，与测试结果一对一，只在详情页按需读取"""
+    result = models.OneToOneField(TestResult, on_delete=models.CASCADE, primary_key=True, related_name='payload',
+                                  verbose_name="测试结果", db_comment="测试结果")
     request_headers = models.JSONField(default=dict, blank=True, verbose_name="请求头", db_comment="请求头")
     request_body = models.JSONField(default=dict, blank=True, null=True, verbose_name="请求体", db_comment="请求体")
-    error_message = models.TextField(blank=True, verbose_name="错误信息", db_comment="错误信息")
+    response_headers = models.JSONField(default=dict, blank=True, verbose_name="响应头", db_comment="响应头")
     extracted_params = models.JSONField(default=dict, blank=True, verbose_name="提取参数", db_comment="提取参数")
     validators = models.JSONField(default=list, blank=True, verbose_name="验证器", db_comment="验证器")
+
+    def __str__(self):
+        return f"载荷 - {self.result_id}"
+
+    class Meta:
+        verbose_name = "测试结果载荷"
+        verbose_name_plural = verbose_name
+
+
+class IngestBatch(models.Model):
+    """
+    外部执行器提交的一批测试结果
+
+    同一测试运行下按幂等键唯一，客户端重试同一批次时不再写入，直接返回首次的处理结果
+    """
+    test_run = models.ForeignKey(TestRun, on_delete=models.CASCADE, related_name='ingest_batches',
+                                 verbose_name="测试运行", db_comment="测试运行")
+    key = models.CharField(max_length=100, verbose_name="幂等键", db_comment="客户端提供的幂等键")
+    result_count = models.PositiveIntegerField(default=0, verbose_name="结果数", db_comment="本批写入的测试结果数")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间", db_comment="创建时间")
 
+    class Meta:
+        unique_together = ('test_run', 'key')
+        verbose_name = "结果提交批次"
+        verbose_name_plural = verbose_name
+
     def __str__(self):
-        return f"{self.test_case.name} - {self.status}"
+        return f"{self.test_run_id}:{self.key}"
+
+
+class TestCaseResultSummary(models.Model):
+    """测试用例历史结果汇总，保存已清理测试结果的聚合统计"""
+    test_case = models.OneToOneField(TestCase, on_delete=models.CASCADE, related_name='result_summary',
+                                     verbose_name="测试用例", db_comment="测试用例")
+    total_count = models.IntegerField(default=0, verbose_name="执行次数", db_comment="执行次数")
+    passed_count = models.IntegerField(default=0, verbose_name="通过次数", db_comment="通过次数")
+    failed_count = models.IntegerField(default=0, verbose_name="失败次数", db_comment="失败次数")
+    error_count = models.IntegerField(default=0, verbose_name="错误次数", db_comment="错误次数")
+    skipped_count = models.IntegerField(default=0, verbose_name="跳过次数", db_comment="跳过次数")
+    timed_count = models.IntegerField(default=0, verbose_name="有响应时间的次数", db_comment="有响应时间的次数")
+    total_response_time = models.FloatField(default=0, verbose_name="响应时间合计", db_comment="响应时间合计")
+    min_response_time = models.FloatField(null=True, blank=True, verbose_name="最小响应时间",
+                                          db_comment="最小响应时间")
+    max_response_time = models.FloatField(null=True, blank=True, verbose_name="最大响应时间",
+                                          db_comment="最大响应时间")
+    first_run_at = models.DateTimeField(null=True, blank=True, verbose_name="最早执行时间", db_comment="最早执行时间")
+    last_run_at = models.DateTimeField(null=True, blank=True, verbose_name="最近执行时间", db_comment="最近执行时间")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="更新时间", db_comment="更新时间")
+
+    def __str__(self):
+        return f"{self.test_case.name} - {self.total_count}"
+
+    @property
+    def avg_response_time(self):
+        if self.timed_count:
+            return self.total_response_time / self.timed_count
+        return None
+
+    @property
+    def pass_rate(self):
+        if self.total_count:
+            return round(self.passed_count / self.total_count * 100, 2)
+        return 0
 
     class Meta:
-        verbose_name = "测试结果"
+        verbose_name = "测试结果汇总"
         verbose_name_plural = verbose_name
 
 
+class ProjectDailyStats(models.Model):
+    """项目每日汇总，测试运行结束时增量更新"""
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='daily_stats',
+                                verbose_name="所属项目", db_comment="所属项目")
+    date = models.DateField(verbose_name="日期", db_comment="日期")
+    run_count = models.IntegerField(default=0, verbose_name="运行次数", db_comment="运行次数")
+    completed_run_count = models.IntegerField(default=0, verbose_name="完成次数", db_comment="完成次数")
+    failed_run_count = models.IntegerField(default=0, verbose_name="失败次数", db_comment="失败次数")
+    result_count = models.IntegerField(default=0, verbose_name="结果数", db_comment="结果数")
+    passed_count = models.IntegerField(default=0, verbose_name="通过数", db_comment="通过数")
+    failed_count = models.IntegerField(default=0, verbose_name="失败数", db_comment="失败数")
+    error_count = models.IntegerField(default=0, verbose_name="错误数", db_comment="错误数")
+    skipped_count = models.IntegerField(default=0, verbose_name="跳过数", db_comment="跳过数")
+    timed_count = models.IntegerField(default=0, verbose_name="有响应时间的结果数", db_comment="有响应时间的结果数")
+    total_response_time = models.FloatField(default=0, verbose_name="响应时间合计", db_comment="响应时间合计")
+
+    def __str__(self):
+        return f"{self.project.name} - {self.date}"
+
+    @property
+    def pass_rate(self):
+        if self.result_count:
+            return round(self.passed_count / self.result_count * 100, 2)
+        return 0
+
+    @property
+    def avg_response_time(self):
+        if self.timed_count:
+            return self.total_response_time / self.timed_count
+        return None
+
+    class Meta:
+        verbose_name = "项目每日汇总"
+        verbose_name_plural = verbose_name
+        unique_together = ('project', 'date')
+        ordering = ['-date']
+
+
+class TestCaseDailyStats(models.Model):
+    """测试用例每日汇总，测试运行结束时增量更新"""
+    test_case = models.ForeignKey(TestCase, on_delete=models.CASCADE, related_name='daily_stats',
+                                  verbose_name="测试用例", db_comment="测试用例")
+    date = models.DateField(verbose_name="日期", db_comment="日期")
+    result_count = models.IntegerField(default=0, verbose_name="执行次数", db_comment="执行次数")
+    passed_count = models.IntegerField(default=0, verbose_name="通过次数", db_comment="通过次数")
+    failed_count = models.IntegerField(default=0, verbose_name="失败次数", db_comment="失败次数")
+    error_count = models.IntegerField(default=0, verbose_name="错误次数", db_comment="错误次数")
+    skipped_count = models.IntegerField(default=0, verbose_name="跳过次数", db_comment="跳过次数")
+    timed_count = models.IntegerField(default=0, verbose_name="有响应时间的次数", db_comment="有响应时间的次数")
+    total_response_time = models.FloatField(default=0, verbose_name="响应时间合计", db_comment="响应时间合计")
+    min_response_time = models.FloatField(null=True, blank=True, verbose_name="最小响应时间",
+                                          db_comment="最小响应时间")
+    max_response_time = models.FloatField(null=True, blank=True, verbose_name="最大响应时间",
+                                          db_comment="最大响应时间")
+
+    def __str__(self):
+        return f"{self.test_case.name} - {self.date}"
+
+    @property
+    def pass_rate(self):
+        if self.result_count:
+            return round(self.passed_count / self.result_count * 100, 2)
+        return 0
+
+    @property
+    def avg_response_time(self):
+        if self.timed_count:
+            return self.total_response_time / self.timed_count
+        return None
+
+    class Meta:
+        verbose_name = "测试用例每日汇总"
+        verbose_name_plural = verbose_name
+        unique_together = ('test_case', 'date')
+        ordering = ['-date']
+
+
 from django.db import models
 from django.conf import settings
-from django.core.mail import EmailMessage
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
 from django.core.exceptions import ValidationError
 import smtplib
 import ssl
@@ -250,6 +765,8 @@ class EmailConfig(models.Model):
         ('mailgun', 'Mailgun API'),
     ]
 
+    ACTIVE_CONFIG_CACHE_KEY = 'email_config:active_id'
+
     name = models.CharField(max_length=100, verbose_name="配置名称", db_comment="配置名称")
     is_active = models.BooleanField(default=False, verbose_name="是否激活", db_comment="是否激活")
     email_backend = models.CharField(
@@ -291,6 +808,12 @@ class EmailConfig(models.Model):
         if self.is_active:
             EmailConfig.objects.filter(is_active=True).update(is_active=False)
         super().save(*args, **kwargs)
+        self.clear_active_config_cache()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self.clear_active_config_cache()
+        return result
 
     def clean(self):
         """验证邮件配置"""
@@ -326,110 +849,85 @@ class EmailConfig(models.Model):
 
         return False, "未知的邮件后端"
 
+    @property
+    def from_email(self):
+        return f"{self.default_from_name} <{self.default_from_email}>"
+
+    def get_connection(self, fail_silently=False):
+        """
+        按当前配置创建邮件连接
+
+        连接参数直接传给后端，不修改全局的 EMAIL_* 设置，
+        同一个连接可以在一批邮件之间复用
+        """
+        if self.email_backend == 'smtp':
+            return get_connection(
+                'django.core.mail.backends.smtp.EmailBackend',
+                fail_silently=fail_silently,
+                host=self.smtp_host,
+                port=self.smtp_port,
+                username=self.smtp_username,
+                password=self.smtp_password,
+                # SSL 和 TLS 不能同时开启，SSL 优先
+                use_tls=self.smtp_use_tls and not self.smtp_use_ssl,
+                use_ssl=self.smtp_use_ssl,
+            )
+        elif self.email_backend == 'sendgrid':
+            return get_connection('sendgrid_backend.SendgridBackend', fail_silently=fail_silently,
+                                  api_key=self.api_key)
+        elif self.email_backend == 'mailgun':
+            # 使用 smtp_host 存储 Mailgun 域名
+            return get_connection('django_mailgun.MailgunBackend', fail_silently=fail_silently,
+                                  access_key=self.api_key, server_name=self.smtp_host)
+        raise ValueError(f"未知的邮件后端: {self.email_backend}")
+
     def send_test_email(self, to_email):
         """发送测试邮件"""
-        global current_backend, current_host, current_port, current_user, current_password, current_tls, current_ssl, current_from
         subject = "EasyTesting - 测试邮件"
         message = "这是一封测试邮件，用于验证 EasyTesting 的邮件发送功能是否正常工作。"
-        from_email = f"{self.default_from_name} <{self.default_from_email}>"
 
         try:
-            # 保存当前设置
-            current_backend = settings.EMAIL_BACKEND
-            current_host = settings.EMAIL_HOST
-            current_port = settings.EMAIL_PORT
-            current_user = settings.EMAIL_HOST_USER
-            current_password = settings.EMAIL_HOST_PASSWORD
-            current_tls = settings.EMAIL_USE_TLS
-            current_ssl = getattr(settings, 'EMAIL_USE_SSL', False)
-            current_from = settings.DEFAULT_FROM_EMAIL
-
-            # 应用临时设置
-            if self.email_backend == 'smtp':
-                settings.EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
-                settings.EMAIL_HOST = self.smtp_host
-                settings.EMAIL_PORT = self.smtp_port
-                settings.EMAIL_HOST_USER = self.smtp_username
-                settings.EMAIL_HOST_PASSWORD = self.smtp_password
-                settings.EMAIL_USE_TLS = self.smtp_use_tls
-                settings.EMAIL_USE_SSL = self.smtp_use_ssl
-            elif self.email_backend == 'sendgrid':
-                settings.EMAIL_BACKEND = 'sendgrid_backend.SendgridBackend'
-                settings.SENDGRID_API_KEY = self.api_key
-            elif self.email_backend == 'mailgun':
-                settings.EMAIL_BACKEND = 'django_mailgun.MailgunBackend'
-                settings.MAILGUN_ACCESS_KEY = self.api_key
-                settings.MAILGUN_SERVER_NAME = self.smtp_host  # 使用 smtp_host 存储 Mailgun 域名
-
-            settings.DEFAULT_FROM_EMAIL = from_email
-
-            # 发送测试邮件
             email = EmailMessage(
                 subject=subject,
                 body=message,
-                from_email=from_email,
+                from_email=self.from_email,
                 to=[to_email],
                 reply_to=[self.default_from_email],
+                connection=self.get_connection(),
             )
             email.send(fail_silently=False)
 
-            # 恢复原始设置
-            settings.EMAIL_BACKEND = current_backend
-            settings.EMAIL_HOST = current_host
-            settings.EMAIL_PORT = current_port
-            settings.EMAIL_HOST_USER = current_user
-            settings.EMAIL_HOST_PASSWORD = current_password
-            settings.EMAIL_USE_TLS = current_tls
-            settings.EMAIL_USE_SSL = current_ssl
-            settings.DEFAULT_FROM_EMAIL = current_from
-
             return True, "测试邮件发送成功"
         except Exception as e:
-            # 恢复原始设置
-            settings.EMAIL_BACKEND = current_backend
-            settings.EMAIL_HOST = current_host
-            settings.EMAIL_PORT = current_port
-            settings.EMAIL_HOST_USER = current_user
-            settings.EMAIL_HOST_PASSWORD = current_password
-            settings.EMAIL_USE_TLS = current_tls
-            settings.EMAIL_USE_SSL = current_ssl
-            settings.DEFAULT_FROM_EMAIL = current_from
-
             return False, f"测试邮件发送失败: {str(e)}"
 
     @classmethod
     def get_active_config(cls):
-        """获取当前激活的邮件配置"""
+        """
+        获取当前激活的邮件配置
+
+        共享缓存中只存激活配置的ID，密码和API密钥不离开数据库；配置修改时缓存失效
+        """
         try:
-            return cls.objects.get(is_active=True)
-        except cls.DoesNotExist:
-            return None
+            config_id = cache.get(cls.ACTIVE_CONFIG_CACHE_KEY)
+        except Exception:
+            config_id = None
+        if config_id is None:
+            # 没有激活配置时缓存0，避免每次发信都扫描配置表
+            config_id = cls.objects.filter(is_active=True).values_list('pk', flat=True).first() or 0
+            try:
+                cache.set(cls.ACTIVE_CONFIG_CACHE_KEY, config_id, getattr(settings, 'EMAIL_CONFIG_CACHE_TTL', 300))
+            except Exception:
+                pass
+        return cls.objects.filter(pk=config_id, is_active=True).first() if config_id else None
 
     @classmethod
-    def apply_active_config(cls):
-        """应用当前激活的邮件配置到 Django 设置"""
-        config = cls.get_active_config()
-        if not config:
-            return False
-
-        if config.email_backend == 'smtp':
-            settings.EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
-            settings.EMAIL_HOST = config.smtp_host
-            settings.EMAIL_PORT = config.smtp_port
-            settings.EMAIL_HOST_USER = config.smtp_username
-            settings.EMAIL_HOST_PASSWORD = config.smtp_password
-            settings.EMAIL_USE_TLS = config.smtp_use_tls
-            settings.EMAIL_USE_SSL = config.smtp_use_ssl
-        elif config.email_backend == 'sendgrid':
-            settings.EMAIL_BACKEND = 'sendgrid_backend.SendgridBackend'
-            settings.SENDGRID_API_KEY = config.api_key
-        elif config.email_backend == 'mailgun':
-            settings.EMAIL_BACKEND = 'django_mailgun.MailgunBackend'
-            settings.MAILGUN_ACCESS_KEY = config.api_key
-            settings.MAILGUN_SERVER_NAME = config.smtp_host  # 使用 smtp_host 存储 Mailgun 域名
-
-        settings.DEFAULT_FROM_EMAIL = f"{config.default_from_name} <{config.default_from_email}>"
-        return True
+    def clear_active_config_cache(cls):
+        try:
+            cache.delete(cls.ACTIVE_CONFIG_CACHE_KEY)
+        except Exception:
+            # 缓存不可用时不影响配置保存，缓存过期后会重新读取
+            pass
 
 
 class TestSuiteRun(models.Model):
@@ -443,6 +941,7 @@ class TestSuiteRun(models.Model):
     end_time = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, related_name='created_test_suite_runs')
+    total_count = models.PositiveIntegerField(default=0, verbose_name="套件数", db_comment="批量运行包含的套件数")
 
     def __str__(self):
         return self.name
@@ -453,6 +952,145 @@ class TestSuiteRun(models.Model):
             return (self.end_time - self.start_time).total_seconds()
         return None
 
+    def get_absolute_url(self):
+        return reverse('test_suite_run_detail', args=[self.pk])
+
+
+class RunSlot(models.Model):
+    """
+    批量运行的全局并发槽位
+
+    每行是一个槽位，子运行开始前用条件UPDATE占用空闲槽位，执行期间续约，结束后释放；
+    租约过期的槽位视为空闲，避免worker异常退出后槽位永久被占用
+    """
+    slot = models.PositiveIntegerField(unique=True, verbose_name="槽位编号", db_comment="槽位编号")
+    test_run = models.OneToOneField(TestRun, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='run_slot', verbose_name="占用的测试运行", db_comment="占用的测试运行")
+    lease_expires_at = models.DateTimeField(null=True, blank=True, verbose_name="租约过期时间",
+                                            db_comment="租约过期时间")
+
+    class Meta:
+        ordering = ['slot']
+        verbose_name = "运行槽位"
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"slot {self.slot}"
+
+    @classmethod
+    def acquire(cls, test_run_id, limit, ttl):
+        """
+        为测试运行占用一个空闲槽位，成功返回True；槽位总数为 limit
+
+        test_run 是一对一字段，调用方须先把运行从等待状态改为执行中，保证同一运行只会来占用一次
+        """
+        cls.objects.bulk_create([cls(slot=i) for i in range(limit)], ignore_conflicts=True)
+        now = timezone.now()
+        free = Q(test_run__isnull=True) | Q(lease_expires_at__lte=now)
+        for slot_id in cls.objects.filter(free, slot__lt=limit).values_list('id', flat=True):
+            # 条件UPDATE保证同一槽位只会被一个运行占用
+            if cls.objects.filter(free, pk=slot_id).update(
+                    test_run_id=test_run_id, lease_expires_at=now + timedelta(seconds=ttl)):
+                return True
+        return False
+
+    @classmethod
+    def renew(cls, test_run_id, ttl):
+        """延长测试运行占用的槽位租约，槽位已不归该运行时返回False"""
+        return bool(cls.objects.filter(test_run_id=test_run_id).update(
+            lease_expires_at=timezone.now() + timedelta(seconds=ttl)))
+
+    @classmethod
+    def release(cls, test_run_id):
+        cls.objects.filter(test_run_id=test_run_id).update(test_run=None, lease_expires_at=None)
+
+
+class RunnerAgent(models.Model):
+    """
+    执行代理，部署在能访问被测系统的机器上
+
+    代理通过HTTP注册、领取运行任务、提交结果和上报心跳，不直接访问数据库
+    """
+    name = models.CharField(max_length=100, unique=True, verbose_name="代理名称", db_comment="代理名称")
+    hostname = models.CharField(max_length=255, blank=True, verbose_name="主机名", db_comment="主机名")
+    labels = models.JSONField(default=list, blank=True, verbose_name="标签",
+                              db_comment="可领取的任务标签，对应环境的执行代理标签")
+    capacity = models.PositiveIntegerField(default=1, verbose_name="并发容量", db_comment="同时执行的任务数")
+    version = models.CharField(max_length=50, blank=True, verbose_name="版本", db_comment="代理版本")
+    registered_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                      related_name='runner_agents', verbose_name="注册用户", db_comment="注册用户")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="启动时间", db_comment="最近一次注册的时间")
+    last_heartbeat = models.DateTimeField(null=True, blank=True, db_index=True, verbose_name="最近心跳时间",
+                                          db_comment="最近心跳时间")
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = "执行代理"
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def alive(cls):
+        """一个租约有效期内上报过心跳的代理"""
+        from django.conf import settings
+
+        ttl = getattr(settings, 'AGENT_LEASE_TTL', 60)
+        return cls.objects.filter(last_heartbeat__gte=timezone.now() - timedelta(seconds=ttl))
+
+    @property
+    def is_online(self):
+        from django.conf import settings
+
+        ttl = getattr(settings, 'AGENT_LEASE_TTL', 60)
+        return bool(self.last_heartbeat) and self.last_heartbeat >= timezone.now() - timedelta(seconds=ttl)
+
+
+class AgentJob(models.Model):
+    """
+    交给执行代理的运行任务，每个测试运行一个
+
+    代理用条件UPDATE领取任务并获得租约，心跳和提交结果时续约；
+    租约过期的任务可被其他代理重新领取，领取次数同时作为防护令牌，失联代理的迟到提交会被拒绝。
+    任务内的用例顺序执行，限制了并发请求数的环境在领取时按任务占用一个名额
+    """
+    STATUS_CHOICES = [
+        ('queued', '等待领取'),
+        ('leased', '执行中'),
+        ('finished', '已结束'),
+    ]
+
+    test_run = models.OneToOneField(TestRun, on_delete=models.CASCADE, related_name='agent_job',
+                                    verbose_name="测试运行", db_comment="测试运行")
+    label = models.CharField(max_length=50, verbose_name="标签", db_comment="只有带此标签的代理可以领取")
+    test_case = models.ForeignKey(TestCase, on_delete=models.SET_NULL, null=True, blank=True,
+                                  related_name='agent_jobs', verbose_name="测试用例",
+                                  db_comment="单个用例的运行执行的用例，套件运行为空")
+    case_environments = models.JSONField(default=dict, blank=True, verbose_name="用例环境",
+                                         db_comment="运行时为套件中的用例指定的环境")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued', verbose_name="状态",
+                              db_comment="状态")
+    agent = models.ForeignKey(RunnerAgent, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs',
+                              verbose_name="执行代理", db_comment="持有租约的执行代理")
+    attempt = models.PositiveIntegerField(default=0, verbose_name="领取次数", db_comment="领取次数，也是租约的防护令牌")
+    lease_expires_at = models.DateTimeField(null=True, blank=True, verbose_name="租约过期时间",
+                                            db_comment="租约过期时间")
+    throttled_environments = models.JSONField(default=list, blank=True, verbose_name="占用并发名额的环境",
+                                              db_comment="领取时占用了并发名额的环境ID，续约时续期，结束时归还")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间", db_comment="创建时间")
+    leased_at = models.DateTimeField(null=True, blank=True, verbose_name="领取时间", db_comment="最近一次领取的时间")
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name="结束时间", db_comment="结束时间")
+
+    class Meta:
+        ordering = ['id']
+        indexes = [models.Index(fields=['status', 'label'], name='agentjob_status_label_idx')]
+        verbose_name = "代理任务"
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"job {self.pk} ({self.test_run_id})"
+
 
 class TestReport(models.Model):
     """测试报告模型"""
@@ -468,6 +1106,13 @@ class TestReport(models.Model):
         ('json', 'JSON'),
     ]
 
+    GENERATION_STATUS_CHOICES = [
+        ('pending', '等待生成'),
+        ('generating', '生成中'),
+        ('completed', '已完成'),
+        ('failed', '生成失败'),
+    ]
+
     name = models.CharField(max_length=255, verbose_name="报告名称", db_comment="报告名称")
     description = models.TextField(null=True, blank=True, verbose_name="报告描述", db_comment="报告描述")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间", db_comment="创建时间")
@@ -478,7 +1123,32 @@ class TestReport(models.Model):
                                    verbose_name="报告类型", db_comment="报告类型")
     report_format = models.CharField(max_length=10, choices=REPORT_FORMAT_CHOICES, default='html',
                                      verbose_name="报告格式", db_comment="报告格式")
-    content = models.TextField(verbose_name="报告内容", db_comment="报告内容")
+    content = models.TextField(blank=True, default='', verbose_name="报告内容",
+                               db_comment="报告内容，后台生成的报告保存在报告文件中")
+    generation_status = models.CharField(max_length=20, choices=GENERATION_STATUS_CHOICES, default='pending',
+                                         verbose_name="生成状态", db_comment="生成状态")
+    progress = models.PositiveSmallIntegerField(default=0, verbose_name="生成进度", db_comment="生成进度(百分比)")
+    processed_count = models.PositiveIntegerField(default=0, verbose_name="已处理结果数", db_comment="已处理结果数")
+    total_count = models.PositiveIntegerField(default=0, verbose_name="结果总数", db_comment="结果总数")
+    file_path = models.CharField(max_length=255, blank=True, default='', verbose_name="报告文件",
+                                 db_comment="报告文件相对 REPORT_STORAGE_DIR 的路径")
+    file_size = models.BigIntegerField(null=True, blank=True, verbose_name="文件大小", db_comment="文件大小(字节)")
+    generation_error = models.TextField(blank=True, default='', verbose_name="生成错误", db_comment="生成错误")
+    generated_at = models.DateTimeField(null=True, blank=True, verbose_name="生成完成时间", db_comment="生成完成时间")
+    section_offsets = models.JSONField(default=list, blank=True, verbose_name="分段偏移",
+                                       db_comment="分段文件中每页起始的字节偏移，最后一项为文件末尾")
+    # 报告元数据，生成时写入，详情页不再解析报告内容
+    title = models.CharField(max_length=255, blank=True, default='', verbose_name="报告标题", db_comment="报告标题")
+    environment_name = models.CharField(max_length=100, blank=True, default='', verbose_name="环境名称",
+                                        db_comment="环境名称")
+    run_status = models.CharField(max_length=20, blank=True, default='', verbose_name="运行状态", db_comment="运行状态")
+    start_time = models.DateTimeField(null=True, blank=True, verbose_name="开始时间", db_comment="开始时间")
+    end_time = models.DateTimeField(null=True, blank=True, verbose_name="结束时间", db_comment="结束时间")
+    duration = models.FloatField(null=True, blank=True, verbose_name="持续时间", db_comment="持续时间(秒)")
+    passed_count = models.PositiveIntegerField(default=0, verbose_name="通过数", db_comment="通过数")
+    failed_count = models.PositiveIntegerField(default=0, verbose_name="失败数", db_comment="失败数")
+    error_count = models.PositiveIntegerField(default=0, verbose_name="错误数", db_comment="错误数")
+    skipped_count = models.PositiveIntegerField(default=0, verbose_name="跳过数", db_comment="跳过数")
     test_run = models.ForeignKey(TestRun, on_delete=models.SET_NULL, null=True, blank=True, related_name='reports',
                                  verbose_name="测试运行", db_comment="测试运行")
     test_suite_run = models.ForeignKey(TestSuiteRun, on_delete=models.SET_NULL, null=True, blank=True,
@@ -503,22 +1173,69 @@ class TestReport(models.Model):
     def get_delete_url(self):
         return reverse('test_report_delete', kwargs={'pk': self.pk})
 
+    @property
+    def is_ready(self):
+        return self.generation_status == 'completed'
+
+    @staticmethod
+    def storage_dir():
+        return Path(getattr(settings, 'REPORT_STORAGE_DIR', settings.BASE_DIR / 'reports'))
+
+    def get_file(self):
+        """报告文件的绝对路径，没有报告文件时返回None"""
+        if not self.file_path:
+            return None
+        return self.storage_dir() / self.file_path
+
+    def read_content(self):
+        """读取报告内容，后台生成的报告从报告文件读取"""
+        path = self.get_file()
+        if path is None:
+            return self.content
+        try:
+            return path.read_text(encoding='utf-8')
+        except OSError as e:
+            logger.warning(f"读取报告文件失败: report={self.pk}, {e}")
+            return ''
+
+    def get_sections_file(self):
+        """分段文件的绝对路径，与报告文件放在一起"""
+        path = self.get_file()
+        if path is None:
+            return None
+        return path.with_name(path.stem + '.sections.jsonl')
+
+    @property
+    def section_pages(self):
+        return max(0, len(self.section_offsets) - 1)
+
+    def read_section(self, page):
+        """读取一页分段，只读取该页对应的字节范围"""
+        path = self.get_sections_file()
+        if path is None or not 0 <= page < self.section_pages:
+            return []
+        start, end = self.section_offsets[page], self.section_offsets[page + 1]
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read(end - start)
+        return [json.loads(line) for line in data.decode('utf-8').splitlines() if line]
+
+    @property
+    def success_rate(self):
+        if not self.total_count:
+            return 0
+        return round(self.passed_count / self.total_count * 100, 2)
+
     def get_summary(self):
         """返回报告的摘要信息"""
-        if self.report_format == 'json':
-            try:
-                data = json.loads(self.content)
-                return {
-                    'total': data.get('total', 0),
-                    'passed': data.get('passed', 0),
-                    'failed': data.get('failed', 0),
-                    'error': data.get('error', 0),
-                    'skipped': data.get('skipped', 0),
-                    'success_rate': data.get('success_rate', '0%'),
-                }
-            except:
-                return {}
-        return {}
+        return {
+            'total': self.total_count,
+            'passed': self.passed_count,
+            'failed': self.failed_count,
+            'error': self.error_count,
+            'skipped': self.skipped_count,
+            'success_rate': f"{self.success_rate}%",
+        }
 
 
 class MockData(models.Model):
@@ -559,6 +1276,15 @@ class ScheduledTask(models.Model):
         ('paused', '暂停'),
     ]
 
+    OVERLAP_POLICY_CHOICES = [
+        ('skip', '跳过本次'),
+        ('queue', '排队一次'),
+        ('coalesce', '合并到当前执行'),
+    ]
+
+    # 租约相关字段只通过条件更新修改，普通保存不会覆盖
+    LEASE_FIELDS = ('lease_owner', 'lease_expires_at', 'pending_run')
+
     name = models.CharField(max_length=200, verbose_name="任务名称", db_comment="任务名称")
     description = models.TextField(blank=True, verbose_name="任务描述", db_comment="任务描述")
     test_suite = models.ForeignKey(TestSuite, on_delete=models.CASCADE, related_name='scheduled_tasks',
@@ -596,11 +1322,26 @@ class ScheduledTask(models.Model):
                                             db_comment="成功时通知")
     notify_on_failure = models.BooleanField(default=True, verbose_name="失败时通知",
                                             db_comment="失败时通知")
+    notification_digest = models.BooleanField(default=False, verbose_name="合并通知", db_comment="合并通知",
+                                              help_text="在汇总窗口内把同一收件人的多次执行通知合并为一封邮件")
+
+    payload_capture = models.CharField(max_length=20, choices=[('', '跟随测试套件')] + PAYLOAD_CAPTURE_CHOICES,
+                                       blank=True, verbose_name="载荷保存策略", db_comment="载荷保存策略",
+                                       help_text="为空时使用测试套件的设置")
 
 
     max_retries = models.IntegerField(default=3, verbose_name="最大重试次数", db_comment="最大重试次数")
     retry_delay = models.IntegerField(default=300, verbose_name="重试间隔(秒)", db_comment="重试间隔(秒)")
 
+    # 并发控制
+    overlap_policy = models.CharField(max_length=20, choices=OVERLAP_POLICY_CHOICES, default='skip',
+                                      verbose_name="重叠执行策略", db_comment="重叠执行策略",
+                                      help_text="上一次执行尚未结束时再次触发的处理方式")
+    lease_owner = models.CharField(max_length=255, blank=True, verbose_name="租约持有者", db_comment="租约持有者")
+    lease_expires_at = models.DateTimeField(null=True, blank=True, verbose_name="租约过期时间",
+                                            db_comment="租约过期时间")
+    pending_run = models.BooleanField(default=False, verbose_name="已排队执行", db_comment="已排队执行")
+
     # 执行统计
     last_run_time = models.DateTimeField(null=True, blank=True, verbose_name="上次执行时间",
                                          db_comment="上次执行时间")
@@ -627,6 +1368,73 @@ class ScheduledTask(models.Model):
         verbose_name_plural = verbose_name
         ordering = ['-created_at']
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.LEASE_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def lease_ttl():
+        from django.conf import settings
+
+        return getattr(settings, 'SCHEDULED_TASK_LEASE_TTL', 300)
+
+    def acquire_lease(self, owner, ttl=None, consume_queued=False):
+        """
+        尝试获取执行租约，成功返回True。租约过期后可被其他执行抢占，上一次执行移交给 owner 的租约直接取得
+
+        consume_queued 时只在排队标记仍在时获取，并在同一条UPDATE中清除标记，
+        标记已被结束的执行取走（移交给了排队的执行）时返回False
+        """
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=ttl or self.lease_ttl())
+        free = Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=now)
+
+        tasks = ScheduledTask.objects.filter(pk=self.pk)
+        if consume_queued:
+            acquired = tasks.filter(free, pending_run=True).update(
+                lease_owner=owner, lease_expires_at=expires_at, pending_run=False)
+        else:
+            acquired = tasks.filter(free | Q(lease_owner=owner)).update(lease_owner=owner, lease_expires_at=expires_at)
+
+        if acquired:
+            self.lease_owner = owner
+            self.lease_expires_at = expires_at
+        return bool(acquired)
+
+    def renew_lease(self, owner, ttl=None):
+        """执行期间续约，租约已不归 owner 所有时返回False"""
+        expires_at = timezone.now() + timedelta(seconds=ttl or self.lease_ttl())
+        return bool(ScheduledTask.objects.filter(pk=self.pk, lease_owner=owner).update(lease_expires_at=expires_at))
+
+    def release_lease(self, owner, next_owner):
+        """
+        释放执行租约，返回是否移交给了排队的执行
+
+        存在排队标记时，在同一条UPDATE中清除标记并把租约移交给 next_owner，
+        调用方应以 next_owner 为任务ID触发下一次执行；释放与排队之间不会漏掉或多出执行
+        """
+        expires_at = timezone.now() + timedelta(seconds=self.lease_ttl())
+        ScheduledTask.objects.filter(pk=self.pk, lease_owner=owner).update(
+            lease_owner=Case(When(pending_run=True, then=Value(next_owner)), default=Value('')),
+            lease_expires_at=Case(When(pending_run=True, then=Value(expires_at)), default=None,
+                                  output_field=models.DateTimeField()),
+            pending_run=False,
+        )
+        handed_over = ScheduledTask.objects.filter(pk=self.pk, lease_owner=next_owner).exists()
+
+        self.lease_owner = next_owner if handed_over else ''
+        self.lease_expires_at = expires_at if handed_over else None
+        self.pending_run = False
+        return handed_over
+
+    def request_queued_run(self):
+        """标记在当前执行结束后再执行一次，已有排队时返回False"""
+        return bool(ScheduledTask.objects.filter(pk=self.pk, pending_run=False).update(pending_run=True))
+
     def get_notification_email_list(self):
         """获取通知邮箱列表"""
         if not self.notification_emails:
@@ -726,6 +1534,9 @@ class TaskExecutionLog(models.Model):
         ('failed', '失败'),
         ('timeout', '超时'),
         ('cancelled', '已取消'),
+        ('skipped', '已跳过'),
+        ('queued', '已排队'),
+        ('coalesced', '已合并'),
     ]
 
     scheduled_task = models.ForeignKey(ScheduledTask, on_delete=models.CASCADE, related_name='execution_logs',
@@ -760,6 +1571,10 @@ class TaskExecutionLog(models.Model):
         verbose_name = "任务执行日志"
         verbose_name_plural = verbose_name
         ordering = ['-start_time']
+        indexes = [
+            # 定时任务详情页的执行历史
+            models.Index(fields=['scheduled_task', '-start_time'], name='tasklog_task_start_idx'),
+        ]
 
     @property
     def success_rate(self):
@@ -774,6 +1589,75 @@ class TaskExecutionLog(models.Model):
             self.duration = (self.end_time - self.start_time).total_seconds()
             return self.duration
         return None
+
+
+class EmailNotification(models.Model):
+    """待发送的邮件通知，每个收件人一条，由通知队列分批发送，发送失败时退避重试"""
+    STATUS_CHOICES = [
+        ('pending', '待发送'),
+        ('sending', '发送中'),
+        ('sent', '已发送'),
+        ('failed', '发送失败'),
+    ]
+
+    execution_log = models.ForeignKey(TaskExecutionLog, on_delete=models.CASCADE, related_name='email_notifications',
+                                      verbose_name="执行日志", db_comment="执行日志")
+    recipient = models.EmailField(verbose_name="收件人", db_comment="收件人")
+    digest = models.BooleanField(default=False, verbose_name="合并发送", db_comment="合并发送")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', db_index=True,
+                              verbose_name="发送状态", db_comment="发送状态")
+    error_message = models.TextField(blank=True, verbose_name="错误信息", db_comment="错误信息")
+    attempts = models.PositiveIntegerField(default=0, verbose_name="发送次数", db_comment="已尝试发送的次数")
+    next_attempt_at = models.DateTimeField(null=True, blank=True, verbose_name="下次发送时间",
+                                           db_comment="发送失败后下次重试的时间，为空时立即发送")
+    claim_token = models.CharField(max_length=32, blank=True, verbose_name="领取标识",
+                                   db_comment="发送中的通知由哪一次发送领取")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="创建时间", db_comment="创建时间")
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name="发送时间", db_comment="发送时间")
+
+    def __str__(self):
+        return f"{self.recipient} - {self.get_status_display()}"
+
+    class Meta:
+        verbose_name = "邮件通知"
+        verbose_name_plural = verbose_name
+        ordering = ['id']
+
+
+class WorkerHeartbeat(models.Model):
+    """Celery worker心跳，由worker定期上报，用于在请求中快速判断worker健康状态"""
+    hostname = models.CharField(max_length=255, unique=True, verbose_name="主机名", db_comment="主机名")
+    pid = models.IntegerField(null=True, blank=True, verbose_name="进程ID", db_comment="进程ID")
+    concurrency = models.IntegerField(default=0, verbose_name="并发容量", db_comment="并发容量")
+    active_tasks = models.IntegerField(default=0, verbose_name="执行中任务数", db_comment="执行中任务数")
+    reserved_tasks = models.IntegerField(default=0, verbose_name="已预取任务数", db_comment="已预取任务数")
+    queues = models.JSONField(default=list, blank=True, verbose_name="消费队列", db_comment="消费队列")
+    queue_depth = models.JSONField(default=dict, blank=True, verbose_name="队列积压", db_comment="队列积压")
+    registered_tasks = models.JSONField(default=list, blank=True, verbose_name="已注册任务", db_comment="已注册任务")
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name="启动时间", db_comment="启动时间")
+    last_seen = models.DateTimeField(db_index=True, verbose_name="最近心跳时间", db_comment="最近心跳时间")
+
+    def __str__(self):
+        return self.hostname
+
+    class Meta:
+        verbose_name = "Worker心跳"
+        verbose_name_plural = verbose_name
+        ordering = ['hostname']
+
+    @property
+    def free_slots(self):
+        """剩余可用并发"""
+        return max(self.concurrency - self.active_tasks, 0)
+
+    @classmethod
+    def alive(cls):
+        """最近一个心跳超时时间内上报过心跳的worker"""
+        from django.conf import settings
+
+        timeout = getattr(settings, 'WORKER_HEARTBEAT_TIMEOUT', 30)
+        return cls.objects.filter(last_seen__gte=timezone.now() - timedelta(seconds=timeout))
+
 #
 #
 # # 信号处理器
@@ -0,0 +1,322 @@
+import logging
+import traceback
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db.models import Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SCHEDULED_KEY = 'notifications:flush_scheduled'
+
+
+class ActiveConfigEmailBackend(BaseEmailBackend):
+    """
+    按当前激活的邮件配置发信的邮件后端
+
+    作为全局 EMAIL_BACKEND 使用，所有 send_mail 调用都会走激活的 EmailConfig，
+    没有激活配置时退回 EMAIL_FALLBACK_BACKEND 和 settings 中的 EMAIL_* 参数
+    """
+
+    def __init__(self, fail_silently=False, **kwargs):
+        super().__init__(fail_silently=fail_silently)
+        from .models import EmailConfig
+
+        self.config = EmailConfig.get_active_config()
+        if self.config:
+            self.backend = self.config.get_connection(fail_silently=fail_silently)
+        else:
+            self.backend = get_connection(
+                getattr(settings, 'EMAIL_FALLBACK_BACKEND', 'django.core.mail.backends.smtp.EmailBackend'),
+                fail_silently=fail_silently, **kwargs
+            )
+
+    def open(self):
+        return self.backend.open()
+
+    def close(self):
+        return self.backend.close()
+
+    def send_messages(self, email_messages):
+        if self.config:
+            # 使用默认发件人的邮件改为激活配置中的发件人
+            for message in email_messages:
+                if not message.from_email or message.from_email == settings.DEFAULT_FROM_EMAIL:
+                    message.from_email = self.config.from_email
+        return self.backend.send_messages(email_messages)
+
+
+def _flush_delay():
+    return getattr(settings, 'NOTIFICATION_FLUSH_DELAY', 10)
+
+
+def schedule_flush():
+    """
+    安排一次通知发送
+
+    延迟时间内只安排一次，短时间内大量执行结束时会合并到同一批发送
+    """
+    from .tasks import flush_email_notifications
+
+    delay = _flush_delay()
+    try:
+        scheduled = not cache.add(FLUSH_SCHEDULED_KEY, 1, timeout=delay)
+    except Exception as e:
+        logger.warning(f"读取通知发送标记失败: {e}")
+        scheduled = False
+    if not scheduled:
+        flush_email_notifications.apply_async(countdown=delay)
+
+
+def enqueue_task_notification(execution_log):
+    """为执行日志的每个收件人登记一条待发送通知"""
+    from .models import EmailNotification
+
+    scheduled_task = execution_log.scheduled_task
+    email_list = scheduled_task.get_notification_email_list()
+    if not email_list:
+        logger.warning(f"任务没有配置通知邮箱: {scheduled_task.name}")
+        return 0
+
+    EmailNotification.objects.bulk_create([
+        EmailNotification(execution_log=execution_log, recipient=recipient,
+                          digest=scheduled_task.notification_digest)
+        for recipient in email_list
+    ])
+    logger.info(f"已登记通知邮件: {scheduled_task.name} -> {', '.join(email_list)}")
+
+    schedule_flush()
+    return len(email_list)
+
+
+def _render(template_name, context, fallback):
+    try:
+        html_message = render_to_string(f'{template_name}.html', context)
+        plain_message = render_to_string(f'{template_name}.txt', context)
+    except Exception as e:
+        logger.error(f"渲染邮件模板失败: {str(e)}")
+        # 使用简单的邮件内容作为备用
+        plain_message = fallback
+        html_message = plain_message.replace('\n', '<br>')
+    return plain_message, html_message
+
+
+def build_task_message(execution_log, recipients):
+    """单次执行的通知邮件"""
+    scheduled_task = execution_log.scheduled_task
+    status_text = "成功" if execution_log.status == 'success' else "失败"
+    context = {
+        'scheduled_task': scheduled_task,
+        'execution_log': execution_log,
+        'test_run': execution_log.test_run,
+        'success': execution_log.status == 'success',
+        'timestamp': timezone.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    fallback = f"""
+    EasyTesting 定时任务执行通知
+
+    任务名称: {scheduled_task.name}
+    执行状态: {status_text}
+    开始时间: {execution_log.start_time}
+    结束时间: {execution_log.end_time}
+    执行时长: {execution_log.duration} 秒
+
+    测试用例统计:
+    - 总数: {execution_log.total_test_cases}
+    - 通过: {execution_log.passed_test_cases}
+    - 失败: {execution_log.failed_test_cases}
+    - 错误: {execution_log.error_test_cases}
+
+    {execution_log.error_message if execution_log.error_message else ''}
+    """
+    plain_message, html_message = _render('emails/task_notification', context, fallback)
+
+    message = EmailMultiAlternatives(
+        subject=f"EasyTesting 定时任务执行通知 - {scheduled_task.name}",
+        body=plain_message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=recipients,
+    )
+    message.attach_alternative(html_message, 'text/html')
+    return message
+
+
+def build_digest_message(recipient, execution_logs):
+    """同一收件人在汇总窗口内的多次执行合并为一封邮件"""
+    failed_count = sum(1 for log in execution_logs if log.status != 'success')
+    context = {
+        'recipient': recipient,
+        'execution_logs': execution_logs,
+        'total_count': len(execution_logs),
+        'failed_count': failed_count,
+        'timestamp': timezone.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    lines = [f"EasyTesting 定时任务执行汇总，共 {len(execution_logs)} 次执行，{failed_count} 次失败", ""]
+    for log in execution_logs:
+        lines.append(f"- {log.scheduled_task.name}: {log.get_status_display()} "
+                     f"({log.passed_test_cases}/{log.total_test_cases} 通过) {log.start_time}")
+    plain_message, html_message = _render('emails/task_digest', context, '\n'.join(lines))
+
+    message = EmailMultiAlternatives(
+        subject=f"EasyTesting 定时任务执行汇总 - {len(execution_logs)} 次执行，{failed_count} 次失败",
+        body=plain_message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[recipient],
+    )
+    message.attach_alternative(html_message, 'text/html')
+    return message
+
+
+def due_notifications():
+    """
+    待发送且已到重试时间的通知
+
+    发送中的通知领取超时后也算到期，发送进程中途退出时不会一直停留在发送中
+    """
+    from .models import EmailNotification
+
+    return EmailNotification.objects.filter(
+        Q(status='pending', next_attempt_at__isnull=True) |
+        Q(status__in=['pending', 'sending'], next_attempt_at__lte=timezone.now())
+    )
+
+
+def _claim(notifications):
+    """
+    领取本批通知，返回领取到的通知
+
+    用一条带状态条件的UPDATE把仍然到期的通知改为发送中，同时运行的多次发送（定时发送、延迟发送、
+    通知队列的多个进程）只有一次能领取到同一条通知；SQLite不支持 select_for_update(skip_locked=True)
+    """
+    from .models import EmailNotification
+
+    ids = [notification.id for notification in notifications]
+    token = uuid.uuid4().hex
+    expires_at = timezone.now() + timedelta(seconds=getattr(settings, 'NOTIFICATION_CLAIM_TTL', 300))
+    due_notifications().filter(id__in=ids).update(status='sending', claim_token=token, next_attempt_at=expires_at)
+    claimed = set(EmailNotification.objects.filter(id__in=ids, claim_token=token, status='sending')
+                  .values_list('id', flat=True))
+    return [notification for notification in notifications if notification.id in claimed]
+
+
+def _record_failure(notification_ids, error):
+    """
+    记录一次发送失败
+
+    未达到 NOTIFICATION_MAX_ATTEMPTS 次的通知退回待发送，按 NOTIFICATION_RETRY_DELAY 翻倍退避后
+    由定时发送重试；达到次数的记为发送失败
+    """
+    from .models import EmailNotification
+
+    max_attempts = getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 5)
+    retry_delay = getattr(settings, 'NOTIFICATION_RETRY_DELAY', 60)
+    now = timezone.now()
+    by_attempts = defaultdict(list)
+    for notification_id, attempts in EmailNotification.objects.filter(
+            id__in=notification_ids).values_list('id', 'attempts'):
+        by_attempts[attempts + 1].append(notification_id)
+    for attempts, ids in by_attempts.items():
+        if attempts >= max_attempts:
+            EmailNotification.objects.filter(id__in=ids).update(
+                status='failed', attempts=attempts, next_attempt_at=None, error_message=error)
+        else:
+            EmailNotification.objects.filter(id__in=ids).update(
+                status='pending', attempts=attempts, error_message=error,
+                next_attempt_at=now + timedelta(seconds=retry_delay * 2 ** (attempts - 1)))
+
+
+def _collect_batch():
+    """
+    取出并领取本批到期的通知
+
+    返回 [(邮件对象, 通知ID列表, 执行日志ID集合)]：即时通知按执行日志合并收件人，
+    合并通知按收件人汇总，且该收件人最早的通知已超过汇总窗口才发送；等待重试的通知到时间后才取出，
+    已被其他发送领取的通知不在本批中
+    """
+    from .models import TaskExecutionLog
+
+    batch_size = getattr(settings, 'NOTIFICATION_BATCH_SIZE', 200)
+    window = timedelta(seconds=getattr(settings, 'NOTIFICATION_DIGEST_WINDOW', 30 * 60))
+
+    pending = due_notifications()
+    due_digest_recipients = set(
+        pending.filter(digest=True, created_at__lte=timezone.now() - window)
+        .values_list('recipient', flat=True).distinct()
+    )
+    notifications = list(
+        pending.filter(digest=False).order_by('id')[:batch_size]
+    ) + list(
+        pending.filter(digest=True, recipient__in=due_digest_recipients).order_by('id')[:batch_size]
+    )
+    if notifications:
+        notifications = _claim(notifications)
+    if not notifications:
+        return []
+
+    log_ids = {notification.execution_log_id for notification in notifications}
+    logs = TaskExecutionLog.objects.select_related(
+        'scheduled_task', 'scheduled_task__test_suite', 'scheduled_task__environment', 'test_run'
+    ).in_bulk(log_ids)
+
+    immediate = defaultdict(list)
+    digests = defaultdict(list)
+    for notification in notifications:
+        if notification.digest:
+            digests[notification.recipient].append(notification)
+        else:
+            immediate[notification.execution_log_id].append(notification)
+
+    batch = []
+    for log_id, items in immediate.items():
+        message = build_task_message(logs[log_id], [item.recipient for item in items])
+        batch.append((message, [item.id for item in items], {log_id}))
+    for recipient, items in digests.items():
+        digest_logs = sorted({logs[item.execution_log_id] for item in items}, key=lambda log: log.start_time)
+        message = build_digest_message(recipient, digest_logs)
+        batch.append((message, [item.id for item in items], {item.execution_log_id for item in items}))
+    return batch
+
+
+def flush_pending_notifications():
+    """发送到期的通知，先领取再发送，整批复用同一个邮件连接；发送失败的通知退避重试"""
+    from .models import EmailNotification, TaskExecutionLog
+
+    batch = _collect_batch()
+    if not batch:
+        return 0
+
+    sent = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        # 连接不上邮件服务器时整批都算作一次发送失败
+        logger.error(f"连接邮件服务器失败: {str(e)}")
+        for message, notification_ids, log_ids in batch:
+            _record_failure(notification_ids, str(e))
+        return 0
+    try:
+        for message, notification_ids, log_ids in batch:
+            message.connection = connection
+            try:
+                message.send(fail_silently=False)
+                now = timezone.now()
+                EmailNotification.objects.filter(id__in=notification_ids).update(
+                    status='sent', sent_at=now, next_attempt_at=None)
+                TaskExecutionLog.objects.filter(id__in=log_ids).update(email_sent=True, email_sent_time=now)
+                sent += 1
+            except Exception as e:
+                logger.error(f"发送邮件失败: {str(e)}")
+                logger.error(traceback.format_exc())
+                _record_failure(notification_ids, str(e))
+    finally:
+        connection.close()
+
+    logger.info(f"本批发送通知邮件 {sent}/{len(batch)} 封")
+    return sent
@@ -0,0 +1,203 @@
+import base64
+import hashlib
+import logging
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Q
+from django.utils.http import urlencode
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PER_PAGE = 10
+
+
+def encode_cursor(created_at, pk):
+    """游标为 (created_at, id) 的URL安全base64编码"""
+    raw = f'{created_at.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析游标，格式错误时返回None，调用方从第一页开始"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return None
+
+
+def estimate_count(queryset):
+    """
+    估算查询集的总数
+
+    PostgreSQL 未过滤的全表查询直接读取统计信息；其他情况最多计数到
+    PAGINATION_COUNT_CAP 条，并缓存 PAGINATION_COUNT_CACHE_TTL 秒。
+    返回 (数量, 是否精确)
+    """
+    cap = getattr(settings, 'PAGINATION_COUNT_CAP', 10000)
+    connection = connections[queryset.db]
+
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] > 0:
+            return row[0], False
+
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    cache_key = 'pagination:count:' + hashlib.md5(f'{sql}{params}'.encode()).hexdigest()
+    try:
+        count = cache.get(cache_key)
+    except Exception as e:
+        logger.warning(f"读取分页计数缓存失败: {e}")
+        count = None
+
+    if count is None:
+        # 只数到上限，超过上限的大表不做全量计数
+        count = queryset.order_by().values('pk')[:cap].count()
+        try:
+            cache.set(cache_key, count, getattr(settings, 'PAGINATION_COUNT_CACHE_TTL', 300))
+        except Exception as e:
+            logger.warning(f"写入分页计数缓存失败: {e}")
+
+    return count, count < cap
+
+
+class KeysetPage:
+    """
+    按 (created_at, id) 倒序的游标分页结果
+
+    不使用 OFFSET，任意深度的翻页都只扫描一页的数据；
+    after 为下一页游标，before 为上一页游标
+    """
+
+    def __init__(self, queryset, per_page=DEFAULT_PER_PAGE, after=None, before=None):
+        self.per_page = per_page
+        after = decode_cursor(after) if after else None
+        before = decode_cursor(before) if before else None
+
+        if before:
+            created_at, pk = before
+            rows = list(queryset.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+            ).order_by('created_at', 'id')[:per_page + 1])
+            self.has_previous = len(rows) > per_page
+            self.object_list = list(reversed(rows[:per_page]))
+            self.has_next = True
+        else:
+            if after:
+                created_at, pk = after
+                queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk))
+            rows = list(queryset.order_by('-created_at', '-id')[:per_page + 1])
+            self.has_next = len(rows) > per_page
+            self.object_list = rows[:per_page]
+            self.has_previous = after is not None
+
+        if not self.object_list:
+            self.has_next = self.has_previous = False
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def next_cursor(self):
+        if self.has_next and self.object_list:
+            last = self.object_list[-1]
+            return encode_cursor(last.created_at, last.pk)
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous and self.object_list:
+            first = self.object_list[0]
+            return encode_cursor(first.created_at, first.pk)
+        return None
+
+
+def keyset_paginate(request, queryset, per_page=DEFAULT_PER_PAGE):
+    """页面视图使用的游标分页，读取 cursor / before 参数"""
+    page = KeysetPage(queryset, per_page, after=request.GET.get('cursor'), before=request.GET.get('before'))
+    page.estimated_count, page.count_is_exact = estimate_count(queryset)
+
+    # 翻页链接保留其他查询参数
+    params = [(key, value) for key, value in request.GET.items() if key not in ('cursor', 'before', 'page')]
+    page.next_query = page.previous_query = ''
+    if page.next_cursor:
+        page.next_query = urlencode(params + [('cursor', page.next_cursor)])
+    if page.previous_cursor:
+        page.previous_query = urlencode(params + [('before', page.previous_cursor)])
+    return page
+
+
+class KeysetPagination(BasePagination):
+    """
+    API 使用的游标分页
+
+    响应中 next / previous 为带游标的完整链接，count 为估算值，
+    count_is_exact 表示该值是否为精确计数
+    """
+    page_size = DEFAULT_PER_PAGE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page = KeysetPage(
+            queryset, self.get_page_size(request),
+            after=request.query_params.get('cursor'), before=request.query_params.get('before'),
+        )
+        self.count, self.count_is_exact = estimate_count(queryset)
+        return self.page.object_list
+
+    def _link(self, key, cursor):
+        if not cursor:
+            return None
+        params = self.request.query_params.copy()
+        params.pop('cursor', None)
+        params.pop('before', None)
+        params[key] = cursor
+        return self.request.build_absolute_uri(f'{self.request.path}?{params.urlencode()}')
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'count_is_exact': self.count_is_exact,
+            'next': self._link('cursor', self.page.next_cursor),
+            'previous': self._link('before', self.page.previous_cursor),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer'},
+                'count_is_exact': {'type': 'boolean'},
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,93 @@
+import logging
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# 队列分组
+QUEUE_INTERACTIVE = 'interactive'   # 手动触发的执行，要求低延迟
+QUEUE_BATCH = 'batch'               # 定时触发的批量执行
+QUEUE_NOTIFICATION = 'notification'  # 邮件通知
+QUEUE_MAINTENANCE = 'maintenance'   # 清理、同步等维护任务
+
+QUEUE_GROUPS = (QUEUE_INTERACTIVE, QUEUE_BATCH, QUEUE_NOTIFICATION, QUEUE_MAINTENANCE)
+
+# 优先级（Redis代理下数值越小优先级越高）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NOTIFICATION = 3
+PRIORITY_BATCH = 6
+PRIORITY_MAINTENANCE = 9
+
+EXECUTE_TASK = 'test_manager.tasks.execute_scheduled_test_suite'
+
+TASK_QUEUES = {
+    'test_manager.tasks.run_scheduled_task_now': (QUEUE_INTERACTIVE, PRIORITY_INTERACTIVE),
+    'test_manager.tasks.execute_test_run': (QUEUE_INTERACTIVE, PRIORITY_INTERACTIVE),
+    'test_manager.tasks.send_task_notification_email': (QUEUE_NOTIFICATION, PRIORITY_NOTIFICATION),
+    'test_manager.tasks.flush_email_notifications': (QUEUE_NOTIFICATION, PRIORITY_NOTIFICATION),
+    # 报告生成耗时较长，在交互队列中排在手动执行之后
+    'test_manager.tasks.generate_test_report': (QUEUE_INTERACTIVE, PRIORITY_BATCH),
+    'test_manager.tasks.cleanup_old_execution_logs': (QUEUE_MAINTENANCE, PRIORITY_MAINTENANCE),
+    'test_manager.tasks.cleanup_old_test_runs': (QUEUE_MAINTENANCE, PRIORITY_MAINTENANCE),
+    'test_manager.tasks.cleanup_response_blobs': (QUEUE_MAINTENANCE, PRIORITY_MAINTENANCE),
+    'test_manager.tasks.update_scheduled_tasks_next_run_time': (QUEUE_MAINTENANCE, PRIORITY_MAINTENANCE),
+    'test_manager.tasks.check_celery_status': (QUEUE_MAINTENANCE, PRIORITY_MAINTENANCE),
+    'test_manager.tasks.resume_suite_runs': (QUEUE_MAINTENANCE, PRIORITY_MAINTENANCE),
+    'test_manager.tasks.expire_agent_leases': (QUEUE_MAINTENANCE, PRIORITY_MAINTENANCE),
+}
+
+
+def batch_queue_shards():
+    return max(1, getattr(settings, 'CELERY_BATCH_QUEUE_SHARDS', 4))
+
+
+def batch_queue(project_id):
+    """
+    项目对应的批量执行队列
+
+    项目按ID散列到固定数量的分片队列，worker轮询消费所有分片，
+    单个项目的大批量执行只会占满自己的分片，不会饿死其他项目
+    """
+    return f'{QUEUE_BATCH}.{(project_id or 0) % batch_queue_shards()}'
+
+
+def queues_for_group(group):
+    """worker消费的队列名称列表"""
+    if group == QUEUE_BATCH:
+        return [f'{QUEUE_BATCH}.{i}' for i in range(batch_queue_shards())]
+    return [group]
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """
+    Celery任务路由
+
+    apply_async显式指定的queue/priority优先于这里的路由结果
+    """
+    if name in TASK_QUEUES:
+        queue, priority = TASK_QUEUES[name]
+        return {'queue': queue, 'priority': priority}
+
+    if name == EXECUTE_TASK:
+        from .models import ScheduledTask
+
+        project_id = None
+        try:
+            scheduled_task_id = args[0] if args else kwargs.get('scheduled_task_id')
+            project_id = ScheduledTask.objects.filter(id=scheduled_task_id).values_list(
+                'test_suite__project_id', flat=True).first()
+        except Exception as e:
+            logger.warning(f"获取定时任务所属项目失败，使用默认分片: {e}")
+        return {'queue': batch_queue(project_id), 'priority': PRIORITY_BATCH}
+
+    return None
+
+
+def dispatch_interactive_run(scheduled_task_id):
+    """以交互优先级提交定时任务执行，排在批量执行之前"""
+    from .tasks import execute_scheduled_test_suite
+
+    return execute_scheduled_test_suite.apply_async(
+        args=[scheduled_task_id],
+        queue=QUEUE_INTERACTIVE,
+        priority=PRIORITY_INTERACTIVE,
+    )
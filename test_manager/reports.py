@@ -0,0 +1,454 @@
+import os
+import json
+import logging
+import threading
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.html import escape
+
+from .models import TestReport, TestResult, TestRun
+
+logger = logging.getLogger(__name__)
+
+RUN_REPORT_STYLE = """
+</div>
+<style>
+    .test-report { font-family: Arial, sans-serif; max-width: 1200px; margin: 0 auto; padding: 20px; }
+    .report-meta { background-color: #f5f5f5; padding: 15px; border-radius: 5px; margin-bottom: 20px; }
+    .test-result { background-color: #f9f9f9; padding: 15px; border-radius: 5px; margin-bottom: 15px; border-left: 5px solid #ddd; }
+    .collapsible { margin-top: 10px; }
+    .collapsible h4, .collapsible h5 { cursor: pointer; background-color: #eee; padding: 8px; border-radius: 3px; }
+    .collapsible pre { background-color: #f5f5f5; padding: 10px; border-radius: 3px; overflow-x: auto; white-space: pre-wrap; }
+    .status-pass, .status-success, .status-completed, .status-passed { color: green; font-weight: bold; }
+    .status-fail, .status-failure, .status-error, .status-failed { color: red; font-weight: bold; }
+    .error-message { background-color: #ffeeee; padding: 10px; border-radius: 3px; margin-top: 10px; }
+    .error-message h4, .error-message h5 { color: red; }
+    .summary { margin-bottom: 30px; }
+    .summary-stats { display: flex; justify-content: space-between; flex-wrap: wrap; gap: 15px; margin-top: 15px; }
+    .stat { background-color: #f5f5f5; border-radius: 5px; padding: 15px; text-align: center; flex: 1; min-width: 100px; }
+    .stat-value { font-size: 24px; font-weight: bold; margin-bottom: 5px; }
+    .stat-label { font-size: 14px; color: #666; }
+    .test-cases-table { width: 100%; border-collapse: collapse; }
+    .test-cases-table th, .test-cases-table td { padding: 8px; border-bottom: 1px solid #ddd; text-align: left; }
+</style>
+<script>
+    document.addEventListener('DOMContentLoaded', function() {
+        document.querySelectorAll('.collapsible h4, .collapsible h5').forEach(function(collapsible) {
+            collapsible.addEventListener('click', function() {
+                this.nextElementSibling.style.display =
+                    this.nextElementSibling.style.display === 'none' ? 'block' : 'none';
+            });
+            // 初始隐藏
+            collapsible.nextElementSibling.style.display = 'none';
+        });
+    });
+</script>
+"""
+
+
+def _chunk_size():
+    return getattr(settings, 'REPORT_CHUNK_SIZE', 500)
+
+
+def _iter_results(queryset):
+    """按ID顺序分块读取测试结果，用例和载荷联表读出，内存中只保留一个分块"""
+    return queryset.with_payload().select_related('test_case').order_by('id').iterator(chunk_size=_chunk_size())
+
+
+def _pretty(value):
+    if not value:
+        return '无数据'
+    if isinstance(value, str):
+        return escape(value)
+    return escape(json.dumps(value, indent=2, ensure_ascii=False, cls=DjangoJSONEncoder))
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, cls=DjangoJSONEncoder)
+
+
+class ReportProgress:
+    """
+    报告生成进度
+
+    每处理 REPORT_PROGRESS_INTERVAL 条结果写一次数据库，页面轮询读取
+    """
+
+    def __init__(self, report, total):
+        self.report_id = report.pk
+        self.total = total
+        self.processed = 0
+        self.interval = getattr(settings, 'REPORT_PROGRESS_INTERVAL', 200)
+        TestReport.objects.filter(pk=self.report_id).update(total_count=total, processed_count=0, progress=0)
+
+    def advance(self, count=1):
+        self.processed += count
+        if self.processed % self.interval < count:
+            self.flush()
+
+    def flush(self):
+        # 文件写完后才算完成，这里最多到99%
+        progress = min(99, self.processed * 100 // self.total) if self.total else 99
+        TestReport.objects.filter(pk=self.report_id).update(processed_count=self.processed, progress=progress)
+
+
+class SectionWriter:
+    """
+    报告分段文件
+
+    每条测试结果一行JSON，每 REPORT_SECTION_PAGE_SIZE 行记录一次字节偏移，
+    详情页按页读取时只需要定位并读取该页的字节范围
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.page_size = getattr(settings, 'REPORT_SECTION_PAGE_SIZE', 50)
+        self.count = 0
+        self.offsets = [0]
+        self.position = 0
+
+    def write(self, entry):
+        if self.count and self.count % self.page_size == 0:
+            self.offsets.append(self.position)
+        data = (_dumps(entry) + '\n').encode('utf-8')
+        self.f.write(data)
+        self.position += len(data)
+        self.count += 1
+
+    def close(self):
+        """返回每页起始偏移，最后一项为文件末尾；没有结果时为空列表"""
+        if not self.count:
+            return []
+        return self.offsets + [self.position]
+
+
+def _save_metadata(report, results, **metadata):
+    """生成开始时写入报告元数据和结果统计，详情页直接读取这些列"""
+    counts = results.aggregate(
+        total=Count('id'),
+        passed=Count('id', filter=Q(status='passed')),
+        failed=Count('id', filter=Q(status='failed')),
+        error=Count('id', filter=Q(status='error')),
+        skipped=Count('id', filter=Q(status='skipped')),
+    )
+    TestReport.objects.filter(pk=report.pk).update(
+        passed_count=counts['passed'],
+        failed_count=counts['failed'],
+        error_count=counts['error'],
+        skipped_count=counts['skipped'],
+        **metadata
+    )
+    return counts['total']
+
+
+def _run_metadata(run, title):
+    return {
+        'title': title,
+        'environment_name': run.environment.name,
+        'run_status': run.status,
+        'start_time': run.start_time,
+        'end_time': run.end_time,
+        'duration': run.duration,
+    }
+
+
+def _result_json(result, include_payload=True):
+    test_case = result.test_case
+    data = {
+        'id': str(result.id),
+        'status': result.status,
+        'response_status_code': result.response_status_code,
+        'response_time': result.response_time,
+        'test_case': {
+            'id': str(test_case.id),
+            'name': test_case.name,
+            'request_method': test_case.request_method,
+            'request_url': test_case.request_url,
+        }
+    }
+    if include_payload:
+        for name in ('response_headers', 'response_body', 'request_headers', 'request_body'):
+            value = getattr(result, name)
+            if value:
+                data[name] = value
+    if result.error_message:
+        data['error_message'] = result.error_message
+    return data
+
+
+def _result_html(result, heading='h4'):
+    test_case = result.test_case
+    parts = [f"""
+    <div class="test-result">
+        <h3>{escape(test_case.name)}</h3>
+        <p><strong>状态:</strong> <span class="status-{escape(result.status.lower())}">{escape(result.status)}</span></p>
+        <p><strong>请求方法:</strong> {escape(test_case.request_method)}</p>
+        <p><strong>请求URL:</strong> {escape(test_case.request_url)}</p>
+        <p><strong>响应状态码:</strong> {result.response_status_code}</p>
+    """]
+    if result.response_time is not None:
+        parts.append(f"<p><strong>响应时间:</strong> {result.response_time} 毫秒</p>")
+    for title, name in (('请求头', 'request_headers'), ('请求体', 'request_body'),
+                        ('响应头', 'response_headers'), ('响应体', 'response_body')):
+        parts.append(f"""
+        <div class="collapsible">
+            <{heading}>{title}</{heading}>
+            <pre>{_pretty(getattr(result, name))}</pre>
+        </div>""")
+    if result.error_message:
+        parts.append(f'<div class="error-message"><{heading}>错误信息</{heading}>'
+                     f'<pre>{escape(result.error_message)}</pre></div>')
+    parts.append("\n    </div>\n")
+    return ''.join(parts)
+
+
+def write_test_run_report(report, f, sections):
+    test_run = TestRun.objects.select_related('project', 'environment', 'test_suite').get(pk=report.test_run_id)
+    results = test_run.test_results.all()
+    progress = ReportProgress(report, _save_metadata(report, results, **_run_metadata(test_run, test_run.name)))
+
+    if report.report_format == 'json':
+        header = {
+            'id': str(test_run.id),
+            'name': test_run.name,
+            'project': {'id': str(test_run.project.id), 'name': test_run.project.name},
+            'environment': {
+                'id': str(test_run.environment.id),
+                'name': test_run.environment.name,
+                'base_url': test_run.environment.base_url,
+            },
+            'status': test_run.status,
+            'start_time': test_run.start_time.isoformat() if test_run.start_time else None,
+            'end_time': test_run.end_time.isoformat() if test_run.end_time else None,
+            'duration': test_run.duration,
+        }
+        if test_run.test_suite:
+            header['test_suite'] = {'id': str(test_run.test_suite.id), 'name': test_run.test_suite.name}
+
+        # 先写出运行信息，再逐条追加结果数组
+        f.write(_dumps(header)[:-1] + ', "results": [\n')
+        for index, result in enumerate(_iter_results(results)):
+            data = _result_json(result)
+            f.write(('' if index == 0 else ',\n') + _dumps(data))
+            sections.write(data)
+            progress.advance()
+        f.write('\n]}\n')
+    else:
+        f.write(f"""
+<div class="test-report">
+    <h1>{escape(test_run.name)} - 测试运行报告</h1>
+    <div class="report-meta">
+        <p><strong>项目:</strong> {escape(test_run.project.name)}</p>
+        <p><strong>环境:</strong> {escape(test_run.environment.name)}</p>
+        <p><strong>状态:</strong> <span class="status-{test_run.status.lower()}">{test_run.status}</span></p>
+        <p><strong>开始时间:</strong> {test_run.start_time}</p>
+        <p><strong>结束时间:</strong> {test_run.end_time}</p>
+        <p><strong>持续时间:</strong> {test_run.duration} 秒</p>
+""")
+        if test_run.test_suite:
+            f.write(f"        <p><strong>测试套件:</strong> {escape(test_run.test_suite.name)}</p>\n")
+        f.write("    </div>\n\n    <h2>测试结果</h2>\n")
+        for result in _iter_results(results):
+            f.write(_result_html(result))
+            sections.write(_result_json(result))
+            progress.advance()
+        f.write(RUN_REPORT_STYLE)
+    return progress
+
+
+def write_test_suite_run_report(report, f, sections):
+    test_suite_run = report.test_suite_run
+    test_runs = test_suite_run.test_runs.select_related('test_suite').order_by('id')
+    # 批量运行包含多个套件，标题使用批量运行的名称
+    title = test_suite_run.test_suite.name if test_suite_run.test_suite_id else test_suite_run.name
+    total = _save_metadata(report, TestResult.objects.filter(test_run__suite_run=test_suite_run),
+                           **_run_metadata(test_suite_run, title))
+    progress = ReportProgress(report, total)
+
+    stats = test_runs.aggregate(
+        total=Count('id'),
+        passed=Count('id', filter=Q(status='completed')),
+        failed=Count('id', filter=Q(status='failed')),
+        error=Count('id', filter=~Q(status__in=['completed', 'failed', 'pending', 'running'])),
+    )
+    success_rate = (stats['passed'] / stats['total'] * 100) if stats['total'] else 0
+
+    if report.report_format == 'json':
+        header = {
+            'id': str(test_suite_run.id),
+            'name': title,
+            'test_suite': {'id': str(test_suite_run.test_suite.id), 'name': test_suite_run.test_suite.name}
+            if test_suite_run.test_suite_id else None,
+            'environment': {
+                'id': str(test_suite_run.environment.id),
+                'name': test_suite_run.environment.name,
+                'base_url': test_suite_run.environment.base_url,
+            },
+            'status': test_suite_run.status,
+            'start_time': test_suite_run.start_time.isoformat() if test_suite_run.start_time else None,
+            'end_time': test_suite_run.end_time.isoformat() if test_suite_run.end_time else None,
+            'duration': test_suite_run.duration,
+            'summary': dict(stats, success_rate=f"{success_rate:.2f}%"),
+        }
+        f.write(_dumps(header)[:-1] + ', "test_runs": [\n')
+        for run_index, test_run in enumerate(test_runs.iterator()):
+            run_data = {
+                'id': str(test_run.id),
+                'name': test_run.name,
+                'test_suite': test_run.test_suite.name if test_run.test_suite_id else None,
+                'status': test_run.status,
+                'start_time': test_run.start_time.isoformat() if test_run.start_time else None,
+                'end_time': test_run.end_time.isoformat() if test_run.end_time else None,
+                'duration': test_run.duration,
+            }
+            f.write(('' if run_index == 0 else ',\n') + _dumps(run_data)[:-1] + ', "results": [\n')
+            for index, result in enumerate(_iter_results(test_run.test_results.all())):
+                f.write(('' if index == 0 else ',\n') + _dumps(_result_json(result, include_payload=False)))
+                sections.write(dict(_result_json(result), test_run=test_run.name))
+                progress.advance()
+            f.write('\n]}')
+        f.write('\n]}\n')
+        return progress
+
+    f.write(f"""
+<div class="test-report">
+    <h1>{escape(title)} - 测试套件运行报告</h1>
+    <div class="report-meta">
+        <p><strong>测试套件:</strong> {escape(title)}</p>
+        <p><strong>套件数:</strong> {stats['total']}</p>
+        <p><strong>环境:</strong> {escape(test_suite_run.environment.name)}</p>
+        <p><strong>状态:</strong> <span class="status-{test_suite_run.status.lower()}">{test_suite_run.status}</span></p>
+        <p><strong>开始时间:</strong> {test_suite_run.start_time}</p>
+        <p><strong>结束时间:</strong> {test_suite_run.end_time}</p>
+""")
+    if test_suite_run.duration is not None:
+        f.write(f"        <p><strong>持续时间:</strong> {test_suite_run.duration} 秒</p>\n")
+    f.write(f"""    </div>
+
+    <div class="summary">
+        <h2>测试摘要</h2>
+        <div class="summary-stats">
+            <div class="stat"><div class="stat-value">{stats['total']}</div><div class="stat-label">总计</div></div>
+            <div class="stat stat-success"><div class="stat-value">{stats['passed']}</div><div class="stat-label">通过</div></div>
+            <div class="stat stat-failure"><div class="stat-value">{stats['failed']}</div><div class="stat-label">失败</div></div>
+            <div class="stat stat-error"><div class="stat-value">{stats['error']}</div><div class="stat-label">错误</div></div>
+            <div class="stat"><div class="stat-value">{success_rate:.2f}%</div><div class="stat-label">成功率</div></div>
+        </div>
+    </div>
+
+    <h2>测试套件结果</h2>
+    <table class="test-cases-table">
+        <thead>
+            <tr><th>测试套件</th><th>运行名称</th><th>状态</th><th>持续时间</th></tr>
+        </thead>
+        <tbody>
+""")
+    for test_run in test_runs.iterator():
+        status = escape(test_run.status.lower())
+        suite_name = test_run.test_suite.name if test_run.test_suite_id else ''
+        f.write(f"""
+            <tr class="test-case-row status-{status}">
+                <td>{escape(suite_name)}</td>
+                <td>{escape(test_run.name)}</td>
+                <td><span class="status-badge status-{status}">{escape(test_run.status)}</span></td>
+                <td>{test_run.duration} 秒</td>
+            </tr>
+            <tr class="test-case-details"><td colspan="4"><div class="details-content">
+""")
+        # 没有测试结果的子运行（执行出错、套件为空）也保留一行，说明没有结果
+        empty = True
+        for result in _iter_results(test_run.test_results.all()):
+            empty = False
+            f.write(_result_html(result, heading='h5'))
+            sections.write(dict(_result_json(result), test_run=test_run.name))
+            progress.advance()
+        if empty:
+            message = f"执行出错: {test_run.error_message}" if test_run.error_message else '没有测试结果'
+            f.write(f'                <p class="no-results">{escape(message)}</p>\n')
+        f.write("            </div></td></tr>\n")
+    f.write("        </tbody>\n    </table>\n")
+    f.write(RUN_REPORT_STYLE)
+    return progress
+
+
+REPORT_WRITERS = {
+    'test_run': write_test_run_report,
+    'test_suite_run': write_test_suite_run_report,
+}
+
+
+def report_relative_path(report):
+    extension = 'json' if report.report_format == 'json' else 'html'
+    return f"{timezone.now():%Y%m}/report_{report.pk}.{extension}"
+
+
+def generate_report(report_id):
+    """
+    生成报告文件
+
+    测试结果分块读取并逐段写入文件，写完后重命名为正式文件，
+    生成过程中的进度和最终状态写回报告记录
+    """
+    report = TestReport.objects.select_related('test_suite_run').get(pk=report_id)
+    writer = REPORT_WRITERS.get(report.report_type)
+    if writer is None:
+        raise ValueError(f"不支持的报告类型: {report.report_type}")
+
+    TestReport.objects.filter(pk=report_id).update(generation_status='generating', generation_error='')
+    relative_path = report_relative_path(report)
+    path = TestReport.storage_dir() / relative_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial_path = path.with_name(path.name + '.part')
+    sections_path = path.with_name(path.stem + '.sections.jsonl')
+    partial_sections_path = sections_path.with_name(sections_path.name + '.part')
+
+    try:
+        with open(partial_path, 'w', encoding='utf-8') as f, open(partial_sections_path, 'wb') as sf:
+            sections = SectionWriter(sf)
+            progress = writer(report, f, sections)
+        os.replace(partial_sections_path, sections_path)
+        os.replace(partial_path, path)
+    except Exception as e:
+        logger.exception(f"生成测试报告失败: report={report_id}")
+        partial_path.unlink(missing_ok=True)
+        partial_sections_path.unlink(missing_ok=True)
+        TestReport.objects.filter(pk=report_id).update(generation_status='failed', generation_error=str(e))
+        raise
+
+    TestReport.objects.filter(pk=report_id).update(
+        generation_status='completed',
+        progress=100,
+        processed_count=progress.processed,
+        file_path=relative_path,
+        file_size=path.stat().st_size,
+        section_offsets=sections.close(),
+        generated_at=timezone.now(),
+    )
+    logger.info(f"测试报告已生成: report={report_id}, {progress.processed} 条结果, {path}")
+
+
+def dispatch_report_generation(report):
+    """事务提交后提交报告生成任务，Celery不可用时在后台线程中生成"""
+
+    def dispatch():
+        from .tasks import generate_test_report
+        try:
+            generate_test_report.delay(report.pk)
+        except Exception as e:
+            logger.warning(f"提交报告生成任务失败，改为后台线程生成: {e}")
+            threading.Thread(target=_generate_in_thread, args=(report.pk,), daemon=True).start()
+
+    transaction.on_commit(dispatch)
+
+
+def _generate_in_thread(report_id):
+    from django.db import connection
+    try:
+        generate_report(report_id)
+    except Exception:
+        pass
+    finally:
+        connection.close()
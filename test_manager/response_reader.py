@@ -0,0 +1,208 @@
+import re
+import logging
+from itertools import chain
+from django.conf import settings
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+logger = logging.getLogger(__name__)
+
+# 只由字典键组成的JSONPath片段：.key 或 ['key']
+_KEY_TOKEN = re.compile(r"""\.([A-Za-z0-9_\-]+)|\[['"]([^'"\]]+)['"]\]""")
+
+
+class ResponseTooLarge(Exception):
+    """响应体超过允许读取的大小"""
+
+
+def max_body_bytes():
+    return getattr(settings, 'RESPONSE_MAX_BYTES', 10 * 1024 * 1024)
+
+
+def max_stream_bytes():
+    return getattr(settings, 'RESPONSE_STREAM_MAX_BYTES', 1024 * 1024 * 1024)
+
+
+def chunk_size():
+    return getattr(settings, 'RESPONSE_READ_CHUNK_SIZE', 64 * 1024)
+
+
+def _read_prefix(response, max_bytes):
+    """
+    分块读取响应体，读到超过 max_bytes 字节时停止
+
+    返回 (已读内容, 剩余内容的块迭代器)，没有超过上限时迭代器为None
+    """
+    buffer = bytearray()
+    chunks = response.iter_content(chunk_size=chunk_size())
+    for chunk in chunks:
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            return bytes(buffer), chunks
+    return bytes(buffer), None
+
+
+def _set_content(response, content):
+    """读取的内容写回 response，之后 response.json() / response.text 可以照常使用"""
+    response._content = content
+    response._content_consumed = True
+    return content
+
+
+def read_limited(response, max_bytes=None):
+    """分块读取响应体并写回 response，超过 max_bytes 时中止并抛出 ResponseTooLarge"""
+    max_bytes = max_bytes or max_body_bytes()
+    length = response.headers.get('Content-Length')
+    if length and length.isdigit() and int(length) > max_bytes:
+        response.close()
+        raise ResponseTooLarge(f"响应体大小 {length} 字节超过上限 {max_bytes} 字节")
+
+    content, rest = _read_prefix(response, max_bytes)
+    if rest is not None:
+        response.close()
+        raise ResponseTooLarge(f"响应体超过上限 {max_bytes} 字节")
+    return _set_content(response, content)
+
+
+class _LimitedStream:
+    """给 ijson 使用的文件对象，累计读取量超过上限时抛出 ResponseTooLarge"""
+
+    def __init__(self, chunks, max_bytes):
+        self.chunks = chunks
+        self.max_bytes = max_bytes
+        self.total = 0
+        self.pending = b''
+
+    def read(self, size=-1):
+        while not self.pending:
+            try:
+                self.pending = next(self.chunks)
+            except StopIteration:
+                return b''
+            self.total += len(self.pending)
+            if self.total > self.max_bytes:
+                raise ResponseTooLarge(f"响应体超过流式读取上限 {self.max_bytes} 字节")
+        if size is None or size < 0:
+            size = len(self.pending)
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+
+def key_prefix(path):
+    """
+    JSONPath 开头连续的字典键，遇到数组下标、通配符等时停止
+
+    返回键的元组；路径不以 $ 开头或第一段就不是字典键时返回None
+    """
+    if not isinstance(path, str) or not path.startswith('$'):
+        return None
+    keys = []
+    position = 1
+    while position < len(path):
+        match = _KEY_TOKEN.match(path, position)
+        if not match:
+            break
+        keys.append(match.group(1) or match.group(2))
+        position = match.end()
+    # 键中包含 . 时无法和 ijson 的前缀对应
+    if not keys or any('.' in key for key in keys):
+        return None
+    return tuple(keys)
+
+
+def incremental_supported(json_paths):
+    """所有路径都能归约到字典键前缀，且安装了 ijson 时可以增量解析"""
+    return ijson is not None and bool(json_paths) and all(key_prefix(path) for path in json_paths)
+
+
+def extract_json_subtrees(response, json_paths, max_bytes=None, chunks=None):
+    """
+    增量解析JSON响应，只保留 json_paths 引用到的子树
+
+    返回只包含这些子树的字典，原有的 JSONPath 可以直接在上面求值；
+    内存占用只与被引用的子树大小有关，与响应体大小无关。
+    chunks 为已经开始读取的响应体的块迭代器，默认从头读取 response
+    """
+    max_bytes = max_bytes or max_stream_bytes()
+    if chunks is None:
+        chunks = response.iter_content(chunk_size=chunk_size())
+    wanted = sorted({'.'.join(key_prefix(path)) for path in json_paths}, key=len)
+    # 父路径已经包含子路径时只保留父路径
+    prefixes = []
+    for prefix in wanted:
+        if not any(prefix.startswith(parent + '.') for parent in prefixes):
+            prefixes.append(prefix)
+
+    found = {}
+    builder = None
+    building = None
+    depth = 0
+    for prefix, event, value in ijson.parse(_LimitedStream(chunks, max_bytes), use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if event in ('start_map', 'start_array'):
+                depth += 1
+            elif event in ('end_map', 'end_array'):
+                depth -= 1
+                if depth == 0:
+                    found[building] = builder.value
+                    builder = None
+            continue
+
+        if prefix in prefixes and prefix not in found and event != 'map_key':
+            if event in ('start_map', 'start_array'):
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+                building = prefix
+                depth = 1
+            else:
+                found[prefix] = value
+            if len(found) == len(prefixes):
+                break
+    response.close()
+
+    skeleton = {}
+    for prefix, value in found.items():
+        node = skeleton
+        keys = prefix.split('.')
+        for key in keys[:-1]:
+            node = node.setdefault(key, {})
+        node[keys[-1]] = value
+    return skeleton
+
+
+def is_json_response(response):
+    content_type = response.headers.get('Content-Type', '')
+    return 'json' in content_type.lower()
+
+
+def read_response_body(response, json_paths=None, keep_full=True):
+    """
+    按大小限制读取响应体，返回 (响应体, 是否为增量解析的部分内容)
+
+    json_paths 为校验和参数提取需要的全部 JSONPath，为None表示需要完整文本。
+    不需要保存完整响应体，或大小超过 RESPONSE_MAX_BYTES 时，JSON响应只增量解析出
+    被引用的子树；未声明大小的响应读到超过上限时，已读的部分接着增量解析。
+    不能增量解析的响应完整读取，超过上限时抛出 ResponseTooLarge
+    """
+    incremental = json_paths is not None and incremental_supported(json_paths) and is_json_response(response)
+    length = response.headers.get('Content-Length', '')
+    too_large = length.isdigit() and int(length) > max_body_bytes()
+    if incremental and (not keep_full or too_large):
+        logger.debug(f"Response body parsed incrementally for {json_paths}")
+        return extract_json_subtrees(response, json_paths), True
+    if not incremental:
+        read_limited(response)
+    else:
+        content, rest = _read_prefix(response, max_body_bytes())
+        if rest is not None:
+            logger.debug(f"Response body exceeds {max_body_bytes()} bytes, parsed incrementally for {json_paths}")
+            return extract_json_subtrees(response, json_paths, chunks=chain([content], rest)), True
+        _set_content(response, content)
+    try:
+        return response.json(), False
+    except ValueError:
+        return {"content": response.text}, False
@@ -0,0 +1,184 @@
+import gzip
+import json
+import time
+import logging
+from pathlib import Path
+from datetime import timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Count, Sum, Min, Max, Q, F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def _batch_size():
+    return max(1, getattr(settings, 'RETENTION_BATCH_SIZE', 500))
+
+
+def _pause():
+    """批次之间暂停，让出数据库写锁"""
+    seconds = getattr(settings, 'RETENTION_BATCH_PAUSE', 0.5)
+    if seconds:
+        time.sleep(seconds)
+
+
+def prune_execution_logs(days=None):
+    """分批删除过期的定时任务执行日志"""
+    from .models import TaskExecutionLog
+
+    days = days if days is not None else getattr(settings, 'RETENTION_EXECUTION_LOG_DAYS', 30)
+    cutoff = timezone.now() - timedelta(days=days)
+    batch_size = _batch_size()
+
+    deleted = 0
+    while True:
+        ids = list(
+            TaskExecutionLog.objects.filter(start_time__lt=cutoff).order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        deleted += TaskExecutionLog.objects.filter(id__in=ids).delete()[0]
+        logger.info(f"已删除 {deleted} 条执行日志")
+        _pause()
+
+    return deleted
+
+
+def _archive_path():
+    archive_dir = Path(getattr(settings, 'RETENTION_ARCHIVE_DIR', settings.BASE_DIR / 'archive'))
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    return archive_dir / f"test_results_{timezone.now():%Y%m%d}.jsonl.gz"
+
+
+def _archive_rows(result_ids):
+    """读出要归档的测试结果，载荷字段从载荷表联表读出，归档行保持原有的字段名"""
+    from .models import TestResult, ResponseBlob, PAYLOAD_FIELDS
+
+    rows = list(TestResult.objects.filter(id__in=result_ids).values(
+        *[field.attname for field in TestResult._meta.concrete_fields],
+        **{name: F(f'payload__{name}') for name in PAYLOAD_FIELDS}
+    ))
+    blobs = ResponseBlob.objects.in_bulk({row['response_blob_id'] for row in rows if row['response_blob_id']})
+    for row in rows:
+        blob = blobs.get(row['response_blob_id'])
+        row['response_body'] = blob.load() if blob else None
+    return rows
+
+
+def _append_archive(rows, path):
+    """把测试结果按行追加写入gzip压缩的JSONL文件"""
+    # 追加模式会产生多成员gzip文件，标准gzip工具可以直接读取
+    with gzip.open(path, 'at', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False))
+            f.write('\n')
+
+
+def _prune_result_batch(result_ids, archive_path):
+    """
+    归档、汇总并删除一批测试结果，返回删除的行数
+
+    归档文件最后写入，与汇总和删除在同一事务中；事务失败时把归档文件截回写入前的长度，
+    重试这一批不会产生重复的归档行
+    """
+    from .models import TestResult
+
+    offset = archive_path.stat().st_size if archive_path and archive_path.exists() else 0
+    try:
+        with transaction.atomic():
+            rows = _archive_rows(result_ids) if archive_path else None
+            _merge_summaries(result_ids)
+            # 只计测试结果本身，不含级联删除的载荷行
+            deleted = TestResult.objects.filter(id__in=result_ids).delete()[1].get(TestResult._meta.label, 0)
+
+            if rows is not None:
+                _append_archive(rows, archive_path)
+    except Exception:
+        if archive_path and archive_path.exists():
+            with open(archive_path, 'r+b') as f:
+                f.truncate(offset)
+        raise
+    return deleted
+
+
+def _merge_summaries(result_ids):
+    """把一批测试结果的统计累加到用例汇总表"""
+    from .models import TestResult, TestCaseResultSummary
+
+    aggregates = TestResult.objects.filter(id__in=result_ids).values('test_case_id').annotate(
+        total=Count('id'),
+        passed=Count('id', filter=Q(status='passed')),
+        failed=Count('id', filter=Q(status='failed')),
+        error=Count('id', filter=Q(status='error')),
+        skipped=Count('id', filter=Q(status='skipped')),
+        timed=Count('response_time'),
+        time_sum=Sum('response_time'),
+        time_min=Min('response_time'),
+        time_max=Max('response_time'),
+        first_run=Min('created_at'),
+        last_run=Max('created_at'),
+    ).order_by()
+
+    for row in aggregates:
+        summary, _ = TestCaseResultSummary.objects.select_for_update().get_or_create(test_case_id=row['test_case_id'])
+        summary.total_count += row['total']
+        summary.passed_count += row['passed']
+        summary.failed_count += row['failed']
+        summary.error_count += row['error']
+        summary.skipped_count += row['skipped']
+        summary.timed_count += row['timed']
+        summary.total_response_time += row['time_sum'] or 0
+        if row['time_min'] is not None:
+            summary.min_response_time = row['time_min'] if summary.min_response_time is None \
+                else min(summary.min_response_time, row['time_min'])
+            summary.max_response_time = row['time_max'] if summary.max_response_time is None \
+                else max(summary.max_response_time, row['time_max'])
+        if summary.first_run_at is None or row['first_run'] < summary.first_run_at:
+            summary.first_run_at = row['first_run']
+        if summary.last_run_at is None or row['last_run'] > summary.last_run_at:
+            summary.last_run_at = row['last_run']
+        summary.save()
+
+
+def prune_test_runs(days=None, archive=None):
+    """
+    分批清理过期的测试运行及其测试结果
+
+    每批结果的归档（可选）、汇总到用例汇总表和删除在同一事务中完成；
+    运行中和等待中的测试运行不会被清理
+
+    """
+    from .models import TestRun, TestResult
+
+    days = days if days is not None else getattr(settings, 'RETENTION_TEST_RUN_DAYS', 90)
+    archive = archive if archive is not None else getattr(settings, 'RETENTION_ARCHIVE_ENABLED', True)
+    cutoff = timezone.now() - timedelta(days=days)
+    batch_size = _batch_size()
+    archive_path = _archive_path() if archive else None
+
+    stats = {'runs': 0, 'results': 0, 'archive': str(archive_path) if archive_path else None}
+    old_runs = TestRun.objects.filter(created_at__lt=cutoff).exclude(status__in=['pending', 'running'])
+
+    while True:
+        run_ids = list(old_runs.order_by('id').values_list('id', flat=True)[:batch_size])
+        if not run_ids:
+            break
+
+        while True:
+            result_ids = list(
+                TestResult.objects.filter(test_run_id__in=run_ids).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not result_ids:
+                break
+
+            stats['results'] += _prune_result_batch(result_ids, archive_path)
+            _pause()
+
+        TestRun.objects.filter(id__in=run_ids).delete()
+        stats['runs'] += len(run_ids)
+        logger.info(f"已清理 {stats['runs']} 个测试运行，{stats['results']} 条测试结果")
+        _pause()
+
+    return stats
@@ -0,0 +1,169 @@
+import logging
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Sum, Min, Max, Q, F, Value
+from django.db.models.functions import Coalesce, Greatest, Least, TruncDate
+from django.utils import timezone
+
+from .models import TestRun, TestResult, ProjectDailyStats, TestCaseDailyStats
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ('completed', 'failed')
+
+RESULT_COUNTERS = ('result_count', 'passed_count', 'failed_count', 'error_count', 'skipped_count',
+                   'timed_count', 'total_response_time')
+
+
+def _result_aggregates():
+    return {
+        'result_count': Count('id'),
+        'passed_count': Count('id', filter=Q(status='passed')),
+        'failed_count': Count('id', filter=Q(status='failed')),
+        'error_count': Count('id', filter=Q(status='error')),
+        'skipped_count': Count('id', filter=Q(status='skipped')),
+        'timed_count': Count('response_time'),
+        'total_response_time': Sum('response_time'),
+    }
+
+
+def _case_aggregates():
+    aggregates = _result_aggregates()
+    aggregates['min_response_time'] = Min('response_time')
+    aggregates['max_response_time'] = Max('response_time')
+    return aggregates
+
+
+def _merge_case_row(stats, row):
+    for field in RESULT_COUNTERS:
+        setattr(stats, field, getattr(stats, field) + (row[field] or 0))
+    if row['min_response_time'] is not None:
+        stats.min_response_time = row['min_response_time'] if stats.min_response_time is None \
+            else min(stats.min_response_time, row['min_response_time'])
+        stats.max_response_time = row['max_response_time'] if stats.max_response_time is None \
+            else max(stats.max_response_time, row['max_response_time'])
+
+
+def _add_case_row(stats, row):
+    """把分组结果写成在数据库中累加的表达式，不依赖事先读出的值"""
+    for field in RESULT_COUNTERS:
+        setattr(stats, field, F(field) + (row[field] or 0))
+    stats.min_response_time = F('min_response_time')
+    stats.max_response_time = F('max_response_time')
+    if row['min_response_time'] is not None:
+        low, high = Value(row['min_response_time']), Value(row['max_response_time'])
+        stats.min_response_time = Least(Coalesce('min_response_time', low), low)
+        stats.max_response_time = Greatest(Coalesce('max_response_time', high), high)
+
+
+def rollup_test_run(test_run_id):
+    """
+    把一个已结束的测试运行计入每日汇总表
+
+    通过 rolled_up 标记保证每个运行只计入一次，重复调用直接返回False
+    """
+    with transaction.atomic():
+        claimed = TestRun.objects.filter(
+            id=test_run_id, rolled_up=False, status__in=FINISHED_STATUSES
+        ).update(rolled_up=True)
+        if not claimed:
+            return False
+
+        project_id, status, created_at = TestRun.objects.filter(id=test_run_id).values_list(
+            'project_id', 'status', 'created_at').get()
+        day = timezone.localtime(created_at).date()
+        results = TestResult.objects.filter(test_run_id=test_run_id)
+
+        # 项目汇总，用F表达式原子累加
+        totals = results.aggregate(**_result_aggregates())
+        ProjectDailyStats.objects.get_or_create(project_id=project_id, date=day)
+        ProjectDailyStats.objects.filter(project_id=project_id, date=day).update(
+            run_count=F('run_count') + 1,
+            completed_run_count=F('completed_run_count') + (1 if status == 'completed' else 0),
+            failed_run_count=F('failed_run_count') + (1 if status == 'failed' else 0),
+            **{field: F(field) + (totals[field] or 0) for field in RESULT_COUNTERS}
+        )
+
+        # 用例汇总：先补齐当天没有的行，并发运行插入同一行时忽略冲突；再用F表达式批量原子累加
+        case_rows = {row['test_case_id']: row for row in
+                     results.values('test_case_id').annotate(**_case_aggregates()).order_by()}
+        if case_rows:
+            TestCaseDailyStats.objects.bulk_create(
+                [TestCaseDailyStats(test_case_id=case_id, date=day) for case_id in case_rows],
+                ignore_conflicts=True)
+            stats_list = list(TestCaseDailyStats.objects.filter(
+                test_case_id__in=case_rows.keys(), date=day).only('id', 'test_case_id'))
+            for stats in stats_list:
+                _add_case_row(stats, case_rows[stats.test_case_id])
+            TestCaseDailyStats.objects.bulk_update(
+                stats_list, list(RESULT_COUNTERS) + ['min_response_time', 'max_response_time'])
+
+    return True
+
+
+def rebuild_rollups(since=None, batch_size=500):
+    """
+    从测试运行和测试结果重新计算每日汇总表
+
+    since 为日期时只重建该日期及之后的数据，分组计算都在数据库中完成
+    """
+    tz = timezone.get_current_timezone()
+    runs = TestRun.objects.filter(status__in=FINISHED_STATUSES)
+    results = TestResult.objects.filter(test_run__status__in=FINISHED_STATUSES)
+    project_stats = ProjectDailyStats.objects.all()
+    case_stats = TestCaseDailyStats.objects.all()
+
+    if since:
+        start = timezone.make_aware(datetime.combine(since, time.min), tz)
+        runs = runs.filter(created_at__gte=start)
+        results = results.filter(test_run__created_at__gte=start)
+        project_stats = project_stats.filter(date__gte=since)
+        case_stats = case_stats.filter(date__gte=since)
+
+    with transaction.atomic():
+        project_stats.delete()
+        case_stats.delete()
+
+        rows = {}
+        for row in runs.annotate(day=TruncDate('created_at', tzinfo=tz)).values('project_id', 'day').annotate(
+                run_count=Count('id'),
+                completed_run_count=Count('id', filter=Q(status='completed')),
+                failed_run_count=Count('id', filter=Q(status='failed')),
+        ).order_by():
+            rows[(row['project_id'], row['day'])] = ProjectDailyStats(
+                project_id=row['project_id'], date=row['day'], run_count=row['run_count'],
+                completed_run_count=row['completed_run_count'], failed_run_count=row['failed_run_count'])
+
+        for row in results.annotate(day=TruncDate('test_run__created_at', tzinfo=tz)).values(
+                'test_run__project_id', 'day').annotate(**_result_aggregates()).order_by():
+            stats = rows[(row['test_run__project_id'], row['day'])]
+            for field in RESULT_COUNTERS:
+                setattr(stats, field, row[field] or 0)
+        ProjectDailyStats.objects.bulk_create(rows.values(), batch_size=batch_size)
+
+        case_count = 0
+        batch = []
+        for row in results.annotate(day=TruncDate('test_run__created_at', tzinfo=tz)).values(
+                'test_case_id', 'day').annotate(**_case_aggregates()).order_by().iterator():
+            stats = TestCaseDailyStats(test_case_id=row['test_case_id'], date=row['day'])
+            _merge_case_row(stats, row)
+            batch.append(stats)
+            if len(batch) >= batch_size:
+                TestCaseDailyStats.objects.bulk_create(batch)
+                case_count += len(batch)
+                batch = []
+        TestCaseDailyStats.objects.bulk_create(batch)
+        case_count += len(batch)
+
+        runs.update(rolled_up=True)
+
+    logger.info(f"重建每日汇总完成: 项目 {len(rows)} 行，用例 {case_count} 行")
+    return {'project_rows': len(rows), 'case_rows': case_count}
+
+
+def get_test_case_trend(test_case, days=None):
+    """测试用例最近若干天的每日汇总，按日期升序"""
+    days = days or getattr(settings, 'TEST_CASE_TREND_DAYS', 30)
+    start = timezone.localdate() - timedelta(days=days - 1)
+    return list(TestCaseDailyStats.objects.filter(test_case=test_case, date__gte=start).order_by('date'))
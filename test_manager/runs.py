@@ -0,0 +1,182 @@
+import time
+import logging
+import threading
+import traceback
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .capture import CapturePolicy
+from .httprunner_executor import execute_test_case, execute_test_suite
+from .models import TestCase, TestResult, TestRun
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ('completed', 'failed')
+
+
+def result_row(test_run, result, default_environment, capture_policy=None):
+    """执行器返回的结果字典按保存策略处理后，转为 create_with_payload 的参数"""
+    if capture_policy is not None:
+        result = capture_policy.apply(result)
+    return {
+        'test_run': test_run,
+        'test_case_id': result['test_case_id'],
+        'environment_id': result.get('environment_id') or default_environment.id,
+        'status': result['status'],
+        'response_time': result.get('response_time'),
+        'throttle_wait': result.get('throttle_wait'),
+        'response_status_code': result.get('response_status_code'),
+        'response_headers': result.get('response_headers', {}),
+        'response_body': result.get('response_body'),
+        'request_headers': result.get('request_headers', {}),
+        'request_body': result.get('request_body'),
+        'error_message': result.get('error_message', ''),
+        'extracted_params': result.get('extracted_params', {}),
+        'validators': result.get('validators', []),
+    }
+
+
+def _save_result(test_run, result, default_environment, capture_policy=None):
+    row = result_row(test_run, result, default_environment, capture_policy)
+    TestResult.objects.create_with_payload(**row)
+    return row['status']
+
+
+def run_test_run(test_run_id, test_case_id=None, case_environments=None):
+    """
+    执行已提交的测试运行，每个用例执行完立即保存结果，状态接口据此计算进度
+
+    关联了测试套件时执行整个套件，否则执行 test_case_id 对应的单个用例
+    """
+    test_run = TestRun.objects.select_related('test_suite', 'environment').get(pk=test_run_id)
+    if test_run.status in FINISHED_STATUSES:
+        logger.info(f"测试运行已结束，跳过: {test_run_id}")
+        return
+
+    test_run.status = 'running'
+    test_run.start_time = test_run.start_time or timezone.now()
+    test_run.save(update_fields=['status', 'start_time'])
+
+    statuses = []
+    try:
+        environment = test_run.environment
+        if test_run.test_suite_id:
+            capture_policy = CapturePolicy.for_suite(test_run.test_suite)
+            # 任务参数经过JSON序列化，字典的键变成了字符串
+            case_environments = {int(k): int(v) for k, v in (case_environments or {}).items()}
+            execute_test_suite(
+                test_run.test_suite, environment, case_environments, capture_policy,
+                on_result=lambda result: statuses.append(
+                    _save_result(test_run, result, environment, capture_policy))
+            )
+        else:
+            test_case = TestCase.objects.get(pk=test_case_id)
+            result = execute_test_case(test_case, environment)
+            result['test_case_id'] = test_case.id
+            statuses.append(_save_result(test_run, result, environment))
+
+        failed = any(status != 'passed' for status in statuses)
+        test_run.status = 'failed' if failed else 'completed'
+    except Exception as e:
+        logger.error(f"测试运行执行出错: {test_run_id}, 错误: {str(e)}")
+        logger.error(traceback.format_exc())
+        test_run.status = 'failed'
+        test_run.error_message = f"执行出错: {str(e)}"
+
+    test_run.end_time = timezone.now()
+    test_run.save()
+    logger.info(f"测试运行执行完成: {test_run_id}, 状态: {test_run.status}, 用例数: {len(statuses)}")
+
+
+def dispatch_test_run(test_run, test_case_id=None, case_environments=None):
+    """
+    事务提交后提交测试运行任务，Celery不可用时在后台线程中执行
+
+    环境设置了执行代理标签时交给执行代理，由带此标签的代理领取执行
+    """
+    if test_run.environment.agent_label:
+        from .agents import enqueue_job
+        enqueue_job(test_run, test_case_id, case_environments)
+        return
+
+    def dispatch():
+        from .tasks import execute_test_run
+        try:
+            execute_test_run.delay(test_run.pk, test_case_id, case_environments)
+        except Exception as e:
+            logger.warning(f"提交测试运行任务失败，改为后台线程执行: {e}")
+            threading.Thread(target=_run_in_thread, args=(test_run.pk, test_case_id, case_environments),
+                             daemon=True).start()
+
+    transaction.on_commit(dispatch)
+
+
+def _run_in_thread(test_run_id, test_case_id, case_environments):
+    from django.db import connection
+    try:
+        run_test_run(test_run_id, test_case_id, case_environments)
+    except Exception as e:
+        logger.error(f"后台线程执行测试运行失败: {test_run_id}, {e}")
+    finally:
+        connection.close()
+
+
+def get_run_status(test_run_id):
+    """
+    测试运行的状态和进度，只有一条运行查询和一条结果聚合查询
+
+    返回字典，测试运行不存在时返回None
+    """
+    test_run = TestRun.objects.filter(pk=test_run_id).only(
+        'id', 'status', 'total_count', 'start_time', 'end_time', 'error_message').first()
+    if test_run is None:
+        return None
+
+    counts = TestResult.objects.filter(test_run_id=test_run_id).aggregate(
+        completed=Count('id'),
+        passed=Count('id', filter=Q(status='passed')),
+        failed=Count('id', filter=Q(status='failed')),
+        error=Count('id', filter=Q(status='error')),
+        skipped=Count('id', filter=Q(status='skipped')),
+    )
+    finished = test_run.status in FINISHED_STATUSES
+    total = max(test_run.total_count, counts['completed'])
+    if finished:
+        progress = 100
+    else:
+        progress = int(counts['completed'] * 100 / total) if total else 0
+
+    return {
+        'id': test_run.id,
+        'status': test_run.status,
+        'finished': finished,
+        'total': total,
+        'progress': progress,
+        **counts,
+        'start_time': test_run.start_time,
+        'end_time': test_run.end_time,
+        'duration': test_run.duration,
+        'error_message': test_run.error_message,
+    }
+
+
+def wait_for_run_status(test_run_id, wait, since=None):
+    """
+    长轮询：等到测试运行结束、已完成数与 since 不同，或等待超过 wait 秒后返回状态
+
+    等待时间不超过 RUN_STATUS_MAX_WAIT（默认10秒），期间每 RUN_STATUS_POLL_INTERVAL 秒查询一次；
+    等待期间占用一个Web工作线程，上限不宜设得过长
+    """
+    wait = min(max(wait, 0), getattr(settings, 'RUN_STATUS_MAX_WAIT', 10))
+    interval = getattr(settings, 'RUN_STATUS_POLL_INTERVAL', 1)
+    deadline = time.monotonic() + wait
+
+    run_status = get_run_status(test_run_id)
+    while run_status is not None and not run_status['finished'] and time.monotonic() < deadline:
+        if since is not None and run_status['completed'] != since:
+            break
+        time.sleep(min(interval, max(deadline - time.monotonic(), 0)))
+        run_status = get_run_status(test_run_id)
+    return run_status
@@ -254,27 +254,23 @@ class TaskScheduler:
     def get_celery_beat_status():
         """获取Celery Beat状态"""
         try:
-            from celery import current_app
+            from .worker_health import get_worker_health
 
-            # 检查Beat调度器
-            i = current_app.control.inspect()
-
-            # 获取活动的任务
-            active_tasks = i.active()
-            scheduled_tasks = i.scheduled()
+            # 从worker心跳表读取状态，避免同步广播inspect
+            health = get_worker_health()
 
             # 获取数据库中的定时任务
             db_tasks = PeriodicTask.objects.filter(enabled=True).count()
 
             return {
-                'status': 'ok',
-                'active_workers': list(active_tasks.keys()) if active_tasks else [],
-                'scheduled_tasks_count': len(scheduled_tasks) if scheduled_tasks else 0,
+                'status': health['status'],
+                'active_workers': [worker['hostname'] for worker in health['workers']],
+                'scheduled_tasks_count': health['reserved_tasks'],
                 'db_tasks_count': db_tasks,
-                'message': 'Celery Beat状态正常'
+                'message': 'Celery Beat状态正常' if health['workers'] else '没有可用的Celery Worker'
             }
         except Exception as e:
             return {
                 'status': 'error',
                 'message': f'Celery Beat状态检查失败: {str(e)}'
-            }
+            }
@@ -1,4 +1,6 @@
-from django.db.models.signals import post_save
+import logging
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.core.mail import send_mail
@@ -6,6 +8,10 @@ from django.conf import settings
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 
+from .models import TestRun, TestCase, TestCaseGroup, TestSuite, TestSuiteGroup
+
+logger = logging.getLogger(__name__)
+
 
 @receiver(post_save, sender=User)
 def send_welcome_email(sender, instance, created, **kwargs):
@@ -32,4 +38,46 @@ def send_welcome_email(sender, instance, created, **kwargs):
             )
         except Exception as e:
             # 记录错误但不中断用户创建流程
-            print(f"发送欢迎邮件失败: {str(e)}")
+            print(f"发送欢迎邮件失败: {str(e)}")
+
+
+@receiver(post_save, sender=TestRun)
+def on_test_run_finished(sender, instance, created, **kwargs):
+    """测试运行结束时计入每日汇总并清除面板统计缓存"""
+    if instance.status not in ('completed', 'failed') or instance.rolled_up:
+        return
+
+    def update_rollups():
+        from .dashboard import invalidate_dashboard_cache
+        from .rollups import rollup_test_run
+        try:
+            rollup_test_run(instance.pk)
+        except Exception as e:
+            # 汇总失败不影响测试运行，可通过 rebuild_rollups 命令重建
+            logger.error(f"更新每日汇总失败: test_run={instance.pk}, {e}")
+        invalidate_dashboard_cache()
+
+    # 等测试运行所在事务提交后再汇总，保证能读到全部测试结果
+    transaction.on_commit(update_rollups)
+
+
+@receiver(post_delete, sender=TestRun)
+def invalidate_dashboard_on_run_deleted(sender, instance, **kwargs):
+    from .dashboard import invalidate_dashboard_cache
+    invalidate_dashboard_cache()
+
+
+@receiver([post_save, post_delete], sender=TestCaseGroup)
+@receiver([post_save, post_delete], sender=TestCase)
+def invalidate_case_tree_on_change(sender, instance, **kwargs):
+    """分组或用例变更时清除所在项目的用例分组树缓存"""
+    from .group_trees import invalidate_case_tree
+    invalidate_case_tree(instance.project_id)
+
+
+@receiver([post_save, post_delete], sender=TestSuiteGroup)
+@receiver([post_save, post_delete], sender=TestSuite)
+def invalidate_suite_tree_on_change(sender, instance, **kwargs):
+    """分组或套件变更时清除所在项目的套件分组树缓存"""
+    from .group_trees import invalidate_suite_tree
+    invalidate_suite_tree(instance.project_id)
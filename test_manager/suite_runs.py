@@ -0,0 +1,231 @@
+import logging
+import threading
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .agents import enqueue_suite_run
+from .leases import LeaseRenewer
+from .models import RunSlot, TestResult, TestRun, TestSuiteCase, TestSuiteRun
+from .queues import PRIORITY_BATCH, batch_queue
+from .runs import FINISHED_STATUSES, run_test_run
+
+logger = logging.getLogger(__name__)
+
+
+def concurrency_limit():
+    return max(1, getattr(settings, 'SUITE_RUN_CONCURRENCY', 4))
+
+
+def slot_ttl():
+    return getattr(settings, 'SUITE_RUN_SLOT_TTL', 3600)
+
+
+def launch_suite_run(name, project, environment, test_suites, user):
+    """
+    创建批量运行，每个套件一个待执行的子运行，事务提交后按全局并发上限开始执行
+
+    test_suites 为测试套件列表，返回 TestSuiteRun
+    """
+    test_suites = list(test_suites)
+    case_counts = dict(TestSuiteCase.objects.filter(test_suite__in=test_suites).values_list(
+        'test_suite_id').annotate(total=Count('id')).order_by())
+
+    with transaction.atomic():
+        suite_run = TestSuiteRun.objects.create(
+            name=name,
+            project=project,
+            test_suite=test_suites[0] if len(test_suites) == 1 else None,
+            environment=environment,
+            status='running',
+            start_time=timezone.now(),
+            created_by=user,
+            total_count=len(test_suites),
+        )
+        TestRun.objects.bulk_create([
+            TestRun(
+                name=f"Suite run: {test_suite.name}",
+                project=project,
+                test_suite=test_suite,
+                environment=environment,
+                suite_run=suite_run,
+                status='pending',
+                total_count=case_counts.get(test_suite.id, 0),
+                created_by=user,
+            )
+            for test_suite in test_suites
+        ])
+        if environment.agent_label:
+            # 交给执行代理的子运行不占用槽位，并发由代理的数量和容量决定
+            enqueue_suite_run(suite_run)
+        else:
+            transaction.on_commit(fill_run_slots)
+
+    logger.info(f"批量运行已创建: {suite_run.name} (ID: {suite_run.id}), 套件数: {len(test_suites)}")
+    return suite_run
+
+
+def fill_run_slots():
+    """
+    为等待中的子运行占用空闲槽位并提交执行，直到没有空闲槽位或没有等待的运行
+
+    所有批量运行共用 SUITE_RUN_CONCURRENCY 个槽位，先创建的子运行先执行。
+    先用条件UPDATE把运行改为执行中再占用槽位，多个进程同时补位时每个运行只会被一个进程认领；
+    没有空闲槽位时把运行改回等待
+    """
+    started = 0
+    limit = concurrency_limit()
+    pending = list(TestRun.objects.filter(suite_run__isnull=False, status='pending', agent_job__isnull=True)
+                   .order_by('id').values_list('id', 'project_id')[:limit])
+    for test_run_id, project_id in pending:
+        if not TestRun.objects.filter(pk=test_run_id, status='pending').update(
+                status='running', start_time=timezone.now()):
+            # 其他进程已认领这个运行
+            continue
+        if not RunSlot.acquire(test_run_id, limit, slot_ttl()):
+            TestRun.objects.filter(pk=test_run_id, status='running').update(status='pending', start_time=None)
+            break
+        _dispatch_child(test_run_id, project_id)
+        started += 1
+    return started
+
+
+def _dispatch_child(test_run_id, project_id):
+    from .tasks import execute_suite_run_child
+    try:
+        execute_suite_run_child.apply_async(args=[test_run_id], queue=batch_queue(project_id),
+                                            priority=PRIORITY_BATCH)
+    except Exception as e:
+        logger.warning(f"提交批量运行子任务失败，改为后台线程执行: {e}")
+        threading.Thread(target=_run_child_in_thread, args=(test_run_id,), daemon=True).start()
+
+
+def _run_child_in_thread(test_run_id):
+    from django.db import connection
+    try:
+        run_child(test_run_id)
+    finally:
+        connection.close()
+
+
+def run_child(test_run_id):
+    """执行一个子运行，执行期间为槽位续约，结束后释放槽位、汇总批量运行状态并开始下一个等待的运行"""
+    ttl = slot_ttl()
+    try:
+        with LeaseRenewer(lambda: RunSlot.renew(test_run_id, ttl), ttl / 3, name=f'run-slot-{test_run_id}'):
+            run_test_run(test_run_id)
+    except Exception as e:
+        logger.error(f"批量运行子运行执行失败: {test_run_id}, {e}")
+        TestRun.objects.filter(pk=test_run_id).exclude(status__in=FINISHED_STATUSES).update(
+            status='failed', end_time=timezone.now(), error_message=f"执行出错: {str(e)}")
+    finally:
+        RunSlot.release(test_run_id)
+        suite_run_id = TestRun.objects.filter(pk=test_run_id).values_list('suite_run_id', flat=True).first()
+        if suite_run_id:
+            finish_suite_run_if_done(suite_run_id)
+        fill_run_slots()
+
+
+def finish_suite_run_if_done(suite_run_id):
+    """所有子运行结束后，按子运行的结果更新批量运行状态"""
+    children = TestRun.objects.filter(suite_run_id=suite_run_id)
+    if children.exclude(status__in=FINISHED_STATUSES).exists():
+        return False
+    status = 'failed' if children.filter(status='failed').exists() else 'completed'
+    # 条件更新，多个子运行同时结束时只有一个会更新
+    finished = TestSuiteRun.objects.filter(pk=suite_run_id, status__in=('pending', 'running')).update(
+        status=status, end_time=timezone.now())
+    if finished:
+        logger.info(f"批量运行执行完成: {suite_run_id}, 状态: {status}")
+    return bool(finished)
+
+
+def get_suite_run_status(suite_run_id):
+    """
+    批量运行的汇总进度，子运行和测试结果各一次聚合查询
+
+    返回字典，批量运行不存在时返回None
+    """
+    suite_run = TestSuiteRun.objects.filter(pk=suite_run_id).only(
+        'id', 'status', 'total_count', 'start_time', 'end_time').first()
+    if suite_run is None:
+        return None
+
+    runs = TestRun.objects.filter(suite_run_id=suite_run_id).aggregate(
+        runs_total=Count('id'),
+        runs_pending=Count('id', filter=Q(status='pending')),
+        runs_running=Count('id', filter=Q(status='running')),
+        runs_completed=Count('id', filter=Q(status='completed')),
+        runs_failed=Count('id', filter=Q(status='failed')),
+        cases_total=Sum('total_count'),
+    )
+    results = TestResult.objects.filter(test_run__suite_run_id=suite_run_id).aggregate(
+        completed=Count('id'),
+        passed=Count('id', filter=Q(status='passed')),
+        failed=Count('id', filter=Q(status='failed')),
+        error=Count('id', filter=Q(status='error')),
+        skipped=Count('id', filter=Q(status='skipped')),
+    )
+    finished = suite_run.status in FINISHED_STATUSES
+    total = max(runs.pop('cases_total') or 0, results['completed'])
+    if finished:
+        progress = 100
+    else:
+        progress = int(results['completed'] * 100 / total) if total else 0
+
+    return {
+        'id': suite_run.id,
+        'status': suite_run.status,
+        'finished': finished,
+        'total': total,
+        'progress': progress,
+        **results,
+        **runs,
+        'start_time': suite_run.start_time,
+        'end_time': suite_run.end_time,
+        'duration': suite_run.duration,
+    }
+
+
+def fail_orphaned_children():
+    """
+    把失去槽位的执行中子运行标记为失败，返回标记的数量
+
+    执行子运行的worker异常退出后不再续约，槽位租约过期后会被其他运行占用，子运行一直停在执行中，
+    批量运行也就永远不会结束。槽位租约过期或已不归该运行（且开始执行已超过一个租约时长，
+    避开认领后尚未占用槽位的瞬间）的子运行视为中断。已有部分结果，重新执行会产生重复结果，所以标记为失败
+    """
+    now = timezone.now()
+    ttl = slot_ttl()
+    orphaned = (TestRun.objects
+                .filter(suite_run__status='running', status='running', agent_job__isnull=True)
+                .filter(Q(run_slot__lease_expires_at__lte=now)
+                        | Q(run_slot__isnull=True, start_time__lte=now - timedelta(seconds=ttl)))
+                .values_list('id', 'suite_run_id'))
+    failed = 0
+    for test_run_id, suite_run_id in list(orphaned):
+        # 条件更新，子运行恰好在此时结束时不覆盖它的结果
+        if not TestRun.objects.filter(pk=test_run_id, status='running').update(
+                status='failed', end_time=now, error_message="执行中断: 槽位租约已过期，执行的worker可能已退出"):
+            continue
+        RunSlot.release(test_run_id)
+        logger.warning(f"批量运行子运行失去槽位，已标记为失败: {test_run_id}")
+        finish_suite_run_if_done(suite_run_id)
+        failed += 1
+    return failed
+
+
+def resume_suite_runs():
+    """
+    定期检查批量运行：释放已结束运行仍占用的槽位，把失去槽位的子运行标记为失败，
+    补上空闲槽位，汇总已全部结束的批量运行
+
+    worker异常退出时子运行不会释放槽位，也不会触发下一个运行，由此恢复
+    """
+    RunSlot.objects.filter(test_run__status__in=FINISHED_STATUSES).update(test_run=None, lease_expires_at=None)
+    fail_orphaned_children()
+    for suite_run_id in TestSuiteRun.objects.filter(status='running').values_list('id', flat=True):
+        finish_suite_run_if_done(suite_run_id)
+    return fill_run_slots()
@@ -1,8 +1,7 @@
 from celery import shared_task, current_app
 from django.utils import timezone
 from django.contrib.auth.models import User
-from django.core.mail import send_mail
-from django.template.loader import render_to_string
+from django.core.cache import cache
 from django.conf import settings
 from celery.utils.log import get_task_logger
 from celery.exceptions import MaxRetriesExceededError
@@ -10,12 +9,17 @@ import traceback
 import json
 import time
 import random
+import uuid
 from datetime import datetime, timedelta
 import sys
 import os
 
 from test_manager.async_executor import execute_test_suite_async
 from test_manager.httprunner_executor import execute_test_suite
+from test_manager.notifications import enqueue_task_notification
+from test_manager.capture import CapturePolicy
+from test_manager.leases import LeaseRenewer
+
 
 # 确保任务可以被正确导入
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -67,116 +71,24 @@ def execute_scheduled_test_suite(self, scheduled_task_id):
             print(f"[WARNING] {error_msg}")
             return {"success": False, "error": error_msg}
 
-        # 创建执行日志
-        execution_log = TaskExecutionLog.objects.create(
-            scheduled_task=scheduled_task,
-            status='running'
-        )
-        logger.info(f"创建执行日志: ID={execution_log.id}")
-        print(f"[TASK] 创建执行日志: ID={execution_log.id}")
-
-        # 创建测试运行记录
-        run_name = f"定时任务: {scheduled_task.name} - {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}"
-        test_run = TestRun.objects.create(
-            name=run_name,
-            project=scheduled_task.test_suite.project,
-            test_suite=scheduled_task.test_suite,
-            environment=scheduled_task.environment,
-            status='running',
-            start_time=timezone.now(),
-            created_by=scheduled_task.created_by
-        )
-        logger.info(f"创建测试运行: ID={test_run.id}")
-        print(f"[TASK] 创建测试运行: ID={test_run.id}")
-
-        # 关联执行日志和测试运行
-        execution_log.test_run = test_run
-        execution_log.save()
+        # 获取执行租约，防止同一定时任务并发执行
+        lease_owner = self.request.id or uuid.uuid4().hex
+        if not scheduled_task.acquire_lease(lease_owner):
+            overlap_result = _handle_overlapping_run(scheduled_task, lease_owner)
+            if overlap_result is not None:
+                return overlap_result
 
-        # 执行测试套件
         try:
-            logger.info(f"开始执行测试套件: {scheduled_task.test_suite.name}")
-            print(f"[TASK] 开始执行测试套件: {scheduled_task.test_suite.name}")
-
-            # 使用简化的执行逻辑
-            result = execute_test_suite_simple(
-                test_suite=scheduled_task.test_suite,
-                environment=scheduled_task.environment,
-                test_run=test_run,
-                user=scheduled_task.created_by
-            )
-
-            logger.info(f"测试套件执行完成: {result}")
-            print(f"[TASK] 测试套件执行完成: {result}")
-
-        except Exception as e:
-            logger.error(f"执行测试套件失败: {e}")
-            print(f"[ERROR] 执行测试套件失败: {e}")
-            result = {"success": False, "error": str(e)}
-
-        # 更新测试运行状态
-        test_run.status = 'completed' if result.get('success', False) else 'failed'
-        test_run.end_time = timezone.now()
-        test_run.save()
-
-        # 更新执行日志
-        execution_log.status = 'success' if result.get('success', False) else 'failed'
-        execution_log.end_time = timezone.now()
-        execution_log.calculate_duration()
-
-        # 统计测试结果
-        test_results = test_run.test_results.all()
-        execution_log.total_test_cases = test_results.count()
-        execution_log.passed_test_cases = test_results.filter(status='passed').count()
-        execution_log.failed_test_cases = test_results.filter(status='failed').count()
-        execution_log.error_test_cases = test_results.filter(status='error').count()
-
-        if not result.get('success', False):
-            execution_log.error_message = result.get('error', '执行失败')
-
-        execution_log.save()
-
-        # 更新定时任务统计
-        scheduled_task.last_run_time = timezone.now()
-        scheduled_task.total_runs += 1
-        if result.get('success', False):
-            scheduled_task.successful_runs += 1
-        else:
-            scheduled_task.failed_runs += 1
-
-        scheduled_task.update_next_run_time()
-        scheduled_task.save()
-
-        # 发送通知邮件
-        if scheduled_task.send_email_notification:
-            should_notify = (
-                    (result.get('success', False) and scheduled_task.notify_on_success) or
-                    (not result.get('success', False) and scheduled_task.notify_on_failure)
-            )
-
-            if should_notify:
-                try:
-                    send_task_notification_email.delay(execution_log.id)
-                    logger.info("通知邮件已发送")
-                except Exception as e:
-                    logger.error(f"发送通知邮件失败: {e}")
-
-        # 记录任务完成
-        try:
-            with open('/tmp/celery_task_log.txt', 'a') as f:
-                f.write(f"{timezone.now().isoformat()} - TASK COMPLETED: {scheduled_task_id}\n")
-        except:
-            pass
-
-        logger.info(f"定时任务执行完成: {scheduled_task.name}")
-        print(f"[TASK COMPLETED] 定时任务执行完成: {scheduled_task.name}")
-
-        return {
-            "success": True,
-            "message": f"定时任务 {scheduled_task.name} 执行完成",
-            "test_run_id": test_run.id,
-            "execution_log_id": execution_log.id
-        }
+            # 执行期间定期续约，执行时间超过租约有效期也不会被后续触发抢占
+            with LeaseRenewer(lambda: scheduled_task.renew_lease(lease_owner),
+                              scheduled_task.lease_ttl() / 3, name=f'scheduled-task-{scheduled_task_id}'):
+                return _run_scheduled_task(scheduled_task)
+        finally:
+            # 释放租约，如有排队的执行则把租约移交给它并触发
+            next_owner = uuid.uuid4().hex
+            if scheduled_task.release_lease(lease_owner, next_owner):
+                logger.info(f"执行排队中的定时任务: {scheduled_task.name}")
+                execute_scheduled_test_suite.apply_async(args=[scheduled_task_id], task_id=next_owner)
 
     except Exception as e:
         error_msg = f"执行定时任务异常: {str(e)}"
@@ -195,10 +107,176 @@ def execute_scheduled_test_suite(self, scheduled_task_id):
         return {"success": False, "error": error_msg}
 
 
-def execute_test_suite_simple(test_suite, environment, test_run, user):
+def _handle_overlapping_run(scheduled_task, lease_owner):
+    """
+    处理上一次执行尚未结束时的再次触发
+
+    根据定时任务的重叠执行策略决定跳过、排队或合并，并记录到执行日志。
+    返回None表示租约已可用，调用方应继续执行。
+    """
+    from .models import TaskExecutionLog
+
+    running_log = (
+        TaskExecutionLog.objects
+        .filter(scheduled_task=scheduled_task, status='running')
+        .order_by('-start_time')
+        .first()
+    )
+    policy = scheduled_task.overlap_policy
+
+    if policy == 'queue':
+        queued = scheduled_task.request_queued_run()
+        # 排队期间上一次执行可能已结束且没有取走排队标记，此时取走标记直接执行；
+        # 标记已被取走时租约已移交给排队的执行，本次按已排队处理
+        if queued and scheduled_task.acquire_lease(lease_owner, consume_queued=True):
+            return None
+        status = 'queued' if queued else 'skipped'
+        message = '上一次执行尚未结束，已排队在其结束后执行' if queued else '上一次执行尚未结束且已有排队的执行，跳过本次触发'
+    elif policy == 'coalesce':
+        status = 'coalesced'
+        message = '上一次执行尚未结束，本次触发已合并到当前执行'
+    else:
+        status = 'skipped'
+        message = '上一次执行尚未结束，跳过本次触发'
+
+    now = timezone.now()
+    TaskExecutionLog.objects.create(
+        scheduled_task=scheduled_task,
+        test_run=running_log.test_run if running_log and status == 'coalesced' else None,
+        status=status,
+        end_time=now,
+        duration=0,
+        error_message=message,
+    )
+    logger.warning(f"定时任务 {scheduled_task.name} 重叠触发，策略={policy}，处理结果={status}")
+
+    return {"success": False, "overlap": status, "message": message}
+
+
+def _run_scheduled_task(scheduled_task):
+    """在持有租约的情况下执行定时任务"""
+    from .models import TaskExecutionLog, TestRun
+
+    # 创建执行日志
+    execution_log = TaskExecutionLog.objects.create(
+        scheduled_task=scheduled_task,
+        status='running'
+    )
+    logger.info(f"创建执行日志: ID={execution_log.id}")
+    print(f"[TASK] 创建执行日志: ID={execution_log.id}")
+
+    # 创建测试运行记录
+    run_name = f"定时任务: {scheduled_task.name} - {timezone.now().strftime('%Y-%m-%d %H:%M:%S')}"
+    test_run = TestRun.objects.create(
+        name=run_name,
+        project=scheduled_task.test_suite.project,
+        test_suite=scheduled_task.test_suite,
+        environment=scheduled_task.environment,
+        status='running',
+        start_time=timezone.now(),
+        created_by=scheduled_task.created_by
+    )
+    logger.info(f"创建测试运行: ID={test_run.id}")
+    print(f"[TASK] 创建测试运行: ID={test_run.id}")
+
+    # 关联执行日志和测试运行
+    execution_log.test_run = test_run
+    execution_log.save()
+
+    # 执行测试套件
+    try:
+        logger.info(f"开始执行测试套件: {scheduled_task.test_suite.name}")
+        print(f"[TASK] 开始执行测试套件: {scheduled_task.test_suite.name}")
+
+        # 使用简化的执行逻辑
+        result = execute_test_suite_simple(
+            test_suite=scheduled_task.test_suite,
+            environment=scheduled_task.environment,
+            test_run=test_run,
+            user=scheduled_task.created_by,
+            capture_policy=CapturePolicy.for_suite(scheduled_task.test_suite, scheduled_task)
+        )
+
+        logger.info(f"测试套件执行完成: {result}")
+        print(f"[TASK] 测试套件执行完成: {result}")
+
+    except Exception as e:
+        logger.error(f"执行测试套件失败: {e}")
+        print(f"[ERROR] 执行测试套件失败: {e}")
+        result = {"success": False, "error": str(e)}
+
+    # 更新测试运行状态
+    test_run.status = 'completed' if result.get('success', False) else 'failed'
+    test_run.end_time = timezone.now()
+    test_run.save()
+
+    # 更新执行日志
+    execution_log.status = 'success' if result.get('success', False) else 'failed'
+    execution_log.end_time = timezone.now()
+    execution_log.calculate_duration()
+
+    # 统计测试结果
+    test_results = test_run.test_results.all()
+    execution_log.total_test_cases = test_results.count()
+    execution_log.passed_test_cases = test_results.filter(status='passed').count()
+    execution_log.failed_test_cases = test_results.filter(status='failed').count()
+    execution_log.error_test_cases = test_results.filter(status='error').count()
+
+    if not result.get('success', False):
+        execution_log.error_message = result.get('error', '执行失败')
+
+    execution_log.save()
+
+    # 更新定时任务统计
+    scheduled_task.last_run_time = timezone.now()
+    scheduled_task.total_runs += 1
+    if result.get('success', False):
+        scheduled_task.successful_runs += 1
+    else:
+        scheduled_task.failed_runs += 1
+
+    scheduled_task.update_next_run_time()
+    scheduled_task.save()
+
+    # 发送通知邮件
+    if scheduled_task.send_email_notification:
+        should_notify = (
+                (result.get('success', False) and scheduled_task.notify_on_success) or
+                (not result.get('success', False) and scheduled_task.notify_on_failure)
+        )
+
+        if should_notify:
+            try:
+                # 登记到通知队列，由通知任务分批发送
+                enqueue_task_notification(execution_log)
+                logger.info("通知邮件已加入发送队列")
+            except Exception as e:
+                logger.error(f"发送通知邮件失败: {e}")
+
+    # 记录任务完成
+    try:
+        with open('/tmp/celery_task_log.txt', 'a') as f:
+            f.write(f"{timezone.now().isoformat()} - TASK COMPLETED: {scheduled_task.id}\n")
+    except:
+        pass
+
+    logger.info(f"定时任务执行完成: {scheduled_task.name}")
+    print(f"[TASK COMPLETED] 定时任务执行完成: {scheduled_task.name}")
+
+    return {
+        "success": True,
+        "message": f"定时任务 {scheduled_task.name} 执行完成",
+        "test_run_id": test_run.id,
+        "execution_log_id": execution_log.id
+    }
+
+
+def execute_test_suite_simple(test_suite, environment, test_run, user, capture_policy=None):
     """简化的测试套件执行函数"""
     from .models import TestResult
 
+    capture_policy = capture_policy or CapturePolicy.for_suite(test_suite)
+
     logger.info(f"执行测试套件: {test_suite.name}")
     print(f"[EXEC] 执行测试套件: {test_suite.name}")
 
@@ -229,8 +307,8 @@ def execute_test_suite_simple(test_suite, environment, test_run, user):
                 status = 'passed' if is_success else 'failed'
                 response_time = random.uniform(100, 1000)
 
-                # 创建测试结果
-                TestResult.objects.create(
+                # 创建测试结果，载荷按保存策略处理
+                TestResult.objects.create_with_payload(**capture_policy.apply(dict(
                     test_run=test_run,
                     test_case=test_case,
                     environment=environment,
@@ -242,7 +320,7 @@ def execute_test_suite_simple(test_suite, environment, test_run, user):
                     request_headers=test_case.request_headers or {},
                     request_body=test_case.request_body or {},
                     error_message='' if is_success else 'Test failed',
-                )
+                )))
 
                 if is_success:
                     success_count += 1
@@ -294,94 +372,50 @@ def send_task_notification_email(execution_log_id):
     logger.info(f"准备发送任务通知邮件: execution_log_id={execution_log_id}")
 
     try:
-        execution_log = TaskExecutionLog.objects.get(id=execution_log_id)
+        execution_log = TaskExecutionLog.objects.select_related('scheduled_task').get(id=execution_log_id)
         scheduled_task = execution_log.scheduled_task
 
         if not scheduled_task.send_email_notification:
             logger.info(f"任务未配置发送邮件通知: {scheduled_task.name}")
             return
 
-        email_list = scheduled_task.get_notification_email_list()
-        if not email_list:
-            logger.warning(f"任务没有配置通知邮箱: {scheduled_task.name}")
-            return
+        # 登记到通知队列，由 flush_email_notifications 复用连接分批发送
+        enqueue_task_notification(execution_log)
 
-        logger.info(f"将发送通知邮件到: {', '.join(email_list)}")
+    except Exception as e:
+        logger.error(f"发送定时任务通知邮件失败: {str(e)}")
+        logger.error(traceback.format_exc())
 
-        # 准备邮件内容
-        subject = f"EasyTesting 定时任务执行通知 - {scheduled_task.name}"
 
-        context = {
-            'scheduled_task': scheduled_task,
-            'execution_log': execution_log,
-            'test_run': execution_log.test_run,
-            'success': execution_log.status == 'success',
-            'timestamp': timezone.now().strftime('%Y-%m-%d %H:%M:%S'),
-        }
+@shared_task(name='test_manager.tasks.flush_email_notifications')
+def flush_email_notifications():
+    """批量发送待发送的通知邮件"""
+    from .notifications import due_notifications, flush_pending_notifications, schedule_flush, FLUSH_SCHEDULED_KEY
 
-        # 渲染邮件模板
-        try:
-            html_message = render_to_string('emails/task_notification.html', context)
-            plain_message = render_to_string('emails/task_notification.txt', context)
-        except Exception as e:
-            logger.error(f"渲染邮件模板失败: {str(e)}")
-            # 使用简单的邮件内容作为备用
-            status_text = "成功" if execution_log.status == 'success' else "失败"
-            plain_message = f"""
-            EasyTesting 定时任务执行通知
-
-            任务名称: {scheduled_task.name}
-            执行状态: {status_text}
-            开始时间: {execution_log.start_time}
-            结束时间: {execution_log.end_time}
-            执行时长: {execution_log.duration} 秒
-
-            测试用例统计:
-            - 总数: {execution_log.total_test_cases}
-            - 通过: {execution_log.passed_test_cases}
-            - 失败: {execution_log.failed_test_cases}
-            - 错误: {execution_log.error_test_cases}
-
-            {execution_log.error_message if execution_log.error_message else ''}
-            """
-            html_message = plain_message.replace('\n', '<br>')
-
-        # 发送邮件
-        try:
-            send_mail(
-                subject=subject,
-                message=plain_message,
-                html_message=html_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=email_list,
-                fail_silently=False,
-            )
-            logger.info(f"定时任务通知邮件发送成功: {scheduled_task.name}")
-
-            # 更新邮件发送状态
-            execution_log.email_sent = True
-            execution_log.email_sent_time = timezone.now()
-            execution_log.save()
-        except Exception as e:
-            logger.error(f"发送邮件失败: {str(e)}")
-            logger.error(traceback.format_exc())
+    try:
+        sent = flush_pending_notifications()
 
+        # 一批没有发完的即时通知，再安排下一批；等待重试的通知由定时发送在到时间后取出
+        if due_notifications().filter(digest=False).exists():
+            cache.delete(FLUSH_SCHEDULED_KEY)
+            schedule_flush()
+        return sent
     except Exception as e:
-        logger.error(f"发送定时任务通知邮件失败: {str(e)}")
+        logger.error(f"批量发送通知邮件失败: {str(e)}")
         logger.error(traceback.format_exc())
+        return 0
 
 
 @shared_task(name='test_manager.tasks.cleanup_old_execution_logs')
 def cleanup_old_execution_logs():
     """清理旧的执行日志"""
-    from .models import TaskExecutionLog
+    from .retention import prune_execution_logs
 
     logger.info("开始清理旧的执行日志")
 
     try:
-        # 删除30天前的执行日志
-        cutoff_date = timezone.now() - timedelta(days=30)
-        deleted_count = TaskExecutionLog.objects.filter(start_time__lt=cutoff_date).delete()[0]
+        # 按保留天数分批删除，避免一次性大事务锁表
+        deleted_count = prune_execution_logs()
 
         logger.info(f"清理了 {deleted_count} 条旧的执行日志")
         return deleted_count
@@ -391,6 +425,89 @@ def cleanup_old_execution_logs():
         return 0
 
 
+@shared_task(name='test_manager.tasks.cleanup_old_test_runs')
+def cleanup_old_test_runs():
+    """清理旧的测试运行和测试结果"""
+    from .retention import prune_test_runs
+
+    logger.info("开始清理旧的测试运行")
+
+    try:
+        stats = prune_test_runs()
+
+        logger.info(f"清理了 {stats['runs']} 个测试运行，{stats['results']} 条测试结果")
+        return stats
+    except Exception as e:
+        logger.error(f"清理旧的测试运行失败: {str(e)}")
+        logger.error(traceback.format_exc())
+        return {'runs': 0, 'results': 0}
+
+
+@shared_task(name='test_manager.tasks.cleanup_response_blobs')
+def cleanup_response_blobs():
+    """删除没有测试结果引用的响应体"""
+    from .blobstore import collect_unreferenced_blobs
+
+    logger.info("开始清理未引用的响应体")
+
+    try:
+        return collect_unreferenced_blobs()
+    except Exception as e:
+        logger.error(f"清理未引用的响应体失败: {str(e)}")
+        logger.error(traceback.format_exc())
+        return 0
+
+
+@shared_task(name='test_manager.tasks.generate_test_report')
+def generate_test_report(report_id):
+    """后台生成测试报告文件"""
+    from .reports import generate_report
+
+    logger.info(f"开始生成测试报告: {report_id}")
+
+    try:
+        generate_report(report_id)
+    except Exception as e:
+        # 失败原因已记录在报告上，页面会显示
+        logger.error(f"生成测试报告失败: {str(e)}")
+
+
+@shared_task(name='test_manager.tasks.execute_test_run')
+def execute_test_run(test_run_id, test_case_id=None, case_environments=None):
+    """执行通过API提交的测试运行"""
+    from .runs import run_test_run
+
+    logger.info(f"开始执行测试运行: {test_run_id}")
+    run_test_run(test_run_id, test_case_id, case_environments)
+
+
+@shared_task(name='test_manager.tasks.execute_suite_run_child')
+def execute_suite_run_child(test_run_id):
+    """执行批量运行中的一个子运行，结束后开始下一个等待的子运行"""
+    from .suite_runs import run_child
+
+    logger.info(f"开始执行批量运行子运行: {test_run_id}")
+    run_child(test_run_id)
+
+
+@shared_task(name='test_manager.tasks.resume_suite_runs')
+def resume_suite_runs():
+    """恢复异常中断的批量运行调度"""
+    from .suite_runs import resume_suite_runs as resume
+
+    started = resume()
+    if started:
+        logger.info(f"批量运行恢复调度，开始执行 {started} 个子运行")
+
+
+@shared_task(name='test_manager.tasks.expire_agent_leases')
+def expire_agent_leases():
+    """处理执行代理失联后租约过期的任务"""
+    from .agents import expire_leases
+
+    return expire_leases()
+
+
 @shared_task(name='test_manager.tasks.update_scheduled_tasks_next_run_time')
 def update_scheduled_tasks_next_run_time():
     """更新所有定时任务的下次执行时间"""
@@ -437,8 +554,9 @@ def run_scheduled_task_now(scheduled_task_id):
             logger.warning(f"定时任务已禁用，无法立即执行: {scheduled_task.name}")
             return {'success': False, 'message': f'定时任务已禁用: {scheduled_task.name}'}
 
-        # 执行任务
-        result = execute_scheduled_test_suite.delay(scheduled_task_id)
+        # 执行任务，走交互队列，避免排在批量执行之后
+        from .queues import dispatch_interactive_run
+        result = dispatch_interactive_run(scheduled_task_id)
 
         logger.info(f"已触发定时任务立即执行: {scheduled_task.name}, task_id={result.id}")
         return {
@@ -461,18 +579,19 @@ def check_celery_status():
     logger.info("检查Celery状态")
 
     try:
-        # 检查Celery是否正常运行
-        i = current_app.control.inspect()
+        # 从worker心跳表读取状态，不再向所有worker广播inspect
+        from .worker_health import get_worker_health
+        health = get_worker_health()
 
         # 获取活动的worker
-        active_workers = i.active()
+        active_workers = {worker['hostname']: worker for worker in health['workers']}
         if not active_workers:
             logger.warning("没有活动的Celery worker")
             return {'status': 'warning', 'message': '没有活动的Celery worker'}
 
         # 获取已注册的任务
-        registered_tasks = i.registered()
-        if not registered_tasks:
+        registered_tasks = {hostname: worker['registered_tasks'] for hostname, worker in active_workers.items()}
+        if not any(registered_tasks.values()):
             logger.warning("没有已注册的Celery任务")
             return {'status': 'warning', 'message': '没有已注册的Celery任务'}
 
@@ -480,7 +599,15 @@ def check_celery_status():
         our_tasks = [
             'test_manager.tasks.execute_scheduled_test_suite',
             'test_manager.tasks.send_task_notification_email',
+            'test_manager.tasks.flush_email_notifications',
             'test_manager.tasks.cleanup_old_execution_logs',
+            'test_manager.tasks.cleanup_old_test_runs',
+            'test_manager.tasks.cleanup_response_blobs',
+            'test_manager.tasks.generate_test_report',
+            'test_manager.tasks.execute_test_run',
+            'test_manager.tasks.execute_suite_run_child',
+            'test_manager.tasks.resume_suite_runs',
+            'test_manager.tasks.expire_agent_leases',
             'test_manager.tasks.update_scheduled_tasks_next_run_time',
             'test_manager.tasks.run_scheduled_task_now',
             'test_manager.tasks.check_celery_status',
@@ -521,7 +648,9 @@ def check_celery_status():
 task_list = [
     execute_scheduled_test_suite,
     send_task_notification_email,
+    flush_email_notifications,
     cleanup_old_execution_logs,
+    cleanup_old_test_runs,
     update_scheduled_tasks_next_run_time,
     run_scheduled_task_now,
     check_celery_status
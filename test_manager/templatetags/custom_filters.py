@@ -1,4 +1,3 @@
-import re
 import ast
 from django import template
 from django.utils.safestring import mark_safe
@@ -59,138 +58,14 @@ def multiply(value, arg):
 
 
 @register.filter
-def extract_title(content):
-    """从报告内容中提取标题"""
-    match = re.search(r'Single run: (.+)', content)
-    if match:
-        return match.group(1)
-    return "测试报告"
-
-
-@register.filter
-def extract_environment(content):
-    """从报告内容中提取环境信息"""
-    match = re.search(r'环境: (\w+)', content)
-    if match:
-        return match.group(1)
-    return "未指定"
-
-
-@register.filter
-def extract_status(content):
-    """从报告内容中提取状态"""
-    match = re.search(r'状态: (\w+)', content)
-    if match:
-        return match.group(1)
-    return "未知"
-
-
-@register.filter
-def extract_start_time(content):
-    """从报告内容中提取开始时间"""
-    match = re.search(r'开始时间: (.+?)(?=\n|$)', content)
-    if match:
-        return match.group(1)
-    return "未知"
-
-
-@register.filter
-def extract_end_time(content):
-    """从报告内容中提取结束时间"""
-    match = re.search(r'结束时间: (.+?)(?=\n|$)', content)
-    if match:
-        return match.group(1)
-    return "未知"
-
-
-@register.filter
-def extract_duration(content):
-    """从报告内容中提取持续时间"""
-    match = re.search(r'持续时间: (.+?)(?=\n|$|秒)', content)
-    if match:
-        return match.group(1) + " 秒"
-    return "未知"
-
-
-@register.filter
-def extract_test_name(content):
-    """从报告内容中提取测试用例名称"""
-    match = re.search(r'测试结果.*?\n(.*?)(?=\n|$)', content, re.DOTALL)
-    if match:
-        return match.group(1).strip()
-    return "未知测试用例"
-
-
-@register.filter
-def extract_test_status(content):
-    """从报告内容中提取测试用例状态"""
-    match = re.search(r'状态: (\w+)', content)
-    if match:
-        return match.group(1)
-    return "未知"
-
-
-@register.filter
-def extract_request_method(content):
-    """从报告内容中提取请求方法"""
-    match = re.search(r'请求方法: (\w+)', content)
-    if match:
-        return match.group(1)
-    return "GET"
-
-
-@register.filter
-def extract_request_url(content):
-    """从报告内容中提取请求URL"""
-    match = re.search(r'请求URL: (.+?)(?=\n|$)', content)
-    if match:
-        return match.group(1)
-    return ""
-
-
-@register.filter
-def extract_request_headers(content):
-    """从报告内容中提取请求头"""
-    match = re.search(r'请求头:(.*?)(?=请求体:|响应头:|$)', content, re.DOTALL)
-    if match:
-        return match.group(1).strip()
-    return ""
-
-
-@register.filter
-def extract_request_body(content):
-    """从报告内容中提取请求体"""
-    match = re.search(r'请求体:(.*?)(?=响应头:|响应体:|$)', content, re.DOTALL)
-    if match:
-        return match.group(1).strip()
-    return ""
-
-
-@register.filter
-def extract_response_headers(content):
-    """从报告内容中提取响应头"""
-    match = re.search(r'响应头:(.*?)(?=响应体:|$)', content, re.DOTALL)
-    if match:
-        return match.group(1).strip()
-    return ""
-
-
-@register.filter
-def extract_response_body(content):
-    """从报告内容中提取响应体"""
-    match = re.search(r'响应体:(.*?)(?=错误信息:|$)', content, re.DOTALL)
-    if match:
-        return match.group(1).strip()
-    return ""
-
-
-@register.filter
-def extract_error_message(content):
-    """从报告内容中提取错误信息"""
-    match = re.search(r'错误信息:(.*?)(?=$)', content, re.DOTALL)
-    if match:
-        return match.group(1).strip()
-    return ""
+def report_payload_sections(result):
+    """报告分段中一条结果的载荷，返回 (标题, 内容) 列表，没有内容的字段不显示"""
+    sections = []
+    for label, name in (('请求头', 'request_headers'), ('请求体', 'request_body'),
+                        ('响应头', 'response_headers'), ('响应体', 'response_body')):
+        if result.get(name):
+            sections.append((label, result[name]))
+    return sections
 
 
 @register.filter
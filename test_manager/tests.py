@@ -1,3 +1,1583 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from xml.etree import ElementTree
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import agents, dashboard, group_trees, queues, reports, retention, rollups, suite_runs, throttle
+from .api.serializers import RunnerAgentSerializer, TestCaseSerializer
+from .capture import CapturePolicy
+from .headless import HeadlessRunner
+from .httprunner_executor import execute_test_case, execute_test_cases
+from .leases import LeaseRenewer
+from .models import TestCase as Case
+from .models import (AgentJob, EmailConfig, EmailNotification, Environment, Project, ResponseBlob, RunnerAgent,
+                     RunSlot, ScheduledTask, TestCaseDailyStats, TestCaseGroup, TestReport, TestRun, TestResult,
+                     TestSuite, TestSuiteCase, TestSuiteGroup, TestSuiteRun, TaskExecutionLog, WorkerHeartbeat)
+from .notifications import flush_pending_notifications
+from .pagination import KeysetPage, decode_cursor, estimate_count
+from .tasks import execute_scheduled_test_suite
+from .views import get_test_case_groups_data
+from .worker_health import get_worker_health, publish_heartbeat, stop_heartbeat
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def create_project(username='tester'):
+    """测试用的用户、项目和运行环境"""
+    user = User.objects.create_user(username, password='pw12345!')
+    project = Project.objects.create(name='项目', created_by=user)
+    environment = Environment.objects.create(name='环境', project=project, base_url='http://127.0.0.1:9')
+    return user, project, environment
+
+
+def create_case(project, user, name='用例', **kwargs):
+    kwargs.setdefault('request_method', 'GET')
+    kwargs.setdefault('request_url', '/ok')
+    return Case.objects.create(name=name, project=project, expected_status_code=200, created_by=user, **kwargs)
+
+
+class QueryPlanIndexTests(TestCase):
+    """
+    常用查询的执行计划回归测试
+
+    查询条件或索引定义改动后不再走对应的组合索引时测试失败
+    """
+
+    def setUp(self):
+        if connection.vendor == 'postgresql':
+            # 空表时 PostgreSQL 倾向于顺序扫描，关闭后才能检查是否有可用索引
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f"查询未使用索引 {index_name}:\n{plan}")
+
+    def test_results_of_run_by_status(self):
+        self.assertUsesIndex(TestResult.objects.filter(test_run_id=1, status='failed'),
+                             'testresult_run_status_idx')
+
+    def test_results_of_case_by_created_at(self):
+        self.assertUsesIndex(TestResult.objects.filter(test_case_id=1).order_by('-created_at', '-id')[:10],
+                             'testresult_case_created_idx')
+
+    def test_results_created_at_range(self):
+        self.assertUsesIndex(TestResult.objects.filter(created_at__gte=timezone.now() - timedelta(days=7)),
+                             'testresult_created_idx')
+
+    def test_runs_of_project_by_created_at(self):
+        self.assertUsesIndex(TestRun.objects.filter(project_id=1).order_by('-created_at', '-id')[:10],
+                             'testrun_project_created_idx')
+
+    def test_runs_created_at_range(self):
+        self.assertUsesIndex(TestRun.objects.filter(created_at__gte=timezone.now() - timedelta(days=7)),
+                             'testrun_created_idx')
+
+    def test_execution_logs_of_task_by_start_time(self):
+        self.assertUsesIndex(TaskExecutionLog.objects.filter(scheduled_task_id=1).order_by('-start_time')[:10],
+                             'tasklog_task_start_idx')
+
+    def path_index(self, model):
+        """分组路径字段 db_index 生成的索引名"""
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+        return next(name for name, info in constraints.items() if info['index'] and info['columns'] == ['path'])
+
+    def test_group_subtree_by_path(self):
+        for model in (TestCaseGroup, TestSuiteGroup):
+            with self.subTest(model=model.__name__):
+                self.assertUsesIndex(model(pk=1, path='/1/').get_descendants(), self.path_index(model))
+
+    def test_cases_and_suites_of_group_subtree(self):
+        self.assertUsesIndex(TestCaseGroup(pk=1, path='/1/').get_test_cases(), self.path_index(TestCaseGroup))
+        self.assertUsesIndex(TestSuiteGroup(pk=1, path='/1/').get_test_suites(), self.path_index(TestSuiteGroup))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ScheduledTaskLeaseTests(TestCase):
+    """定时任务的执行租约、续约和三种重叠执行策略"""
+
+    def setUp(self):
+        user, project, environment = create_project()
+        suite = TestSuite.objects.create(name='套件', project=project, created_by=user)
+        self.task = ScheduledTask.objects.create(name='定时', test_suite=suite, environment=environment,
+                                                 created_by=user)
+
+    def trigger(self, task_id=None):
+        """以 task_id 为Celery任务ID触发一次执行，返回 (结果, 是否执行了套件)"""
+        with mock.patch('test_manager.tasks._run_scheduled_task', return_value={'success': True}) as run, \
+                mock.patch.object(execute_scheduled_test_suite, 'apply_async') as apply_async:
+            result = execute_scheduled_test_suite.apply(args=[self.task.id], task_id=task_id).get()
+        self.apply_async = apply_async
+        return result, run.called
+
+    def hold_lease(self, owner='running'):
+        self.assertTrue(self.task.acquire_lease(owner))
+
+    def set_policy(self, policy):
+        self.task.overlap_policy = policy
+        self.task.save()
+
+    def test_runs_and_releases_lease(self):
+        result, ran = self.trigger()
+        self.assertTrue(ran)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.lease_owner, '')
+        self.assertIsNone(self.task.lease_expires_at)
+        self.apply_async.assert_not_called()
+
+    def test_skip_policy(self):
+        self.hold_lease()
+        result, ran = self.trigger()
+        self.assertFalse(ran)
+        self.assertEqual(result['overlap'], 'skipped')
+        self.assertTrue(TaskExecutionLog.objects.filter(scheduled_task=self.task, status='skipped').exists())
+
+    def test_coalesce_policy_links_running_run(self):
+        self.set_policy('coalesce')
+        self.hold_lease()
+        test_run = TestRun.objects.create(name='运行中', project=self.task.test_suite.project,
+                                          environment=self.task.environment, status='running',
+                                          created_by=self.task.created_by)
+        TaskExecutionLog.objects.create(scheduled_task=self.task, test_run=test_run, status='running')
+        result, ran = self.trigger()
+        self.assertFalse(ran)
+        self.assertEqual(result['overlap'], 'coalesced')
+        self.assertEqual(TaskExecutionLog.objects.get(scheduled_task=self.task, status='coalesced').test_run,
+                         test_run)
+
+    def test_queue_policy_hands_lease_to_queued_run(self):
+        self.set_policy('queue')
+        self.hold_lease()
+        self.assertEqual(self.trigger()[0]['overlap'], 'queued')
+        # 已有排队的执行时再次触发跳过
+        self.assertEqual(self.trigger()[0]['overlap'], 'skipped')
+
+        self.assertTrue(self.task.release_lease('running', 'next-run'))
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.lease_owner, 'next-run')
+        self.assertFalse(self.task.pending_run)
+        # 租约移交后其他触发不能取得租约
+        self.assertEqual(self.trigger()[0]['overlap'], 'queued')
+        self.task.refresh_from_db()
+        self.assertTrue(self.task.pending_run)
+
+        # 排队的执行以移交的租约执行，结束后再移交给新排队的执行
+        result, ran = self.trigger(task_id='next-run')
+        self.assertTrue(ran)
+        self.assertEqual(self.apply_async.call_count, 1)
+        next_owner = self.apply_async.call_args.kwargs['task_id']
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.lease_owner, next_owner)
+        self.assertFalse(self.task.pending_run)
+
+    def test_queue_after_previous_run_finished_runs_directly(self):
+        self.set_policy('queue')
+        self.hold_lease()
+        # 排队标记写入前上一次执行已结束并释放了租约，排队的触发取走标记直接执行
+        self.task.release_lease('running', 'unused')
+        self.assertTrue(self.task.request_queued_run())
+        self.assertTrue(self.task.acquire_lease('late', consume_queued=True))
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.lease_owner, 'late')
+        self.assertFalse(self.task.pending_run)
+
+    def test_queue_flag_taken_by_release_is_not_run_twice(self):
+        self.hold_lease()
+        self.assertTrue(self.task.request_queued_run())
+        # 上一次执行结束时取走排队标记并移交租约，排队的触发不能再直接执行
+        self.assertTrue(self.task.release_lease('running', 'next-run'))
+        self.assertFalse(self.task.acquire_lease('late', consume_queued=True))
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.lease_owner, 'next-run')
+
+    def test_renew_keeps_lease_past_ttl(self):
+        self.assertTrue(self.task.acquire_lease('running', ttl=60))
+        ScheduledTask.objects.filter(pk=self.task.pk).update(lease_expires_at=timezone.now() + timedelta(seconds=1))
+        self.assertTrue(self.task.renew_lease('running'))
+        self.assertFalse(self.task.acquire_lease('other'))
+        self.assertFalse(self.task.renew_lease('other'))
+
+        ScheduledTask.objects.filter(pk=self.task.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(self.task.acquire_lease('other'))
+        self.assertFalse(self.task.renew_lease('running'))
+
+
+class LeaseRenewerTests(TestCase):
+
+    def test_renews_until_exit(self):
+        calls = []
+        with LeaseRenewer(lambda: calls.append(1) or True, 0.01) as renewer:
+            threading.Event().wait(0.1)
+        count = len(calls)
+        self.assertGreater(count, 2)
+        self.assertFalse(renewer.lost.is_set())
+        threading.Event().wait(0.05)
+        self.assertEqual(len(calls), count)
+
+    def test_stops_when_lease_lost(self):
+        calls = []
+        with LeaseRenewer(lambda: bool(calls.append(1)), 0.01) as renewer:
+            self.assertTrue(renewer.lost.wait(1))
+        self.assertEqual(len(calls), 1)
+
+    def test_errors_are_retried(self):
+        results = iter([RuntimeError('数据库不可用'), True, False])
+
+        def renew():
+            result = next(results)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        with LeaseRenewer(renew, 0.01) as renewer:
+            self.assertTrue(renewer.lost.wait(1))
+
+
+@override_settings(WORKER_HEARTBEAT_TIMEOUT=30)
+class WorkerHealthTests(TestCase):
+    """worker心跳上报和健康状态汇总"""
+
+    def consumer(self, hostname, queues=('default',)):
+        app = mock.Mock()
+        app.amqp.queues.consume_from = {queue: None for queue in queues}
+        app.tasks = {'test_manager.tasks.execute_test_run': None, 'celery.backend_cleanup': None}
+        return mock.Mock(hostname=hostname, app=app, pool=mock.Mock(num_processes=4))
+
+    def heartbeat(self, hostname, seconds_ago=0, **kwargs):
+        kwargs.setdefault('concurrency', 4)
+        return WorkerHeartbeat.objects.create(hostname=hostname,
+                                              last_seen=timezone.now() - timedelta(seconds=seconds_ago), **kwargs)
+
+    def test_publish_heartbeat(self):
+        consumer = self.consumer('celery@a', queues=('default', 'notifications'))
+        with mock.patch('test_manager.worker_health._collect_queue_depth', return_value={'default': 3}):
+            publish_heartbeat(consumer, timezone.now())
+            publish_heartbeat(consumer, timezone.now())
+
+        heartbeat = WorkerHeartbeat.objects.get()
+        self.assertEqual(heartbeat.hostname, 'celery@a')
+        self.assertEqual(heartbeat.concurrency, 4)
+        self.assertEqual(heartbeat.queues, ['default', 'notifications'])
+        self.assertEqual(heartbeat.queue_depth, {'default': 3})
+        self.assertEqual(heartbeat.registered_tasks, ['test_manager.tasks.execute_test_run'])
+
+    def test_health_skips_stale_workers(self):
+        self.heartbeat('celery@a', active_tasks=1)
+        self.heartbeat('celery@b', seconds_ago=120, active_tasks=2)
+
+        health = get_worker_health()
+        self.assertEqual([w['hostname'] for w in health['workers']], ['celery@a'])
+        self.assertEqual((health['total_capacity'], health['active_tasks'], health['free_slots']), (4, 1, 3))
+
+        WorkerHeartbeat.objects.filter(hostname='celery@a').delete()
+        self.assertEqual(get_worker_health()['status'], 'warning')
+
+    def test_queue_depth_uses_newest_sample(self):
+        # 主机名靠前的worker采样更新，不能被主机名靠后的旧采样覆盖
+        self.heartbeat('celery@a', queue_depth={'default': 5})
+        self.heartbeat('celery@b', seconds_ago=10, queue_depth={'default': 50, 'notifications': 2})
+
+        self.assertEqual(get_worker_health()['queue_depth'], {'default': 5, 'notifications': 2})
+
+    def test_shutdown_unregisters_worker(self):
+        self.heartbeat('celery@a')
+        stop_heartbeat(sender=mock.Mock(hostname='celery@a'))
+        self.assertFalse(WorkerHeartbeat.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES, CELERY_BATCH_QUEUE_SHARDS=4)
+class QueueRoutingTests(TestCase):
+    """任务按队列分组路由，定时执行按项目散列到批量分片队列"""
+
+    def test_routes_by_task_name(self):
+        self.assertEqual(queues.route_task('test_manager.tasks.execute_test_run', (), {}, {}),
+                         {'queue': queues.QUEUE_INTERACTIVE, 'priority': queues.PRIORITY_INTERACTIVE})
+        self.assertEqual(queues.route_task('test_manager.tasks.flush_email_notifications', (), {}, {}),
+                         {'queue': queues.QUEUE_NOTIFICATION, 'priority': queues.PRIORITY_NOTIFICATION})
+        self.assertIsNone(queues.route_task('celery.backend_cleanup', (), {}, {}))
+
+    def test_scheduled_execution_uses_project_shard(self):
+        user, project, environment = create_project()
+        suite = TestSuite.objects.create(name='套件', project=project, created_by=user)
+        task = ScheduledTask.objects.create(name='定时', test_suite=suite, environment=environment, created_by=user)
+        expected = {'queue': f'batch.{project.id % 4}', 'priority': queues.PRIORITY_BATCH}
+
+        self.assertEqual(queues.route_task(queues.EXECUTE_TASK, (task.id,), {}, {}), expected)
+        self.assertEqual(queues.route_task(queues.EXECUTE_TASK, (), {'scheduled_task_id': task.id}, {}), expected)
+        # 定时任务已删除时落到默认分片
+        self.assertEqual(queues.route_task(queues.EXECUTE_TASK, (0,), {}, {})['queue'], 'batch.0')
+
+    def test_batch_shards(self):
+        self.assertEqual([queues.batch_queue(project_id) for project_id in (1, 4, 6, None)],
+                         ['batch.1', 'batch.0', 'batch.2', 'batch.0'])
+        self.assertEqual(queues.queues_for_group('batch'), ['batch.0', 'batch.1', 'batch.2', 'batch.3'])
+        self.assertEqual(queues.queues_for_group('notification'), ['notification'])
+        with self.settings(CELERY_BATCH_QUEUE_SHARDS=0):
+            self.assertEqual(queues.queues_for_group('batch'), ['batch.0'])
+
+    def test_run_worker_consumes_all_shards(self):
+        with mock.patch('test_manager.management.commands.run_worker.app.worker_main') as worker_main:
+            call_command('run_worker', 'batch', 'notification', stdout=io.StringIO())
+        argv = worker_main.call_args.args[0]
+        self.assertEqual(argv[argv.index('-Q') + 1], 'batch.0,batch.1,batch.2,batch.3,notification')
+        self.assertEqual(argv[argv.index('-c') + 1], '4')
+
+    def test_manual_run_uses_interactive_queue(self):
+        with mock.patch.object(execute_scheduled_test_suite, 'apply_async') as apply_async:
+            queues.dispatch_interactive_run(7)
+        apply_async.assert_called_once_with(args=[7], queue=queues.QUEUE_INTERACTIVE,
+                                            priority=queues.PRIORITY_INTERACTIVE)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, RETENTION_BATCH_PAUSE=0, RETENTION_BATCH_SIZE=2)
+class RetentionTests(TestCase):
+    """过期测试运行的归档和清理"""
+
+    def setUp(self):
+        user, project, environment = create_project()
+        test_case = create_case(project, user)
+        self.test_run = TestRun.objects.create(name='过期', project=project, environment=environment,
+                                               status='completed', created_by=user)
+        TestRun.objects.filter(pk=self.test_run.pk).update(created_at=timezone.now() - timedelta(days=200))
+        for status in ('passed', 'failed', 'passed'):
+            TestResult.objects.create_with_payload(test_run=self.test_run, test_case=test_case,
+                                                   environment=environment, status=status, response_time=10,
+                                                   response_body={'ok': status})
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+
+    def archived_lines(self, stats):
+        with gzip.open(stats['archive'], 'rt', encoding='utf-8') as f:
+            return f.read().splitlines()
+
+    def test_archives_and_deletes(self):
+        with self.settings(RETENTION_ARCHIVE_DIR=Path(self.archive_dir.name)):
+            stats = retention.prune_test_runs(days=90)
+        self.assertEqual((stats['runs'], stats['results']), (1, 3))
+        self.assertEqual(len(self.archived_lines(stats)), 3)
+        self.assertFalse(TestRun.objects.filter(pk=self.test_run.pk).exists())
+
+    def test_failed_batch_leaves_no_archive_rows(self):
+        append = retention._append_archive
+        calls = []
+
+        def append_then_fail(rows, path):
+            # 写完归档后事务失败（例如提交失败），这一批不能留下归档行
+            append(rows, path)
+            calls.append(len(rows))
+            if len(calls) == 2:
+                raise RuntimeError('提交失败')
+
+        with self.settings(RETENTION_ARCHIVE_DIR=Path(self.archive_dir.name)):
+            with mock.patch.object(retention, '_append_archive', side_effect=append_then_fail):
+                with self.assertRaises(RuntimeError):
+                    retention.prune_test_runs(days=90)
+            self.assertEqual(TestResult.objects.filter(test_run=self.test_run).count(), 1)
+            stats = retention.prune_test_runs(days=90)
+        self.assertEqual(stats['results'], 1)
+        self.assertEqual(len(self.archived_lines(stats)), 3)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class EmailConfigCacheTests(TestCase):
+    """激活的邮件配置只缓存ID，密码不进入共享缓存"""
+
+    def test_caches_only_config_id(self):
+        from django.core.cache import cache
+
+        config = EmailConfig.objects.create(name='配置', is_active=True, smtp_host='smtp.example.com',
+                                            smtp_password='secret', default_from_email='qa@example.com',
+                                            default_from_name='QA')
+        self.assertEqual(EmailConfig.get_active_config(), config)
+        self.assertEqual(cache.get(EmailConfig.ACTIVE_CONFIG_CACHE_KEY), config.pk)
+
+        EmailConfig.objects.filter(pk=config.pk).update(is_active=False)
+        self.assertIsNone(EmailConfig.get_active_config())
+
+
+@override_settings(CACHES=LOCMEM_CACHES, NOTIFICATION_MAX_ATTEMPTS=2, NOTIFICATION_RETRY_DELAY=60)
+class NotificationRetryTests(TestCase):
+    """通知先领取再发送，同时运行的发送不重复发信；发送失败的通知退避重试，达到次数后记为失败"""
+
+    def setUp(self):
+        user, project, environment = create_project()
+        suite = TestSuite.objects.create(name='套件', project=project, created_by=user)
+        task = ScheduledTask.objects.create(name='定时', test_suite=suite, environment=environment,
+                                            created_by=user)
+        log = TaskExecutionLog.objects.create(scheduled_task=task, status='success')
+        self.notification = EmailNotification.objects.create(execution_log=log, recipient='qa@example.com')
+
+    def flush(self, error=None):
+        with mock.patch('django.core.mail.EmailMultiAlternatives.send', side_effect=error) as send:
+            sent = flush_pending_notifications()
+        self.notification.refresh_from_db()
+        return sent, send.call_count
+
+    def test_retries_after_delay_then_fails(self):
+        self.assertEqual(self.flush(OSError('连接被重置')), (0, 1))
+        self.assertEqual((self.notification.status, self.notification.attempts), ('pending', 1))
+        self.assertGreater(self.notification.next_attempt_at, timezone.now() + timedelta(seconds=50))
+
+        # 未到重试时间不会再发送
+        self.assertEqual(self.flush(OSError('连接被重置')), (0, 0))
+
+        EmailNotification.objects.filter(pk=self.notification.pk).update(next_attempt_at=timezone.now())
+        self.flush(OSError('连接被重置'))
+        self.assertEqual((self.notification.status, self.notification.attempts), ('failed', 2))
+        self.assertEqual(self.notification.error_message, '连接被重置')
+
+    def test_retry_succeeds(self):
+        self.flush(OSError('连接被重置'))
+        EmailNotification.objects.filter(pk=self.notification.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(self.flush(), (1, 1))
+        self.assertEqual(self.notification.status, 'sent')
+
+    def test_connection_failure_counts_as_attempt(self):
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=OSError('拒绝连接')):
+            self.assertEqual(self.flush(), (0, 0))
+        self.assertEqual((self.notification.status, self.notification.attempts), ('pending', 1))
+
+    def test_concurrent_flushes_send_once(self):
+        other_log = TaskExecutionLog.objects.create(scheduled_task=self.notification.execution_log.scheduled_task,
+                                                    status='failed')
+        EmailNotification.objects.create(execution_log=other_log, recipient='dev@example.com')
+        recipients = []
+        nested = []
+
+        def send(message, fail_silently=False):
+            recipients.extend(message.to)
+            if not nested:
+                # 第一封发送期间另一次发送（定时发送或延迟发送）开始处理同一批待发送通知
+                nested.append(flush_pending_notifications())
+
+        with mock.patch('django.core.mail.EmailMultiAlternatives.send', autospec=True, side_effect=send):
+            self.assertEqual(flush_pending_notifications(), 2)
+        self.assertEqual(nested, [0])
+        self.assertEqual(sorted(recipients), ['dev@example.com', 'qa@example.com'])
+        self.assertEqual(set(EmailNotification.objects.values_list('status', flat=True)), {'sent'})
+
+    def test_expired_claim_is_sent_again(self):
+        # 发送进程在领取后退出，领取超时后由下一次发送处理
+        EmailNotification.objects.filter(pk=self.notification.pk).update(
+            status='sending', claim_token='lost', next_attempt_at=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(self.flush(), (0, 0))
+        EmailNotification.objects.filter(pk=self.notification.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(self.flush(), (1, 1))
+        self.assertEqual(self.notification.status, 'sent')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RollupTests(TestCase):
+    """测试运行结束后的每日汇总"""
+
+    def setUp(self):
+        user, project, environment = create_project()
+        self.test_case = create_case(project, user)
+        self.runs = []
+        for response_times in ((10, 30), (5, 50)):
+            test_run = TestRun.objects.create(name='运行', project=project, environment=environment,
+                                              status='completed', created_by=user)
+            for response_time in response_times:
+                TestResult.objects.create(test_run=test_run, test_case=self.test_case, environment=environment,
+                                          status='passed', response_time=response_time)
+            self.runs.append(test_run)
+
+    def test_concurrent_rollups_of_same_day(self):
+        first, second = self.runs
+        bulk_create = TestCaseDailyStats.objects.bulk_create
+        calls = []
+
+        def insert_after_other_run(objs, **kwargs):
+            # 第一个运行插入用例汇总行之前，另一个运行先插入了同一天的行
+            calls.append(1)
+            if len(calls) == 1:
+                rollups.rollup_test_run(second.id)
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(TestCaseDailyStats.objects, 'bulk_create', side_effect=insert_after_other_run):
+            self.assertTrue(rollups.rollup_test_run(first.id))
+
+        stats = TestCaseDailyStats.objects.get(test_case=self.test_case)
+        self.assertEqual((stats.result_count, stats.passed_count, stats.total_response_time), (4, 4, 95))
+        self.assertEqual((stats.min_response_time, stats.max_response_time), (5, 50))
+        self.assertFalse(rollups.rollup_test_run(first.id))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class DashboardCacheTests(TestCase):
+    """面板统计缓存，测试运行结束或删除时失效"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user, self.project, self.environment = create_project()
+        self.test_run = TestRun.objects.create(name='运行', project=self.project, environment=self.environment,
+                                               status='running', created_by=self.user)
+
+    def test_stats_are_cached(self):
+        self.assertEqual(dashboard.get_dashboard_stats()['test_run_stats']['running'], 1)
+        TestRun.objects.filter(pk=self.test_run.pk).update(status='completed')
+        with self.assertNumQueries(0):
+            stats = dashboard.get_dashboard_stats()
+        self.assertEqual(stats['test_run_stats']['running'], 1)
+
+    def test_finished_run_invalidates_cache(self):
+        dashboard.get_dashboard_stats()
+        self.test_run.status = 'completed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.test_run.save()
+        stats = dashboard.get_dashboard_stats()
+        self.assertEqual((stats['test_run_stats']['running'], stats['test_run_stats']['passed']), (0, 1))
+
+    def test_deleted_run_invalidates_cache(self):
+        self.assertEqual(dashboard.get_dashboard_stats()['test_runs_count'], 1)
+        self.test_run.delete()
+        self.assertEqual(dashboard.get_dashboard_stats()['test_runs_count'], 0)
+
+    def test_cache_errors_fall_back_to_database(self):
+        with mock.patch.object(dashboard.cache, 'get', side_effect=ConnectionError('缓存不可用')), \
+                mock.patch.object(dashboard.cache, 'set', side_effect=ConnectionError('缓存不可用')):
+            self.assertEqual(dashboard.get_dashboard_stats()['test_runs_count'], 1)
+
+    def test_redis_cache_is_opt_in(self):
+        from EasyTesting import settings as project_settings
+
+        def cache_backend(environ):
+            with mock.patch.dict(os.environ, environ, clear=True):
+                return importlib.reload(project_settings).CACHES['default']
+
+        self.addCleanup(importlib.reload, project_settings)
+        self.assertEqual(cache_backend({})['BACKEND'], 'django.core.cache.backends.locmem.LocMemCache')
+        redis = cache_backend({'EASYTESTING_REDIS_CACHE_URL': 'redis://cache:6379/1'})
+        self.assertEqual((redis['BACKEND'], redis['LOCATION']),
+                         ('django.core.cache.backends.redis.RedisCache', 'redis://cache:6379/1'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class KeysetPaginationTests(TestCase):
+    """按 (created_at, id) 倒序的游标分页和估算总数"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user, project, environment = create_project()
+        test_case = create_case(project, self.user)
+        self.test_run = TestRun.objects.create(name='运行', project=project, environment=environment,
+                                               created_by=self.user)
+        results = [TestResult.objects.create(test_run=self.test_run, test_case=test_case, environment=environment,
+                                             status='passed') for _ in range(5)]
+        # 前三条的创建时间相同，翻页只能靠id区分
+        same_time = timezone.now() - timedelta(hours=1)
+        TestResult.objects.filter(pk__in=[result.pk for result in results[:3]]).update(created_at=same_time)
+        self.expected = list(TestResult.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def pages(self, per_page):
+        pages = [KeysetPage(TestResult.objects.all(), per_page)]
+        while pages[-1].next_cursor:
+            pages.append(KeysetPage(TestResult.objects.all(), per_page, after=pages[-1].next_cursor))
+        return pages
+
+    def test_walks_forward_and_back(self):
+        pages = self.pages(2)
+        self.assertEqual([result.pk for page in pages for result in page], self.expected)
+        self.assertEqual([(page.has_previous, page.has_next) for page in pages],
+                         [(False, True), (True, True), (True, False)])
+
+        previous = KeysetPage(TestResult.objects.all(), 2, before=pages[2].previous_cursor)
+        self.assertEqual([result.pk for result in previous], [result.pk for result in pages[1]])
+        first = KeysetPage(TestResult.objects.all(), 2, before=previous.previous_cursor)
+        self.assertEqual([result.pk for result in first], self.expected[:2])
+        self.assertFalse(first.has_previous)
+
+    def test_deep_pages_do_not_use_offset(self):
+        cursor = self.pages(2)[1].next_cursor
+        with self.assertNumQueries(1) as queries:
+            page = KeysetPage(TestResult.objects.all(), 2, after=cursor)
+        self.assertEqual([result.pk for result in page], self.expected[4:])
+        self.assertNotIn('OFFSET', queries.captured_queries[0]['sql'].upper())
+
+    def test_invalid_cursor_starts_from_first_page(self):
+        self.assertIsNone(decode_cursor('不是游标'))
+        page = KeysetPage(TestResult.objects.all(), 2, after='bm90LWEtY3Vyc29y')
+        self.assertEqual([result.pk for result in page], self.expected[:2])
+
+    def test_estimated_count_is_capped(self):
+        with self.settings(PAGINATION_COUNT_CAP=3):
+            self.assertEqual(estimate_count(TestResult.objects.filter(status='passed')), (3, False))
+        self.assertEqual(estimate_count(TestResult.objects.filter(status='failed')), (0, True))
+
+    def test_api_links(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(f'/api/test-runs/{self.test_run.pk}/results/?page_size=2&fields=id')
+        self.assertEqual((response.data['count'], response.data['count_is_exact']), (5, True))
+        self.assertIsNone(response.data['previous'])
+
+        ids = [row['id'] for row in response.data['results']]
+        while response.data['next']:
+            self.assertIn('fields=id', response.data['next'])
+            response = client.get(response.data['next'])
+            ids.extend(row['id'] for row in response.data['results'])
+        self.assertEqual(ids, self.expected)
+        self.assertIn('before=', response.data['previous'])
+
+
+class ResponseBlobTests(TestCase):
+    """响应体按内容去重保存"""
+
+    def test_keeps_key_order_and_deduplicates(self):
+        digest, size = ResponseBlob.store({'b': 1, 'a': {'d': 2, 'c': 3}})
+        self.assertEqual(list(ResponseBlob.objects.get(hash=digest).load()), ['b', 'a'])
+        self.assertEqual(list(ResponseBlob.objects.get(hash=digest).load()['a']), ['d', 'c'])
+
+        stored = ResponseBlob.store_many([{'a': {'c': 3, 'd': 2}, 'b': 1}, {'b': 2}])
+        self.assertEqual(stored[0], (digest, size))
+        self.assertEqual(ResponseBlob.objects.count(), 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ResultPayloadTests(TestCase):
+    """请求和响应内容拆分到载荷表，列表查询不读取"""
+
+    def setUp(self):
+        self.user, project, self.environment = create_project()
+        self.test_case = create_case(project, self.user)
+        self.test_run = TestRun.objects.create(name='运行', project=project, environment=self.environment,
+                                               created_by=self.user)
+
+    def row(self, **kwargs):
+        kwargs.setdefault('status', 'passed')
+        return dict(test_run=self.test_run, test_case=self.test_case, environment=self.environment, **kwargs)
+
+    def test_payload_is_loaded_on_demand(self):
+        result = TestResult.objects.create_with_payload(**self.row(
+            request_headers={'Accept': 'application/json'}, validators=[{'eq': ['status_code', 200]}],
+            response_body={'ok': True}))
+        self.assertEqual(result.response_size, len(b'{"ok":true}'))
+
+        sql = str(TestResult.objects.all().query)
+        self.assertNotIn('request_headers', sql)
+        self.assertNotIn('response_body', sql)
+        result = TestResult.objects.get(pk=result.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(result.request_headers, {'Accept': 'application/json'})
+            self.assertEqual(result.validators, [{'eq': ['status_code', 200]}])
+
+        result = TestResult.objects.with_payload().get(pk=result.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(result.request_headers, {'Accept': 'application/json'})
+            self.assertEqual(result.response_body, {'ok': True})
+
+    def test_missing_payload_uses_defaults(self):
+        result = TestResult.objects.create(**self.row())
+        self.assertIsNone(result.get_payload())
+        self.assertEqual((result.request_headers, result.validators, result.response_body), ({}, [], {}))
+
+    def test_bulk_create(self):
+        results = TestResult.objects.bulk_create_with_payload([
+            self.row(request_body={'n': n}, response_body={'same': True}) for n in range(3)
+        ])
+        self.assertEqual([result.request_body for result in TestResult.objects.with_payload().order_by('id')],
+                         [{'n': 0}, {'n': 1}, {'n': 2}])
+        self.assertEqual(len({result.response_blob_id for result in results}), 1)
+        self.assertEqual(ResponseBlob.objects.count(), 1)
+
+    def test_api_list_and_detail(self):
+        result = TestResult.objects.create_with_payload(**self.row(response_headers={'X-Id': '1'},
+                                                                   response_body=[1, 2]))
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        listed = client.get(f'/api/test-results/?test_run={self.test_run.pk}').data['results'][0]
+        self.assertNotIn('payload', listed)
+        self.assertNotIn('response_body', listed)
+
+        detail = client.get(f'/api/test-results/{result.pk}/').data
+        self.assertEqual(detail['payload']['response_headers'], {'X-Id': '1'})
+        self.assertEqual(detail['response_body'], [1, 2])
+
+
+def json_response(body, headers=None, status_code=200):
+    """测试用的流式JSON响应，响应体分块读取"""
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers = requests.structures.CaseInsensitiveDict({'Content-Type': 'application/json', **(headers or {})})
+    response.raw = io.BytesIO(json.dumps(body).encode('utf-8'))
+    return response
+
+
+@override_settings(CACHES=LOCMEM_CACHES, RESPONSE_READ_CHUNK_SIZE=64)
+class ParameterExtractionTests(TestCase):
+    """参数提取在各种载荷保存策略和增量解析下都能取到值"""
+
+    BODY = {'data': {'token': 'abc', 'user': {'id': 7}}, 'items': [{'n': i} for i in range(200)]}
+
+    def setUp(self):
+        user, project, self.environment = create_project()
+        self.test_case = create_case(project, user, validation_rules=[{'Equal': ['$.data.user.id', 7]}],
+                                     extract_params=[{'name': 'token', 'path': '$.data.token'},
+                                                     {'name': 'user_id', 'path': '$.data.user.id'}])
+
+    def execute(self, capture_policy=None, headers=None):
+        response = json_response(self.BODY, headers)
+        with mock.patch('test_manager.httprunner_executor.requests.request', return_value=response):
+            return execute_test_case(self.test_case, self.environment, capture_policy=capture_policy)
+
+    def test_each_capture_mode(self):
+        for mode in (None, 'full', 'on_failure', 'truncated', 'none'):
+            with self.subTest(mode=mode):
+                result = self.execute(CapturePolicy(mode) if mode else None)
+                self.assertEqual(result['status'], 'passed')
+                self.assertEqual(result['extracted_params'], {'token': 'abc', 'user_id': 7})
+                self.assertNotIn('partial_size', result)
+
+    def test_partial_body_is_marked_after_extraction(self):
+        result = self.execute(CapturePolicy('none'))
+        self.assertEqual(result['response_body'], {
+            'truncated': True, 'size': None, 'extracted': {'data': {'token': 'abc', 'user': {'id': 7}}},
+        })
+        self.assertEqual(result['validators'][0]['check_result'], 'pass')
+
+    def test_chunked_body_over_limit_parsed_incrementally(self):
+        with self.settings(RESPONSE_MAX_BYTES=256):
+            result = self.execute(CapturePolicy('full'))
+        self.assertEqual(result['status'], 'passed')
+        self.assertEqual(result['extracted_params'], {'token': 'abc', 'user_id': 7})
+        self.assertTrue(result['response_body']['truncated'])
+
+    def test_body_over_limit_without_key_paths_fails(self):
+        # 递归下降的路径无法增量解析，超过上限的响应体仍然报错
+        self.test_case.extract_params = [{'name': 'token', 'path': '$..token'}]
+        with self.settings(RESPONSE_MAX_BYTES=256):
+            result = self.execute(CapturePolicy('full'))
+        self.assertEqual(result['status'], 'error')
+
+    def test_on_result_receives_payload_and_returns_summaries(self):
+        received = []
+        with mock.patch('test_manager.httprunner_executor.requests.request',
+                        side_effect=lambda *args, **kwargs: json_response(self.BODY)):
+            summaries = execute_test_cases([(self.test_case, self.environment)] * 2, CapturePolicy('full'),
+                                           on_result=received.append)
+
+        self.assertEqual([result['response_body'] for result in received], [self.BODY] * 2)
+        self.assertEqual(summaries, [{'test_case_id': self.test_case.id, 'environment_id': self.environment.id,
+                                      'status': 'passed', 'response_time': received[i]['response_time'],
+                                      'error_message': received[i].get('error_message')} for i in range(2)])
+
+
+@override_settings(CACHES=LOCMEM_CACHES, REPORT_SECTION_PAGE_SIZE=2)
+class ReportTests(TestCase):
+    """报告分块生成到文件，详情页按页读取分段"""
+
+    def setUp(self):
+        self.user, self.project, self.environment = create_project()
+        self.test_case = create_case(self.project, self.user, name='登录')
+        storage = tempfile.TemporaryDirectory()
+        self.addCleanup(storage.cleanup)
+        override = self.settings(REPORT_STORAGE_DIR=Path(storage.name))
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def create_run(self, name, statuses, **kwargs):
+        kwargs.setdefault('status', 'completed')
+        test_run = TestRun.objects.create(name=name, project=self.project, environment=self.environment,
+                                          created_by=self.user, **kwargs)
+        for status in statuses:
+            TestResult.objects.create_with_payload(test_run=test_run, test_case=self.test_case,
+                                                   environment=self.environment, status=status,
+                                                   response_body={'status': status})
+        return test_run
+
+    def generate(self, report_format='html', **kwargs):
+        report = TestReport.objects.create(name='报告', project=self.project, report_format=report_format,
+                                           created_by=self.user, **kwargs)
+        reports.generate_report(report.pk)
+        report.refresh_from_db()
+        return report
+
+    def test_suite_run_report_lists_runs_without_results(self):
+        suite_run = TestSuiteRun.objects.create(name='批量', project=self.project, environment=self.environment,
+                                                status='failed', created_by=self.user)
+        self.create_run('有结果', ['passed', 'failed'], suite_run=suite_run)
+        self.create_run('空运行', [], suite_run=suite_run, status='failed', error_message='套件中没有测试用例')
+
+        report = self.generate(report_type='test_suite_run', test_suite_run=suite_run)
+        content = report.read_content()
+        self.assertEqual(report.generation_status, 'completed')
+        self.assertEqual(content.count('class="test-case-row'), 2)
+        self.assertIn('<td>空运行</td>', content)
+        self.assertIn('执行出错: 套件中没有测试用例', content)
+        self.assertEqual((report.total_count, report.processed_count), (2, 2))
+
+        report = self.generate('json', report_type='test_suite_run', test_suite_run=suite_run)
+        runs = json.loads(report.read_content())['test_runs']
+        self.assertEqual([(run['name'], len(run['results'])) for run in runs], [('有结果', 2), ('空运行', 0)])
+
+    def test_metadata_and_sections(self):
+        test_run = self.create_run('运行', ['passed', 'failed', 'error'], status='failed')
+        report = self.generate(report_type='test_run', test_run=test_run)
+
+        self.assertEqual((report.generation_status, report.progress, report.processed_count), ('completed', 100, 3))
+        self.assertEqual((report.title, report.environment_name, report.run_status), ('运行', '环境', 'failed'))
+        self.assertEqual((report.passed_count, report.failed_count, report.error_count, report.total_count),
+                         (1, 1, 1, 3))
+        self.assertEqual(report.section_pages, 2)
+        self.assertEqual([entry['status'] for entry in report.read_section(0)], ['passed', 'failed'])
+        self.assertEqual([entry['response_body'] for entry in report.read_section(1)], [{'status': 'error'}])
+        self.assertEqual(report.read_section(2), [])
+
+    def test_viewer_endpoints(self):
+        report = self.generate(report_type='test_run', test_run=self.create_run('运行', ['passed'] * 3))
+        self.client.force_login(self.user)
+
+        detail = self.client.get(f'/reports/{report.pk}/')
+        self.assertEqual(detail.status_code, 200)
+        # 测试结果由页面分页加载，详情页不包含报告内容
+        self.assertNotIn('{&quot;status&quot;', detail.content.decode())
+
+        status = self.client.get(f'/reports/{report.pk}/status/').json()
+        self.assertEqual((status['status'], status['progress'], status['total']), ('completed', 100, 3))
+
+        first = self.client.get(f'/reports/{report.pk}/sections/?page=0').json()
+        last = self.client.get(f'/reports/{report.pk}/sections/?page=1').json()
+        self.assertEqual((first['pages'], first['has_next'], last['has_next']), (2, True, False))
+        self.assertEqual(first['html'].count('登录'), 2)
+        self.assertEqual(last['html'].count('登录'), 1)
+
+        download = self.client.get(f'/reports/{report.pk}/file/?download=1')
+        self.assertIn('attachment', download['Content-Disposition'])
+        self.assertEqual(b''.join(download.streaming_content).decode(), report.read_content())
+
+    def test_failed_generation_leaves_no_files(self):
+        test_run = self.create_run('运行', ['passed'])
+        report = TestReport.objects.create(name='报告', project=self.project, report_type='test_run',
+                                           test_run=test_run, created_by=self.user)
+        with mock.patch.object(reports, '_result_html', side_effect=RuntimeError('磁盘已满')):
+            with self.assertRaises(RuntimeError):
+                reports.generate_report(report.pk)
+
+        report.refresh_from_db()
+        self.assertEqual((report.generation_status, report.generation_error), ('failed', '磁盘已满'))
+        self.assertEqual(list(TestReport.storage_dir().rglob('*.*')), [])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GroupPathTests(TestCase):
+    """分组物化路径的维护和子树查询"""
+
+    def setUp(self):
+        self.user, self.project, environment = create_project()
+        self.root = self.create_group('根')
+        self.child = self.create_group('子', parent=self.root)
+        self.other = self.create_group('其他')
+
+    def create_group(self, name, parent=None):
+        return TestCaseGroup.objects.create(name=name, project=self.project, parent=parent, created_by=self.user)
+
+    def test_move_with_update_fields(self):
+        self.root.parent = self.other
+        self.root.save(update_fields=['parent'])
+        self.root.refresh_from_db()
+        self.child.refresh_from_db()
+        self.assertEqual(self.root.path, f'/{self.other.pk}/{self.root.pk}/')
+        self.assertEqual(self.child.path, f'/{self.other.pk}/{self.root.pk}/{self.child.pk}/')
+        self.assertEqual(set(self.other.get_descendants()), {self.other, self.root, self.child})
+
+    def test_empty_path_does_not_match_every_group(self):
+        TestCaseGroup.objects.filter(pk__in=[self.root.pk, self.child.pk]).update(path='')
+        create_case(self.project, self.user, group=self.other)
+        child = TestCaseGroup.objects.get(pk=self.child.pk)
+        self.assertEqual(list(child.get_descendants()), [child])
+        self.assertFalse(child.get_test_cases().exists())
+        self.assertEqual(TestCaseGroup.objects.get(pk=self.root.pk).path, f'/{self.root.pk}/')
+
+        self.assertFalse(TestCaseGroup(name='新分组', project=self.project).get_descendants().exists())
+
+    def test_subtree_range_stops_at_sibling_prefix(self):
+        # /50/ 与 /5/ 前缀相同但不在 /5/ 的子树中
+        for group, path in ((self.root, '/5/'), (self.child, '/5/7/'), (self.other, '/50/')):
+            TestCaseGroup.objects.filter(pk=group.pk).update(path=path)
+        root = TestCaseGroup.objects.get(pk=self.root.pk)
+        self.assertEqual(set(root.get_descendants()), {self.root, self.child})
+        self.assertEqual(list(root.get_descendants(include_self=False)), [self.child])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class GroupTreeTests(TestCase):
+    """分组树一次组装并缓存，分组、用例或套件变更时失效"""
+
+    def setUp(self):
+        from django.core.cache import cache
+
+        cache.clear()
+        self.user, self.project, environment = create_project()
+        self.root = TestCaseGroup.objects.create(name='根', project=self.project, created_by=self.user)
+        self.child = TestCaseGroup.objects.create(name='子', project=self.project, parent=self.root,
+                                                  created_by=self.user)
+        create_case(self.project, self.user, name='分组用例', group=self.child)
+        create_case(self.project, self.user, name='未分组用例')
+
+    def test_case_tree(self):
+        tree = group_trees.get_case_tree(self.project.id)
+        self.assertEqual([case['name'] for case in tree['ungrouped']], ['未分组用例'])
+        [root] = tree['groups']
+        [child] = root['children']
+        self.assertEqual((root['name'], root['case_count'], child['name'], child['case_count']), ('根', 0, '子', 1))
+        self.assertEqual([node['name'] for node in group_trees.iter_groups(tree['groups'])], ['根', '子'])
+
+    def test_queries_do_not_grow_with_groups_or_projects(self):
+        _, other_project, _ = create_project('other')
+        for i in range(5):
+            group = TestCaseGroup.objects.create(name=f'分组{i}', project=other_project, parent=None,
+                                                 created_by=self.user)
+            TestSuiteGroup.objects.create(name=f'套件分组{i}', project=other_project, created_by=self.user)
+            create_case(other_project, self.user, name=f'用例{i}', group=group)
+
+        with self.assertNumQueries(2):
+            trees = group_trees.build_case_trees([self.project.id, other_project.id])
+        self.assertEqual(len(trees[other_project.id]['groups']), 5)
+        with self.assertNumQueries(2):
+            trees = group_trees.build_suite_trees([self.project.id, other_project.id])
+        self.assertEqual(len(trees[other_project.id]['groups']), 5)
+
+    def test_cached_until_changed(self):
+        group_trees.get_case_tree(self.project.id)
+        with self.assertNumQueries(0):
+            group_trees.get_case_tree(self.project.id)
+
+        create_case(self.project, self.user, name='新用例', group=self.root)
+        self.assertEqual(group_trees.get_case_tree(self.project.id)['groups'][0]['case_count'], 1)
+        self.child.delete()
+        self.assertEqual(group_trees.get_case_tree(self.project.id)['groups'][0]['children'], [])
+
+        suite_group = TestSuiteGroup.objects.create(name='套件分组', project=self.project, created_by=self.user)
+        self.assertEqual(group_trees.get_suite_tree(self.project.id)['groups'][0]['suite_count'], 0)
+        TestSuite.objects.create(name='套件', project=self.project, group=suite_group, created_by=self.user)
+        self.assertEqual(group_trees.get_suite_tree(self.project.id)['groups'][0]['suite_count'], 1)
+
+    def test_group_pages(self):
+        self.client.force_login(self.user)
+        for url in ('/test-case-groups/', f'/test-case-groups/?project={self.project.id}',
+                    '/test-suite-groups/', f'/test-suite-groups/?project={self.project.id}'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+        request = RequestFactory().get('/')
+        request.user = self.user
+        groups = json.loads(get_test_case_groups_data(request, self.project.id).content)['groups']
+        self.assertEqual([group['name'] for group in groups], ['根', 'Ungrouped'])
+        self.assertEqual(groups[0]['children'][0]['test_cases'][0]['name'], '分组用例')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SparseFieldsApiTests(TestCase):
+    """?fields= 只返回并读取列出的字段，?expand= 展开的关联对象联表或预取，查询数不随行数增加"""
+
+    def setUp(self):
+        self.user, self.project, self.environment = create_project()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_suites(self, count):
+        for i in range(count):
+            project = Project.objects.create(name=f'项目{i}', created_by=self.user)
+            environment = Environment.objects.create(name='环境', project=project, base_url='http://127.0.0.1:9')
+            suite = TestSuite.objects.create(name=f'套件{i}', project=project, created_by=self.user)
+            for order in range(2):
+                TestSuiteCase.objects.create(test_suite=suite, test_case=create_case(project, self.user),
+                                             environment=environment, order=order)
+            TestRun.objects.create(name=f'运行{i}', project=project, environment=environment, test_suite=suite,
+                                   created_by=self.user)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data['results'], len(queries)
+
+    def test_fields_limit_output_and_columns(self):
+        create_case(self.project, self.user, name='用例', description='很长的描述')
+        results, _ = self.get('/api/test-cases/?fields=id,name')
+        self.assertEqual(results, [{'id': Case.objects.get().id, 'name': '用例'}])
+
+        queryset = TestCaseSerializer.optimize_queryset(Case.objects.all(), ['id', 'name'])
+        self.assertEqual(queryset.query.deferred_loading, ({'id', 'name'}, False))
+        # 计算字段无法确定依赖的列，读取全部列
+        queryset = RunnerAgentSerializer.optimize_queryset(RunnerAgent.objects.all(), ['id', 'is_online'])
+        self.assertEqual(queryset.query.deferred_loading, (frozenset(), True))
+
+    def test_relations_default_to_ids(self):
+        self.add_suites(1)
+        [run], _ = self.get('/api/test-runs/')
+        self.assertEqual(run['project'], TestRun.objects.get().project_id)
+
+    def test_expand_foreign_keys_with_constant_queries(self):
+        self.add_suites(2)
+        url = '/api/test-runs/?expand=project,environment.project,test_suite&fields=id,project.name,environment'
+        results, before = self.get(url)
+        self.assertEqual(set(results[0]), {'id', 'project', 'environment'})
+        self.assertEqual(set(results[0]['project']), {'name'})
+        self.assertEqual(results[0]['environment']['project']['name'], results[0]['project']['name'])
+
+        self.add_suites(3)
+        results, after = self.get(url)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(after, before)
+
+    def test_expand_many_with_prefetch(self):
+        self.add_suites(2)
+        url = '/api/test-suites/?expand=test_suite_cases.test_case&fields=id,test_suite_cases.order,' \
+              'test_suite_cases.test_case.name'
+        results, before = self.get(url)
+        self.assertEqual(results[0]['test_suite_cases'], [{'order': 0, 'test_case': {'name': '用例'}},
+                                                          {'order': 1, 'test_case': {'name': '用例'}}])
+
+        self.add_suites(3)
+        results, after = self.get(url)
+        self.assertEqual(len(results), 5)
+        self.assertEqual(after, before)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, RUN_STATUS_POLL_INTERVAL=0.01)
+class RunStatusApiTests(TestCase):
+    """提交测试运行返回202和状态地址，状态接口支持长轮询"""
+
+    def setUp(self):
+        self.user, project, self.environment = create_project()
+        self.test_case = create_case(project, self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def submit(self):
+        response = self.client.post(f'/api/test-cases/{self.test_case.pk}/run/',
+                                    {'environment_id': self.environment.pk}, format='json')
+        self.assertEqual(response.status_code, 202)
+        return response
+
+    def test_accepted_with_location(self):
+        response = self.submit()
+        test_run = TestRun.objects.get(pk=response.data['id'])
+        self.assertEqual(response['Location'], response.data['status_url'])
+        self.assertTrue(response['Location'].endswith(f'/api/test-runs/{test_run.pk}/status/'))
+        self.assertEqual(response.data['status'], 'pending')
+
+    def test_status(self):
+        run_id = self.submit().data['id']
+        TestResult.objects.create(test_run_id=run_id, test_case=self.test_case, environment=self.environment,
+                                  status='passed')
+        data = self.client.get(f'/api/test-runs/{run_id}/status/').data
+        self.assertEqual((data['status'], data['finished'], data['completed'], data['passed']),
+                         ('pending', False, 1, 1))
+        self.assertEqual(data['progress'], 100)
+
+        TestRun.objects.filter(pk=run_id).update(status='completed')
+        data = self.client.get(f'/api/test-runs/{run_id}/status/?wait=5').data
+        self.assertTrue(data['finished'])
+
+    def test_long_poll_is_capped(self):
+        run_id = self.submit().data['id']
+        with self.settings(RUN_STATUS_MAX_WAIT=0.05):
+            started = time.monotonic()
+            response = self.client.get(f'/api/test-runs/{run_id}/status/?wait=30&since=0')
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertFalse(response.data['finished'])
+
+    def test_invalid_and_missing(self):
+        run_id = self.submit().data['id']
+        self.assertEqual(self.client.get(f'/api/test-runs/{run_id}/status/?wait=x').status_code, 400)
+        self.assertEqual(self.client.get(f'/api/test-runs/{run_id + 100}/status/').status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, SUITE_RUN_CONCURRENCY=2)
+class RunSlotTests(TestCase):
+    """批量运行子运行的认领、槽位占用和续约"""
+
+    def setUp(self):
+        user, project, environment = create_project()
+        suite_run = TestSuiteRun.objects.create(name='批量', project=project, environment=environment,
+                                                status='running', created_by=user)
+        self.runs = [TestRun.objects.create(name=f'子运行{i}', project=project, environment=environment,
+                                            suite_run=suite_run, status='pending', created_by=user)
+                     for i in range(3)]
+        dispatch = mock.patch.object(suite_runs, '_dispatch_child')
+        self.dispatch = dispatch.start()
+        self.addCleanup(dispatch.stop)
+
+    def statuses(self):
+        return [TestRun.objects.get(pk=run.pk).status for run in self.runs]
+
+    @override_settings(SUITE_RUN_CONCURRENCY=3)
+    def test_concurrent_fill(self):
+        # 有空闲槽位时，两个进程为同一个运行占用槽位会违反一对一约束
+        TestRun.objects.filter(pk=self.runs[2].pk).update(status='completed')
+        acquire = RunSlot.acquire
+        calls = []
+
+        def acquire_after_other_process(test_run_id, limit, ttl):
+            # 本进程取出等待列表后，另一个进程先补位
+            calls.append(test_run_id)
+            if len(calls) == 1:
+                suite_runs.fill_run_slots()
+            return acquire(test_run_id, limit, ttl)
+
+        with mock.patch.object(RunSlot, 'acquire', side_effect=acquire_after_other_process):
+            suite_runs.fill_run_slots()
+
+        self.assertEqual(self.statuses(), ['running', 'running', 'completed'])
+        self.assertEqual(set(RunSlot.objects.exclude(test_run=None).values_list('test_run_id', flat=True)),
+                         {self.runs[0].pk, self.runs[1].pk})
+        self.assertEqual(self.dispatch.call_count, 2)
+
+    def test_claim_returned_when_no_slot_is_free(self):
+        self.assertEqual(suite_runs.fill_run_slots(), 2)
+        self.assertEqual(suite_runs.fill_run_slots(), 0)
+        third = TestRun.objects.get(pk=self.runs[2].pk)
+        self.assertEqual((third.status, third.start_time), ('pending', None))
+
+        RunSlot.release(self.runs[0].pk)
+        self.assertEqual(suite_runs.fill_run_slots(), 1)
+        self.assertEqual(self.statuses()[2], 'running')
+
+    def test_renew(self):
+        suite_runs.fill_run_slots()
+        run_id = self.runs[0].pk
+        RunSlot.objects.filter(test_run_id=run_id).update(lease_expires_at=timezone.now())
+        self.assertTrue(RunSlot.renew(run_id, 600))
+        self.assertGreater(RunSlot.objects.get(test_run_id=run_id).lease_expires_at,
+                           timezone.now() + timedelta(seconds=500))
+        RunSlot.release(run_id)
+        self.assertFalse(RunSlot.renew(run_id, 600))
+
+    @override_settings(SUITE_RUN_CONCURRENCY=3)
+    def test_resume_fails_children_with_expired_slot(self):
+        # 三个子运行都已开始，第一个的worker退出后槽位租约过期，第二个的槽位已被其他运行占用
+        suite_runs.fill_run_slots()
+        long_ago = timezone.now() - timedelta(seconds=suite_runs.slot_ttl() + 60)
+        TestRun.objects.filter(pk__in=[self.runs[0].pk, self.runs[1].pk]).update(start_time=long_ago)
+        RunSlot.objects.filter(test_run_id=self.runs[0].pk).update(lease_expires_at=long_ago)
+        RunSlot.release(self.runs[1].pk)
+        # 第三个刚认领还未占用槽位，不算中断
+        RunSlot.release(self.runs[2].pk)
+
+        self.assertEqual(suite_runs.resume_suite_runs(), 0)
+        self.assertEqual(self.statuses(), ['failed', 'failed', 'running'])
+        self.assertIn('槽位租约已过期', TestRun.objects.get(pk=self.runs[0].pk).error_message)
+        self.assertFalse(RunSlot.objects.filter(test_run_id=self.runs[0].pk).exists())
+        self.assertEqual(TestSuiteRun.objects.get(pk=self.runs[0].suite_run_id).status, 'running')
+
+        # 最后一个子运行结束后批量运行汇总为失败
+        TestRun.objects.filter(pk=self.runs[2].pk).update(status='completed')
+        suite_runs.resume_suite_runs()
+        self.assertEqual(TestSuiteRun.objects.get(pk=self.runs[0].suite_run_id).status, 'failed')
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EXPORT_CHUNK_SIZE=2)
+class ExportApiTests(TestCase):
+    """测试结果按 NDJSON、CSV 和 JUnit XML 流式导出，分块读取时不丢行"""
+
+    def setUp(self):
+        self.user, self.project, environment = create_project()
+        test_case = create_case(self.project, self.user, name='登录', request_method='POST', request_url='/login')
+        self.test_run = TestRun.objects.create(name='运行', project=self.project, environment=environment,
+                                               created_by=self.user)
+        self.other_run = TestRun.objects.create(name='另一个运行', project=self.project, environment=environment,
+                                                created_by=self.user)
+        self.results = TestResult.objects.bulk_create_with_payload([
+            dict(test_run=self.test_run, test_case=test_case, environment=environment, status=status,
+                 response_time=250, error_message=error, response_body={'n': n})
+            for n, (status, error) in enumerate([('passed', ''), ('failed', '状态码不符\n期望200'),
+                                                 ('error', '连接超时\x0b'), ('skipped', '')])
+        ])
+        TestResult.objects.create(test_run=self.other_run, test_case=test_case, environment=environment,
+                                  status='passed')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def export(self, **params):
+        return self.client.get('/api/test-results/export/', params)
+
+    def content(self, response):
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson(self):
+        response = self.export(test_run=self.test_run.pk)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'],
+                         f'attachment; filename="test_results_run{self.test_run.pk}.ndjson"')
+        rows = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [result.pk for result in self.results])
+        self.assertEqual([row['status'] for row in rows], ['passed', 'failed', 'error', 'skipped'])
+        self.assertEqual((rows[0]['test_case'], rows[0]['request_method']), ('登录', 'POST'))
+        self.assertNotIn('response_body', rows[0])
+
+    def test_ndjson_with_payload(self):
+        rows = [json.loads(line) for line in self.content(self.export(test_run=self.test_run.pk, payload=1))
+                .splitlines()]
+        self.assertEqual([row['response_body'] for row in rows], [{'n': n} for n in range(4)])
+        self.assertEqual(rows[0]['test_run'], '运行')
+
+    def test_csv(self):
+        response = self.export(test_run=self.test_run.pk, file_format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        content = self.content(response)
+        self.assertTrue(content.startswith('\ufeffid,test_run_id,'))
+        rows = list(csv.DictReader(io.StringIO(content.lstrip('\ufeff'))))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[1]['error_message'], '状态码不符\n期望200')
+        self.assertEqual(rows[0]['created_at'], timezone.localtime(
+            TestResult.objects.get(pk=self.results[0].pk).created_at).isoformat())
+
+    def test_junit(self):
+        response = self.export(project=self.project.pk, file_format='junit')
+        self.assertEqual(response['Content-Disposition'],
+                         f'attachment; filename="test_results_project{self.project.pk}.xml"')
+        root = ElementTree.fromstring(self.content(response).encode('utf-8'))
+        self.assertEqual({name: root.get(name) for name in ('tests', 'failures', 'errors', 'skipped')},
+                         {'tests': '5', 'failures': '1', 'errors': '1', 'skipped': '1'})
+        suites = root.findall('testsuite')
+        self.assertEqual([suite.get('name') for suite in suites], ['运行', '另一个运行'])
+        self.assertEqual((suites[0].get('tests'), suites[0].get('time')), ('4', '1.000'))
+        cases = suites[0].findall('testcase')
+        self.assertEqual((cases[0].get('classname'), cases[0].get('time')), ('POST /login', '0.250'))
+        self.assertEqual(list(cases[0]), [])
+        self.assertEqual(cases[1].find('failure').get('message'), '状态码不符')
+        # XML 不允许的控制字符被去掉
+        self.assertEqual(cases[2].find('error').text, '连接超时')
+        self.assertIsNotNone(cases[3].find('skipped'))
+
+    def test_date_range(self):
+        TestResult.objects.filter(pk=self.results[0].pk).update(created_at=timezone.now() - timedelta(days=3))
+        today = timezone.localdate().isoformat()
+        rows = self.content(self.export(start=today, end=today)).splitlines()
+        self.assertEqual(len(rows), 4)
+        rows = self.content(self.export(project=self.project.pk, end=today)).splitlines()
+        self.assertEqual(len(rows), 5)
+
+    def test_invalid_filters(self):
+        for params in ({}, {'test_run': 'abc'}, {'start': '2026/01/01'},
+                       {'test_run': self.test_run.pk, 'file_format': 'xlsx'}):
+            response = self.export(**params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('error', response.data)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class IngestApiTests(TestCase):
+    """外部执行器以 NDJSON 批量提交测试结果"""
+
+    def setUp(self):
+        self.user, project, environment = create_project()
+        self.test_case = create_case(project, self.user)
+        self.test_run = TestRun.objects.create(name='外部', project=project, environment=environment,
+                                               status='pending', created_by=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, rows, key='', finish=False, compress=False):
+        body = ''.join(row if isinstance(row, str) else json.dumps(row) + '\n' for row in rows).encode('utf-8')
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        if compress:
+            body = gzip.compress(body)
+            headers['HTTP_CONTENT_ENCODING'] = 'gzip'
+        url = f'/api/test-runs/{self.test_run.pk}/ingest/' + ('?finish=1' if finish else '')
+        return self.client.post(url, data=body, content_type='application/x-ndjson', **headers)
+
+    def row(self, status='passed'):
+        return {'test_case_id': self.test_case.pk, 'status': status, 'response_time': 12}
+
+    def count(self):
+        return TestResult.objects.filter(test_run=self.test_run).count()
+
+    def test_idempotent_replay(self):
+        response = self.post([self.row(), self.row('failed')], key='batch-1', compress=True)
+        self.assertEqual((response.status_code, response.data['accepted']), (201, 2))
+        response = self.post([self.row(), self.row('failed')], key='batch-1', compress=True)
+        self.assertEqual((response.status_code, response.data['replayed'], response.data['accepted']),
+                         (200, True, 2))
+        self.assertEqual(self.count(), 2)
+
+    def test_one_bad_row_rejects_batch(self):
+        response = self.post([self.row(), self.row(), {'test_case_id': self.test_case.pk, 'status': 'unknown'}],
+                             key='batch-1')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('第3行', response.data['error'])
+        self.assertEqual(self.count(), 0)
+        # 被拒绝的批次不占用幂等键，修正后可以用同一个键重新提交
+        self.assertEqual(self.post([self.row()], key='batch-1').status_code, 201)
+
+    def test_conflict_after_finish(self):
+        response = self.post([self.row()], finish=True)
+        self.assertEqual((response.status_code, response.data['status']), (201, 'completed'))
+        self.assertEqual(self.post([self.row()]).status_code, 409)
+        self.assertEqual(self.count(), 1)
+
+    def test_size_limits(self):
+        with self.settings(INGEST_MAX_BYTES=1024):
+            response = self.post([self.row()] * 100, compress=True)
+        self.assertEqual(response.status_code, 413)
+        with self.settings(INGEST_MAX_LINE_BYTES=200):
+            response = self.post([self.row(), dict(self.row(), error_message='x' * 300)])
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('第2行', response.data['error'])
+        self.assertEqual(self.count(), 0)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class HeadlessRunnerTests(TransactionTestCase):
+    """命令行运行每条结果执行完即写入数据库，内存中只保留输出需要的字段；执行线程使用各自的数据库连接"""
+
+    def setUp(self):
+        self.user, project, self.environment = create_project()
+        self.cases = [create_case(project, self.user, name=f'用例{i}') for i in range(2)]
+        self.suites = []
+        for i in range(2):
+            suite = TestSuite.objects.create(name=f'套件{i}', project=project, created_by=self.user)
+            for order, test_case in enumerate(self.cases):
+                TestSuiteCase.objects.create(test_suite=suite, test_case=test_case, order=order)
+            self.suites.append(suite)
+
+    def run_suites(self, statuses, **kwargs):
+        saved = []
+        codes = iter(statuses)
+
+        def request(*args, **kwargs):
+            # 执行下一个用例时，前面的结果已经写入
+            saved.append(TestResult.objects.count())
+            return json_response({'ok': True}, status_code=next(codes))
+
+        runner = HeadlessRunner(self.environment, user=self.user, **kwargs)
+        with mock.patch('test_manager.httprunner_executor.requests.request', side_effect=request):
+            summary = runner.run_suites(self.suites)
+        return runner, summary, saved
+
+    def test_results_saved_as_they_arrive(self):
+        runner, summary, saved = self.run_suites([200, 500, 200, 200])
+
+        self.assertEqual(saved, [0, 1, 2, 3])
+        self.assertEqual(summary['counts'], {'passed': 3, 'failed': 1, 'error': 0, 'skipped': 0, 'total': 4})
+        self.assertEqual(set(runner.jobs[0].results[1]), {'test_case_id', 'status', 'response_time', 'error_message'})
+        runs = TestRun.objects.filter(suite_run_id=summary['suite_run']).order_by('id')
+        self.assertEqual([(run.status, run.test_results.count()) for run in runs], [('failed', 2), ('completed', 2)])
+        self.assertEqual(TestSuiteRun.objects.get(pk=summary['suite_run']).status, 'failed')
+        self.assertEqual(TestCaseDailyStats.objects.filter(test_case=self.cases[1]).get().failed_count, 1)
+
+        root = ElementTree.fromstring(''.join(runner.iter_junit()).encode('utf-8'))
+        self.assertEqual((root.get('tests'), root.get('failures')), ('4', '1'))
+        self.assertEqual([case.get('name') for case in root.iter('testcase')], ['用例0', '用例1'] * 2)
+
+    def test_fail_fast_keeps_saved_results(self):
+        runner, summary, saved = self.run_suites([200, 500], fail_fast=True)
+
+        self.assertEqual([job.status for job in runner.jobs], ['failed', 'skipped'])
+        run = TestRun.objects.get(pk=runner.jobs[0].test_run_id)
+        self.assertEqual((run.status, run.error_message, run.test_results.count()), ('failed', '', 2))
+        self.assertEqual(TestRun.objects.count(), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, AGENT_MAX_ATTEMPTS=3)
+class AgentLeaseApiTests(TestCase):
+    """两个执行代理通过接口领取同一任务：租约过期后重新领取，旧租约的提交被拒绝"""
+
+    def setUp(self):
+        self.user, project, environment = create_project()
+        environment.agent_label = 'lab'
+        environment.save()
+        test_case = create_case(project, self.user)
+        self.row = {'test_case_id': test_case.pk, 'status': 'passed', 'response_time': 5}
+        self.test_run = TestRun.objects.create(name='代理', project=project, environment=environment,
+                                               status='pending', created_by=self.user)
+        self.job = agents.enqueue_job(self.test_run, test_case.pk)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.first = self.register('agent-1')
+        self.second = self.register('agent-2')
+
+    def register(self, name):
+        response = self.client.post('/api/agents/', {'name': name, 'labels': ['lab'], 'capacity': 1}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def lease(self, agent_id):
+        return self.client.post(f'/api/agents/{agent_id}/lease/', {}, format='json').data['jobs']
+
+    def push(self, agent_id, attempt, key='1'):
+        body = gzip.compress((json.dumps(self.row) + '\n').encode('utf-8'))
+        return self.client.post(f'/api/agent-jobs/{self.job.pk}/results/?agent={agent_id}&attempt={attempt}',
+                                data=body, content_type='application/x-ndjson',
+                                HTTP_CONTENT_ENCODING='gzip', HTTP_IDEMPOTENCY_KEY=key)
+
+    def complete(self, agent_id, attempt):
+        return self.client.post(f'/api/agent-jobs/{self.job.pk}/complete/',
+                                {'agent': agent_id, 'attempt': attempt}, format='json')
+
+    def expire(self):
+        AgentJob.objects.filter(pk=self.job.pk).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_release_after_agent_loss(self):
+        [job] = self.lease(self.first)
+        self.assertEqual(job['attempt'], 1)
+        self.assertEqual(self.push(self.first, 1).status_code, 201)
+        # 租约有效期内其他代理领取不到
+        self.assertEqual(self.lease(self.second), [])
+
+        self.expire()
+        [job] = self.lease(self.second)
+        self.assertEqual(job['attempt'], 2)
+        # 失联代理提交的部分结果作废
+        self.assertEqual(TestResult.objects.filter(test_run=self.test_run).count(), 0)
+
+        # 旧租约的提交、心跳和结束都被拒绝
+        self.assertEqual(self.push(self.first, 1, key='2').status_code, 409)
+        heartbeat = self.client.post(f'/api/agents/{self.first}/heartbeat/', {'jobs': [self.job.pk]}, format='json')
+        self.assertEqual(heartbeat.data['cancelled'], [self.job.pk])
+        self.assertEqual(self.complete(self.first, 1).status_code, 409)
+
+        self.assertEqual(self.push(self.second, 2).status_code, 201)
+        self.assertEqual(self.complete(self.second, 2).status_code, 200)
+        self.test_run.refresh_from_db()
+        self.assertEqual(self.test_run.status, 'completed')
+        self.assertEqual(TestResult.objects.filter(test_run=self.test_run).count(), 1)
+
+    def test_heartbeat_renews_lease(self):
+        self.lease(self.first)
+        AgentJob.objects.filter(pk=self.job.pk).update(lease_expires_at=timezone.now() + timedelta(seconds=1))
+        heartbeat = self.client.post(f'/api/agents/{self.first}/heartbeat/', {'jobs': [self.job.pk]}, format='json')
+        self.assertEqual(heartbeat.data['cancelled'], [])
+        self.assertGreater(AgentJob.objects.get(pk=self.job.pk).lease_expires_at,
+                           timezone.now() + timedelta(seconds=30))
+        self.assertEqual(self.lease(self.second), [])
+
+    def test_attempt_cap_on_lease(self):
+        for attempt, agent_id in enumerate((self.first, self.second, self.first), 1):
+            [job] = self.lease(agent_id)
+            self.assertEqual(job['attempt'], attempt)
+            self.expire()
+        self.assertEqual(self.lease(self.second), [])
+        self.test_run.refresh_from_db()
+        self.assertEqual(self.test_run.status, 'failed')
+        self.assertEqual(AgentJob.objects.get(pk=self.job.pk).status, 'finished')
+
+    def test_attempt_cap_on_expiry(self):
+        self.lease(self.first)
+        self.expire()
+        self.assertEqual(agents.expire_leases(), (1, 0))
+        self.assertEqual(AgentJob.objects.get(pk=self.job.pk).status, 'queued')
+
+        with self.settings(AGENT_MAX_ATTEMPTS=2):
+            self.lease(self.second)
+            self.expire()
+            self.assertEqual(agents.expire_leases(), (0, 1))
+        self.test_run.refresh_from_db()
+        self.assertEqual(self.test_run.status, 'failed')
+
+
+class ThrottleTests(TestCase):
+    """环境的令牌桶和并发名额"""
+
+    def setUp(self):
+        user, project, self.environment = create_project()
+        self.backend = throttle.LocalBackend()
+        throttle.set_backend(self.backend)
+        self.addCleanup(throttle.set_backend, None)
+        self.now = 1000.0
+        clock = mock.patch('test_manager.throttle.time.monotonic', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def limit(self, rate=0, burst=0, max_in_flight=0):
+        self.environment.rate_limit = rate
+        self.environment.rate_burst = burst
+        self.environment.max_in_flight = max_in_flight
+        self.environment.save()
+
+    def test_local_take(self):
+        self.assertEqual(self.backend.take(1, 10, 3, count=5), (3, 0))
+        granted, wait_ms = self.backend.take(1, 10, 3)
+        self.assertEqual(granted, 0)
+        self.assertAlmostEqual(wait_ms, 100, delta=2)
+        self.now += 0.1
+        self.assertEqual(self.backend.take(1, 10, 3), (1, 0))
+        # 令牌补充不超过桶容量
+        self.now += 60
+        self.assertEqual(self.backend.take(1, 10, 3, count=10), (3, 0))
+
+    def test_local_hold(self):
+        self.assertTrue(self.backend.hold(1, 2, 'a', ttl=10))
+        self.assertTrue(self.backend.hold(1, 2, 'b', ttl=10))
+        self.assertFalse(self.backend.hold(1, 2, 'c', ttl=10))
+        # 已占用者续期成功
+        self.assertTrue(self.backend.hold(1, 2, 'a', ttl=10))
+        self.backend.release(1, 'a')
+        self.assertTrue(self.backend.hold(1, 2, 'c', ttl=10))
+        # 过期未续期的名额自动释放
+        self.now += 11
+        self.assertTrue(self.backend.hold(1, 2, 'd', ttl=10))
+        self.assertEqual(set(self.backend.slots[1]), {'d'})
+
+    def test_throttled_waits_and_releases(self):
+        self.limit(max_in_flight=1)
+        self.backend.hold(self.environment.id, 1, 'other', ttl=10)
+
+        def sleep(seconds):
+            self.now += seconds
+            if self.now >= 1000.2:
+                self.backend.release(self.environment.id, 'other')
+
+        with mock.patch('test_manager.throttle.time.sleep', side_effect=sleep):
+            with throttle.throttled(self.environment) as permit:
+                self.assertEqual(len(self.backend.slots[self.environment.id]), 1)
+        self.assertAlmostEqual(permit.wait_ms, 200, delta=60)
+        self.assertEqual(self.backend.slots[self.environment.id], {})
+
+    @override_settings(THROTTLE_MAX_WAIT=0.5)
+    def test_throttled_timeout(self):
+        def sleep(seconds):
+            self.now += seconds
+
+        self.limit(max_in_flight=1)
+        self.backend.hold(self.environment.id, 1, 'other', ttl=60)
+        with mock.patch('test_manager.throttle.time.sleep', side_effect=sleep):
+            with self.assertRaises(throttle.ThrottleTimeout):
+                with throttle.throttled(self.environment):
+                    pass
+        # 超时不影响其他占用者的名额
+        self.assertEqual(set(self.backend.slots[self.environment.id]), {'other'})
+
+        # 每秒1个请求，下一个令牌要等1秒，超过最长等待时间
+        self.limit(rate=1, burst=1)
+        self.backend.take(self.environment.id, 1, 1)
+        with mock.patch('test_manager.throttle.time.sleep', side_effect=sleep):
+            with self.assertRaises(throttle.ThrottleTimeout):
+                with throttle.throttled(self.environment):
+                    pass
+
+    def test_grant_tokens_capped_at_burst(self):
+        self.assertEqual(agents.grant_tokens(self.environment, 7), (7, 0))
+        self.limit(rate=5, burst=2)
+        self.assertEqual(agents.grant_tokens(self.environment, 10), (2, 0))
+        granted, wait_ms = agents.grant_tokens(self.environment, 10)
+        self.assertEqual(granted, 0)
+        self.assertGreater(wait_ms, 0)
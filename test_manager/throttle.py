@@ -0,0 +1,229 @@
+import time
+import uuid
+import logging
+import threading
+from contextlib import contextmanager
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'easytesting:throttle'
+
+# 等待并发名额时查询的间隔(秒)
+SLOT_POLL_INTERVAL = 0.05
+
+# 令牌桶：按Redis服务器时间补充令牌，取最多 count 个，返回 {取得数, 令牌不足时还需等待的毫秒数}
+TAKE_TOKENS = """
+if redis.replicate_commands then redis.replicate_commands() end
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local count = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + tonumber(clock[2]) / 1000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+local granted = math.min(count, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+local wait = 0
+if granted == 0 then
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+return {granted, wait}
+"""
+
+# 并发名额：有序集合的成员为占用者，分数为过期时间；先清理过期的占用，已占用或未满时占用(续期)成功
+HOLD_SLOT = """
+if redis.replicate_commands then redis.replicate_commands() end
+local limit = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) * 1000 + math.floor(tonumber(clock[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZSCORE', KEYS[1], ARGV[2]) or redis.call('ZCARD', KEYS[1]) < limit then
+    redis.call('ZADD', KEYS[1], now + ttl, ARGV[2])
+    if redis.call('PTTL', KEYS[1]) < ttl then
+        redis.call('PEXPIRE', KEYS[1], ttl)
+    end
+    return 1
+end
+return 0
+"""
+
+
+class ThrottleTimeout(Exception):
+    """等待环境的限流或并发上限超过 THROTTLE_MAX_WAIT"""
+
+
+def max_wait():
+    return getattr(settings, 'THROTTLE_MAX_WAIT', 300)
+
+
+def slot_ttl():
+    return getattr(settings, 'THROTTLE_SLOT_TTL', 120)
+
+
+def limits(environment):
+    """
+    环境的 (每秒请求数, 令牌桶容量, 并发请求数上限)，0为不限制
+
+    执行代理用接口返回的数据构造的环境同样适用，缺少的字段视为不限制
+    """
+    rate = getattr(environment, 'rate_limit', 0) or 0
+    burst = getattr(environment, 'rate_burst', 0) or rate
+    return rate, burst, getattr(environment, 'max_in_flight', 0) or 0
+
+
+class RedisBackend:
+    """Redis中的共享计数器，所有线程、worker和平台共用；令牌桶和并发名额都在Lua脚本中原子更新"""
+
+    def __init__(self, url):
+        self.client = redis.Redis.from_url(url, socket_connect_timeout=1, socket_timeout=2)
+        self._take = self.client.register_script(TAKE_TOKENS)
+        self._hold = self.client.register_script(HOLD_SLOT)
+
+    def take(self, environment_id, rate, burst, count=1):
+        granted, wait_ms = self._take(keys=[f'{KEY_PREFIX}:{environment_id}:bucket'], args=[rate, burst, count])
+        return int(granted), int(wait_ms)
+
+    def hold(self, environment_id, max_in_flight, member, ttl):
+        return bool(self._hold(keys=[f'{KEY_PREFIX}:{environment_id}:slots'],
+                               args=[max_in_flight, member, int(ttl * 1000)]))
+
+    def release(self, environment_id, member):
+        self.client.zrem(f'{KEY_PREFIX}:{environment_id}:slots', member)
+
+
+class LocalBackend:
+    """进程内的计数器，Redis不可用时临时使用，只能限制当前进程内的线程"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}  # 环境ID -> (令牌数, 更新时间)
+        self.slots = {}  # 环境ID -> {占用者: 过期时间}
+
+    def take(self, environment_id, rate, burst, count=1):
+        now = time.monotonic()
+        with self.lock:
+            tokens, ts = self.buckets.get(environment_id, (burst, now))
+            tokens = min(burst, tokens + (now - ts) * rate)
+            granted = min(count, int(tokens))
+            tokens -= granted
+            self.buckets[environment_id] = (tokens, now)
+        return granted, 0 if granted else int((1 - tokens) * 1000 / rate) + 1
+
+    def hold(self, environment_id, max_in_flight, member, ttl):
+        now = time.monotonic()
+        with self.lock:
+            slots = self.slots.setdefault(environment_id, {})
+            for expired in [key for key, expires_at in slots.items() if expires_at <= now]:
+                del slots[expired]
+            if member in slots or len(slots) < max_in_flight:
+                slots[member] = now + ttl
+                return True
+        return False
+
+    def release(self, environment_id, member):
+        with self.lock:
+            self.slots.get(environment_id, {}).pop(member, None)
+
+
+_local = LocalBackend()
+_redis = None
+_redis_retry_at = 0
+_override = None
+
+
+def set_backend(backend):
+    """替换计数器，执行代理改用向平台申请令牌的计数器；传入None恢复默认"""
+    global _override
+    _override = backend
+
+
+def _call(name, *args):
+    """
+    调用计数器，默认使用 THROTTLE_REDIS_URL 的共享计数器
+
+    Redis连接失败时30秒内改用进程内计数，限制只在当前进程内生效
+    """
+    global _redis, _redis_retry_at
+    if _override is not None:
+        return getattr(_override, name)(*args)
+    url = getattr(settings, 'THROTTLE_REDIS_URL', None)
+    if url and time.monotonic() >= _redis_retry_at:
+        try:
+            if _redis is None:
+                _redis = RedisBackend(url)
+            return getattr(_redis, name)(*args)
+        except redis.RedisError as e:
+            _redis_retry_at = time.monotonic() + 30
+            logger.warning(f"限流计数器连接Redis失败，30秒内改用进程内计数: {e}")
+    return getattr(_local, name)(*args)
+
+
+def take_tokens(environment_id, rate, burst, count=1):
+    """从环境的令牌桶中取最多 count 个令牌，返回 (取得数, 令牌不足时还需等待的毫秒数)"""
+    return _call('take', environment_id, rate, burst, count)
+
+
+def hold_slot(environment_id, max_in_flight, member, ttl):
+    """占用或续期环境的一个并发名额，ttl 秒后未续期自动释放，返回是否成功"""
+    return _call('hold', environment_id, max_in_flight, member, ttl)
+
+
+def release_slot(environment_id, member):
+    _call('release', environment_id, member)
+
+
+def _wait(deadline, seconds):
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise ThrottleTimeout(f"等待环境限流超过 {max_wait()} 秒")
+    time.sleep(min(seconds, remaining))
+
+
+class Permit:
+    """一次请求的限流许可，wait_ms 为发送前等待的时间(毫秒)"""
+
+    def __init__(self):
+        self.wait_ms = 0.0
+
+
+@contextmanager
+def throttled(environment):
+    """
+    在环境的每秒请求数和并发请求数上限内发送一个请求
+
+    先占用并发名额再取令牌，请求结束后归还名额；等待超过 THROTTLE_MAX_WAIT 秒抛出 ThrottleTimeout
+    """
+    permit = Permit()
+    rate, burst, max_in_flight = limits(environment)
+    if not rate and not max_in_flight:
+        yield permit
+        return
+
+    started = time.monotonic()
+    deadline = started + max_wait()
+    member = uuid.uuid4().hex
+    held = False
+    try:
+        if max_in_flight:
+            while not hold_slot(environment.id, max_in_flight, member, slot_ttl()):
+                _wait(deadline, SLOT_POLL_INTERVAL)
+            held = True
+        if rate:
+            while True:
+                granted, wait_ms = take_tokens(environment.id, rate, burst)
+                if granted:
+                    break
+                _wait(deadline, wait_ms / 1000)
+        permit.wait_ms = (time.monotonic() - started) * 1000
+        yield permit
+    finally:
+        if held:
+            release_slot(environment.id, member)
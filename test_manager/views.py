@@ -1,19 +1,27 @@
 import datetime
 import json
 import ast
+import logging
 import traceback
-import pytz
 from datetime import timedelta
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
-from django.http import JsonResponse, HttpResponse
+from django.db.models import Q, Count
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404
+from django.template.loader import render_to_string
 from django.utils import timezone
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.views.decorators.http import require_POST,require_GET
 
-from .async_executor import execute_test_suite_async, execute_test_case_async
+from .async_executor import execute_test_suite_async, execute_test_case_async, execute_test_group_async
+from .dashboard import get_dashboard_stats
+from .exports import EXPORT_FORMATS, export_filename, export_response, filter_results
+from .pagination import keyset_paginate
+from .reports import dispatch_report_generation
+from .suite_runs import concurrency_limit, get_suite_run_status, launch_suite_run
+from .rollups import get_test_case_trend
 from .gen_data import auto_gen_data
+from .group_trees import get_case_tree, get_case_trees, get_suite_tree, get_suite_trees, iter_groups
 from .models import (
     Project, Environment, TestCase, TestSuite,
     TestSuiteCase, TestRun, TestResult, EmailConfig, TestSuiteGroup, TestCaseGroup, TestReport, TestSuiteRun, MockData,
@@ -22,12 +30,15 @@ from .models import (
 from .forms import (
     ProjectForm, EnvironmentForm, TestCaseForm, TestSuiteForm,
     TestRunForm, EmailConfigForm, TestEmailForm, TestSuiteGroupForm, TestCaseGroupForm, GenerateReportForm,
-    MockDataForm, ScheduledTaskForm
+    MockDataForm, ScheduledTaskForm, SuiteRunForm
 )
 from .httprunner_executor import execute_test_case, execute_test_suite
 from .scheduler import TaskScheduler
 from .tasks import execute_scheduled_test_suite
 
+logger = logging.getLogger(__name__)
+
+
 def paginate_queryset(request, queryset, per_page=10):
     page = request.GET.get('page', 1)
     paginator = Paginator(queryset, per_page)
@@ -44,161 +55,30 @@ def paginate_queryset(request, queryset, per_page=10):
 
 @login_required
 def dashboard(request):
-    # 统计数量
-    projects_count = Project.objects.count()
-    test_cases_count = TestCase.objects.count()
-    test_suites_count = TestSuite.objects.count()
-    test_runs_count = TestRun.objects.count()
-    report_count = TestReport.objects.count()
+    # 统计数据在数据库中聚合并缓存，测试运行结束时失效
+    stats = get_dashboard_stats()
 
     # 最近测试记录
-    all_test_runs = TestRun.objects.order_by('-created_at')
+    all_test_runs = TestRun.objects.select_related('project', 'environment').order_by('-created_at')
     recent_test_runs = paginate_queryset(request, all_test_runs, 5)
 
-    tz = pytz.timezone(settings.TIME_ZONE)
-
-    # 获取时间序列数据
-    daily_data = generate_time_series_data(mode='daily', tz=tz)
-    monthly_data = generate_time_series_data(mode='monthly', tz=tz)
-    yearly_data = generate_time_series_data(mode='yearly', tz=tz)
-
-    # 测试运行状态统计
-    test_run_stats = {
-        'total': test_runs_count,
-        'passed': TestRun.objects.filter(status='completed').count(),
-        'failed': TestRun.objects.filter(status='failed').count(),
-        'pending': TestRun.objects.filter(status='pending').count(),
-        'running': TestRun.objects.filter(status='running').count(),
-    }
-
-    # 测试结果状态统计
-    test_result_stats = {
-        'total': TestResult.objects.count(),
-        'passed': TestResult.objects.filter(status='passed').count(),
-        'failed': TestResult.objects.filter(status='failed').count(),
-        'error': TestResult.objects.filter(status='error').count(),
-        'skipped': TestResult.objects.filter(status='skipped').count(),
-    }
-
-    # 最近活动列表
-    recent_activities = []
-    activities = TestRun.objects.all().order_by('-created_at')
-    for activity in activities:
-        action = activity.name.split(': ')[0]
-        timestamp = activity.created_at
-        description = f"{activity.name} 执行结果为： {activity.status}"
-        recent_activities.append({
-            'action': action,
-            'timestamp': timestamp,
-            'description': description
-        })
-
     context = {
-        'projects_count': projects_count,
-        'test_cases_count': test_cases_count,
-        'test_suites_count': test_suites_count,
-        'test_runs_count': test_runs_count,
-        'report_count': report_count,
+        'projects_count': stats['projects_count'],
+        'test_cases_count': stats['test_cases_count'],
+        'test_suites_count': stats['test_suites_count'],
+        'test_runs_count': stats['test_runs_count'],
+        'report_count': stats['report_count'],
         'recent_test_runs': recent_test_runs,
-        'test_run_stats': test_run_stats,
-        'test_result_stats': test_result_stats,
-        'recent_activities': recent_activities,
-        'daily_data_json': json.dumps(daily_data),
-        'monthly_data_json': json.dumps(monthly_data),
-        'yearly_data_json': json.dumps(yearly_data),
+        'test_run_stats': stats['test_run_stats'],
+        'test_result_stats': stats['test_result_stats'],
+        'recent_activities': stats['recent_activities'],
+        'daily_data_json': json.dumps(stats['daily_data']),
+        'monthly_data_json': json.dumps(stats['monthly_data']),
+        'yearly_data_json': json.dumps(stats['yearly_data']),
     }
 
     return render(request, 'test_manager/dashboard.html', context)
 
-def generate_time_series_data(mode, tz):
-    now = timezone.now().astimezone(tz)
-
-
-    if mode == 'daily':
-        count = 7
-        start_date = now - timedelta(days=count - 1)
-        end_date = now
-        period = 'day'
-
-    elif mode == 'monthly':
-        start_date = now.replace(month=1, day=1)
-        end_date = now.replace(month=12, day=31)
-        count = 12
-        period = 'month'
-
-    elif mode == 'yearly':
-        current_year = now.year
-        start_date = now.replace(year=current_year - 4, month=1, day=1)
-        end_date = now.replace(month=12, day=31)
-        count = 5
-        period = 'year'
-
-    else:
-        raise ValueError("Invalid mode")
-
-    labels = generate_date_labels(start_date, period, count)
-    data = {
-        'projects': get_model_timeseries(Project, start_date, count, period, tz),
-        'test_cases': get_model_timeseries(TestCase, start_date, count, period, tz),
-        'test_suites': get_model_timeseries(TestSuite, start_date, count, period, tz),
-        'test_runs': get_model_timeseries(TestRun, start_date, count, period, tz),
-        'test_reports': get_model_timeseries(TestReport, start_date, count, period, tz),
-    }
-    return {'labels': labels, 'datasets': data}
-
-
-def generate_date_labels(start_date, period, count):
-    labels = []
-    current = start_date
-
-    if period == 'day':
-        for _ in range(count):
-            labels.append(current.strftime('%b %d').lstrip('0').replace(' 0', ' '))
-            current += timedelta(days=1)
-
-    elif period == 'month':
-        for i in range(count):
-            labels.append(f'{i+1}月')
-
-    elif period == 'year':
-        for i in range(count):
-            labels.append(str(start_date.year + i))
-
-    return labels
-
-
-def get_model_timeseries(model, start_date, count, period, tz):
-    now = timezone.now().astimezone(tz)
-    end_date = now
-
-    utc_start = start_date.astimezone(pytz.utc)
-    utc_end = end_date.astimezone(pytz.utc)
-
-    results = (
-        model.objects
-        .filter(created_at__range=(utc_start, utc_end))
-        .values_list('created_at', flat=True)
-    )
-
-    counts = [0] * count
-
-    for dt in results:
-        local_dt = dt.astimezone(tz)
-
-        if period == 'day':
-            diff = (local_dt.date() - start_date.date()).days
-        elif period == 'month':
-            diff = local_dt.month - 1
-        elif period == 'year':
-            diff = local_dt.year - start_date.year
-        else:
-            continue
-
-        if 0 <= diff < count:
-            counts[diff] += 1
-
-    return counts
-
 
 # Project views
 @login_required
@@ -419,6 +299,7 @@ def environment_delete(request, pk):
 def test_case_list(request):
     project_id = request.GET.get('project')
     group_id = request.GET.get('group')
+    include_subgroups = request.GET.get('subgroups') == '1'
     search_query = request.GET.get('search', '')
 
     # 获取每页显示的记录数
@@ -434,16 +315,23 @@ def test_case_list(request):
         # 构建查询条件
         query = Q(project=project)
 
-        # 如果指定了分组，则只显示该分组下的测试用例
+        # 如果指定了分组，则只显示该分组下的测试用例，include_subgroups 时包含所有子分组
+        group_ancestors = []
         if group_id:
             group = get_object_or_404(TestCaseGroup, pk=group_id)
-            query &= Q(group=group)
+            if include_subgroups:
+                query &= group.subtree_q('group__path')
+            else:
+                query &= Q(group=group)
+            group_ancestors = group.get_ancestors()
 
             # 获取当前分组的所有子分组
             child_groups = TestCaseGroup.objects.filter(project=project, parent=group)
         else:
             # 获取项目的所有顶级分组
             child_groups = TestCaseGroup.objects.filter(project=project, parent=None)
+        child_groups = child_groups.annotate(
+            item_count=Count('test_cases', distinct=True), child_count=Count('children', distinct=True))
 
         # 如果有搜索查询，添加搜索条件
         if search_query:
@@ -451,13 +339,15 @@ def test_case_list(request):
                       Q(description__icontains=search_query) |
                       Q(request_url__icontains=search_query))
 
-        all_test_cases = TestCase.objects.filter(query).order_by('-created_at')
+        all_test_cases = TestCase.objects.filter(query).select_related('project', 'group').order_by('-created_at')
         test_cases = paginate_queryset(request, all_test_cases, per_page)
 
         context = {
             'test_cases': test_cases,
             'project': project,
             'current_group': group if group_id else None,
+            'group_ancestors': group_ancestors,
+            'include_subgroups': include_subgroups,
             'child_groups': child_groups,
             'per_page': per_page,
             'total_count': all_test_cases.count(),
@@ -518,15 +408,17 @@ def test_case_detail(request, pk):
     except ValueError:
         per_page = 10
 
-    # 分页获取测试结果
-    all_test_results = TestResult.objects.filter(test_case=test_case).order_by('-created_at')
-    test_results = paginate_queryset(request, all_test_results, per_page)
+    # 按 (created_at, id) 游标分页获取测试结果，总数为估算值
+    all_test_results = TestResult.objects.filter(test_case=test_case).select_related('test_run__environment')
+    test_results = keyset_paginate(request, all_test_results, per_page)
 
     context = {
         'test_case': test_case,
         'test_results': test_results,
         'per_page': per_page,
-        'total_results': all_test_results.count()
+        'total_results': test_results.estimated_count,
+        # 近期每日趋势读取汇总表
+        'daily_stats': get_test_case_trend(test_case),
     }
 
     return render(request, 'test_manager/test_case_detail.html', context)
@@ -589,11 +481,65 @@ def test_case_run(request, pk):
     return render(request, 'test_manager/test_case_run.html', {'test_case': test_case, 'environments': environments})
 
 
+@login_required
+def test_case_group_run(request, pk):
+    """
+    运行分组及其所有子分组下的测试用例
+    """
+    group = get_object_or_404(TestCaseGroup.objects.select_related('project'), pk=pk)
+    test_cases = group.get_test_cases().order_by('group__path', 'id')
+
+    if request.method == 'POST':
+        environment_id = request.POST.get('environment')
+        if not environment_id:
+            messages.error(request, '请先选择环境')
+            return redirect('test_case_group_run', pk=group.pk)
+        if not test_cases.exists():
+            messages.warning(request, '该分组下没有测试用例')
+            return redirect(f"{reverse('test_case_list')}?project={group.project_id}&group={group.pk}")
+
+        environment = get_object_or_404(Environment, pk=environment_id)
+
+        # 创建测试运行记录
+        test_run = TestRun.objects.create(
+            name=f"Group run: {group.name}",
+            project=group.project,
+            environment=environment,
+            status='running',
+            start_time=timezone.now(),
+            created_by=request.user
+        )
+
+        # 异步执行分组下的测试用例
+        execute_test_group_async(
+            test_cases=test_cases,
+            environment=environment,
+            test_run=test_run,
+            user=request.user,
+            execute_test_case_func=execute_test_case
+        )
+
+        messages.success(
+            request,
+            f'分组测试用例已开始执行。您可以在测试运行详情页中查看结果'
+        )
+        return redirect('test_run_detail', pk=test_run.pk)
+
+    environments = Environment.objects.filter(project=group.project)
+    return render(request, 'test_manager/test_case_group_run.html', {
+        'group': group,
+        'group_ancestors': group.get_ancestors(),
+        'test_cases': test_cases.select_related('group'),
+        'environments': environments,
+    })
+
+
 # Test Suite views
 @login_required
 def test_suite_list(request):
     project_id = request.GET.get('project')
     group_id = request.GET.get('group')
+    include_subgroups = request.GET.get('subgroups') == '1'
     search_query = request.GET.get('search', '')
 
     # 获取每页显示的记录数
@@ -611,16 +557,23 @@ def test_suite_list(request):
         # 添加项目条件
         query &= Q(project=project)
 
-        # 如果指定了分组，则只显示该分组下的测试套件
+        # 如果指定了分组，则只显示该分组下的测试套件，include_subgroups 时包含所有子分组
+        group_ancestors = []
         if group_id:
             group = get_object_or_404(TestSuiteGroup, pk=group_id)
-            query &= Q(group=group)
+            if include_subgroups:
+                query &= group.subtree_q('group__path')
+            else:
+                query &= Q(group=group)
+            group_ancestors = group.get_ancestors()
 
             # 获取当前分组的所有子分组
             child_groups = TestSuiteGroup.objects.filter(project=project, parent=group)
         else:
             # 获取项目的所有顶级分组
             child_groups = TestSuiteGroup.objects.filter(project=project, parent=None)
+        child_groups = child_groups.annotate(
+            item_count=Count('test_suites', distinct=True), child_count=Count('children', distinct=True))
 
         # 如果有搜索查询，添加搜索条件
         if search_query:
@@ -628,13 +581,15 @@ def test_suite_list(request):
                       Q(description__icontains=search_query))
 
         # 应用查询条件
-        all_test_suites = TestSuite.objects.filter(query).order_by('-created_at')
+        all_test_suites = TestSuite.objects.filter(query).select_related('project', 'group').order_by('-created_at')
         test_suites = paginate_queryset(request, all_test_suites, per_page)
 
         context = {
             'test_suites': test_suites,
             'project': project,
             'current_group': group if group_id else None,
+            'group_ancestors': group_ancestors,
+            'include_subgroups': include_subgroups,
             'child_groups': child_groups,
             'per_page': per_page,
             'total_count': all_test_suites.count(),
@@ -701,21 +656,18 @@ def test_suite_detail(request, pk):
     # 获取项目中的所有测试用例，而不仅仅是未添加到套件的测试用例
     project_test_cases = TestCase.objects.filter(project=test_suite.project)
 
-    # 获取项目中的所有测试用例分组
-    test_case_groups = TestCaseGroup.objects.filter(project=test_suite.project)
-
-    # 获取每个分组下的测试用例
+    # 分组和用例从缓存的分组树读取
+    case_tree = get_case_tree(test_suite.project_id)
     grouped_test_cases = {}
-    for group in test_case_groups:
-        group_test_cases = TestCase.objects.filter(project=test_suite.project, group=group)
-        if group_test_cases.exists():
-            grouped_test_cases[group.id] = {
+    for group in iter_groups(case_tree['groups']):
+        if group['test_cases']:
+            grouped_test_cases[group['id']] = {
                 'group': group,
-                'test_cases': group_test_cases
+                'test_cases': group['test_cases']
             }
 
     # 获取未分组的测试用例
-    ungrouped_test_cases = TestCase.objects.filter(project=test_suite.project, group__isnull=True)
+    ungrouped_test_cases = case_tree['ungrouped']
 
     # 获取已添加到测试套件的测试用例ID列表
     added_test_case_ids = TestSuiteCase.objects.filter(test_suite=test_suite).values_list('test_case_id', flat=True)
@@ -827,25 +779,16 @@ def test_run_list(request):
     except ValueError:
         per_page = 10
 
+    # 按 (created_at, id) 游标分页，深页不再产生 OFFSET 扫描，总数为估算值
+    all_test_runs = TestRun.objects.select_related('project', 'environment', 'created_by')
+    context = {'per_page': per_page}
     if project_id:
-        all_test_runs = TestRun.objects.filter(project_id=project_id).order_by('-created_at')
-        project = get_object_or_404(Project, pk=project_id)
-        test_runs = paginate_queryset(request, all_test_runs, per_page)
-        context = {
-            'test_runs': test_runs,
-            'project': project,
-            'per_page': per_page,
-            'total_count': all_test_runs.count()
+        context['project'] = get_object_or_404(Project, pk=project_id)
+        all_test_runs = all_test_runs.filter(project_id=project_id)
 
-        }
-    else:
-        all_test_runs = TestRun.objects.all().order_by('-created_at')
-        test_runs = paginate_queryset(request, all_test_runs, per_page)
-        context = {
-            'test_runs': test_runs,
-            'per_page': per_page,
-            'total_count': all_test_runs.count()
-        }
+    test_runs = keyset_paginate(request, all_test_runs, per_page)
+    context['test_runs'] = test_runs
+    context['total_count'] = test_runs.estimated_count
 
     return render(request, 'test_manager/test_run_list.html', context)
 
@@ -862,12 +805,12 @@ def test_run_detail(request, pk):
     except ValueError:
         per_page = 10
 
-    # 分页获取测试结果
+    # 分页获取测试结果，只有当前页的结果读取请求和响应载荷
     if status:
         all_test_results = TestResult.objects.filter(test_run=test_run, status=status)
     else:
         all_test_results = TestResult.objects.filter(test_run=test_run)
-    test_results = paginate_queryset(request, all_test_results, per_page)
+    test_results = paginate_queryset(request, all_test_results.with_payload().select_related('test_case'), per_page)
 
     # Calculate statistics
     total_tests = all_test_results.count()
@@ -901,6 +844,98 @@ def test_run_delete(request, pk):
     return render(request, 'test_manager/test_run_confirm_delete.html', {'test_run': test_run})
 
 
+
+@login_required
+@require_GET
+def test_result_export(request):
+    """
+    流式导出测试结果，可按运行、项目和日期范围过滤
+
+    ?file_format=ndjson|csv|junit，NDJSON 加 ?payload=1 时附带请求和响应内容
+    """
+    export_format = request.GET.get('file_format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return HttpResponse(f"不支持的导出格式: {export_format}", status=400)
+
+    filters = {name: request.GET.get(name) for name in ('test_run', 'project', 'start', 'end')}
+    try:
+        results = filter_results(**filters)
+    except ValueError as e:
+        return HttpResponse(str(e), status=400)
+
+    logger.info(f"导出测试结果: {filters}, 格式: {export_format}, 用户: {request.user.username}")
+    return export_response(results, export_format, export_filename(**filters),
+                           include_payload=request.GET.get('payload') == '1')
+
+# 批量运行
+@login_required
+def test_suite_run_list(request):
+    project_id = request.GET.get('project')
+
+    all_suite_runs = TestSuiteRun.objects.select_related('project', 'environment', 'created_by').order_by('-created_at')
+    context = {}
+    if project_id:
+        context['project'] = get_object_or_404(Project, pk=project_id)
+        all_suite_runs = all_suite_runs.filter(project_id=project_id)
+
+    context['suite_runs'] = paginate_queryset(request, all_suite_runs, 10)
+    return render(request, 'test_manager/test_suite_run_list.html', context)
+
+
+@login_required
+def test_suite_run_create(request):
+    """批量运行多个测试套件，或某个套件分组、某个项目下的全部套件"""
+    project = get_object_or_404(Project, pk=request.GET.get('project') or request.POST.get('project'))
+
+    if request.method == 'POST':
+        form = SuiteRunForm(request.POST, project=project)
+        if form.is_valid():
+            suite_run = launch_suite_run(
+                name=form.cleaned_data['name'],
+                project=project,
+                environment=form.cleaned_data['environment'],
+                test_suites=form.cleaned_data['suites'],
+                user=request.user,
+            )
+            messages.success(request, f'批量运行已开始，共 {suite_run.total_count} 个测试套件')
+            return redirect('test_suite_run_detail', pk=suite_run.pk)
+    else:
+        initial = {'name': f"{project.name} 批量运行 {timezone.localtime().strftime('%Y-%m-%d %H:%M')}"}
+        if request.GET.get('group'):
+            initial.update(scope='group', group=request.GET.get('group'))
+        form = SuiteRunForm(initial=initial, project=project)
+
+    return render(request, 'test_manager/test_suite_run_form.html', {
+        'form': form,
+        'project': project,
+        'concurrency': concurrency_limit(),
+    })
+
+
+@login_required
+def test_suite_run_detail(request, pk):
+    suite_run = get_object_or_404(TestSuiteRun.objects.select_related('project', 'environment'), pk=pk)
+    test_runs = suite_run.test_runs.select_related('test_suite').order_by('id')
+
+    return render(request, 'test_manager/test_suite_run_detail.html', {
+        'suite_run': suite_run,
+        'test_runs': test_runs,
+        'run_status': get_suite_run_status(suite_run.pk),
+    })
+
+
+@login_required
+@require_GET
+def test_suite_run_status(request, pk):
+    """批量运行的汇总进度和各子运行的状态，供详情页轮询"""
+    run_status = get_suite_run_status(pk)
+    if run_status is None:
+        raise Http404
+    run_status['test_runs'] = list(TestRun.objects.filter(suite_run_id=pk).order_by('id').values(
+        'id', 'status', 'start_time', 'end_time'))
+    return JsonResponse(run_status)
+
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, user_passes_test
@@ -1021,7 +1056,6 @@ def email_config_activate(request, pk):
     if success:
         config.is_active = True
         config.save()  # save 方法会自动将其他配置设置为非激活
-        EmailConfig.apply_active_config()  # 应用配置到 Django 设置
         messages.success(request, f"邮件配置 '{config.name}' 已激活: {message}")
     else:
         messages.error(request, f"无法激活邮件配置: {message}")
@@ -1037,18 +1071,19 @@ def test_case_group_list(request):
     if project_id:
         project = get_object_or_404(Project, pk=project_id)
         # 获取顶级分组
-        root_groups = TestCaseGroup.objects.filter(project=project, parent=None).order_by('name')
+        root_groups = get_case_tree(project.id)['groups']
         context = {
             'project': project,
             'root_groups': root_groups,
         }
     else:
-        # 获取所有项目的顶级分组
+        # 获取所有项目的顶级分组，所有项目的分组树一起读取
         projects = Project.objects.all()
+        trees = get_case_trees([project.id for project in projects])
         project_groups = []
         for project in projects:
-            root_groups = TestCaseGroup.objects.filter(project=project, parent=None).order_by('name')
-            if root_groups.exists():
+            root_groups = trees[project.id]['groups']
+            if root_groups:
                 project_groups.append({
                     'project': project,
                     'root_groups': root_groups,
@@ -1140,18 +1175,19 @@ def test_suite_group_list(request):
     if project_id:
         project = get_object_or_404(Project, pk=project_id)
         # 获取顶级分组
-        root_groups = TestSuiteGroup.objects.filter(project=project, parent=None).order_by('name')
+        root_groups = get_suite_tree(project.id)['groups']
         context = {
             'project': project,
             'root_groups': root_groups,
         }
     else:
-        # 获取所有项目的顶级分组
+        # 获取所有项目的顶级分组，所有项目的分组树一起读取
         projects = Project.objects.all()
+        trees = get_suite_trees([project.id for project in projects])
         project_groups = []
         for project in projects:
-            root_groups = TestSuiteGroup.objects.filter(project=project, parent=None).order_by('name')
-            if root_groups.exists():
+            root_groups = trees[project.id]['groups']
+            if root_groups:
                 project_groups.append({
                     'project': project,
                     'root_groups': root_groups,
@@ -1240,70 +1276,36 @@ def test_suite_group_delete(request, pk):
 def get_test_case_groups_data(request, project_id):
     """获取项目的测试用例分组数据，用于前端展示"""
     project = get_object_or_404(Project, pk=project_id)
-
-    # 获取所有分组
-    groups = TestCaseGroup.objects.filter(project=project)
-
-    # 构建分组树
-    group_tree = []
-    group_dict = {}
-
-    # 先创建所有分组的字典
-    for group in groups:
-        group_data = {
-            'id': group.id,
-            'name': group.name,
-            'parent_id': group.parent_id,
-            'children': [],
-            'test_cases': []
+    case_tree = get_case_tree(project.id)
+
+    def group_data(group):
+        return {
+            'id': group['id'],
+            'name': group['name'],
+            'parent_id': group['parent_id'],
+            'children': [group_data(child) for child in group['children']],
+            'test_cases': [case_data(test_case) for test_case in group['test_cases']]
         }
-        group_dict[group.id] = group_data
-
-    # 构建分组树
-    for group_id, group_data in group_dict.items():
-        if group_data['parent_id'] is None:
-            # 顶级分组
-            group_tree.append(group_data)
-        else:
-            # 子分组
-            parent_data = group_dict.get(group_data['parent_id'])
-            if parent_data:
-                parent_data['children'].append(group_data)
-
-    # 获取每个分组下的测试用例
-    for group in groups:
-        test_cases = TestCase.objects.filter(project=project, group=group)
-        group_data = group_dict.get(group.id)
-        if group_data:
-            for test_case in test_cases:
-                group_data['test_cases'].append({
-                    'id': test_case.id,
-                    'name': test_case.name,
-                    'method': test_case.request_method,
-                    'url': test_case.request_url
-                })
 
-    # 获取未分组的测试用例
-    ungrouped_test_cases = TestCase.objects.filter(project=project, group__isnull=True)
-    ungrouped_data = {
-        'id': 0,
-        'name': 'Ungrouped',
-        'parent_id': None,
-        'children': [],
-        'test_cases': []
-    }
+    def case_data(test_case):
+        return {
+            'id': test_case['id'],
+            'name': test_case['name'],
+            'method': test_case['request_method'],
+            'url': test_case['request_url']
+        }
 
-    for test_case in ungrouped_test_cases:
-        ungrouped_data['test_cases'].append({
-            'id': test_case.id,
-            'name': test_case.name,
-            'method': test_case.request_method,
-            'url': test_case.request_url
-        })
+    group_tree = [group_data(group) for group in case_tree['groups']]
 
     # 如果有未分组的测试用例，添加到结果中
-    if ungrouped_data['test_cases']:
-        group_tree.append(ungrouped_data)
+    if case_tree['ungrouped']:
+        group_tree.append({
+            'id': 0,
+            'name': 'Ungrouped',
+            'parent_id': None,
+            'children': [],
+            'test_cases': [case_data(test_case) for test_case in case_tree['ungrouped']]
+        })
 
     return JsonResponse({
         'groups': group_tree
@@ -1354,21 +1356,76 @@ def test_report_detail(request, pk):
         'report': report,
     }
 
-    if report.report_format == 'html':
-        # 如果是HTML格式，直接渲染内容
-        context['report_content'] = report.content
-    elif report.report_format == 'json':
-        # 如果是JSON格式，解析并格式化显示
-        try:
-            context['report_content'] = json.loads(report.content)
-        except:
+    # 后台生成的报告只显示元数据，测试结果由页面分页加载；旧报告内容仍直接显示
+    if not report.file_path:
+        if report.report_format == 'json':
+            try:
+                context['report_content'] = json.loads(report.content)
+            except:
+                context['report_content'] = report.content
+        else:
             context['report_content'] = report.content
-    else:
-        context['report_content'] = report.content
 
     return render(request, 'test_manager/test_report_detail.html', context)
 
 
+@login_required
+@require_GET
+def test_report_status(request, pk):
+    """报告生成进度，详情页轮询"""
+    report = get_object_or_404(TestReport, pk=pk)
+    return JsonResponse({
+        'status': report.generation_status,
+        'progress': report.progress,
+        'processed': report.processed_count,
+        'total': report.total_count,
+        'file_size': report.file_size,
+        'error': report.generation_error,
+    })
+
+
+@login_required
+@require_GET
+def test_report_sections(request, pk):
+    """按页返回报告中的测试结果，只读取分段文件中该页的字节范围"""
+    report = get_object_or_404(TestReport, pk=pk)
+    try:
+        page = max(0, int(request.GET.get('page', 0)))
+    except ValueError:
+        page = 0
+
+    try:
+        results = report.read_section(page)
+    except OSError as e:
+        logger.warning(f"读取报告分段失败: report={pk}, page={page}, {e}")
+        raise Http404('报告文件不存在')
+
+    html = render_to_string('test_manager/report_section.html', {
+        'results': results,
+        'offset': page * getattr(settings, 'REPORT_SECTION_PAGE_SIZE', 50),
+    })
+    return JsonResponse({
+        'page': page,
+        'pages': report.section_pages,
+        'has_next': page + 1 < report.section_pages,
+        'html': html,
+    })
+
+
+@login_required
+def test_report_file(request, pk):
+    """以流的方式返回报告文件，download=1 时作为附件下载"""
+    report = get_object_or_404(TestReport, pk=pk)
+    path = report.get_file()
+    if path is None or not path.exists():
+        raise Http404('报告文件不存在')
+
+    as_attachment = request.GET.get('download') == '1'
+    content_type = 'application/json' if report.report_format == 'json' else 'text/html'
+    return FileResponse(open(path, 'rb'), as_attachment=as_attachment, filename=path.name,
+                        content_type=f'{content_type}; charset=utf-8')
+
+
 @login_required
 def test_report_delete(request, pk):
     """删除测试报告"""
@@ -1376,7 +1433,11 @@ def test_report_delete(request, pk):
 
     if request.method == 'POST':
         project_id = report.project.id
+        report_files = [report.get_file(), report.get_sections_file()]
         report.delete()
+        for report_file in report_files:
+            if report_file is not None:
+                report_file.unlink(missing_ok=True)
         messages.success(request, f'测试报告 "{report.name}" 已成功删除')
         return redirect('test_report_list')
 
@@ -1403,205 +1464,10 @@ def generate_test_run_report(request, pk):
                 created_by=request.user
             )
 
-            # 生成报告内容
-            if form.cleaned_data['report_format'] == 'json':
-                # 生成JSON格式的报告
-                content = {
-                    'id': str(test_run.id),
-                    'name': test_run.name,
-                    'project': {
-                        'id': str(test_run.project.id),
-                        'name': test_run.project.name,
-                    },
-                    'environment': {
-                        'id': str(test_run.environment.id),
-                        'name': test_run.environment.name,
-                        'base_url': test_run.environment.base_url,
-                    },
-                    'status': test_run.status,
-                    'start_time': test_run.start_time.isoformat() if test_run.start_time else None,
-                    'end_time': test_run.end_time.isoformat() if test_run.end_time else None,
-                    'duration': test_run.duration,
-                    'results': []
-                }
-
-                # 添加测试套件信息（如果有）
-                if test_run.test_suite:
-                    content['test_suite'] = {
-                        'id': str(test_run.test_suite.id),
-                        'name': test_run.test_suite.name,
-                    }
-
-                # 添加测试结果
-                for result in test_run.test_results.all():
-                    result_data = {
-                        'id': str(result.id),
-                        'status': result.status,
-                        'response_status_code': result.response_status_code,
-                        'response_time': result.response_time,
-                        'test_case': {
-                            'id': str(result.test_case.id),
-                            'name': result.test_case.name,
-                            'request_method': result.test_case.request_method,
-                            'request_url': result.test_case.request_url,
-                        }
-                    }
-
-                    # 添加可选字段
-                    if hasattr(result, 'response_headers') and result.response_headers:
-                        result_data['response_headers'] = result.response_headers
-
-                    if hasattr(result, 'response_body') and result.response_body:
-                        result_data['response_body'] = result.response_body
-
-                    if hasattr(result, 'request_headers') and result.request_headers:
-                        result_data['request_headers'] = result.request_headers
-
-                    if hasattr(result, 'request_body') and result.request_body:
-                        result_data['request_body'] = result.request_body
-
-                    if hasattr(result, 'error_message') and result.error_message:
-                        result_data['error_message'] = result.error_message
-
-                    content['results'].append(result_data)
-
-                report.content = json.dumps(content, indent=2)
-            else:
-                # 生成HTML格式的报告
-                html_content = f"""
-                <div class="test-report">
-                    <h1>{test_run.name} - 测试运行报告</h1>
-                    <div class="report-meta">
-                        <p><strong>项目:</strong> {test_run.project.name}</p>
-                        <p><strong>环境:</strong> {test_run.environment.name}</p>
-                        <p><strong>状态:</strong> <span class="status-{test_run.status.lower()}">{test_run.status}</span></p>
-                        <p><strong>开始时间:</strong> {test_run.start_time}</p>
-                        <p><strong>结束时间:</strong> {test_run.end_time}</p>
-                        <p><strong>持续时间:</strong> {test_run.duration} 秒</p>
-                """
-
-                # 添加测试套件信息（如果有）
-                if test_run.test_suite:
-                    html_content += f"""
-                        <p><strong>测试套件:</strong> {test_run.test_suite.name}</p>
-                    """
-
-                html_content += """
-                    </div>
-
-                    <h2>测试结果</h2>
-                """
-
-                # 添加测试结果
-                for result in test_run.test_results.all():
-                    html_content += f"""
-                    <div class="test-result">
-                        <h3>{result.test_case.name}</h3>
-                        <p><strong>状态:</strong> <span class="status-{result.status.lower()}">{result.status}</span></p>
-                        <p><strong>请求方法:</strong> {result.test_case.request_method}</p>
-                        <p><strong>请求URL:</strong> {result.test_case.request_url}</p>
-                        <p><strong>响应状态码:</strong> {result.response_status_code}</p>
-                        <p><strong>响应时间:</strong> {result.response_time} 毫秒</p>
-
-                        <div class="collapsible">
-                            <h4>请求头</h4>
-                            <pre>{json.dumps(result.request_headers, indent=2) if hasattr(result, 'request_headers') and result.request_headers else '无数据'}</pre>
-                        </div>
-
-                        <div class="collapsible">
-                            <h4>请求体</h4>
-                            <pre>{result.request_body if hasattr(result, 'request_body') and result.request_body else '无数据'}</pre>
-                        </div>
-
-                        <div class="collapsible">
-                            <h4>响应头</h4>
-                            <pre>{json.dumps(result.response_headers, indent=2) if hasattr(result, 'response_headers') and result.response_headers else '无数据'}</pre>
-                        </div>
-
-                        <div class="collapsible">
-                            <h4>响应体</h4>
-                            <pre>{result.response_body if hasattr(result, 'response_body') and result.response_body else '无数据'}</pre>
-                        </div>
-
-                        {f'<div class="error-message"><h4>错误信息</h4><pre>{result.error_message}</pre></div>' if hasattr(result, 'error_message') and result.error_message else ''}
-                    </div>
-                    """
-
-                html_content += """
-                </div>
-                <style>
-                    .test-report {
-                        font-family: Arial, sans-serif;
-                        max-width: 1200px;
-                        margin: 0 auto;
-                        padding: 20px;
-                    }
-                    .report-meta {
-                        background-color: #f5f5f5;
-                        padding: 15px;
-                        border-radius: 5px;
-                        margin-bottom: 20px;
-                    }
-                    .test-result {
-                        background-color: #f9f9f9;
-                        padding: 15px;
-                        border-radius: 5px;
-                        margin-bottom: 15px;
-                        border-left: 5px solid #ddd;
-                    }
-                    .collapsible {
-                        margin-top: 10px;
-                    }
-                    .collapsible h4 {
-                        cursor: pointer;
-                        background-color: #eee;
-                        padding: 8px;
-                        border-radius: 3px;
-                    }
-                    .collapsible pre {
-                        background-color: #f5f5f5;
-                        padding: 10px;
-                        border-radius: 3px;
-                        overflow-x: auto;
-                        white-space: pre-wrap;
-                    }
-                    .status-pass, .status-success, .status-completed {
-                        color: green;
-                        font-weight: bold;
-                    }
-                    .status-fail, .status-failure, .status-error, .status-failed {
-                        color: red;
-                        font-weight: bold;
-                    }
-                    .error-message {
-                        background-color: #ffeeee;
-                        padding: 10px;
-                        border-radius: 3px;
-                        margin-top: 10px;
-                    }
-                    .error-message h4 {
-                        color: red;
-                    }
-                </style>
-                <script>
-                    document.addEventListener('DOMContentLoaded', function() {
-                        const collapsibles = document.querySelectorAll('.collapsible h4');
-                        collapsibles.forEach(function(collapsible) {
-                            collapsible.addEventListener('click', function() {
-                                this.nextElementSibling.style.display = 
-                                    this.nextElementSibling.style.display === 'none' ? 'block' : 'none';
-                            });
-                            // 初始隐藏
-                            collapsible.nextElementSibling.style.display = 'none';
-                        });
-                    });
-                </script>
-                """
-
-                report.content = html_content
-
             report.save()
-            messages.success(request, f'测试报告 "{report.name}" 已成功生成')
+            # 报告内容由后台任务分块生成，页面跳转到详情页查看进度
+            dispatch_report_generation(report)
+            messages.success(request, f'测试报告 "{report.name}" 已开始生成')
             return redirect('test_report_detail', pk=report.pk)
     else:
         # 默认报告名称
@@ -1633,423 +1499,13 @@ def generate_test_suite_run_report(request, pk):
                 is_public=form.cleaned_data['is_public']
             )
 
-            # 计算持续时间（如果可能）
-            duration = None
-            if test_suite_run.start_time and test_suite_run.end_time:
-                duration = (test_suite_run.end_time - test_suite_run.start_time).total_seconds()
-
-            # 生成报告内容
-            if form.cleaned_data['report_format'] == 'json':
-                # 生成JSON格式的报告
-                content = {
-                    'id': str(test_suite_run.id),
-                    'test_suite': {
-                        'id': str(test_suite_run.test_suite.id),
-                        'name': test_suite_run.test_suite.name,
-                    },
-                    'environment': {
-                        'id': str(test_suite_run.environment.id),
-                        'name': test_suite_run.environment.name,
-                        'base_url': test_suite_run.environment.base_url,
-                    },
-                    'status': test_suite_run.status,
-                    'start_time': test_suite_run.start_time.isoformat() if test_suite_run.start_time else None,
-                    'end_time': test_suite_run.end_time.isoformat() if test_suite_run.end_time else None,
-                    'duration': duration,
-                    'test_runs': []
-                }
-
-                # 添加测试运行
-                for test_run in test_suite_run.test_runs.all():
-                    # 计算测试运行的持续时间（如果可能）
-                    run_duration = None
-                    if test_run.start_time and test_run.end_time:
-                        run_duration = (test_run.end_time - test_run.start_time).total_seconds()
-
-                    run_data = {
-                        'id': str(test_run.id),
-                        'name': test_run.name,
-                        'status': test_run.status,
-                        'start_time': test_run.start_time.isoformat() if test_run.start_time else None,
-                        'end_time': test_run.end_time.isoformat() if test_run.end_time else None,
-                        'duration': run_duration,
-                        'results': []
-                    }
-
-                    # 添加测试结果
-                    for result in test_run.test_results.all():
-                        result_data = {
-                            'id': str(result.id),
-                            'status': result.status,
-                            'response_status_code': result.response_status_code,
-                            'response_time': result.response_time,
-                            'test_case': {
-                                'id': str(result.test_case.id),
-                                'name': result.test_case.name,
-                                'request_method': result.test_case.request_method,
-                                'request_url': result.test_case.request_url,
-                            }
-                        }
-
-                        if hasattr(result, 'error_message') and result.error_message:
-                            result_data['error_message'] = result.error_message
-
-                        run_data['results'].append(result_data)
-
-                    content['test_runs'].append(run_data)
-
-                # 计算统计信息
-                total_runs = len(content['test_runs'])
-                passed_runs = sum(1 for run in content['test_runs'] if run['status'] == 'completed')
-                failed_runs = sum(1 for run in content['test_runs'] if run['status'] == 'failed')
-                error_runs = sum(1 for run in content['test_runs'] if
-                                 run['status'] not in ['completed', 'failed', 'pending', 'running'])
-
-                content['summary'] = {
-                    'total': total_runs,
-                    'passed': passed_runs,
-                    'failed': failed_runs,
-                    'error': error_runs,
-                    'success_rate': f"{(passed_runs / total_runs * 100) if total_runs > 0 else 0:.2f}%"
-                }
-
-                report.content = json.dumps(content, indent=2)
-            else:
-                # 生成HTML格式的报告
-                # 计算统计信息
-                total_runs = test_suite_run.test_runs.count()
-                passed_runs = test_suite_run.test_runs.filter(status='completed').count()
-                failed_runs = test_suite_run.test_runs.filter(status='failed').count()
-                error_runs = test_suite_run.test_runs.exclude(
-                    status__in=['completed', 'failed', 'pending', 'running']).count()
-                success_rate = (passed_runs / total_runs * 100) if total_runs > 0 else 0
-
-                html_content = f"""
-                <div class="test-report">
-                    <h1>{test_suite_run.test_suite.name} - 测试套件运行报告</h1>
-                    <div class="report-meta">
-                        <p><strong>测试套件:</strong> {test_suite_run.test_suite.name}</p>
-                        <p><strong>环境:</strong> {test_suite_run.environment.name}</p>
-                        <p><strong>状态:</strong> <span class="status-{test_suite_run.status.lower()}">{test_suite_run.status}</span></p>
-                        <p><strong>开始时间:</strong> {test_suite_run.start_time}</p>
-                        <p><strong>结束时间:</strong> {test_suite_run.end_time}</p>
-                """
-
-                # 只有在有开始和结束时间时才显示持续时间
-                if duration is not None:
-                    html_content += f"""
-                        <p><strong>持续时间:</strong> {duration} 秒</p>
-                    """
-
-                html_content += """
-                    </div>
-
-                    <div class="summary">
-                        <h2>测试摘要</h2>
-                        <div class="summary-stats">
-                            <div class="stat">
-                                <div class="stat-value">{total_runs}</div>
-                                <div class="stat-label">总计</div>
-                            </div>
-                            <div class="stat stat-success">
-                                <div class="stat-value">{passed_runs}</div>
-                                <div class="stat-label">通过</div>
-                            </div>
-                            <div class="stat stat-failure">
-                                <div class="stat-value">{failed_runs}</div>
-                                <div class="stat-label">失败</div>
-                            </div>
-                            <div class="stat stat-error">
-                                <div class="stat-value">{error_runs}</div>
-                                <div class="stat-label">错误</div>
-                            </div>
-                            <div class="stat">
-                                <div class="stat-value">{success_rate:.2f}%</div>
-                                <div class="stat-label">成功率</div>
-                            </div>
-                        </div>
-                    </div>
-
-                    <h2>测试用例结果</h2>
-                    <table class="test-cases-table">
-                        <thead>
-                            <tr>
-                                <th>测试用例</th>
-                                <th>方法</th>
-                                <th>URL</th>
-                                <th>状态</th>
-                                <th>持续时间</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                """
-
-                for test_run in test_suite_run.test_runs.all():
-                    # 计算测试运行的持续时间（如果可能）
-                    run_duration = None
-                    if test_run.start_time and test_run.end_time:
-                        run_duration = (test_run.end_time - test_run.start_time).total_seconds()
-
-                    # 获取第一个测试结果（如果有）
-                    first_result = test_run.test_results.first()
-
-                    if first_result:
-                        html_content += f"""
-                        <tr class="test-case-row status-{test_run.status.lower()}">
-                            <td>{first_result.test_case.name}</td>
-                            <td>{first_result.test_case.request_method}</td>
-                            <td>{first_result.test_case.request_url}</td>
-                            <td><span class="status-badge status-{test_run.status.lower()}">{test_run.status}</span></td>
-                            <td>{run_duration} 秒</td>
-                        </tr>
-                        <tr class="test-case-details">
-                            <td colspan="5">
-                                <div class="details-content">
-                        """
-
-                        for result in test_run.test_results.all():
-                            html_content += f"""
-                                    <div class="result-item">
-                                        <h4>响应详情</h4>
-                                        <p><strong>状态码:</strong> {result.response_status_code}</p>
-                            """
-
-                            # 只有在有响应时间时才显示
-                            if result.response_time is not None:
-                                html_content += f"""
-                                        <p><strong>响应时间:</strong> {result.response_time} 毫秒</p>
-                                """
-
-                            html_content += f"""
-                                        <div class="collapsible">
-                                            <h5>请求头</h5>
-                                            <pre>{json.dumps(result.request_headers, indent=2) if hasattr(result, 'request_headers') and result.request_headers else '无数据'}</pre>
-                                        </div>
-
-                                        <div class="collapsible">
-                                            <h5>请求体</h5>
-                                            <pre>{result.request_body if hasattr(result, 'request_body') and result.request_body else '无数据'}</pre>
-                                        </div>
-
-                                        <div class="collapsible">
-                                            <h5>响应头</h5>
-                                            <pre>{json.dumps(result.response_headers, indent=2) if hasattr(result, 'response_headers') and result.response_headers else '无数据'}</pre>
-                                        </div>
-
-                                        <div class="collapsible">
-                                            <h5>响应体</h5>
-                                            <pre>{result.response_body if hasattr(result, 'response_body') and result.response_body else '无数据'}</pre>
-                                        </div>
-
-                                        {f'<div class="error-message"><h5>错误信息</h5><pre>{result.error_message}</pre></div>' if hasattr(result, 'error_message') and result.error_message else ''}
-                                    </div>
-                            """
-
-                        html_content += """
-                                </div>
-                            </td>
-                        </tr>
-                        """
-
-                html_content += """
-                        </tbody>
-                    </table>
-                </div>
-                <style>
-                    .test-report {
-                        font-family: Arial, sans-serif;
-                        max-width: 1200px;
-                        margin: 0 auto;
-                        padding: 20px;
-                    }
-                    .report-meta {
-                        background-color: #f5f5f5;
-                        padding: 15px;
-                        border-radius: 5px;
-                        margin-bottom: 20px;
-                    }
-                    .summary {
-                        margin-bottom: 30px;
-                    }
-                    .summary-stats {
-                        display: flex;
-                        justify-content: space-between;
-                        flex-wrap: wrap;
-                        gap: 15px;
-                        margin-top: 15px;
-                    }
-                    .stat {
-                        background-color: #f5f5f5;
-                        border-radius: 5px;
-                        padding: 15px;
-                        text-align: center;
-                        flex: 1;
-                        min-width: 100px;
-                    }
-                    .stat-value {
-                        font-size: 24px;
-                        font-weight: bold;
-                        margin-bottom: 5px;
-                    }
-                    .stat-label {
-                        font-size: 14px;
-                        color: #666;
-                    }
-                    .stat-success {
-                        background-color: #e6f7e6;
-                    }
-                    .stat-success .stat-value {
-                        color: #2e7d32;
-                    }
-                    .stat-failure {
-                        background-color: #fde9e8;
-                    }
-                    .stat-failure .stat-value {
-                        color: #c62828;
-                    }
-                    .stat-error {
-                        background-color: #fff3e0;
-                    }
-                    .stat-error .stat-value {
-                        color: #e65100;
-                    }
-                    .test-cases-table {
-                        width: 100%;
-                        border-collapse: collapse;
-                        margin-top: 20px;
-                    }
-                    .test-cases-table th, .test-cases-table td {
-                        padding: 10px;
-                        text-align: left;
-                        border-bottom: 1px solid #ddd;
-                    }
-                    .test-cases-table th {
-                        background-color: #f5f5f5;
-                        font-weight: bold;
-                    }
-                    .test-case-row {
-                        cursor: pointer;
-                    }
-                    .test-case-row:hover {
-                        background-color: #f9f9f9;
-                    }
-                    .test-case-row.status-completed {
-                        background-color: #f0fff0;
-                    }
-                    .test-case-row.status-failed {
-                        background-color: #fff0f0;
-                    }
-                    .test-case-row.status-error {
-                        background-color: #fffaf0;
-                    }
-                    .status-badge {
-                        display: inline-block;
-                        padding: 3px 8px;
-                        border-radius: 3px;
-                        font-size: 12px;
-                        font-weight: bold;
-                    }
-                    .status-badge.status-completed {
-                        background-color: #e6f7e6;
-                        color: #2e7d32;
-                    }
-                    .status-badge.status-failed {
-                        background-color: #fde9e8;
-                        color: #c62828;
-                    }
-                    .status-badge.status-error {
-                        background-color: #fff3e0;
-                        color: #e65100;
-                    }
-                    .test-case-details {
-                        display: none;
-                    }
-                    .details-content {
-                        padding: 15px;
-                        background-color: #f9f9f9;
-                    }
-                    .result-item {
-                        margin-bottom: 15px;
-                        padding-bottom: 15px;
-                        border-bottom: 1px solid #eee;
-                    }
-                    .result-item:last-child {
-                        margin-bottom: 0;
-                        padding-bottom: 0;
-                        border-bottom: none;
-                    }
-                    .collapsible {
-                        margin-top: 10px;
-                    }
-                    .collapsible h5 {
-                        cursor: pointer;
-                        background-color: #eee;
-                        padding: 8px;
-                        border-radius: 3px;
-                        margin: 0;
-                    }
-                    .collapsible pre {
-                        background-color: #f5f5f5;
-                        padding: 10px;
-                        border-radius: 3px;
-                        overflow-x: auto;
-                        white-space: pre-wrap;
-                        margin-top: 5px;
-                    }
-                    .status-pass, .status-success, .status-completed, .status-passed {
-                        color: green;
-                        font-weight: bold;
-                    }
-                    .status-fail, .status-failure, .status-error, .status-failed {
-                        color: red;
-                        font-weight: bold;
-                    }
-                    .error-message {
-                        background-color: #ffeeee;
-                        padding: 10px;
-                        border-radius: 3px;
-                        margin-top: 10px;
-                    }
-                    .error-message h5 {
-                        color: red;
-                        margin-top: 0;
-                    }
-                </style>
-                <script>
-                    document.addEventListener('DOMContentLoaded', function() {
-                        // 折叠/展开详情
-                        const testCaseRows = document.querySelectorAll('.test-case-row');
-                        testCaseRows.forEach(function(row) {
-                            row.addEventListener('click', function() {
-                                const detailsRow = this.nextElementSibling;
-                                detailsRow.style.display = 
-                                    detailsRow.style.display === 'table-row' ? 'none' : 'table-row';
-                            });
-                        });
-
-                        // 折叠/展开可折叠内容
-                        const collapsibles = document.querySelectorAll('.collapsible h5');
-                        collapsibles.forEach(function(collapsible) {
-                            collapsible.addEventListener('click', function(e) {
-                                e.stopPropagation();
-                                this.nextElementSibling.style.display = 
-                                    this.nextElementSibling.style.display === 'none' ? 'block' : 'none';
-                            });
-                            // 初始隐藏
-                            collapsible.nextElementSibling.style.display = 'none';
-                        });
-                    });
-                </script>
-                """
-
-                report.content = html_content
-
             report.save()
-            messages.success(request, f'测试报告 "{report.name}" 已成功生成')
+            dispatch_report_generation(report)
+            messages.success(request, f'测试报告 "{report.name}" 已开始生成')
             return redirect('test_report_detail', pk=report.pk)
     else:
         # 默认报告名称
-        default_name = f"{test_suite_run.test_suite.name} - 测试报告 - {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}"
+        default_name = f"{test_suite_run.name} - 测试报告 - {datetime.datetime.now().strftime('%Y-%m-%d %H:%M')}"
         form = GenerateReportForm(initial={'name': default_name, 'report_format': 'html'})
 
     return render(request, 'test_manager/generate_test_report.html', {
@@ -2477,9 +1933,8 @@ def scheduled_task_run_now(request, pk):
 
         # 检查Celery是否可用
         try:
-            from celery import current_app
-            i = current_app.control.inspect()
-            active_workers = i.active()
+            from .worker_health import get_worker_health
+            active_workers = get_worker_health()['workers']
 
             if not active_workers:
                 print('[ERROR] 没有活动的Celery worker')
@@ -2489,7 +1944,7 @@ def scheduled_task_run_now(request, pk):
                     'message': 'Celery服务未运行，无法执行定时任务'
                 })
 
-            print(f'[DEBUG] 找到活动的Celery worker: {list(active_workers.keys())}')
+            print(f'[DEBUG] 找到活动的Celery worker: {[worker["hostname"] for worker in active_workers]}')
 
         except Exception as celery_check_error:
             print(f'[ERROR] Celery状态检查失败: {str(celery_check_error)}')
@@ -2497,9 +1952,9 @@ def scheduled_task_run_now(request, pk):
 
         # 尝试异步执行任务
         try:
-            from .tasks import execute_scheduled_test_suite
+            from .queues import dispatch_interactive_run
             print(f'[DEBUG] 准备异步执行任务: {task.id}')
-            result = execute_scheduled_test_suite.delay(task.id)
+            result = dispatch_interactive_run(task.id)
             print(f'[DEBUG] 任务已提交到Celery队列，task_id: {result.id}')
 
             messages.success(request, f'定时任务 "{task.name}" 已开始执行')
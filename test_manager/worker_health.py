@@ -0,0 +1,135 @@
+import os
+import logging
+import threading
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from celery.signals import worker_ready, worker_shutdown
+
+logger = logging.getLogger(__name__)
+
+# 心跳线程的停止信号
+_stop_event = threading.Event()
+
+
+def _collect_queue_depth(app, queues):
+    """查询各队列中等待消费的消息数量"""
+    depth = {}
+    try:
+        with app.connection_for_read() as conn:
+            channel = conn.default_channel
+            for queue in queues:
+                try:
+                    depth[queue] = channel.queue_declare(queue=queue, passive=True).message_count
+                except Exception as e:
+                    logger.debug(f"获取队列 {queue} 积压失败: {e}")
+    except Exception as e:
+        logger.warning(f"连接消息代理获取队列积压失败: {e}")
+    return depth
+
+
+def publish_heartbeat(consumer, started_at):
+    """上报一次当前worker的心跳"""
+    from celery.worker import state
+    from .models import WorkerHeartbeat
+
+    app = consumer.app
+    queues = sorted(app.amqp.queues.consume_from.keys()) if app.amqp.queues.consume_from else \
+        [app.conf.task_default_queue]
+    concurrency = getattr(getattr(consumer, 'pool', None), 'num_processes', None) or \
+        app.conf.worker_concurrency or os.cpu_count() or 0
+
+    WorkerHeartbeat.objects.update_or_create(
+        hostname=consumer.hostname,
+        defaults={
+            'pid': os.getpid(),
+            'concurrency': concurrency,
+            'active_tasks': len(state.active_requests),
+            'reserved_tasks': len(state.reserved_requests),
+            'queues': queues,
+            'queue_depth': _collect_queue_depth(app, queues),
+            'registered_tasks': sorted(name for name in app.tasks if not name.startswith('celery.')),
+            'started_at': started_at,
+            'last_seen': timezone.now(),
+        }
+    )
+
+
+def _heartbeat_loop(consumer):
+    """心跳线程，按固定间隔上报直到worker退出"""
+    interval = getattr(settings, 'WORKER_HEARTBEAT_INTERVAL', 10)
+    started_at = timezone.now()
+
+    while not _stop_event.is_set():
+        try:
+            close_old_connections()
+            publish_heartbeat(consumer, started_at)
+        except Exception as e:
+            logger.error(f"上报worker心跳失败: {e}")
+        _stop_event.wait(interval)
+
+
+@worker_ready.connect
+def start_heartbeat(sender=None, **kwargs):
+    """worker启动完成后开始上报心跳"""
+    _stop_event.clear()
+    thread = threading.Thread(target=_heartbeat_loop, args=(sender,), name='worker-heartbeat', daemon=True)
+    thread.start()
+    logger.info(f"worker心跳已启动: {sender.hostname}")
+
+
+@worker_shutdown.connect
+def stop_heartbeat(sender=None, **kwargs):
+    """worker退出时停止心跳并注销"""
+    from .models import WorkerHeartbeat
+
+    _stop_event.set()
+    hostname = getattr(sender, 'hostname', None)
+    if not hostname:
+        return
+    try:
+        close_old_connections()
+        WorkerHeartbeat.objects.filter(hostname=hostname).delete()
+        logger.info(f"worker已注销: {hostname}")
+    except Exception as e:
+        logger.error(f"注销worker心跳失败: {e}")
+
+
+def get_worker_health():
+    """
+    读取worker健康状态
+
+    只查询心跳表，不向worker广播inspect请求，可以在HTTP请求中直接调用
+    """
+    from .models import WorkerHeartbeat
+
+    workers = []
+    queue_depth = {}
+    sampled_at = {}
+    for heartbeat in WorkerHeartbeat.alive():
+        workers.append({
+            'hostname': heartbeat.hostname,
+            'concurrency': heartbeat.concurrency,
+            'active_tasks': heartbeat.active_tasks,
+            'reserved_tasks': heartbeat.reserved_tasks,
+            'free_slots': heartbeat.free_slots,
+            'queues': heartbeat.queues,
+            'registered_tasks': heartbeat.registered_tasks,
+            'last_seen': heartbeat.last_seen.isoformat(),
+        })
+        # 积压是消息代理中的队列长度，消费同一队列的worker各自采样上报，只是采样时间不同，
+        # 不能累加；每个队列取最近一次心跳中的采样
+        for queue, depth in (heartbeat.queue_depth or {}).items():
+            if queue not in sampled_at or heartbeat.last_seen > sampled_at[queue]:
+                queue_depth[queue] = depth
+                sampled_at[queue] = heartbeat.last_seen
+
+    return {
+        'status': 'ok' if workers else 'warning',
+        'workers': workers,
+        'total_capacity': sum(w['concurrency'] for w in workers),
+        'active_tasks': sum(w['active_tasks'] for w in workers),
+        'reserved_tasks': sum(w['reserved_tasks'] for w in workers),
+        'free_slots': sum(w['free_slots'] for w in workers),
+        'queue_depth': queue_depth,
+    }